@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Invalid-output rate and tokens per accepted envelope, with and without constraints.
+
+Usage:
+    python scripts/bench_constrained_envelope.py --model MODEL_ID [--strategy S1_QUICK] [--turns 20]
+
+Each turn runs ``HFChatAgent.step`` (JSON/DSL body style) and the control
+summary is aggregated exactly as the controller does, once with free decoding
+and once with the envelope grammar applied.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.agents_hf import HFChatAgent  # noqa: E402
+from src.controller import _control_summary, _update_control_stats  # noqa: E402
+from src.model_loader import load_model_and_tokenizer  # noqa: E402
+from src.schemas import Envelope  # noqa: E402
+from src.strategies import build_strategy  # noqa: E402
+
+SYSTEM = "You are a careful collaborator. Reply with a single JSON envelope."
+TASKS = [
+    "Add 17 and 25 and report the sum.",
+    "Name the capital of France.",
+    "Is 91 a prime number? Answer TRUE or FALSE.",
+    "Sort the letters of 'orchestrate' alphabetically.",
+]
+
+
+def _run(agent: HFChatAgent, turns: int) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {}
+    start = time.perf_counter()
+    for turn in range(turns):
+        envelope, _ = agent.step(TASKS[turn % len(TASKS)], [])
+        _update_control_stats(stats, Envelope(**envelope), turn + 1)
+    summary = _control_summary(stats)
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--dtype", default=None)
+    parser.add_argument("--strategy", default="S1_QUICK")
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    model, tokenizer = load_model_and_tokenizer(args.model, dtype=args.dtype)
+    strategy = build_strategy(args.strategy)
+
+    print(f"{'mode':<12} {'invalid_rate':>12} {'accepted':>9} {'tok/accepted':>13} {'seconds':>8}")
+    for label, constrained in (("free", False), ("constrained", True)):
+        agent = HFChatAgent("bench", SYSTEM, tokenizer, model, strategy, constrained_json=constrained)
+        summary = _run(agent, args.turns)
+        tokens = summary.get("tokens_per_accepted_envelope")
+        print(
+            f"{label:<12} {summary.get('json_invalid_rate', 0.0):>12.2f} "
+            f"{summary.get('json_accepted', 0):>9} "
+            f"{(f'{tokens:.1f}' if tokens is not None else '-'):>13} {summary['seconds']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
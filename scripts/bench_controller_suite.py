@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""Controller overhead suite: every registered strategy driven by scripted mock agents.
+
+Usage:
+    python scripts/bench_controller_suite.py [--dialogs 100] [--repeats 3] [--strategies S1 DSL ...] [--dumps]
+    python scripts/bench_controller_suite.py --check [--tolerance 1.0] [--memory-tolerance 0.25]
+    python scripts/bench_controller_suite.py --update-baseline
+
+Each case runs ``run_controller`` with :class:`src.agents_mock.ScriptedAgent`
+pairs for the strategy's full ``max_rounds``: one malformed envelope that
+needs repair, ``WORKING`` turns with control telemetry, then a proposal that
+the peer accepts.  DSL-style strategies get DSL envelopes and a DSL validator,
+every envelope case gets the envelope schema, and a ``TEXT`` case covers
+text-mode dialogs with ``ConciseTextAgent``.  Every run is logged through
+``record_run`` into a temporary directory.
+
+Reported per case:
+    us/round, rounds/s   controller and logging time, agent steps excluded
+    ctrl/round           controller time alone, logging excluded (gated)
+    peak_kib             peak traced allocation per dialog (tracemalloc)
+    dumps/turn           ``Envelope.model_dump`` calls per agent turn
+                         (``--dumps`` only)
+    phase columns        us/round in validation (pydantic, strategy
+                         validators, pseudocode), repair, dsl, schema,
+                         handshake, telemetry (control stats, ACL intents),
+                         hooks (other strategy hooks), logging and other
+
+``us/round`` is the best of ``--repeats`` plain runs and ``ctrl/round`` the
+median dialog over all of them, so bursts of machine noise drop out.  Phase
+shares come from a separately instrumented pass and are scaled onto the plain
+timing.  Baselines (``scripts/baselines/controller_overhead.json``) are stored
+relative to a fixed pure-Python calibration loop, so ``--check`` can flag
+regressions on a different CPU-only machine; each case is calibrated right
+before and after it runs.  The check gates ``ctrl/round``, since logging
+writes files and swings with the disk, and ``peak_kib``.  On shared or
+virtualised runners calibrated timings still drift by up to ~1.7x between
+runs, so the default time gate only flags a doubling; pass a lower
+``--tolerance`` on quiet hardware.  ``peak_kib`` is nearly deterministic and
+keeps a tight gate.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src import controller  # noqa: E402
+from src.agents_mock import ConciseTextAgent, ScriptedAgent  # noqa: E402
+from src.dsl import DSLValidator, default_dsl_spec  # noqa: E402
+from src.logger import RunLogSink, RunMetadata, record_run  # noqa: E402
+from src.schemas import Envelope, get_envelope_validator  # noqa: E402
+from src.strategies import Strategy, build_strategy, list_strategy_ids  # noqa: E402
+
+BASELINE = ROOT / "scripts" / "baselines" / "controller_overhead.json"
+SCHEMA = "schemas/envelope.schema.json"
+PHASES = ("validation", "repair", "dsl", "schema", "handshake", "telemetry", "hooks", "logging", "other")
+ANSWER = "5050"
+PSEUDOCODE_ANSWER = "- STEP 1: sum the numbers\n- RETURN 5050"
+
+
+@dataclass
+class Case:
+    name: str
+    strategy: Strategy
+    make_agents: Callable[[], Tuple[Any, Any]]
+    dsl: Optional[DSLValidator]
+    schema: Any
+
+
+# --- scripted dialogs ---------------------------------------------------------
+
+def _envelope(
+    actor: str,
+    round_idx: int,
+    style: str,
+    *,
+    intent: str,
+    status: str = "WORKING",
+    tag: str = "[CONTACT]",
+    answer: Optional[str] = None,
+) -> Dict[str, Any]:
+    env: Dict[str, Any] = {
+        "tag": tag,
+        "status": status,
+        "content": {
+            "acl": f"{intent}: round {round_idx} from {actor} => WAIT_FOR_PEER",
+            "control": {
+                "telemetry": {
+                    "retry_count": 0,
+                    "body_len": 180,
+                    "trailer_len": 40,
+                    "tokens_used": 64,
+                    "stop_reason": "suffix",
+                }
+            },
+        },
+    }
+    if answer is not None:
+        env["final_solution"] = {"canonical_text": answer}
+    if style == "dsl":
+        marker = "[SOLVED]" if status == "SOLVED" else "[CONTACT]"
+        env.update(
+            {
+                "role": actor,
+                "domain": "arithmetic",
+                "task_understanding": "Sum 1..100",
+                "public_message": f"{marker} round {round_idx}",
+                "artifact": {"type": "plan", "content": {"steps": [round_idx]}},
+                "needs_from_peer": [],
+                "handoff_to": "peer",
+            }
+        )
+    return env
+
+
+def _scripts(rounds: int, style: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    answer = PSEUDOCODE_ANSWER if style == "pseudocode" else ANSWER
+    intents = ("QUESTION", "PLAN", "CRITIQUE")
+    script_a = [_envelope("a", r, style, intent=intents[r % 3]) for r in range(1, rounds)]
+    script_a.append(_envelope("a", rounds, style, intent="PROPOSE", status="PROPOSED", answer=answer))
+    script_b = [_envelope("b", r, style, intent=intents[(r + 1) % 3]) for r in range(1, rounds)]
+    script_b[0]["tag"] = "contact"  # fails the tag pattern, so the controller repairs it
+    script_b.append(_envelope("b", rounds, style, intent="SOLVED", status="SOLVED", tag="[SOLVED]", answer=answer))
+    return script_a, script_b
+
+
+def _cases(strategy_ids: List[str]) -> List[Case]:
+    schema = get_envelope_validator(SCHEMA)
+    cases: List[Case] = []
+    for strategy_id in strategy_ids:
+        if strategy_id == "TEXT":
+            strategy = Strategy(
+                id="TEXT",
+                name="text",
+                envelope_required=False,
+                validator_id="concise_text",
+                validator_params={"max_sentences": 2},
+                max_rounds=4,
+            )
+            messages = ["Summing 1..100.", "Pairing terms gives 50 pairs of 101.", "Checking the pairs."]
+
+            def make_text() -> Tuple[Any, Any]:
+                return ConciseTextAgent("A", messages, ANSWER), ConciseTextAgent("B", messages, ANSWER)
+
+            cases.append(Case("TEXT", strategy, make_text, None, None))
+            continue
+        strategy = build_strategy(strategy_id)
+        style = str((strategy.metadata or {}).get("body_style", "json")).lower()
+        script_a, script_b = _scripts(strategy.max_rounds, style)
+
+        def make(strategy: Strategy = strategy, a: List[Any] = script_a, b: List[Any] = script_b) -> Tuple[Any, Any]:
+            return ScriptedAgent("A", a, strategy=strategy), ScriptedAgent("B", b, strategy=strategy)
+
+        dsl = default_dsl_spec().create_validator() if style == "dsl" else None
+        cases.append(Case(strategy_id, strategy, make, dsl, schema))
+    return cases
+
+
+# --- timing -------------------------------------------------------------------
+
+class PhaseTimer:
+    """Exclusive time per phase: nested timed calls are not counted twice."""
+
+    def __init__(self) -> None:
+        self.totals: Dict[str, float] = defaultdict(float)
+        self._stack: List[float] = []
+
+    def wrap(self, phase: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            self._stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = self._stack.pop()
+                self.totals[phase] += elapsed - children
+                if self._stack:
+                    self._stack[-1] += elapsed
+
+        return timed
+
+
+@contextmanager
+def _patched(owner: Any, name: str, replacement: Callable[..., Any], *, static: bool = False) -> Iterator[None]:
+    own = name in vars(owner)
+    previous = vars(owner)[name] if own else None
+    setattr(owner, name, staticmethod(replacement) if static else replacement)
+    try:
+        yield
+    finally:
+        if own:
+            setattr(owner, name, previous)
+        else:
+            delattr(owner, name)
+
+
+@contextmanager
+def _instrumented(timer: PhaseTimer, *, phases: bool) -> Iterator[None]:
+    targets: List[Tuple[Any, str, str, bool]] = [(controller, "_call_step", "agent", False)]
+    if phases:
+        targets += [
+            (Envelope, "model_validate", "validation", True),
+            (Strategy, "validate_message", "validation", False),
+            (controller, "_apply_pseudocode", "validation", False),
+            (controller, "repair_envelope", "repair", False),
+            (DSLValidator, "validate", "dsl", False),
+            (controller, "_enforce_schema", "schema", False),
+            (controller.HandshakeTracker, "observe", "handshake", False),
+            (controller, "_handle_handshake_event", "handshake", False),
+            (controller, "_update_control_stats", "telemetry", False),
+            (controller, "_parse_intent", "telemetry", False),
+            (Strategy, "prepare_prompt", "hooks", False),
+            (Strategy, "postprocess", "hooks", False),
+            (Strategy, "should_stop", "hooks", False),
+            (Strategy, "apply_pre_round_hooks", "hooks", False),
+        ]
+    with ExitStack() as stack:
+        for owner, name, phase, static in targets:
+            stack.enter_context(_patched(owner, name, timer.wrap(phase, getattr(owner, name)), static=static))
+        yield
+
+
+@contextmanager
+def _counted(owner: Any, name: str, counts: Dict[str, int], key: str) -> Iterator[None]:
+    original = getattr(owner, name)
+
+    def counting(*args: Any, **kwargs: Any) -> Any:
+        counts[key] += 1
+        return original(*args, **kwargs)
+
+    with _patched(owner, name, counting):
+        yield
+
+
+def _dialogs(
+    case: Case,
+    count: int,
+    logdir: Path,
+    timer: PhaseTimer,
+    *,
+    memory: bool = False,
+    samples: Optional[List[float]] = None,
+) -> Tuple[float, int, float]:
+    """Run ``count`` dialogs; returns (controller+logging seconds, rounds, peak KiB per dialog).
+
+    ``samples`` collects the controller seconds per round of each dialog,
+    logging excluded.
+    """
+
+    sink = RunLogSink()
+    meta = RunMetadata("bench", "bench", case.name, "mock-a", "mock-b")
+    rounds = 0
+    peak = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        agent_a, agent_b = case.make_agents()
+        if memory:
+            tracemalloc.reset_peak()
+            floor = tracemalloc.get_traced_memory()[0]
+        dialog_start, agent_before = time.perf_counter(), timer.totals["agent"]
+        result = controller.run_controller(
+            "Sum 1..100",
+            agent_a,
+            agent_b,
+            max_rounds=case.strategy.max_rounds,
+            dsl_validator=case.dsl,
+            schema_validator=case.schema,
+            strategy=case.strategy,
+        )
+        log_start = time.perf_counter()
+        if samples is not None:
+            agent = timer.totals["agent"] - agent_before
+            samples.append((log_start - dialog_start - agent) / max(int(result["rounds"]), 1))
+        record_run(result, meta, csv_path=logdir / "runs.csv", jsonl_path=logdir / "runs.jsonl", sink=sink)
+        timer.totals["logging"] += time.perf_counter() - log_start
+        if memory:
+            peak += tracemalloc.get_traced_memory()[1] - floor
+        if result.get("status") != "CONSENSUS":
+            raise RuntimeError(f"{case.name}: scripted dialog ended with {result.get('status')}")
+        rounds += int(result["rounds"])
+    elapsed = time.perf_counter() - start
+    sink.close()
+    return elapsed - timer.totals["agent"], rounds, peak / 1024 / max(count, 1)
+
+
+def run_case(
+    case: Case, dialogs: int, *, repeats: int = 3, memory_dialogs: int = 20, dumps: bool = False
+) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        logdir = Path(tmp)
+        warm = PhaseTimer()
+        with _instrumented(warm, phases=False):
+            _dialogs(case, max(dialogs // 10, 1), logdir, warm)
+
+        seconds = float("inf")
+        per_round: List[float] = []
+        for _ in range(max(repeats, 1)):
+            gc.collect()
+            plain = PhaseTimer()
+            with _instrumented(plain, phases=False):
+                elapsed, rounds, _ = _dialogs(case, dialogs, logdir, plain, samples=per_round)
+            seconds = min(seconds, elapsed)
+
+        detail = PhaseTimer()
+        with _instrumented(detail, phases=True):
+            detail_seconds, _, _ = _dialogs(case, dialogs, logdir, detail)
+
+        peak_kib = 0.0
+        if memory_dialogs:
+            tracemalloc.start()
+            try:
+                with _instrumented(PhaseTimer(), phases=False):
+                    _, _, peak_kib = _dialogs(case, memory_dialogs, logdir, PhaseTimer(), memory=True)
+            finally:
+                tracemalloc.stop()
+
+        dumps_per_turn = None
+        if dumps:
+            counts: Dict[str, int] = defaultdict(int)
+            with _counted(Envelope, "model_dump", counts, "dumps"), _counted(controller, "_call_step", counts, "turns"):
+                _dialogs(case, max(dialogs // 10, 1), logdir, PhaseTimer())
+            dumps_per_turn = counts["dumps"] / max(counts["turns"], 1)
+
+    us_per_round = seconds / rounds * 1e6
+    named = sum(detail.totals[p] for p in PHASES if p != "other")
+    shares = {p: detail.totals[p] / detail_seconds for p in PHASES if p != "other"}
+    shares["other"] = max(detail_seconds - named, 0.0) / detail_seconds
+    return {
+        "rounds": rounds // dialogs,
+        "us_per_round": us_per_round,
+        "controller_us_per_round": statistics.median(per_round) * 1e6,
+        "rounds_per_sec": 1e6 / us_per_round,
+        "phases_us": {p: shares[p] * us_per_round for p in PHASES},
+        "peak_kib": peak_kib,
+        "dumps_per_turn": dumps_per_turn,
+    }
+
+
+def calibrate(repeats: int = 7, loops: int = 2000) -> float:
+    """Microseconds per iteration of a fixed dict/JSON workload, used to normalise results."""
+
+    payload = {"tag": "[CONTACT]", "status": "WORKING", "content": {"acl": "QUESTION: x", "n": list(range(16))}}
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            data = json.loads(json.dumps(payload, sort_keys=True))
+            {key: value for key, value in data.items() if value is not None}
+        best = min(best, time.perf_counter() - start)
+    return best / loops * 1e6
+
+
+# --- baselines ----------------------------------------------------------------
+
+def _load_baseline(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _write_baseline(path: Path, calibration_us: float, results: Dict[str, Dict[str, Any]]) -> None:
+    payload = {
+        "calibration_us": round(calibration_us, 4),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cases": {
+            name: {
+                "controller_us_per_round": round(res["controller_us_per_round"], 2),
+                "normalized": round(res["controller_us_per_round"] / res.get("calibration_us", calibration_us), 3),
+                "peak_kib": round(res["peak_kib"], 1),
+            }
+            for name, res in sorted(results.items())
+        },
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    calibration_us: float,
+    baseline: Dict[str, Any],
+    tolerance: float,
+    *,
+    memory_tolerance: Optional[float] = None,
+) -> List[str]:
+    """Cases whose calibrated controller cost per round, or peak allocation,
+    exceeds the baseline by more than ``tolerance`` (``memory_tolerance``)."""
+
+    memory_tolerance = tolerance if memory_tolerance is None else memory_tolerance
+    regressions: List[str] = []
+    for name, res in results.items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+        ratio = (res["controller_us_per_round"] / res.get("calibration_us", calibration_us)) / base["normalized"]
+        res["vs_baseline"] = ratio
+        regressed = ratio > 1.0 + tolerance
+        if res.get("peak_kib") and base.get("peak_kib"):
+            res["peak_vs_baseline"] = res["peak_kib"] / base["peak_kib"]
+            regressed = regressed or res["peak_vs_baseline"] > 1.0 + memory_tolerance
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dialogs", type=int, default=100, help="Dialogs per case")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per case")
+    parser.add_argument("--memory-dialogs", type=int, default=20, help="Dialogs traced for allocations (0: skip)")
+    parser.add_argument("--dumps", action="store_true", help="Count Envelope.model_dump calls per turn")
+    parser.add_argument("--strategies", nargs="+", help="Case ids (default: every registered strategy and TEXT)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--check", action="store_true", help="Exit 1 if a case regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Allowed slowdown for --check")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed peak_kib growth for --check")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--json", dest="json_out", type=Path, help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    ids = args.strategies or [*list_strategy_ids(), "TEXT"]
+    results: Dict[str, Dict[str, Any]] = {}
+    for case in _cases(ids):
+        # Calibrate around each case, so it is normalised by the clock it ran at.
+        before = calibrate()
+        res = run_case(case, args.dialogs, repeats=args.repeats, memory_dialogs=args.memory_dialogs, dumps=args.dumps)
+        res["calibration_us"] = min(before, calibrate())
+        results[case.name] = res
+    calibration_us = min(res["calibration_us"] for res in results.values())
+
+    baseline = _load_baseline(args.baseline)
+    regressions = (
+        compare(results, calibration_us, baseline, args.tolerance, memory_tolerance=args.memory_tolerance)
+        if baseline
+        else []
+    )
+
+    print(f"calibration {calibration_us:.2f} us, {args.dialogs} dialogs per case, best of {args.repeats}")
+    header = f"{'case':<18} {'rounds':>6} {'us/round':>9} {'ctrl/rnd':>9} {'rounds/s':>9} {'peak_kib':>9}"
+    if args.dumps:
+        header += f" {'dumps/trn':>9}"
+    header += "".join(f" {p[:9]:>9}" for p in PHASES)
+    if baseline:
+        header += f" {'vs_base':>8} {'peak_vs':>8}"
+    print(header)
+    for name, res in results.items():
+        peak = f"{res['peak_kib']:>9.1f}" if args.memory_dialogs else f"{'-':>9}"
+        line = f"{name:<18} {res['rounds']:>6} {res['us_per_round']:>9.1f} {res['controller_us_per_round']:>9.1f}"
+        line += f" {res['rounds_per_sec']:>9.0f} {peak}"
+        if args.dumps:
+            line += f" {res['dumps_per_turn']:>9.2f}"
+        line += "".join(f" {res['phases_us'][p]:>9.1f}" for p in PHASES)
+        if baseline:
+            for key in ("vs_baseline", "peak_vs_baseline"):
+                ratio = res.get(key)
+                line += f" {ratio:>7.2f}x" if ratio is not None else f" {'-':>8}"
+        print(line)
+
+    if args.json_out:
+        args.json_out.write_text(json.dumps({"calibration_us": calibration_us, "cases": results}, indent=2), encoding="utf-8")
+    if args.update_baseline:
+        _write_baseline(args.baseline, calibration_us, results)
+        print(f"baseline written to {args.baseline}")
+    if args.check:
+        if baseline is None:
+            print(f"no baseline at {args.baseline}; run with --update-baseline first")
+            return 1
+        if regressions:
+            print(f"regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+        print("no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Per-envelope schema validation cost in the controller loop.
+
+Usage:
+    python scripts/bench_envelope_validation.py [--schema schemas/envelope.schema.json] [--envelopes 2000]
+
+Rows:
+    rebuild       what a path argument to ``validate_envelope`` used to cost:
+                  read the file and build a ``Draft7Validator`` per envelope
+    jsonschema    cached validator, ``iter_errors`` on every envelope
+    fast_path     cached validator with the compiled plain-Python checker
+    fast_valid    the same on the envelopes the schema accepts (no fallback)
+    controller    ``controller._enforce_schema`` (cached envelope snapshot + fast path)
+
+Envelopes are a fixed mix of valid turns and schema violations.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from jsonschema import Draft7Validator  # noqa: E402
+
+from src.controller import _enforce_schema  # noqa: E402
+from src.json_enforcer import validate_envelope  # noqa: E402
+from src.schemas import Envelope, get_envelope_validator  # noqa: E402
+
+
+def _envelopes(count: int, invalid_share: float) -> List[Dict[str, Any]]:
+    rng = random.Random(0)
+    out: List[Dict[str, Any]] = []
+    for i in range(count):
+        if rng.random() < 0.2:
+            env: Dict[str, Any] = {
+                "tag": "[SOLVED]",
+                "status": "SOLVED",
+                "content": {"acl": f"SOLVED: answer {i}"},
+                "final_solution": {"canonical_text": str(rng.randint(0, 999))},
+            }
+        else:
+            env = {
+                "tag": rng.choice(["[CONTACT]", "[PLAN]", "[SOLVER]"]),
+                "status": rng.choice(["WORKING", "NEED_PEER", "PROPOSED", "REVISED"]),
+                "content": {"acl": f"PROPOSE: step {i} => WAIT", "notes": "x" * rng.randint(0, 200)},
+            }
+        if rng.random() < invalid_share:
+            env["status"] = "DONE"
+        out.append(env)
+    return out
+
+
+def _per_envelope_us(fn: Callable[[Any], Any], items: List[Any], repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def _enforce(validator: Draft7Validator) -> Callable[[Envelope], None]:
+    def run(env: Envelope) -> None:
+        try:
+            _enforce_schema(env, validator, "a", 1)
+        except ValueError:
+            pass
+
+    return run
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--schema", default="schemas/envelope.schema.json")
+    parser.add_argument("--envelopes", type=int, default=2000)
+    parser.add_argument("--invalid-share", type=float, default=0.1)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    path = Path(args.schema)
+    if not path.is_absolute():
+        path = ROOT / path
+    validator = get_envelope_validator(path)
+    envelopes = _envelopes(args.envelopes, args.invalid_share)
+    valid = [env for env in envelopes if validator.is_valid(env)]
+    models = [Envelope.model_validate(env) for env in envelopes if env["status"] != "DONE"]
+
+    def rebuild(env: Dict[str, Any]) -> None:
+        legacy = Draft7Validator(json.loads(path.read_text(encoding="utf-8")))
+        list(legacy.iter_errors(env))
+
+    rows = [
+        ("rebuild", _per_envelope_us(rebuild, envelopes, 1)),
+        ("jsonschema", _per_envelope_us(lambda env: validate_envelope(env, validator, fast=False), envelopes, args.repeats)),
+        ("fast_path", _per_envelope_us(lambda env: validate_envelope(env, validator), envelopes, args.repeats)),
+        ("fast_valid", _per_envelope_us(lambda env: validate_envelope(env, validator), valid, args.repeats)),
+        ("controller", _per_envelope_us(_enforce(validator), models, args.repeats)),
+    ]
+    print(f"schema: {path.relative_to(ROOT) if path.is_relative_to(ROOT) else path}")
+    print(f"{len(valid)}/{len(envelopes)} envelopes valid")
+    print(f"{'path':<12} {'us/envelope':>12} {'vs rebuild':>11}")
+    for name, us in rows:
+        print(f"{name:<12} {us:>12.2f} {rows[0][1] / us:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
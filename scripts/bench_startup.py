@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Cold-start time of the CLIs and which heavy dependencies they import.
+
+Usage:
+    python scripts/bench_startup.py [--repeats 5] [--scenario llm_eval_preference] [--strategy S1]
+
+Every measurement runs in a fresh interpreter, so nothing is shared through
+``sys.modules``.  ``import`` rows time the module import alone; ``--help``
+and ``--mock`` rows time the whole process.  The ``heavy`` column lists the
+third-party packages that ended up loaded (``import`` rows only).  Run JSON
+files the ``--mock`` runs leave in ``runs/`` are removed afterwards.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+HEAVY = ("torch", "transformers", "jsonschema", "pydantic", "sqlparse", "yaml")
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("HF_HUB_OFFLINE", "1")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+    return env
+
+
+def _time_import(module: str, repeats: int) -> Tuple[float, List[str]]:
+    code = _IMPORT_PROBE.format(module=module, heavy=HEAVY)
+    samples: List[float] = []
+    heavy: List[str] = []
+    for _ in range(repeats):
+        proc = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, env=_env(), capture_output=True, text=True, check=True
+        )
+        report = json.loads(proc.stdout.strip().splitlines()[-1])
+        samples.append(report["seconds"])
+        heavy = report["heavy"]
+    return statistics.median(samples), heavy
+
+
+def _time_command(args: Sequence[str], repeats: int) -> float:
+    samples: List[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *args], cwd=ROOT, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--scenario", default="llm_eval_preference", help="Scenario for the --mock run")
+    parser.add_argument("--strategy", default="S1", help="Strategy for the --mock run")
+    args = parser.parse_args(argv)
+
+    print(f"{'target':<40} {'median_ms':>10}  heavy")
+    for module in ("src.main", "src.simple_dialog"):
+        seconds, heavy = _time_import(module, args.repeats)
+        print(f"{'import ' + module:<40} {seconds * 1e3:>10.1f}  {','.join(heavy) or '-'}")
+    for module in ("src.main", "src.simple_dialog"):
+        seconds = _time_command(["-m", module, "--help"], args.repeats)
+        print(f"{module + ' --help':<40} {seconds * 1e3:>10.1f}")
+
+    runs_dir = ROOT / "runs"
+    existing = set(runs_dir.glob("*.json"))
+    with tempfile.TemporaryDirectory() as tmp:
+        mock = [
+            "-m",
+            "src.main",
+            "--scenario",
+            args.scenario,
+            "--strategy",
+            args.strategy,
+            "--mock",
+            "--csv-log",
+            str(Path(tmp) / "runs.csv"),
+            "--jsonl-log",
+            str(Path(tmp) / "runs.jsonl"),
+        ]
+        try:
+            seconds = _time_command(mock, args.repeats)
+        finally:
+            for path in set(runs_dir.glob("*.json")) - existing:
+                path.unlink(missing_ok=True)
+    print(f"{'src.main --mock ' + args.strategy:<40} {seconds * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Per-step overhead of SuffixStop versus the previous tensor-tail matcher.
+
+Usage:
+    python scripts/bench_suffix_stop.py [--tokenizer PATH] [--steps 512] [--batch 1 4 16]
+
+Without ``--tokenizer`` a character-level stub is used so the script runs
+offline.  The legacy matcher only inspects row 0; ``legacy_rows_us`` runs its
+check over every row, which is what batched generation would need.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import torch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.control_trailer import CTRL_SUFFIX  # noqa: E402
+from src.model_loader import SuffixStop  # noqa: E402
+
+
+class CharTokenizer:
+    def encode(self, text, add_special_tokens=False):  # noqa: ARG002
+        return [ord(ch) for ch in text]
+
+    def decode(self, ids, skip_special_tokens=False):  # noqa: ARG002
+        return "".join(chr(int(i)) for i in ids)
+
+
+class LegacySuffixStop:
+    """The matcher ``SuffixStop`` used before the incremental automaton."""
+
+    def __init__(self, tokenizer, suffix: str, *, input_length: int, all_rows: bool = False) -> None:
+        self._rows = all_rows
+        self._suffix_ids = [int(t) for t in tokenizer.encode(suffix, add_special_tokens=False)]
+        self._input_length = input_length
+        self._suffix_tensor = None
+        self.triggered = False
+
+    def __call__(self, input_ids, scores, **_):
+        hit = False
+        for row in range(input_ids.shape[0] if self._rows else 1):
+            tail_view = input_ids[row, self._input_length :]
+            if tail_view.shape[-1] < len(self._suffix_ids):
+                continue
+            if self._suffix_tensor is None:
+                self._suffix_tensor = torch.tensor(self._suffix_ids, dtype=tail_view.dtype)
+            if torch.equal(tail_view[-len(self._suffix_ids) :], self._suffix_tensor):
+                self.triggered = hit = True
+        return hit
+
+
+def _stream(tokenizer, batch: int, prompt_len: int, steps: int) -> torch.Tensor:
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz {}\":,"
+    text = "".join(rng.choice(alphabet) for _ in range(steps * 4))
+    ids = tokenizer.encode(text, add_special_tokens=False)[:steps]
+    row = [0] * prompt_len + list(ids)
+    return torch.tensor([row] * batch, dtype=torch.long)
+
+
+def _time(make, full: torch.Tensor, prompt_len: int, repeats: int) -> float:
+    best = float("inf")
+    steps = full.shape[-1] - prompt_len
+    for _ in range(repeats):
+        stopper = make()
+        start = time.perf_counter()
+        for length in range(prompt_len + 1, full.shape[-1] + 1):
+            stopper(full[:, :length], None)
+        best = min(best, time.perf_counter() - start)
+    return best / steps * 1e6
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokenizer", default=None, help="HF tokenizer id or path")
+    parser.add_argument("--steps", type=int, default=512)
+    parser.add_argument("--prompt-len", type=int, default=512)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    else:
+        tokenizer = CharTokenizer()
+
+    print(f"{'batch':>5} {'legacy_us':>10} {'legacy_rows_us':>15} {'incremental_us':>15} {'speedup':>8}")
+    for batch in args.batch:
+        full = _stream(tokenizer, batch, args.prompt_len, args.steps)
+        legacy = _time(
+            lambda: LegacySuffixStop(tokenizer, CTRL_SUFFIX, input_length=args.prompt_len),
+            full,
+            args.prompt_len,
+            args.repeats,
+        )
+        legacy_rows = _time(
+            lambda: LegacySuffixStop(
+                tokenizer, CTRL_SUFFIX, input_length=args.prompt_len, all_rows=True
+            ),
+            full,
+            args.prompt_len,
+            args.repeats,
+        )
+        incremental = _time(
+            lambda: SuffixStop(tokenizer, CTRL_SUFFIX, input_length=args.prompt_len),
+            full,
+            args.prompt_len,
+            args.repeats,
+        )
+        print(
+            f"{batch:>5} {legacy:>10.2f} {legacy_rows:>15.2f} {incremental:>15.2f} "
+            f"{legacy_rows / incremental:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
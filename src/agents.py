@@ -2,11 +2,14 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import List, Dict, Any, Tuple
 import time
-from .model_loader import load_causal_lm, generate_json_only, build_inputs, _render_chat
+from .model_loader import load_causal_lm, generate_json_only, sample_json_only, build_inputs, _render_chat
 from .utils import parse_envelope
 from .json_enforcer import validate_envelope, coerce_minimal_defaults
 from .strategies import REGISTRY as STRATS
 from .pseudocode import augment_system_prompt
+from .history_digest import CHAT_TEMPLATE_SLACK, HistoryDigest, context_window
+from .token_budget import count_tokens
+from .self_consistency import majority_vote
 
 @dataclass
 class Agent:
@@ -18,15 +21,19 @@ class Agent:
     seed: int = 7
     max_new_tokens: int = 768
     strategy_id: str = "S1"
+    history_tokens: int = 256  # 0 disables the "Earlier rounds" digest
 
     def __post_init__(self):
         self.tok, self.model = load_causal_lm(self.model_id, seed=self.seed)
-        self.cfg = STRATS.get(self.strategy_id, STRATS["strategy-01"])
+        definition = STRATS.get(self.strategy_id) or STRATS["S1"]
+        self.cfg = definition.agent_profile
         self.system_prompt = augment_system_prompt(self.system_prompt)
+        self.history = HistoryDigest(self.tok, budget_tokens=self.history_tokens, keep_last=0)
 
     def _build_user_prompt(self, task: str, transcript: List[Dict[str, Any]]) -> str:
         # Include last peer [CONTACT] or request.to_peer and any arbiter hint
         peer_msgs = []
+        shown = None  # transcript entry quoted verbatim below
         for e in reversed(transcript[-6:]):  # look back a few turns
             if isinstance(e, dict):
                 r = e.get("role","")
@@ -36,42 +43,60 @@ class Agent:
                         req = (e.get("request") or {}).get("to_peer", "")
                         if req:
                             peer_msgs.append(f"Peer says: {req}")
+                            shown = e
                             break
                 if e.get("role") == "arbiter":
                     peer_msgs.append(f"Arbiter: {e.get('public_message','')}")
+                    shown = e
                     break
-        if peer_msgs:
-            return task.strip() + "\n\n" + "\n".join(peer_msgs)
-        return task
+        prompt = task.strip() + "\n\n" + "\n".join(peer_msgs) if peer_msgs else task
+        # Leave the quoted entry out of the digest when it is the latest one.
+        self.history.keep_last = 1 if transcript and shown is transcript[-1] else 0
+        return self._with_history(prompt, transcript)
+
+    def _with_history(self, prompt: str, transcript: List[Dict[str, Any]]) -> str:
+        # Digest of earlier rounds, shrunk so prompt + reply fit the context window
+        if self.history_tokens <= 0 or not transcript:
+            return prompt
+        self.history.update(transcript)
+        budget = self.history_tokens
+        limit = context_window(self.model, self.tok)
+        if limit is not None:
+            reply = min(self.max_new_tokens, self.cfg.max_new_tokens)
+            used = count_tokens(self.tok, self.system_prompt) + count_tokens(self.tok, prompt)
+            budget = min(budget, limit - reply - used - CHAT_TEMPLATE_SLACK)
+        digest = self.history.render(max_tokens=budget)
+        return prompt + "\n\nEarlier rounds:\n" + digest if digest else prompt
 
     def _gen_once(self, user_prompt: str, max_new_tokens: int) -> Tuple[Dict[str,Any] | None, str]:
+        return self._gen_samples(user_prompt, max_new_tokens, 1)[0]
+
+    def _gen_samples(self, user_prompt: str, max_new_tokens: int, k: int) -> List[Tuple[Dict[str,Any] | None, str]]:
+        # k > 1 samples all come from one batched generate (prompt prefilled once)
         messages = [
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": user_prompt},
         ]
-        result = generate_json_only(
-            self.tok,
-            self.model,
-            messages,
-            max_new_tokens=max_new_tokens,
-            do_sample=not self.cfg.greedy,
-            temperature=0.7 if not self.cfg.greedy else 0.0,
-            top_p=0.95 if not self.cfg.greedy else None,
-        )
-        obj, err = parse_envelope(result.text)
-        return obj, result.text
+        decoding = {
+            "max_new_tokens": max_new_tokens,
+            "do_sample": not self.cfg.greedy,
+            "temperature": 0.7 if not self.cfg.greedy else 0.0,
+            "top_p": 0.95 if not self.cfg.greedy else None,
+        }
+        if k > 1:
+            results = sample_json_only(self.tok, self.model, messages, k, decoding=decoding)
+        else:
+            results = [generate_json_only(self.tok, self.model, messages, decoding=decoding)]
+        return [(parse_envelope(result.text)[0], result.text) for result in results]
 
     def step(self, task: str, transcript: List[Dict[str, Any]]) -> Tuple[Dict[str,Any], str]:
         user_prompt = self._build_user_prompt(task, transcript)
         # Self-consistency k samples if configured
         candidates: List[Tuple[Dict[str,Any], str]] = []
         k = max(1, int(self.cfg.k_samples))
-        for _ in range(k):
-            obj, raw = self._gen_once(user_prompt, max_new_tokens=min(self.max_new_tokens, self.cfg.max_new_tokens))
+        for obj, raw in self._gen_samples(user_prompt, min(self.max_new_tokens, self.cfg.max_new_tokens), k):
             if obj:
                 candidates.append((obj, raw))
-                if k == 1:
-                    break
         if not candidates:
             # one retry with an explicit JSON reminder
             reminder = user_prompt + "\n\nIMPORTANT: Emit a single valid JSON object matching the agreed envelope. No prose."
@@ -93,13 +118,8 @@ class Agent:
                 }
                 return fb, raw or ""
             candidates.append((obj, raw))
-        # If multiple, pick the first SOLVED else first
-        best_obj, best_raw = None, ""
-        for obj, raw in candidates:
-            if (obj.get("status") == "SOLVED"):
-                best_obj, best_raw = obj, raw; break
-        if best_obj is None:
-            best_obj, best_raw = candidates[0]
+        # If multiple, keep the answer most samples agree on
+        best_obj, best_raw = candidates[majority_vote([obj for obj, _ in candidates]).winner]
         # Ensure meta/strategy_id present
         best_obj.setdefault("meta", {}).setdefault("strategy_id", self.strategy_id)
         # Estimate tokens (prompt/gen) for logging
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import json
+import warnings
 from dataclasses import replace
 from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
 
+from .constrained_json import TokenGrammar, envelope_constraint
 from .control_trailer import (
     CONTROL_TRAILER_GUIDE,
     CTRL_PREFIX,
@@ -12,10 +14,31 @@ from .control_trailer import (
     extract_control_trailer,
     validate_control_payload,
 )
-from .model_loader import GenerationResult, generate_json_only, generate_with_trailer
+from .dsl import DSLValidator, default_dsl_spec
+from .history_digest import (
+    CHAT_TEMPLATE_SLACK,
+    DEFAULT_HISTORY_TOKENS,
+    HistoryDigest,
+    clip_to_tokens,
+    context_window,
+)
+from .model_loader import (
+    TRAILER_TEMPLATE,
+    DraftModel,
+    GenerationResult,
+    generate_json_only,
+    generate_with_trailer,
+    sample_json_only,
+    sample_with_trailer,
+)
+from .prefix_cache import PrefixCache, get_prefix_cache
+from .prompt_table import get_prompt_table
 from .pseudocode import augment_system_prompt
+from .response_cache import ResponseCache
 from .sanitize import ALLOWED_STATUS, repair_envelope
+from .self_consistency import Vote, majority_vote
 from .strategies import Strategy
+from .token_budget import TrailerBudgetPlanner, count_tokens, get_budget_planner
 from .utils import ALLOWED_PERFORMATIVES, ACLParseError, parse_acl_message
 
 
@@ -152,6 +175,10 @@ def _extract_last_json(text: str) -> Optional[str]:
     return last
 
 
+def _acceptance_rate(accepted: int, drafted: int) -> Optional[float]:
+    return round(accepted / drafted, 4) if drafted else None
+
+
 def _telemetry_from(
     result: GenerationResult,
     extraction: Dict[str, Any],
@@ -179,6 +206,16 @@ def _telemetry_from(
     )
     body_budget = int(totals.get("body_budget", result.body_budget))
     trailer_budget = int(totals.get("trailer_budget", result.trailer_budget))
+    prefix_hits = int(totals.get("prefix_cache_hits", result.prefix_cache_hits))
+    prefix_misses = int(totals.get("prefix_cache_misses", result.prefix_cache_misses))
+    prefix_reused = int(totals.get("prefix_tokens_reused", result.prefix_tokens_reused))
+    prefill_total = int(totals.get("prefill_tokens_total", result.prefill_tokens))
+    decode_total = int(totals.get("decode_tokens_total", result.decode_tokens))
+    salvage_total = int(totals.get("salvage_tokens_total", result.salvage_tokens))
+    response_hits = int(totals.get("response_cache_hits", int(result.response_cache_hit)))
+    planned_calls = int(totals.get("budget_planned_calls", 0))
+    draft_total = int(totals.get("draft_tokens_total", result.draft_tokens))
+    accepted_total = int(totals.get("draft_accepted_total", result.draft_accepted))
     closed_ctrl = suffix_at_end and not result.has_tail
     telemetry = {
         "retry_count": attempt,
@@ -204,12 +241,37 @@ def _telemetry_from(
         "tokens_body_budget": body_budget,
         "tokens_trailer_budget": trailer_budget,
         "trailer_only_retry": bool(trailer_only_retry),
+        "prefix_cache_hits": prefix_hits,
+        "prefix_cache_misses": prefix_misses,
+        "prefix_tokens_reused": prefix_reused,
+        "tokens_prefill_total": prefill_total,
+        "tokens_decode_total": decode_total,
+        "tokens_salvage_total": salvage_total,
+        "response_cache_hits": response_hits,
+        "budget_planned_calls": planned_calls,
+        "draft_tokens_total": draft_total,
+        "draft_accepted_total": accepted_total,
+        "draft_acceptance": _acceptance_rate(accepted_total, draft_total),
+        "draft": totals.get("draft"),
         "closed_ctrl": bool(closed_ctrl),
         "first_error": failure_codes[0] if failure_codes else None,
     }
     return telemetry
 
 
+def _pick_sample(candidates: Sequence[Tuple[Dict[str, Any], str]], drawn: int) -> Tuple[Dict[str, Any], str]:
+    """Majority-voted candidate, with the vote recorded in its control telemetry."""
+
+    if drawn <= 1:
+        return candidates[0]
+    vote: Vote = majority_vote([envelope for envelope, _ in candidates])
+    envelope, raw = candidates[vote.winner]
+    control = (envelope.get("content") or {}).get("control")
+    if isinstance(control, dict) and isinstance(control.get("telemetry"), dict):
+        control["telemetry"]["self_consistency"] = vote.telemetry(drawn)
+    return envelope, raw
+
+
 def _maybe_add_snippet(strategy: Strategy) -> Optional[str]:
     meta = strategy.metadata or {}
     snippet = meta.get("prompt_snippet")
@@ -228,46 +290,123 @@ class HFChatAgent:
         tokenizer,
         model,
         strategy: Strategy,
+        *,
+        prefix_cache: Optional[PrefixCache] = None,
+        use_prefix_cache: bool = True,
+        constrained_json: Optional[bool] = None,
+        dsl_validator: Optional[DSLValidator] = None,
+        response_cache: Optional[ResponseCache] = None,
+        budget_planner: Optional[TrailerBudgetPlanner] = None,
+        plan_budgets: bool = True,
+        history_tokens: int = DEFAULT_HISTORY_TOKENS,
+        draft: Optional[DraftModel] = None,
     ) -> None:
         self.name = name
         self.base_system_prompt = augment_system_prompt(system_prompt)
         self.tokenizer = tokenizer
         self.model = model
         self.strategy = strategy
+        # The system prefix is identical across turns; its KV cache is shared
+        # process-wide unless the caller supplies or disables one.
+        if use_prefix_cache:
+            self.prefix_cache: Optional[PrefixCache] = prefix_cache or get_prefix_cache()
+        else:
+            self.prefix_cache = None
+        if constrained_json is None:
+            constrained_json = bool((strategy.metadata or {}).get("constrained_decoding"))
+        self.constrained_json = bool(constrained_json)
+        self.dsl_validator = dsl_validator
+        self._constraint: Optional[TokenGrammar] = None
+        # ``None`` defers to the process-wide cache (``LLM_RESPONSE_CACHE``).
+        self.response_cache = response_cache
+        # Trailer budgets follow the observed trailer lengths of this strategy
+        # (shared across agents) instead of a fixed fraction of max_new_tokens.
+        if plan_budgets:
+            self.budget_planner: Optional[TrailerBudgetPlanner] = budget_planner or get_budget_planner()
+        else:
+            self.budget_planner = None
+        # Digest of rounds before the peer's last envelope; 0 disables it.
+        self.history: Optional[HistoryDigest] = (
+            HistoryDigest(tokenizer, budget_tokens=history_tokens) if history_tokens > 0 else None
+        )
+        # Optional draft model for assisted decoding; acceptance lands in telemetry.
+        self.draft = draft
+        self._warned_draft = False
 
     def _count_tokens(self, text: str) -> int:
-        if not text:
-            return 0
-        tokenizer = getattr(self, "tokenizer", None)
-        encode = getattr(tokenizer, "encode", None) if tokenizer is not None else None
-        if encode is not None:
-            try:
-                tokens = encode(text, add_special_tokens=False)  # type: ignore[arg-type]
-            except TypeError:
-                tokens = encode(text)  # type: ignore[arg-type]
-            except Exception:
-                tokens = None
-            if isinstance(tokens, (list, tuple)):
-                return len(tokens)
-            if hasattr(tokens, "input_ids"):
-                candidate = getattr(tokens, "input_ids")
-                if hasattr(candidate, "__len__"):
-                    return len(candidate)  # type: ignore[arg-type]
-            if hasattr(tokens, "__len__"):
-                return len(tokens)  # type: ignore[arg-type]
-        stripped = text.strip()
-        if not stripped:
-            return 0
-        return len(stripped.split())
+        return count_tokens(getattr(self, "tokenizer", None), text)
+
+    def _planned_budget(self, max_new_tokens: int, gen_kwargs: Mapping[str, Any]) -> Dict[str, int]:
+        planner = getattr(self, "budget_planner", None)
+        if planner is None or any(
+            key in gen_kwargs for key in ("trailer_budget", "body_budget", "salvage_max_new_tokens")
+        ):
+            return {}
+        plan = planner.plan(
+            self.strategy.id,
+            max_new_tokens,
+            template_tokens=self._count_tokens(TRAILER_TEMPLATE),
+        )
+        if plan is None:
+            return {}
+        return {
+            "trailer_budget": plan.trailer_budget,
+            "body_budget": plan.body_budget,
+            "salvage_max_new_tokens": plan.salvage_max_new_tokens,
+        }
+
+    def _json_constraint(self) -> Optional[TokenGrammar]:
+        if not self.constrained_json:
+            return None
+        if self._constraint is None:
+            validator = self.dsl_validator
+            if validator is None and self._body_style() == "dsl":
+                validator = default_dsl_spec().create_validator()
+            self._constraint = envelope_constraint(self.tokenizer, dsl_validator=validator)
+        return self._constraint
 
     def _body_style(self) -> str:
         metadata = self.strategy.metadata or {}
         return str(metadata.get("body_style", "json")).strip().lower()
 
+    def _samples(self) -> int:
+        """Self-consistency sample count from the strategy's agent profile."""
+
+        profile = getattr(self.strategy, "agent_profile", None)
+        return max(int(getattr(profile, "k_samples", 1) or 1), 1)
+
+    def _draft_mode(self, samples: int) -> Optional[str]:
+        """Telemetry value for the draft model: unset, used, or skipped.
+
+        Batched self-consistency sampling runs without assisted decoding, so
+        a configured draft is reported (and warned about once) instead of
+        being dropped silently.
+        """
+
+        if getattr(self, "draft", None) is None:
+            return None
+        if samples <= 1:
+            return "assisted"
+        if not getattr(self, "_warned_draft", False):
+            self._warned_draft = True
+            warnings.warn(
+                f"agent {self.name!r}: draft model ignored for {samples} batched samples "
+                "(assisted decoding needs a single sequence)",
+                RuntimeWarning,
+                stacklevel=3,
+            )
+        return "disabled_for_batched_samples"
+
     # -- prompt assembly -------------------------------------------------
     def _adjust_decoding(self, decoding: Dict[str, Any]) -> None:
         body_style = self._body_style()
-        if body_style in {"json", "dsl", "kqml"}:
+        if body_style in {"json", "dsl", "kqml"} and self._samples() > 1:
+            # Self-consistency needs distinct samples; JSON modes are greedy otherwise.
+            decoding["do_sample"] = True
+            decoding["temperature"] = float(decoding.get("temperature") or 0.7)
+            if "top_p" in decoding:
+                decoding["top_p"] = float(decoding["top_p"])
+        elif body_style in {"json", "dsl", "kqml"}:
             decoding["do_sample"] = False
             decoding.pop("temperature", None)
             decoding.pop("top_p", None)
@@ -303,18 +442,33 @@ class HFChatAgent:
         if prep.get("system_suffix"):
             parts.append(str(prep["system_suffix"]))
 
-        return "\n\n".join([p for p in parts if p])
+        # Interned once per combination, so the prefix cache's per-turn lookup
+        # hits the same string object.
+        return get_prompt_table().join(parts)
+
+    def _history_text(self, transcript: List[Dict[str, Any]], max_tokens: Optional[int]) -> str:
+        history = getattr(self, "history", None)
+        if history is None or not transcript:
+            return ""
+        history.update(transcript)
+        return history.render(max_tokens)
 
     def _user_prompt(
         self,
         task: str,
         transcript: List[Dict[str, Any]],
         preparation: Optional[Mapping[str, Any]],
+        *,
+        history_tokens: Optional[int] = None,
+        peer_tokens: Optional[int] = None,
     ) -> str:
         prep = preparation or {}
         peer_context = "{}"
         if transcript:
             peer_context = json.dumps(transcript[-1].get("envelope", {}), ensure_ascii=False)
+            if peer_tokens is not None:
+                peer_context = clip_to_tokens(self.tokenizer, peer_context, peer_tokens)
+        history = self._history_text(transcript, history_tokens)
 
         parts: List[str] = []
         if prep.get("user_prefix"):
@@ -322,7 +476,8 @@ class HFChatAgent:
 
         base = (
             f"Task: {task}\n"
-            f"Peer context: {peer_context}\n"
+            + (f"Earlier rounds:\n{history}\n" if history else "")
+            + f"Peer context: {peer_context}\n"
             "Respond in your preferred style, then append the control trailer exactly as instructed."
         )
         prompt_context = {"agent": self.name}
@@ -342,14 +497,50 @@ class HFChatAgent:
         task: str,
         transcript: List[Dict[str, Any]],
         preparation: Optional[Mapping[str, Any]],
+        *,
+        reply_tokens: int = 0,
     ) -> List[Dict[str, str]]:
         system_prompt = self._system_prompt(preparation)
         user_prompt = self._user_prompt(task, transcript, preparation)
+        limit = context_window(self.model, self.tokenizer)
+        if limit is not None:
+            user_prompt = self._fit_user_prompt(
+                task, transcript, preparation, user_prompt, limit - reply_tokens - self._count_tokens(system_prompt)
+            )
         return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
 
+    def _fit_user_prompt(
+        self,
+        task: str,
+        transcript: List[Dict[str, Any]],
+        preparation: Optional[Mapping[str, Any]],
+        user_prompt: str,
+        room: int,
+    ) -> str:
+        """Shrink the history digest, then the peer context, until the prompt fits ``room``."""
+
+        overflow = self._count_tokens(user_prompt) + CHAT_TEMPLATE_SLACK - room
+        if overflow <= 0:
+            return user_prompt
+        history = self._history_text(transcript, None)
+        if history:
+            budget = max(self._count_tokens(history) - overflow, 0)
+            user_prompt = self._user_prompt(task, transcript, preparation, history_tokens=budget)
+            overflow = self._count_tokens(user_prompt) + CHAT_TEMPLATE_SLACK - room
+        if overflow > 0 and transcript:
+            peer = json.dumps(transcript[-1].get("envelope", {}), ensure_ascii=False)
+            user_prompt = self._user_prompt(
+                task,
+                transcript,
+                preparation,
+                history_tokens=0,
+                peer_tokens=max(self._count_tokens(peer) - overflow, 0),
+            )
+        return user_prompt
+
     # -- controller hook -------------------------------------------------
     def step(
         self,
@@ -357,12 +548,22 @@ class HFChatAgent:
         transcript: List[Dict[str, Any]],
         preparation: Optional[Dict[str, Any]] = None,
     ) -> Tuple[Dict[str, Any], str]:
-        base_messages = self._messages(task, transcript, preparation)
-        system_message, user_message = base_messages
         decoding: Dict[str, Any] = dict(self.strategy.decoding or {})
         if preparation and preparation.get("decoding_override"):
             decoding.update(preparation["decoding_override"])  # type: ignore[arg-type]
         self._adjust_decoding(decoding)
+        reply_tokens = int(decoding.get("max_new_tokens", 512))
+        system_message, user_message = self._messages(task, transcript, preparation, reply_tokens=reply_tokens)
+        limit = context_window(self.model, self.tokenizer)
+        if limit is not None:
+            # Whatever the prompt could not give up comes out of the reply budget.
+            prompt_tokens = (
+                self._count_tokens(system_message["content"])
+                + self._count_tokens(user_message["content"])
+                + CHAT_TEMPLATE_SLACK
+            )
+            if prompt_tokens + reply_tokens > limit:
+                decoding["max_new_tokens"] = max(limit - prompt_tokens, 1)
 
         body_style = self._body_style()
         if body_style in {"json", "dsl", "kqml"}:
@@ -380,8 +581,32 @@ class HFChatAgent:
         errors: List[str] = []
         last_result: Optional[GenerationResult] = None
         raw_output = ""
-
-        base_messages = [dict(system_message), dict(user_message)]
+        invalid_outputs = 0
+        tokens_total = 0
+        response_hits = 0
+        drafted = accepted_drafts = 0
+        constraint = self._json_constraint()
+        samples = self._samples() if decoding.get("do_sample") else 1
+        draft_mode = self._draft_mode(samples)
+
+        def _control(attempt: int, accepted: bool) -> Dict[str, Any]:
+            telemetry = {
+                "retry_count": attempt,
+                "stopped_on": last_result.stop_reason if last_result else None,
+                "tokens_used": last_result.tokens_used if last_result else 0,
+                "tokens_used_total": tokens_total,
+                "json_attempts": attempt + 1,
+                "json_invalid_outputs": invalid_outputs,
+                "json_accepted": bool(accepted),
+                "constrained": constraint is not None,
+                "response_cache_hits": response_hits,
+                "draft_tokens_total": drafted,
+                "draft_accepted_total": accepted_drafts,
+                "draft_acceptance": _acceptance_rate(accepted_drafts, drafted),
+                "draft": draft_mode,
+                "first_error": errors[0] if errors else None,
+            }
+            return {"source": "json_mode", "telemetry": telemetry}
 
         for attempt in range(max_attempts):
             if attempt and errors:
@@ -390,33 +615,70 @@ class HFChatAgent:
             else:
                 convo = [dict(system_message), dict(user_message)]
 
-            result = generate_json_only(
-                self.tokenizer,
-                self.model,
-                convo,
-                decoding=decoding,
-            )
-            raw_output = result.text
-            last_result = result
-
-            try:
-                candidate = json.loads(raw_output)
-            except json.JSONDecodeError as exc:
-                errors = [f"Invalid JSON: {exc.msg} (line {exc.lineno}, column {exc.colno})."]
-                continue
-
-            errors = _validate_envelope_candidate(candidate)
-            if errors:
+            if samples > 1:
+                results = sample_json_only(
+                    self.tokenizer,
+                    self.model,
+                    convo,
+                    samples,
+                    decoding=decoding,
+                    prefix_cache=self.prefix_cache,
+                    constraint=constraint,
+                )
+            else:
+                results = [
+                    generate_json_only(
+                        self.tokenizer,
+                        self.model,
+                        convo,
+                        decoding=decoding,
+                        prefix_cache=self.prefix_cache,
+                        constraint=constraint,
+                        response_cache=self.response_cache,
+                        draft=getattr(self, "draft", None),
+                    )
+                ]
+
+            candidates: List[Tuple[Dict[str, Any], str]] = []
+            failures: List[str] = []
+            for result in results:
+                raw_output = result.text
+                last_result = result
+                tokens_total += max(int(result.tokens_used), 0)
+                response_hits += int(result.response_cache_hit)
+                drafted += int(result.draft_tokens)
+                accepted_drafts += int(result.draft_accepted)
+
+                try:
+                    candidate = json.loads(raw_output)
+                except json.JSONDecodeError as exc:
+                    failures = failures or [f"Invalid JSON: {exc.msg} (line {exc.lineno}, column {exc.colno})."]
+                    invalid_outputs += 1
+                    continue
+
+                problems = _validate_envelope_candidate(candidate)
+                if problems:
+                    failures = failures or problems
+                    invalid_outputs += 1
+                    continue
+                candidates.append((repair_envelope(candidate), raw_output))
+
+            if not candidates:
+                errors = failures
                 continue
-
-            envelope = repair_envelope(candidate)
-            return envelope, raw_output
+            errors = []
+            for envelope, _ in candidates:
+                content_block = dict(envelope.get("content") or {})
+                content_block["control"] = _control(attempt, True)
+                envelope["content"] = content_block
+            return _pick_sample(candidates, len(results))
 
         fallback: Dict[str, Any] = {
             "tag": "[CONTACT]",
             "status": "NEED_PEER",
             "content": {
                 "acl": "QUESTION: Unable to parse your last reply => WAIT_FOR_PEER",
+                "control": _control(max_attempts - 1, False),
             },
         }
         if errors:
@@ -434,7 +696,7 @@ class HFChatAgent:
         failure_codes: List[str] = []
         errors: List[str] = []
         last_output = ""
-        totals: Dict[str, int] = {
+        totals: Dict[str, Any] = {
             "tokens_used_total": 0,
             "tokens_reserved_total": 0,
             "body_tokens_total": 0,
@@ -443,6 +705,16 @@ class HFChatAgent:
             "tokens_trailer_overflow_total": 0,
             "body_budget": 0,
             "trailer_budget": 0,
+            "prefix_cache_hits": 0,
+            "prefix_cache_misses": 0,
+            "prefix_tokens_reused": 0,
+            "prefill_tokens_total": 0,
+            "decode_tokens_total": 0,
+            "salvage_tokens_total": 0,
+            "response_cache_hits": 0,
+            "budget_planned_calls": 0,
+            "draft_tokens_total": 0,
+            "draft_accepted_total": 0,
         }
         pending_body: str = ""
         trailer_only_retry = False
@@ -463,6 +735,8 @@ class HFChatAgent:
             if top_k is not None:
                 sampling_kwargs["top_k"] = int(top_k)
 
+        samples = self._samples() if do_sample else 1
+        totals["draft"] = self._draft_mode(samples)
         for attempt in range(max_attempts):
             if attempt and errors:
                 hint = "\n".join(errors)
@@ -470,108 +744,151 @@ class HFChatAgent:
             else:
                 convo = [dict(system_message), dict(user_message)]
 
-            result = generate_with_trailer(
-                self.model,
-                self.tokenizer,
-                convo,
-                max_new_tokens=max_new_tokens,
-                do_sample=do_sample,
-                **sampling_kwargs,
-                **gen_kwargs,
-            )
-            last_output = result.text
-            trailer_only_retry = result.tokens_reserved > result.max_new_tokens
-
-            totals["tokens_used_total"] += max(int(result.tokens_used), 0)
-            totals["tokens_reserved_total"] += max(int(result.tokens_reserved), 0)
-            totals["body_tokens_total"] += max(int(result.body_tokens), 0)
-            totals["trailer_tokens_total"] += max(int(result.trailer_tokens), 0)
-            totals["tokens_body_overflow_total"] += max(int(result.tokens_body_overflow), 0)
-            totals["tokens_trailer_overflow_total"] += max(
-                int(result.tokens_trailer_overflow), 0
-            )
-            totals["body_budget"] = max(totals.get("body_budget", 0), int(result.body_budget))
-            totals["trailer_budget"] = max(
-                totals.get("trailer_budget", 0), int(result.trailer_budget)
-            )
-
-            extraction = extract_control_trailer(last_output)
-            offsets = extraction.get("offsets") or {}
-            json_start = offsets.get("json_start", -1)
-            json_end = offsets.get("json_end", -1)
-            trailer_json = (
-                last_output[json_start:json_end]
-                if json_start != -1 and json_end != -1 and json_end >= json_start
-                else ""
-            )
-
-            if not extraction.get("ok"):
-                error_code = extraction.get("error") or "UNKNOWN"
-                failure_codes.append(error_code)
-                errors = [_trailer_error_hint(error_code)]
-                if error_code == "ERR_TRAILER_UNCLOSED":
-                    pending_body = extraction.get("body") or pending_body
-                continue
-
-            payload = dict(extraction.get("payload") or {})
-            validation = validate_control_payload(payload)
-            if not validation.get("ok"):
-                val_errors = list(validation.get("errors") or [])
-                if not val_errors:
-                    val_errors = ["Invalid control payload."]
-                failure_codes.extend(val_errors)
-                errors = val_errors
-                continue
-
-            payload = dict(validation.get("payload") or {})
-            body_text = extraction.get("body") or ""
-            if not body_text and pending_body:
-                body_text = pending_body
-                extraction = dict(extraction)
-                extraction["body"] = body_text
-                if extraction.get("offsets"):
-                    offsets = dict(extraction["offsets"])
-                else:
-                    offsets = {"json_start": json_start, "json_end": json_end, "suffix_at_end": True}
-                shift = len(body_text)
-                offsets["json_start"] = (offsets.get("json_start", -1) + shift) if offsets.get("json_start", -1) != -1 else -1
-                offsets["json_end"] = (offsets.get("json_end", -1) + shift) if offsets.get("json_end", -1) != -1 else -1
-                extraction["offsets"] = offsets
-                trailer_only_retry = True
-                if body_text and not last_output.startswith(body_text):
-                    last_output = f"{body_text}{last_output}"
-            pending_body = body_text
-            content = dict(payload.get("content") or {})
-            if body_text.strip():
-                content.setdefault("body", body_text.strip())
-            payload["content"] = content
-
-            telemetry = _telemetry_from(
-                result,
-                extraction,
-                failure_codes,
-                attempt,
-                totals,
-                trailer_only_retry,
-            )
-            payload["telemetry"] = telemetry
-
-            envelope = envelope_from_payload(payload)
-            content_block = dict(envelope.get("content") or {})
-            control_meta = {
-                "source": "control_trailer",
-                "telemetry": telemetry,
-                "raw_trailer": f"{CTRL_PREFIX}{trailer_json}{CTRL_SUFFIX}" if trailer_json else None,
-                "body_preview": _truncate(body_text),
-                "errors": list(failure_codes),
-            }
-            if control_meta["raw_trailer"] is None:
-                control_meta.pop("raw_trailer")
-            if not control_meta["errors"]:
-                control_meta.pop("errors")
-            content_block["control"] = control_meta
-            envelope["content"] = content_block
-            return repair_envelope(envelope), last_output
+            planned = self._planned_budget(max_new_tokens, gen_kwargs)
+            if samples > 1:
+                results = sample_with_trailer(
+                    self.model,
+                    self.tokenizer,
+                    convo,
+                    samples,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=do_sample,
+                    prefix_cache=self.prefix_cache,
+                    **planned,
+                    **sampling_kwargs,
+                    **gen_kwargs,
+                )
+            else:
+                results = [
+                    generate_with_trailer(
+                        self.model,
+                        self.tokenizer,
+                        convo,
+                        max_new_tokens=max_new_tokens,
+                        do_sample=do_sample,
+                        prefix_cache=self.prefix_cache,
+                        response_cache=self.response_cache,
+                        draft=getattr(self, "draft", None),
+                        **planned,
+                        **sampling_kwargs,
+                        **gen_kwargs,
+                    )
+                ]
+
+            totals["budget_planned_calls"] += int(bool(planned))
+            planner = getattr(self, "budget_planner", None)
+            for result in results:
+                totals["tokens_used_total"] += max(int(result.tokens_used), 0)
+                totals["tokens_reserved_total"] += max(int(result.tokens_reserved), 0)
+                totals["body_tokens_total"] += max(int(result.body_tokens), 0)
+                totals["trailer_tokens_total"] += max(int(result.trailer_tokens), 0)
+                totals["tokens_body_overflow_total"] += max(int(result.tokens_body_overflow), 0)
+                totals["tokens_trailer_overflow_total"] += max(
+                    int(result.tokens_trailer_overflow), 0
+                )
+                totals["body_budget"] = max(totals.get("body_budget", 0), int(result.body_budget))
+                totals["trailer_budget"] = max(
+                    totals.get("trailer_budget", 0), int(result.trailer_budget)
+                )
+                totals["prefix_cache_hits"] += int(result.prefix_cache_hits)
+                totals["prefix_cache_misses"] += int(result.prefix_cache_misses)
+                totals["prefix_tokens_reused"] += int(result.prefix_tokens_reused)
+                totals["prefill_tokens_total"] += int(result.prefill_tokens)
+                totals["decode_tokens_total"] += int(result.decode_tokens)
+                totals["salvage_tokens_total"] += int(result.salvage_tokens)
+                totals["response_cache_hits"] += int(result.response_cache_hit)
+                totals["draft_tokens_total"] += int(result.draft_tokens)
+                totals["draft_accepted_total"] += int(result.draft_accepted)
+                if result.suffix_triggered and planner is not None:
+                    planner.observe(self.strategy.id, int(result.trailer_tokens))
+
+            candidates: List[Tuple[Dict[str, Any], str]] = []
+            for result in results:
+                last_output = result.text
+                trailer_only_retry = result.tokens_reserved > result.max_new_tokens
+
+                extraction = extract_control_trailer(last_output)
+                offsets = extraction.get("offsets") or {}
+                json_start = offsets.get("json_start", -1)
+                json_end = offsets.get("json_end", -1)
+                trailer_json = (
+                    last_output[json_start:json_end]
+                    if json_start != -1 and json_end != -1 and json_end >= json_start
+                    else ""
+                )
+
+                if not extraction.get("ok"):
+                    error_code = extraction.get("error") or "UNKNOWN"
+                    failure_codes.append(error_code)
+                    errors = [_trailer_error_hint(error_code)]
+                    # Independent samples do not continue each other's body.
+                    if error_code == "ERR_TRAILER_UNCLOSED" and len(results) == 1:
+                        pending_body = extraction.get("body") or pending_body
+                    continue
+
+                payload = dict(extraction.get("payload") or {})
+                validation = validate_control_payload(payload)
+                if not validation.get("ok"):
+                    val_errors = list(validation.get("errors") or [])
+                    if not val_errors:
+                        val_errors = ["Invalid control payload."]
+                    failure_codes.extend(val_errors)
+                    errors = val_errors
+                    continue
+
+                payload = dict(validation.get("payload") or {})
+                body_text = extraction.get("body") or ""
+                if not body_text and pending_body:
+                    body_text = pending_body
+                    extraction = dict(extraction)
+                    extraction["body"] = body_text
+                    if extraction.get("offsets"):
+                        offsets = dict(extraction["offsets"])
+                    else:
+                        offsets = {"json_start": json_start, "json_end": json_end, "suffix_at_end": True}
+                    shift = len(body_text)
+                    offsets["json_start"] = (offsets.get("json_start", -1) + shift) if offsets.get("json_start", -1) != -1 else -1
+                    offsets["json_end"] = (offsets.get("json_end", -1) + shift) if offsets.get("json_end", -1) != -1 else -1
+                    extraction["offsets"] = offsets
+                    trailer_only_retry = True
+                    if body_text and not last_output.startswith(body_text):
+                        last_output = f"{body_text}{last_output}"
+                if len(results) == 1:
+                    pending_body = body_text
+                content = dict(payload.get("content") or {})
+                if body_text.strip():
+                    content.setdefault("body", body_text.strip())
+                payload["content"] = content
+
+                telemetry = _telemetry_from(
+                    result,
+                    extraction,
+                    failure_codes,
+                    attempt,
+                    totals,
+                    trailer_only_retry,
+                )
+                payload["telemetry"] = telemetry
+
+                envelope = envelope_from_payload(payload)
+                content_block = dict(envelope.get("content") or {})
+                control_meta = {
+                    "source": "control_trailer",
+                    "telemetry": telemetry,
+                    "raw_trailer": f"{CTRL_PREFIX}{trailer_json}{CTRL_SUFFIX}" if trailer_json else None,
+                    "body_preview": _truncate(body_text),
+                    "errors": list(failure_codes),
+                }
+                if control_meta["raw_trailer"] is None:
+                    control_meta.pop("raw_trailer")
+                if not control_meta["errors"]:
+                    control_meta.pop("errors")
+                content_block["control"] = control_meta
+                envelope["content"] = content_block
+                candidates.append((repair_envelope(envelope), last_output))
+
+            if candidates:
+                return _pick_sample(candidates, len(results))
 
         fallback: Dict[str, Any] = {
             "tag": "[CONTACT]",
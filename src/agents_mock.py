@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
+import copy
+import json
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
 
 from .strategies import Strategy
 from .utils import sha256_hex
@@ -84,4 +86,38 @@ class ConciseTextAgent:
         return payload, payload["text"]
 
 
-__all__ = ["MockAgent", "ConciseTextAgent"]
+class ScriptedAgent:
+    """Mock agent that replays a fixed list of envelopes, one per turn.
+
+    Each turn returns a deep copy of the next scripted envelope (the last one
+    repeats once the script runs out) and its JSON text as the raw output, so
+    controller benchmarks can exercise repair, DSL and handshake paths
+    without a model.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        script: Sequence[Mapping[str, Any]],
+        *,
+        strategy: Optional[Strategy] = None,
+    ) -> None:
+        if not script:
+            raise ValueError("ScriptedAgent needs at least one envelope")
+        self.name = name
+        self.strategy = strategy or Strategy(id="scripted", name=f"{name}-scripted")
+        self._script = [dict(envelope) for envelope in script]
+        self._turn = 0
+
+    def step(
+        self,
+        task: str,
+        transcript: List[Dict[str, Any]],
+        preparation: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Dict[str, Any], str]:
+        envelope = copy.deepcopy(self._script[min(self._turn, len(self._script) - 1)])
+        self._turn += 1
+        return envelope, json.dumps(envelope)
+
+
+__all__ = ["MockAgent", "ConciseTextAgent", "ScriptedAgent"]
@@ -0,0 +1,183 @@
+"""Run many controller dialogs concurrently on a shared generation worker.
+
+``run_controller`` alternates GPU generation with CPU-side work (envelope
+repair, pydantic/DSL/schema validation, handshake tracking) and idles the
+device during the latter.  Here each dialog is a coroutine driving
+:func:`~src.controller.controller_steps`; agent steps are submitted to a
+:class:`GenerationWorker` whose single thread owns the model, while
+validation and result handling run on the event loop.  With several dialogs
+in flight the worker always has the next generation queued, so the CPU work
+of one dialog overlaps with generation for the others.
+
+Results have exactly the shape returned by ``run_controller``.  Agents must
+not be shared between concurrent dialogs (they keep per-dialog state); sharing
+the underlying model is fine because the worker serialises every step.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from .controller import DialogSteps, _call_step, controller_steps
+from .dsl import DSLValidator
+from .strategies import Strategy
+
+if TYPE_CHECKING:  # jsonschema is imported where a schema is first compiled
+    from jsonschema import Draft7Validator
+
+ResultCallback = Callable[[int, Dict[str, Any]], Optional[Awaitable[None]]]
+
+
+class GenerationWorker:
+    """Single-thread executor that runs agent steps one at a time."""
+
+    def __init__(self, *, name: str = "generation") -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.busy_seconds = 0.0
+
+    def _run(self, request: tuple) -> Any:
+        start = time.perf_counter()
+        try:
+            return _call_step(*request)
+        finally:
+            with self._lock:
+                self.calls += 1
+                self.busy_seconds += time.perf_counter() - start
+
+    async def step(self, request: tuple) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run, request)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "GenerationWorker":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+@dataclass
+class Scenario:
+    """Arguments of one ``run_controller`` call."""
+
+    task: str
+    agent_a: Any
+    agent_b: Any
+    max_rounds: int = 8
+    kind: Optional[str] = None
+    dsl_validator: Optional[DSLValidator] = None
+    schema_validator: Optional[Draft7Validator] = None
+    strategy: Optional[Strategy] = None
+
+    def steps(self) -> DialogSteps:
+        return controller_steps(
+            self.task,
+            self.agent_a,
+            self.agent_b,
+            self.max_rounds,
+            kind=self.kind,
+            dsl_validator=self.dsl_validator,
+            schema_validator=self.schema_validator,
+            strategy=self.strategy,
+        )
+
+
+async def drive_steps(dialog: DialogSteps, worker: GenerationWorker) -> Dict[str, Any]:
+    """Async counterpart of :func:`~src.controller.run_steps`."""
+
+    try:
+        request = next(dialog)
+        while True:
+            reply = await worker.step(request)
+            request = dialog.send(reply)
+    except StopIteration as done:
+        return done.value
+    finally:
+        dialog.close()
+
+
+async def run_controller_async(
+    task: str,
+    agent_a: Any,
+    agent_b: Any,
+    max_rounds: int = 8,
+    *,
+    kind: Optional[str] = None,
+    dsl_validator: Optional[DSLValidator] = None,
+    schema_validator: Optional[Draft7Validator] = None,
+    strategy: Optional[Strategy] = None,
+    worker: Optional[GenerationWorker] = None,
+) -> Dict[str, Any]:
+    scenario = Scenario(task, agent_a, agent_b, max_rounds, kind, dsl_validator, schema_validator, strategy)
+    if worker is not None:
+        return await drive_steps(scenario.steps(), worker)
+    with GenerationWorker() as own:
+        return await drive_steps(scenario.steps(), own)
+
+
+async def run_scenarios_async(
+    scenarios: Sequence[Scenario],
+    *,
+    worker: Optional[GenerationWorker] = None,
+    max_active: Optional[int] = None,
+    on_result: Optional[ResultCallback] = None,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """Run ``scenarios`` concurrently; results come back in input order.
+
+    ``max_active`` caps the number of dialogs in flight (default: all).
+    ``on_result(index, result)`` is called on the event loop as each dialog
+    finishes, so logging one result overlaps with generation for the rest; it
+    may be a coroutine function.  With ``return_exceptions`` a failing dialog
+    yields its exception in place of a result instead of aborting the batch.
+    """
+
+    own_worker = worker is None
+    worker = worker or GenerationWorker()
+    gate = asyncio.Semaphore(max_active) if max_active else None
+
+    async def _one(index: int, scenario: Scenario) -> Dict[str, Any]:
+        if gate is not None:
+            async with gate:
+                result = await drive_steps(scenario.steps(), worker)
+        else:
+            result = await drive_steps(scenario.steps(), worker)
+        if on_result is not None:
+            pending = on_result(index, result)
+            if asyncio.iscoroutine(pending):
+                await pending
+        return result
+
+    try:
+        return await asyncio.gather(
+            *(_one(idx, scenario) for idx, scenario in enumerate(scenarios)),
+            return_exceptions=return_exceptions,
+        )
+    finally:
+        if own_worker:
+            worker.close()
+
+
+def run_scenarios(scenarios: Sequence[Scenario], **kwargs: Any) -> List[Any]:
+    """Blocking wrapper around :func:`run_scenarios_async`."""
+
+    return asyncio.run(run_scenarios_async(scenarios, **kwargs))
+
+
+__all__ = [
+    "GenerationWorker",
+    "Scenario",
+    "drive_steps",
+    "run_controller_async",
+    "run_scenarios",
+    "run_scenarios_async",
+]
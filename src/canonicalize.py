@@ -1,7 +1,6 @@
 from __future__ import annotations
 import json, re
 from decimal import Decimal
-import sqlparse
 
 def _looks_like_json(text: str) -> bool:
     t = text.strip()
@@ -37,6 +36,8 @@ def canonicalize_for_hash(text: str, kind: str | None = None) -> str:
         stripped = re.sub(r"/\*.*?\*/", " ", s, flags=re.DOTALL)
         stripped = re.sub(r"--.*?(?=\n|$)", " ", stripped)
         try:
+            import sqlparse  # deferred: only SQL answers need it
+
             formatted = sqlparse.format(stripped, keyword_case="upper", strip_comments=True)
         except Exception:
             return " ".join(stripped.split())
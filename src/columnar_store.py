@@ -0,0 +1,405 @@
+"""Partitioned Parquet store for matrix rows and run records.
+
+``matrix_results.csv`` and the logger CSVs take their columns from whatever
+keys the rows happen to have, and every analysis re-parses them as text.
+:class:`ColumnarSink` buffers rows (``build_row`` output from the matrix
+runners or ``build_run_record`` output from :func:`~src.logger.record_run`)
+and writes them as Parquet files under hive-style partitions::
+
+    <root>/dt=2025-10-21/model=mistralai__Mistral-7B/strategy=JSON_SCHEMA/part-....parquet
+
+Known columns always get the type in :data:`COLUMN_TYPES`; other columns are
+typed from their values (nested values are stored as JSON strings).  Every file
+carries its own schema and :func:`read_rows` unifies them on read -- columns
+missing from older files come back as ``None`` and conflicting types are
+widened (``int64`` → ``float64`` → ``string``) -- so adding a metric never
+requires rewriting earlier partitions, and concurrent writers share no state.
+
+``pyarrow`` is optional; it is imported when a sink is created or a store is
+read.  :func:`strategy_aggregates` reads only the grouping, latency and token
+columns of the partitions that match its filters.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+COLUMN_TYPES: Dict[str, str] = {
+    **dict.fromkeys(
+        (
+            "timestamp git_rev task_id strategy roleset model_a model_b last_stop_reason "
+            "out_jsonl out_csv cache_key scenario_id strategy_id status canonical_text sha256 "
+            "final_actor final_canonical first_error proposer acceptor"
+        ).split(),
+        "string",
+    ),
+    **dict.fromkeys(
+        (
+            "turns repeat_idx seed total_prompt_tokens total_output_tokens first_hit_turn "
+            "batch_size rounds transcript_turns trailer_missing_ct invalid_trailer_ct "
+            "retry_count retries_total stopped_on_ctrl_ct handshake_error_ct first_valid_round "
+            "first_proposal_round solved_round stopped_on_ctrl stopped_on_eos stopped_on_max_new "
+            "legacy_turns overflow_turns draft_tokens_total"
+        ).split(),
+        "int64",
+    ),
+    **dict.fromkeys(
+        (
+            "elapsed_sec tokens_per_sec duration_s avg_body_len avg_trailer_len "
+            "avg_tokens_reserved max_overflow tokens_used_trailer_total "
+            "tokens_used_body_total tokens_used_total draft_acceptance"
+        ).split(),
+        "float64",
+    ),
+    "cache_hit": "bool",
+    "needs_higher_reserve": "bool",
+}
+
+LATENCY_COLUMNS = ("elapsed_sec", "duration_s")
+TOKEN_COLUMNS = ("total_prompt_tokens", "total_output_tokens", "tokens_used_total")
+PARTITION_KEYS = ("dt", "model", "strategy")
+DEFAULT_BATCH_ROWS = 256
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:  # pragma: no cover - depends on the environment
+        raise ImportError("the columnar store needs pyarrow (pip install pyarrow)") from exc
+    return pa, pq
+
+
+# -- typing -------------------------------------------------------------------
+
+
+def infer_type(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int64"
+    if isinstance(value, float):
+        return "float64"
+    return "string"
+
+
+def widen(left: Optional[str], right: Optional[str]) -> Optional[str]:
+    """Smallest type that holds values of both ``left`` and ``right``."""
+
+    if left is None or left == right:
+        return right
+    if right is None:
+        return left
+    if {left, right} <= {"int64", "float64"}:
+        return "float64"
+    return "string"
+
+
+def coerce(value: Any, kind: str) -> Any:
+    if value is None:
+        return None
+    if kind == "string":
+        if isinstance(value, (Mapping, list, tuple)):
+            return json.dumps(value, ensure_ascii=False, sort_keys=True)
+        return str(value)
+    if kind == "bool":
+        if isinstance(value, str):
+            return value.strip().lower() in {"1", "true", "yes"}
+        return bool(value)
+    if kind == "int64":
+        if isinstance(value, str) and not value.strip():
+            return None
+        return int(value)
+    if kind == "float64":
+        if isinstance(value, str) and not value.strip():
+            return None
+        number = float(value)
+        return None if math.isnan(number) else number
+    raise ValueError(f"unknown column type {kind!r}")
+
+
+def batch_schema(rows: Sequence[Mapping[str, Any]]) -> Dict[str, str]:
+    """Column types for ``rows``: :data:`COLUMN_TYPES` first, inferred otherwise."""
+
+    schema: Dict[str, Optional[str]] = {}
+    for row in rows:
+        for key, value in row.items():
+            if key in COLUMN_TYPES:
+                schema[key] = COLUMN_TYPES[key]
+            else:
+                schema[key] = widen(schema.get(key), infer_type(value))
+    return {key: kind or "string" for key, kind in schema.items()}
+
+
+def unify_schemas(schemas: Iterable[Mapping[str, str]]) -> Dict[str, str]:
+    merged: Dict[str, str] = {}
+    for schema in schemas:
+        for key, kind in schema.items():
+            merged[key] = widen(merged.get(key), kind) or "string"
+    return merged
+
+
+# -- partitions ---------------------------------------------------------------
+
+
+def _safe(value: Any) -> str:
+    text = str(value or "unknown").replace("/", "__")
+    return re.sub(r"[^A-Za-z0-9._=-]+", "_", text) or "unknown"
+
+
+def partition_of(row: Mapping[str, Any]) -> Tuple[str, str, str]:
+    """``(dt, model, strategy)`` partition values of a matrix row or run record."""
+
+    stamp = str(row.get("timestamp") or "")
+    day = stamp[:10] if re.match(r"\d{4}-\d{2}-\d{2}", stamp) else datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    return day, _safe(row.get("model_a")), _safe(row.get("strategy") or row.get("strategy_id"))
+
+
+def partition_dir(root: str, partition: Sequence[str]) -> str:
+    return os.path.join(root, *(f"{key}={value}" for key, value in zip(PARTITION_KEYS, partition)))
+
+
+def _matches(partition: Mapping[str, str], filters: Mapping[str, Any]) -> bool:
+    for key, wanted in filters.items():
+        if key not in partition:
+            continue
+        allowed = {_safe(v) for v in wanted} if isinstance(wanted, (list, tuple, set)) else {_safe(wanted)}
+        if partition[key] not in allowed:
+            return False
+    return True
+
+
+def partition_files(root: str, filters: Optional[Mapping[str, Any]] = None) -> List[str]:
+    """Parquet files under ``root`` whose ``dt``/``model``/``strategy`` match ``filters``."""
+
+    filters = {k: v for k, v in (filters or {}).items() if k in PARTITION_KEYS}
+    found: List[str] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        parts = dict(p.split("=", 1) for p in rel.split(os.sep) if "=" in p)
+        if not _matches(parts, filters):
+            dirnames[:] = []
+            continue
+        dirnames.sort()
+        found.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith(".parquet"))
+    return found
+
+
+# -- writing ------------------------------------------------------------------
+
+
+def _arrow_type(pa: Any, kind: str) -> Any:
+    return {"bool": pa.bool_(), "int64": pa.int64(), "float64": pa.float64(), "string": pa.string()}[kind]
+
+
+def _kind_of(pa: Any, arrow_type: Any) -> str:
+    if pa.types.is_boolean(arrow_type):
+        return "bool"
+    if pa.types.is_integer(arrow_type):
+        return "int64"
+    if pa.types.is_floating(arrow_type):
+        return "float64"
+    return "string"
+
+
+class ColumnarSink:
+    """Buffer rows and write them to ``root`` as partitioned Parquet files."""
+
+    def __init__(self, root: str, *, batch_rows: int = DEFAULT_BATCH_ROWS) -> None:
+        self._pa, self._pq = _require_pyarrow()
+        self.root = root
+        self.batch_rows = max(int(batch_rows), 1)
+        self.rows_written = 0
+        self.files_written = 0
+        self._pending: List[Dict[str, Any]] = []
+        os.makedirs(root, exist_ok=True)
+
+    def append(self, row: Mapping[str, Any]) -> None:
+        self._pending.append(dict(row))
+        if len(self._pending) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        groups: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = defaultdict(list)
+        for row in pending:
+            groups[partition_of(row)].append(row)
+        for partition, rows in groups.items():
+            self._write(partition, rows)
+
+    def _write(self, partition: Tuple[str, str, str], rows: List[Dict[str, Any]]) -> None:
+        pa, pq = self._pa, self._pq
+        schema = batch_schema(rows)
+        columns = {}
+        for name, kind in schema.items():
+            try:
+                values = [coerce(row.get(name), kind) for row in rows]
+            except (TypeError, ValueError) as exc:
+                raise ValueError(f"column {name!r} does not fit type {kind}: {exc}") from exc
+            columns[name] = pa.array(values, type=_arrow_type(pa, kind))
+        directory = partition_dir(self.root, partition)
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        final = os.path.join(directory, f"part-{stamp}-{uuid.uuid4().hex[:12]}.parquet")
+        tmp = final + ".tmp"
+        pq.write_table(pa.table(columns), tmp)
+        os.replace(tmp, final)
+        self.rows_written += len(rows)
+        self.files_written += 1
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "ColumnarSink":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+
+# -- reading ------------------------------------------------------------------
+
+
+def read_rows(
+    root: str,
+    *,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[Mapping[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Rows of every matching file, with schemas unified across files.
+
+    ``columns`` restricts which columns are read from disk; columns a file does
+    not have come back as ``None``.
+    """
+
+    pa, pq = _require_pyarrow()
+    tables = []
+    for path in partition_files(root, filters):
+        available = set(pq.read_schema(path).names)
+        wanted = [c for c in columns if c in available] if columns is not None else None
+        tables.append(pq.read_table(path, columns=wanted))
+    merged = unify_schemas({f.name: _kind_of(pa, f.type) for f in table.schema} for table in tables)
+    names = list(columns) if columns is not None else list(merged)
+    rows: List[Dict[str, Any]] = []
+    for table in tables:
+        data = table.to_pydict()
+        for idx in range(table.num_rows):
+            rows.append(
+                {
+                    name: coerce(data[name][idx], merged[name]) if name in data else None
+                    for name in names
+                }
+            )
+    return rows
+
+
+def _quantile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def aggregate_rows(
+    rows: Iterable[Mapping[str, Any]],
+    *,
+    group_by: Sequence[str] = ("strategy",),
+    latency: str = "elapsed_sec",
+    tokens: Sequence[str] = TOKEN_COLUMNS,
+) -> List[Dict[str, Any]]:
+    """Per-group count, latency mean/p50/p95 and token sums/means."""
+
+    groups: Dict[Tuple[Any, ...], List[Mapping[str, Any]]] = defaultdict(list)
+    for row in rows:
+        groups[tuple(row.get(key) for key in group_by)].append(row)
+
+    out: List[Dict[str, Any]] = []
+    for key in sorted(groups, key=lambda k: tuple(str(v) for v in k)):
+        members = groups[key]
+        entry: Dict[str, Any] = dict(zip(group_by, key))
+        entry["runs"] = len(members)
+        lat = [float(r[latency]) for r in members if r.get(latency) is not None]
+        if lat:
+            entry[f"{latency}_mean"] = round(sum(lat) / len(lat), 4)
+            entry[f"{latency}_p50"] = round(_quantile(lat, 0.5), 4)
+            entry[f"{latency}_p95"] = round(_quantile(lat, 0.95), 4)
+        for column in tokens:
+            values = [float(r[column]) for r in members if r.get(column) is not None]
+            if values:
+                entry[f"{column}_sum"] = sum(values)
+                entry[f"{column}_mean"] = round(sum(values) / len(values), 2)
+        out.append(entry)
+    return out
+
+
+def strategy_aggregates(
+    root: str,
+    *,
+    group_by: Sequence[str] = ("strategy",),
+    filters: Optional[Mapping[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """Latency and token aggregates per strategy from the columnar store.
+
+    Only the grouping, latency and token columns are read; ``filters`` on
+    ``dt``/``model``/``strategy`` prune whole partitions before any file is
+    opened.
+    """
+
+    pa, pq = _require_pyarrow()
+    files = partition_files(root, filters)
+    available = set()
+    for path in files:
+        available.update(pq.read_schema(path).names)
+    latency = next((c for c in LATENCY_COLUMNS if c in available), LATENCY_COLUMNS[0])
+    tokens = [c for c in TOKEN_COLUMNS if c in available]
+    columns = [*group_by, latency, *tokens]
+    if "strategy" in group_by:
+        columns.append("strategy_id")  # run records name the column strategy_id
+    rows = read_rows(root, columns=columns, filters=filters)
+    for row in rows:
+        strategy_id = row.pop("strategy_id", None)
+        if "strategy" in group_by and row.get("strategy") is None:
+            row["strategy"] = strategy_id
+    return aggregate_rows(rows, group_by=group_by, latency=latency, tokens=tokens)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    import argparse
+
+    ap = argparse.ArgumentParser("per-strategy aggregates from a Parquet results store")
+    ap.add_argument("root")
+    ap.add_argument("--group-by", default="strategy", help="Comma list of columns")
+    ap.add_argument("--model", default=None, help="Only this model partition")
+    ap.add_argument("--dt", default=None, help="Only this date partition (YYYY-MM-DD)")
+    args = ap.parse_args(argv)
+
+    filters = {k: v for k, v in (("model", args.model), ("dt", args.dt)) if v}
+    group_by = [c.strip() for c in args.group_by.split(",") if c.strip()]
+    for entry in strategy_aggregates(args.root, group_by=group_by, filters=filters):
+        print(json.dumps(entry, ensure_ascii=False))
+
+
+__all__ = [
+    "COLUMN_TYPES",
+    "ColumnarSink",
+    "aggregate_rows",
+    "batch_schema",
+    "partition_files",
+    "partition_of",
+    "read_rows",
+    "strategy_aggregates",
+    "unify_schemas",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,876 @@
+"""Grammar-constrained decoding for JSON envelopes.
+
+The envelope contract (``schemas/envelope.schema.json`` plus the ``content.acl``
+rule enforced by :mod:`src.agents_hf`, or the DSL grammar from :mod:`src.dsl`)
+is compiled into a regular language over characters: key order is fixed and
+free-form objects are narrowed to the fields the controller reads, which keeps
+the language regular while every string it accepts still validates.
+
+The language is turned into a lazily-built DFA.  Per tokenizer, the decoded
+vocabulary is stored as a character trie; walking the trie alongside the DFA
+yields the set of tokens allowed from a DFA state, which is memoised together
+with each token's successor state.  :class:`EnvelopeLogitsProcessor` applies
+those masks row by row during ``generate``.
+
+Compiled grammars are cached per schema hash and token masks per
+``(schema hash, tokenizer)``, so the walk over the vocabulary happens once per
+process for each DFA state that is actually visited.  Per grammar, the most
+recently used ``MAX_STATE_ENTRIES`` successor tables and ``MAX_MASK_ENTRIES``
+masks are kept; older ones are rebuilt on demand.  Tokenizers are tracked
+through weak references, so their vocabulary tries and grammars are dropped
+when they are collected, and at most ``MAX_TOKEN_INDEXES`` tries and
+``MAX_TOKEN_GRAMMARS`` grammars are kept at once.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import torch
+from transformers import LogitsProcessor
+
+from .dsl import DSLValidator
+from .utils import ALLOWED_PERFORMATIVES
+from .weak_owners import WeakOwnerIndex
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schemas" / "envelope.schema.json"
+
+MAX_STATE_ENTRIES = 4096
+MAX_MASK_ENTRIES = 512  # one bool per vocabulary entry each
+MAX_TOKEN_INDEXES = 8  # one character trie over the whole vocabulary each
+MAX_TOKEN_GRAMMARS = 64
+
+# ---------------------------------------------------------------------------
+# Regular-expression AST.  Nodes are plain tuples so they hash and compare.
+# ---------------------------------------------------------------------------
+
+Node = Tuple[Any, ...]
+
+
+@dataclass(frozen=True)
+class CharSet:
+    chars: FrozenSet[str]
+    negated: bool = False
+
+    def __contains__(self, ch: object) -> bool:
+        return (ch in self.chars) != self.negated
+
+
+def lit(text: str) -> Node:
+    return ("lit", text)
+
+
+def cset(chars: Iterable[str], *, negated: bool = False) -> Node:
+    return ("set", CharSet(frozenset(chars), negated))
+
+
+def seq(*parts: Node) -> Node:
+    return ("seq", tuple(parts))
+
+
+def alt(*parts: Node) -> Node:
+    return ("alt", tuple(parts))
+
+
+def star(node: Node) -> Node:
+    return ("star", node)
+
+
+def plus(node: Node) -> Node:
+    return seq(node, star(node))
+
+
+def opt(node: Node) -> Node:
+    return alt(node, seq())
+
+
+_CONTROL_CHARS = frozenset(chr(i) for i in range(0x20))
+_HEX = "0123456789abcdefABCDEF"
+WS = opt(lit(" "))
+
+# One character of a JSON string body: a raw safe character or an escape.
+STRING_CHAR = alt(
+    cset(_CONTROL_CHARS | {'"', "\\"}, negated=True),
+    seq(lit("\\"), cset('"\\/bfnrt')),
+    seq(lit("\\u"), cset(_HEX), cset(_HEX), cset(_HEX), cset(_HEX)),
+)
+# First character of a string that must not be blank after ``strip()``.
+VISIBLE_CHAR = cset(_CONTROL_CHARS | {'"', "\\", " ", "\u00a0"}, negated=True)
+
+
+def json_string(body: Optional[Node] = None) -> Node:
+    return seq(lit('"'), body if body is not None else star(STRING_CHAR), lit('"'))
+
+
+def nonempty_string() -> Node:
+    return json_string(seq(VISIBLE_CHAR, star(STRING_CHAR)))
+
+
+def containing_string(marker: str) -> Node:
+    return json_string(seq(star(STRING_CHAR), lit(marker), star(STRING_CHAR)))
+
+
+def json_literal(value: Any) -> Node:
+    return lit(json.dumps(value, ensure_ascii=False))
+
+
+def json_object(fields: Sequence[Tuple[str, Node, bool]]) -> Node:
+    """Object with fixed key order; ``fields`` are ``(key, value, required)``."""
+
+    if not fields:
+        return lit("{}")
+    if not fields[0][2]:
+        raise ValueError("the first field of a constrained object must be required")
+    parts: List[Node] = [lit("{"), WS]
+    for index, (key, value, required) in enumerate(fields):
+        member = seq(json_literal(key), WS, lit(":"), WS, value)
+        if index:
+            member = seq(WS, lit(","), WS, member)
+        parts.append(member if required else opt(member))
+    parts.extend([WS, lit("}")])
+    return seq(*parts)
+
+
+# ---------------------------------------------------------------------------
+# JSON-Schema ``pattern`` subset: literals, escapes, classes, groups, ``|``,
+# ``* + ?`` and ``{m,n}``.
+# ---------------------------------------------------------------------------
+
+_ESCAPE_CLASSES = {
+    "d": frozenset("0123456789"),
+    "w": frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_"),
+    "s": frozenset(" \t\n\r\f\v"),
+}
+# Pattern characters are matched against the decoded string, but the model
+# emits them inside a JSON string; characters that would need escaping are
+# excluded so a pattern never produces invalid JSON.
+_UNSAFE_IN_STRING = _CONTROL_CHARS | {'"', "\\"}
+
+
+class _PatternParser:
+    def __init__(self, pattern: str) -> None:
+        self.text = pattern
+        self.pos = 0
+
+    def parse(self) -> Node:
+        anchored_start = self.text.startswith("^")
+        if anchored_start:
+            self.pos = 1
+        node = self._alternation()
+        anchored_end = self.pos < len(self.text) and self.text[self.pos] == "$"
+        if anchored_end:
+            self.pos += 1
+        if self.pos != len(self.text):
+            raise ValueError(f"unsupported pattern syntax at {self.pos}: {self.text!r}")
+        if anchored_start and anchored_end:
+            return node
+        anything = star(STRING_CHAR)
+        return seq(
+            *(() if anchored_start else (anything,)),
+            node,
+            *(() if anchored_end else (anything,)),
+        )
+
+    def _peek(self) -> str:
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def _alternation(self) -> Node:
+        branches = [self._sequence()]
+        while self._peek() == "|":
+            self.pos += 1
+            branches.append(self._sequence())
+        return branches[0] if len(branches) == 1 else alt(*branches)
+
+    def _sequence(self) -> Node:
+        parts: List[Node] = []
+        while self._peek() and self._peek() not in "|)$":
+            parts.append(self._quantified(self._atom()))
+        return parts[0] if len(parts) == 1 else seq(*parts)
+
+    def _quantified(self, atom: Node) -> Node:
+        ch = self._peek()
+        if ch == "*":
+            self.pos += 1
+            return star(atom)
+        if ch == "+":
+            self.pos += 1
+            return plus(atom)
+        if ch == "?":
+            self.pos += 1
+            return opt(atom)
+        if ch == "{":
+            end = self.text.index("}", self.pos)
+            low_text, comma, high_text = self.text[self.pos + 1 : end].partition(",")
+            self.pos = end + 1
+            low = int(low_text or 0)
+            repeated = [atom] * low
+            if not comma:
+                return seq(*repeated)
+            if not high_text:
+                return seq(*repeated, star(atom))
+            return seq(*repeated, *[opt(atom)] * (int(high_text) - low))
+        return atom
+
+    def _atom(self) -> Node:
+        ch = self._peek()
+        self.pos += 1
+        if ch == "(":
+            if self.text.startswith("?:", self.pos):
+                self.pos += 2
+            node = self._alternation()
+            if self._peek() != ")":
+                raise ValueError(f"unbalanced group in pattern {self.text!r}")
+            self.pos += 1
+            return node
+        if ch == "[":
+            return self._char_class()
+        if ch == ".":
+            return cset(_UNSAFE_IN_STRING, negated=True)
+        if ch == "\\":
+            escaped = self._peek()
+            self.pos += 1
+            if escaped in _ESCAPE_CLASSES:
+                return ("set", CharSet(_ESCAPE_CLASSES[escaped] - _UNSAFE_IN_STRING))
+            return self._literal_char(escaped)
+        return self._literal_char(ch)
+
+    @staticmethod
+    def _literal_char(ch: str) -> Node:
+        if ch in _UNSAFE_IN_STRING:
+            return lit(json.dumps(ch)[1:-1])
+        return lit(ch)
+
+    def _char_class(self) -> Node:
+        negated = self._peek() == "^"
+        if negated:
+            self.pos += 1
+        chars: set = set()
+        first = True
+        while first or self._peek() != "]":
+            first = False
+            ch = self.text[self.pos]
+            self.pos += 1
+            if ch == "\\":
+                ch = self.text[self.pos]
+                self.pos += 1
+                if ch in _ESCAPE_CLASSES:
+                    chars |= _ESCAPE_CLASSES[ch]
+                    continue
+            if self._peek() == "-" and self.text[self.pos + 1 : self.pos + 2] not in ("]", ""):
+                end = self.text[self.pos + 1]
+                self.pos += 2
+                chars |= {chr(c) for c in range(ord(ch), ord(end) + 1)}
+            else:
+                chars.add(ch)
+        self.pos += 1
+        if negated:
+            return cset(set(chars) | _UNSAFE_IN_STRING, negated=True)
+        return cset(set(chars) - _UNSAFE_IN_STRING)
+
+
+def pattern_node(pattern: str) -> Node:
+    """Body of a JSON string whose decoded value matches ``pattern``."""
+
+    return _PatternParser(pattern).parse()
+
+
+def _words_except(chars: CharSet, word: str) -> Node:
+    """Non-empty strings over ``chars`` other than ``word``."""
+
+    letter = ("set", chars)
+    branches: List[Node] = [lit(word[:i]) for i in range(1, len(word))]
+    for i, ch in enumerate(word):
+        others = CharSet(chars.chars - {ch}, False) if not chars.negated else CharSet(chars.chars | {ch}, True)
+        branches.append(seq(lit(word[:i]), ("set", others), star(letter)))
+    branches.append(seq(lit(word), plus(letter)))
+    return alt(*branches)
+
+
+def _pattern_except(pattern: str, value: str) -> Optional[Node]:
+    """``pattern`` minus the single string ``value``, for ``lit* set+ lit*`` shapes."""
+
+    node = pattern_node(pattern)
+    parts = list(node[1]) if node[0] == "seq" else [node]
+    prefix, suffix, letters = "", "", None
+    for part in parts:
+        if part[0] == "lit" and letters is None:
+            prefix += part[1]
+        elif part[0] == "lit":
+            suffix += part[1]
+        elif (
+            letters is None
+            and part[0] == "seq"
+            and len(part[1]) == 2
+            and part[1][0][0] == "set"
+            and part[1][1] == ("star", part[1][0])
+        ):
+            letters = part[1][0][1]
+        else:
+            return None
+    if letters is None or not value.startswith(prefix) or not value.endswith(suffix):
+        return None
+    word = value[len(prefix) : len(value) - len(suffix)]
+    if not word or any(ch not in letters for ch in word):
+        return node
+    return seq(lit(prefix), _words_except(letters, word), lit(suffix))
+
+
+# ---------------------------------------------------------------------------
+# Envelope grammars
+# ---------------------------------------------------------------------------
+
+
+def acl_string(performatives: Sequence[str] = ALLOWED_PERFORMATIVES) -> Node:
+    """``"INTENT: message [=> next_action]"`` as accepted by ``parse_acl_message``."""
+
+    text = seq(VISIBLE_CHAR, star(STRING_CHAR))
+    return json_string(
+        seq(
+            alt(*[lit(p) for p in performatives]),
+            lit(": "),
+            text,
+            opt(seq(lit(" => "), text)),
+        )
+    )
+
+
+def acl_content() -> Node:
+    return json_object([("acl", acl_string(), True)])
+
+
+def final_solution_object() -> Node:
+    return json_object([("canonical_text", nonempty_string(), True)])
+
+
+def _value_node(schema: Mapping[str, Any]) -> Node:
+    if "const" in schema:
+        return json_literal(schema["const"])
+    if "enum" in schema:
+        return alt(*[json_literal(v) for v in schema["enum"]])
+    types = schema.get("type")
+    if isinstance(types, list):
+        types = next((t for t in types if t != "null"), "null")
+    if types == "string":
+        if schema.get("pattern"):
+            return json_string(pattern_node(str(schema["pattern"])))
+        if int(schema.get("minLength", 0) or 0) > 0:
+            return nonempty_string()
+        return json_string()
+    if types == "object":
+        properties = schema.get("properties") or {}
+        required = [k for k in properties if k in set(schema.get("required") or [])]
+        return json_object([(k, _value_node(properties[k]), True) for k in required])
+    if types == "boolean":
+        return alt(lit("true"), lit("false"))
+    if types == "integer":
+        return seq(opt(lit("-")), alt(lit("0"), seq(cset("123456789"), star(cset("0123456789")))))
+    if types == "null":
+        return lit("null")
+    return json_string()
+
+
+def _split_on_const(schema: Mapping[str, Any], value: Any) -> Tuple[Optional[Node], Optional[Node], bool]:
+    """Return ``(equal, different, exact)`` languages for ``property == value``."""
+
+    equal = json_literal(value)
+    if "enum" in schema:
+        others = [v for v in schema["enum"] if v != value]
+        return equal, (alt(*[json_literal(v) for v in others]) if others else None), True
+    pattern = schema.get("pattern")
+    if isinstance(value, str) and pattern:
+        if not re.search(pattern, value):
+            return None, _value_node(schema), True
+        different = _pattern_except(str(pattern), value)
+        if different is not None:
+            return equal, json_string(different), True
+    return equal, _value_node(schema), False
+
+
+def compile_schema(
+    schema: Mapping[str, Any],
+    *,
+    overrides: Optional[Mapping[str, Node]] = None,
+    include: Sequence[str] = (),
+) -> Node:
+    """Compile an object schema with ``allOf`` if-const/then-required rules."""
+
+    properties: Mapping[str, Any] = schema.get("properties") or {}
+    overrides = dict(overrides or {})
+    required = set(schema.get("required") or []) | set(overrides)
+    keys = [k for k in properties if k in required or k in include]
+    keys += [k for k in overrides if k not in keys]
+
+    conditions: List[Tuple[str, Any, List[str]]] = []
+    for clause in schema.get("allOf") or []:
+        cond = (clause.get("if") or {}).get("properties") or {}
+        then_required = list((clause.get("then") or {}).get("required") or [])
+        for prop, rule in cond.items():
+            if isinstance(rule, Mapping) and "const" in rule and prop in properties:
+                conditions.append((prop, rule["const"], then_required))
+
+    # Each case fixes, per condition, whether the trigger property equals the
+    # constant; the object grammar is the union over all consistent cases.
+    cases: List[Tuple[Dict[str, Node], set]] = [({}, set())]
+    for prop, value, then_required in conditions:
+        equal, different, exact = _split_on_const(properties[prop], value)
+        expanded: List[Tuple[Dict[str, Node], set]] = []
+        for fixed, extra in cases:
+            base = fixed.get(prop)
+            if equal is not None and (base is None or base == equal or base[0] == "alt"):
+                expanded.append(({**fixed, prop: equal}, extra | set(then_required)))
+            if different is not None and base != equal:
+                narrowed = different if base is None else base
+                needed = extra if exact else extra | set(then_required)
+                expanded.append(({**fixed, prop: narrowed}, needed))
+        cases = expanded
+
+    branches: List[Node] = []
+    for fixed, extra in cases:
+        fields = []
+        for key in keys + [k for k in sorted(extra) if k not in keys and k in properties]:
+            value = fixed.get(key) or overrides.get(key) or _value_node(properties[key])
+            fields.append((key, value, key in required or key in extra))
+        branches.append(json_object(fields))
+    return branches[0] if len(branches) == 1 else alt(*branches)
+
+
+def envelope_grammar(schema: Optional[Mapping[str, Any]] = None) -> Node:
+    """Grammar for JSON-mode replies: the envelope schema plus ``content.acl``."""
+
+    schema = schema if schema is not None else load_envelope_schema()
+    return compile_schema(schema, overrides={"content": acl_content()}, include=("final_solution",))
+
+
+def dsl_grammar(validator: DSLValidator) -> Node:
+    """Grammar for DSL envelopes accepted by ``validator`` and the JSON-mode checks."""
+
+    artifact_branches = []
+    for typ in validator.artifact_types:
+        required_keys = validator.artifact_content_rules.get(typ, [])
+        content = json_object([(k, nonempty_string(), True) for k in required_keys])
+        artifact_branches.append(json_object([("type", json_literal(typ), True), ("content", content, True)]))
+    item = nonempty_string()
+    needs = seq(lit("["), opt(seq(item, opt(seq(lit(","), WS, item, opt(seq(lit(","), WS, item)))))), lit("]"))
+
+    branches = []
+    for status in validator.allowed_status:
+        if status == "SOLVED":
+            tags = ["[SOLVED]"] if "[SOLVED]" in validator.allowed_tags else []
+            public = containing_string("[SOLVED]")
+        else:
+            tags = [t for t in validator.allowed_tags if t != "[SOLVED]"]
+            public = containing_string("[CONTACT]") if status == "NEED_PEER" else nonempty_string()
+        if not tags:
+            continue
+        fields = [
+            ("status", json_literal(status), True),
+            ("tag", alt(*[json_literal(t) for t in tags]), True),
+            ("role", nonempty_string(), True),
+            ("domain", nonempty_string(), True),
+            ("task_understanding", nonempty_string(), True),
+            ("public_message", public, True),
+            ("artifact", alt(*artifact_branches), True),
+            ("needs_from_peer", needs, True),
+            ("handoff_to", nonempty_string(), True),
+            ("content", acl_content(), True),
+            ("final_solution", final_solution_object(), status == "SOLVED"),
+        ]
+        branches.append(json_object(fields))
+    return alt(*branches)
+
+
+# ---------------------------------------------------------------------------
+# Automata
+# ---------------------------------------------------------------------------
+
+
+class CharDFA:
+    """Thompson NFA with lazily constructed subset-DFA states."""
+
+    def __init__(self, node: Node) -> None:
+        self._eps: List[List[int]] = []
+        self._edges: List[List[Tuple[Any, int]]] = []
+        start = self._new()
+        self._accept = self._build(node, start)
+        self._ids: Dict[FrozenSet[int], int] = {}
+        self._sets: List[FrozenSet[int]] = []
+        self._delta: List[Dict[str, int]] = []
+        self._accepting: List[bool] = []
+        self._lock = threading.Lock()
+        self.start = self._intern(self._closure({start}))
+
+    # -- NFA construction -------------------------------------------------
+    def _new(self) -> int:
+        self._eps.append([])
+        self._edges.append([])
+        return len(self._eps) - 1
+
+    def _build(self, node: Node, start: int) -> int:
+        kind = node[0]
+        if kind == "lit":
+            current = start
+            for ch in node[1]:
+                nxt = self._new()
+                self._edges[current].append((ch, nxt))
+                current = nxt
+            return current
+        if kind == "set":
+            end = self._new()
+            self._edges[start].append((node[1], end))
+            return end
+        if kind == "seq":
+            current = start
+            for part in node[1]:
+                current = self._build(part, current)
+            return current
+        if kind == "alt":
+            end = self._new()
+            for part in node[1]:
+                branch = self._new()
+                self._eps[start].append(branch)
+                self._eps[self._build(part, branch)].append(end)
+            return end
+        if kind == "star":
+            loop = self._new()
+            self._eps[start].append(loop)
+            self._eps[self._build(node[1], loop)].append(loop)
+            return loop
+        raise ValueError(f"unknown grammar node {kind!r}")
+
+    def _closure(self, states: Iterable[int]) -> FrozenSet[int]:
+        seen = set(states)
+        stack = list(seen)
+        while stack:
+            for nxt in self._eps[stack.pop()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return frozenset(seen)
+
+    def _intern(self, states: FrozenSet[int]) -> int:
+        sid = self._ids.get(states)
+        if sid is None:
+            sid = len(self._sets)
+            self._ids[states] = sid
+            self._sets.append(states)
+            self._delta.append({})
+            self._accepting.append(self._accept in states)
+        return sid
+
+    # -- DFA interface ----------------------------------------------------
+    @property
+    def size(self) -> int:
+        return len(self._sets)
+
+    def accepting(self, sid: int) -> bool:
+        return self._accepting[sid]
+
+    def step(self, sid: int, ch: str) -> int:
+        """Successor of ``sid`` on ``ch`` or ``-1`` when the text leaves the language."""
+
+        nxt = self._delta[sid].get(ch)
+        if nxt is not None:
+            return nxt
+        targets = [
+            target
+            for state in self._sets[sid]
+            for label, target in self._edges[state]
+            if (ch == label if isinstance(label, str) else ch in label)
+        ]
+        with self._lock:
+            nxt = self._intern(self._closure(targets)) if targets else -1
+            self._delta[sid][ch] = nxt
+        return nxt
+
+    def walk(self, sid: int, text: str) -> int:
+        for ch in text:
+            if sid < 0:
+                break
+            sid = self.step(sid, ch)
+        return sid
+
+    def matches(self, text: str) -> bool:
+        sid = self.walk(self.start, text)
+        return sid >= 0 and self.accepting(sid)
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.ids: List[int] = []
+
+
+class TokenIndex:
+    """Decoded vocabulary of a tokenizer arranged as a character trie."""
+
+    def __init__(self, tokenizer: Any) -> None:
+        special = {int(t) for t in (getattr(tokenizer, "all_special_ids", None) or []) if t is not None}
+        self.eos_token_id = getattr(tokenizer, "eos_token_id", None)
+        self.root = _TrieNode()
+        self.pieces: Dict[int, str] = {}
+        anchor = _encode(tokenizer, "\n")
+        anchor_text = tokenizer.decode(anchor) if anchor else ""
+        for token_id in range(len(tokenizer)):
+            if token_id in special:
+                continue
+            piece = tokenizer.decode(anchor + [token_id])[len(anchor_text) :] if anchor else tokenizer.decode([token_id])
+            if not piece:
+                continue
+            self.pieces[token_id] = piece
+            node = self.root
+            for ch in piece:
+                node = node.children.setdefault(ch, _TrieNode())
+            node.ids.append(token_id)
+
+
+def _encode(tokenizer: Any, text: str) -> List[int]:
+    try:
+        ids = tokenizer.encode(text, add_special_tokens=False)
+    except TypeError:
+        ids = tokenizer.encode(text)
+    return [int(t) for t in getattr(ids, "input_ids", ids)]
+
+
+class TokenGrammar:
+    """A :class:`CharDFA` bound to a :class:`TokenIndex` with memoised masks."""
+
+    def __init__(self, dfa: CharDFA, index: TokenIndex, key: str = "") -> None:
+        self.dfa = dfa
+        self.index = index
+        self.key = key
+        self._next: "OrderedDict[int, Dict[int, int]]" = OrderedDict()
+        self._masks: "OrderedDict[Tuple[int, int, str], torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _successors(self, sid: int) -> Dict[int, int]:
+        with self._lock:
+            table = self._next.get(sid)
+            if table is not None:
+                self._next.move_to_end(sid)
+                return table
+        table = {}
+        step = self.dfa.step
+        stack = [(self.index.root, sid)]
+        while stack:
+            node, state = stack.pop()
+            for ch, child in node.children.items():
+                nxt = step(state, ch)
+                if nxt < 0:
+                    continue
+                for token_id in child.ids:
+                    table[token_id] = nxt
+                if child.children:
+                    stack.append((child, nxt))
+        with self._lock:
+            self._next[sid] = table
+            while len(self._next) > MAX_STATE_ENTRIES:
+                self._next.popitem(last=False)
+        return table
+
+    def advance(self, sid: int, token_id: int) -> int:
+        """DFA state after ``token_id`` (``-1`` once the envelope is finished or broken)."""
+
+        if sid < 0:
+            return -1
+        return self._successors(sid).get(int(token_id), -1)
+
+    def blocked(self, sid: int, width: int, device: torch.device) -> torch.Tensor:
+        """Boolean mask of tokens that may *not* follow state ``sid``.
+
+        A state with no allowed token and no usable EOS id is left unmasked:
+        blocking the whole row would make every logit ``-inf`` and the
+        sampling probabilities NaN.  The row then leaves the grammar (its
+        state becomes ``-1``) and is generated unconstrained.
+        """
+
+        key = (sid, width, str(device))
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        allowed = [t for t in self._successors(sid) if t < width]
+        eos = self.index.eos_token_id
+        if eos is not None and int(eos) < width and (self.dfa.accepting(sid) or not allowed):
+            allowed.append(int(eos))
+        mask = torch.ones(width, dtype=torch.bool) if allowed else torch.zeros(width, dtype=torch.bool)
+        if allowed:
+            mask[torch.tensor(allowed, dtype=torch.long)] = False
+        mask = mask.to(device)
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > MAX_MASK_ENTRIES:
+                self._masks.popitem(last=False)
+        return mask
+
+
+class EnvelopeLogitsProcessor(LogitsProcessor):
+    """Restrict every row of a generation to continuations of the grammar."""
+
+    def __init__(self, grammar: TokenGrammar, *, input_length: int) -> None:
+        self.grammar = grammar
+        self.input_length = int(input_length)
+        self._states: List[int] = []
+        self._seen = self.input_length
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        batch, length = int(input_ids.shape[0]), int(input_ids.shape[-1])
+        if len(self._states) != batch or length < self._seen:
+            self._states = [self.grammar.dfa.start] * batch
+            self._seen = self.input_length
+        if length > self._seen:
+            for row, tokens in enumerate(input_ids[:, self._seen :].tolist()):
+                state = self._states[row]
+                for token in tokens:
+                    state = self.grammar.advance(state, token)
+                self._states[row] = state
+            self._seen = length
+        width = int(scores.shape[-1])
+        for row, state in enumerate(self._states):
+            if state >= 0:
+                scores[row].masked_fill_(self.grammar.blocked(state, width, scores.device), float("-inf"))
+        return scores
+
+
+# ---------------------------------------------------------------------------
+# Caches
+# ---------------------------------------------------------------------------
+
+_DFA_CACHE: Dict[str, CharDFA] = {}
+_TOKEN_INDEXES: "OrderedDict[Tuple[int, str, int], TokenIndex]" = OrderedDict()
+_TOKEN_GRAMMARS: "OrderedDict[Tuple[str, Tuple[int, str, int]], TokenGrammar]" = OrderedDict()
+_CACHE_LOCK = threading.RLock()
+
+
+def load_envelope_schema(path: Path = SCHEMA_PATH) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def schema_hash(schema: Any) -> str:
+    payload = json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _forget_tokenizer(owner: int) -> None:
+    with _CACHE_LOCK:
+        for tok_key in [k for k in _TOKEN_INDEXES if k[0] == owner]:
+            del _TOKEN_INDEXES[tok_key]
+        for key in [k for k in _TOKEN_GRAMMARS if k[1][0] == owner]:
+            del _TOKEN_GRAMMARS[key]
+
+
+_TOKENIZER_OWNERS = WeakOwnerIndex(_forget_tokenizer)
+
+
+def _tokenizer_key(tokenizer: Any) -> Optional[Tuple[int, str, int]]:
+    owner = _TOKENIZER_OWNERS.key(tokenizer)
+    if owner is None:
+        return None
+    return (owner, str(getattr(tokenizer, "name_or_path", "")), len(tokenizer))
+
+
+def compiled_dfa(key: str, build: Any) -> CharDFA:
+    with _CACHE_LOCK:
+        dfa = _DFA_CACHE.get(key)
+        if dfa is None:
+            dfa = CharDFA(build())
+            _DFA_CACHE[key] = dfa
+        return dfa
+
+
+def envelope_dfa(schema: Optional[Mapping[str, Any]] = None) -> Tuple[str, CharDFA]:
+    schema = schema if schema is not None else load_envelope_schema()
+    key = "schema:" + schema_hash(schema)
+    return key, compiled_dfa(key, lambda: envelope_grammar(schema))
+
+
+def dsl_dfa(validator: DSLValidator) -> Tuple[str, CharDFA]:
+    spec = {
+        "grammar": validator.grammar_sha256,
+        "status": sorted(validator.allowed_status),
+        "tags": sorted(validator.allowed_tags),
+        "artifacts": sorted(validator.artifact_types),
+        "rules": {k: list(v) for k, v in sorted(validator.artifact_content_rules.items())},
+    }
+    key = "dsl:" + schema_hash(spec)
+    return key, compiled_dfa(key, lambda: dsl_grammar(validator))
+
+
+def token_grammar(key: str, dfa: CharDFA, tokenizer: Any) -> TokenGrammar:
+    """Token-level grammar for ``dfa`` under ``tokenizer``, cached per tokenizer.
+
+    Tokenizers that cannot be weakly referenced get a fresh, uncached grammar.
+    """
+
+    tok_key = _tokenizer_key(tokenizer)
+    if tok_key is None:
+        return TokenGrammar(dfa, TokenIndex(tokenizer), key)
+    with _CACHE_LOCK:
+        bound = _TOKEN_GRAMMARS.get((key, tok_key))
+        if bound is not None:
+            _TOKEN_GRAMMARS.move_to_end((key, tok_key))
+            return bound
+        index = _TOKEN_INDEXES.get(tok_key)
+        if index is None:
+            index = TokenIndex(tokenizer)
+            _TOKEN_INDEXES[tok_key] = index
+            while len(_TOKEN_INDEXES) > MAX_TOKEN_INDEXES:
+                _TOKEN_INDEXES.popitem(last=False)
+        else:
+            _TOKEN_INDEXES.move_to_end(tok_key)
+        bound = TokenGrammar(dfa, index, key)
+        _TOKEN_GRAMMARS[(key, tok_key)] = bound
+        while len(_TOKEN_GRAMMARS) > MAX_TOKEN_GRAMMARS:
+            _TOKEN_GRAMMARS.popitem(last=False)
+        return bound
+
+
+def envelope_constraint(
+    tokenizer: Any,
+    *,
+    schema: Optional[Mapping[str, Any]] = None,
+    dsl_validator: Optional[DSLValidator] = None,
+) -> TokenGrammar:
+    """Cached token-level grammar for the envelope schema or a DSL validator."""
+
+    key, dfa = dsl_dfa(dsl_validator) if dsl_validator is not None else envelope_dfa(schema)
+    return token_grammar(key, dfa, tokenizer)
+
+
+def clear_caches() -> None:
+    with _CACHE_LOCK:
+        _DFA_CACHE.clear()
+        _TOKEN_INDEXES.clear()
+        _TOKEN_GRAMMARS.clear()
+
+
+__all__ = [
+    "CharDFA",
+    "EnvelopeLogitsProcessor",
+    "MAX_MASK_ENTRIES",
+    "MAX_STATE_ENTRIES",
+    "MAX_TOKEN_GRAMMARS",
+    "MAX_TOKEN_INDEXES",
+    "TokenGrammar",
+    "TokenIndex",
+    "clear_caches",
+    "compile_schema",
+    "dsl_dfa",
+    "dsl_grammar",
+    "envelope_constraint",
+    "envelope_dfa",
+    "envelope_grammar",
+    "load_envelope_schema",
+    "pattern_node",
+    "schema_hash",
+]
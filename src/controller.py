@@ -4,9 +4,8 @@ import inspect
 from collections import Counter
 from dataclasses import asdict
 from functools import lru_cache
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generator, List, Mapping, Optional, Tuple
 
-from jsonschema import Draft7Validator
 from pydantic import ValidationError
 
 from .canonicalize import canonicalize_for_hash
@@ -20,6 +19,9 @@ from .strategies import Strategy
 from .utils import ACLParseError, ACLParseResult, ALLOWED_PERFORMATIVES, parse_acl_message, sha256_hex
 from .validators import get_validator
 
+if TYPE_CHECKING:  # jsonschema is imported where a schema is first compiled
+    from jsonschema import Draft7Validator
+
 
 @lru_cache(maxsize=None)
 def _step_accepts_preparation(agent_cls: type) -> bool:
@@ -76,14 +78,15 @@ def _apply_pseudocode(env: Envelope) -> Envelope:
 def _checked(
     env_candidate: Any,
     dsl_validator: Optional[DSLValidator],
-) -> Tuple[Envelope, Dict[str, Any], Optional[DSLParseResult]]:
-    candidate = dict(env_candidate) if isinstance(env_candidate, dict) else {}
+) -> Tuple[Envelope, Optional[DSLParseResult]]:
+    # pydantic copies what it keeps and repair_envelope works on a copy, so the
+    # agent's dict is validated in place.
+    candidate = env_candidate if isinstance(env_candidate, dict) else {}
     try:
         env = Envelope.model_validate(candidate)
     except ValidationError:
-        repaired = repair_envelope(candidate)
-        env = Envelope.model_validate(repaired)
-        candidate = repaired
+        candidate = repair_envelope(candidate)
+        env = Envelope.model_validate(candidate)
     env = _apply_pseudocode(env)
 
     parsed: Optional[DSLParseResult] = None
@@ -91,10 +94,17 @@ def _checked(
         try:
             parsed = dsl_validator.validate(candidate)
         except DSLValidationError as exc:
-            if exc.envelope is None:
-                exc.envelope = candidate
+            # Lands in the transcript; do not alias the agent's dict.
+            exc.envelope = dict(candidate)
             raise
-    return env, candidate, parsed
+    return env, parsed
+
+
+def _hooks_may_mutate(strategy: Strategy) -> bool:
+    """Whether ``postprocess``/``should_stop`` are overridden and may edit the envelope."""
+
+    cls = type(strategy)
+    return cls.postprocess is not Strategy.postprocess or cls.should_stop is not Strategy.should_stop
 
 
 def _final_return_value(env: Envelope) -> Optional[str]:
@@ -154,6 +164,22 @@ def _register_control_error(stats: Dict[str, Any], code: str) -> None:
         stats["first_error"] = code
 
 
+def _update_json_mode_stats(stats: Dict[str, Any], telemetry: Mapping[str, Any]) -> None:
+    attempts = telemetry.get("json_attempts")
+    invalid = telemetry.get("json_invalid_outputs")
+    if isinstance(attempts, int):
+        stats["json_attempts_total"] = stats.get("json_attempts_total", 0) + max(attempts, 0)
+    if isinstance(invalid, int):
+        stats["json_invalid_total"] = stats.get("json_invalid_total", 0) + max(invalid, 0)
+    if telemetry.get("json_accepted"):
+        stats["json_accepted_total"] = stats.get("json_accepted_total", 0) + 1
+        tokens = telemetry.get("tokens_used_total")
+        if isinstance(tokens, int):
+            stats["json_accepted_tokens"] = stats.get("json_accepted_tokens", 0) + max(tokens, 0)
+    if telemetry.get("constrained"):
+        stats["json_constrained_turns"] = stats.get("json_constrained_turns", 0) + 1
+
+
 def _update_control_stats(stats: Dict[str, Any], env: Envelope, round_idx: int) -> None:
     content = env.content or {}
     if not isinstance(content, dict):
@@ -187,6 +213,15 @@ def _update_control_stats(stats: Dict[str, Any], env: Envelope, round_idx: int)
         trailer_end = telemetry.get("trailer_end")
         if telemetry.get("has_ctrl") and not telemetry.get("closed_ctrl"):
             _register_control_error(stats, "ERR_TRAILER_INCOMPLETE")
+        if control.get("source") == "json_mode":
+            _update_json_mode_stats(stats, telemetry)
+        drafted = telemetry.get("draft_tokens_total")
+        if isinstance(drafted, int) and drafted > 0:
+            accepted = telemetry.get("draft_accepted_total")
+            stats["draft_tokens_total"] = stats.get("draft_tokens_total", 0) + drafted
+            stats["draft_accepted_total"] = stats.get("draft_accepted_total", 0) + (
+                max(accepted, 0) if isinstance(accepted, int) else 0
+            )
     else:
         first_error = control.get("first_error")
         retry_count = control.get("retry_count")
@@ -330,8 +365,22 @@ def _control_summary(stats: Dict[str, Any]) -> Dict[str, Any]:
         summary["tokens_used_total"] = stats["tokens_used_total"]
     if stats.get("first_valid_round"):
         summary["first_valid_round"] = stats["first_valid_round"]
+    drafted = stats.get("draft_tokens_total", 0)
+    if drafted:
+        summary["draft_tokens_total"] = drafted
+        summary["draft_accepted_total"] = stats.get("draft_accepted_total", 0)
+        summary["draft_acceptance"] = summary["draft_accepted_total"] / drafted
     if stats.get("first_proposal_round"):
         summary["first_proposal_round"] = stats["first_proposal_round"]
+    json_attempts = stats.get("json_attempts_total", 0)
+    if json_attempts:
+        summary["json_invalid_rate"] = stats.get("json_invalid_total", 0) / json_attempts
+        accepted = stats.get("json_accepted_total", 0)
+        summary["json_accepted"] = accepted
+        if accepted:
+            summary["tokens_per_accepted_envelope"] = stats.get("json_accepted_tokens", 0) / accepted
+        if stats.get("json_constrained_turns"):
+            summary["json_constrained_turns"] = stats["json_constrained_turns"]
     stop_reasons = stats.get("stop_reasons")
     if isinstance(stop_reasons, dict):
         for reason, count in stop_reasons.items():
@@ -466,7 +515,7 @@ def _handle_handshake_event(stats: Dict[str, Any], event: Optional[Dict[str, Any
 def _enforce_schema(env: Envelope, validator: Optional[Draft7Validator], actor: str, round_no: int) -> None:
     if not validator:
         return
-    ok, errors = validate_envelope(env.model_dump(exclude_none=True), validator)
+    ok, errors = validate_envelope(env.compact_snapshot(), validator)
     if ok:
         return
     details = "; ".join(errors) if errors else "unknown validation error"
@@ -505,7 +554,11 @@ def _prepare_text_turn(obj: Any, validator: Optional[Callable[[str], str]]) -> D
     return payload
 
 
-def run_controller(
+StepRequest = Tuple[Any, str, List[Dict[str, Any]], Optional[Dict[str, Any]]]
+DialogSteps = Generator[StepRequest, Tuple[Any, Any], Dict[str, Any]]
+
+
+def controller_steps(
     task: str,
     agent_a: Any,
     agent_b: Any,
@@ -515,7 +568,16 @@ def run_controller(
     dsl_validator: Optional[DSLValidator] = None,
     schema_validator: Optional[Draft7Validator] = None,
     strategy: Optional[Strategy] = None,
-) -> Dict[str, Any]:
+) -> DialogSteps:
+    """Controller loop with agent generation factored out.
+
+    Yields ``(agent, task, transcript, preparation)`` whenever an agent must
+    speak and expects the ``(envelope, raw)`` pair of that step to be sent
+    back; the result dict is returned via ``StopIteration.value``.  Everything
+    between two yields (repair, validation, handshake tracking) is CPU-only,
+    so a driver is free to generate for other dialogs in the meantime.
+    """
+
     transcript: List[Dict[str, Any]] = []
     dsl_trace: List[Dict[str, Any]] = []
     intent_counts: Dict[str, Counter] = {"a": Counter(), "b": Counter()}
@@ -534,6 +596,10 @@ def run_controller(
     )
 
     text_mode = not strat_a.envelope_required or not strat_b.envelope_required
+    # Each turn's envelope is dumped once (Envelope.snapshot) and shared by the
+    # schema check, transcript and final message; custom hooks may have edited it.
+    refresh_a = _hooks_may_mutate(strat_a)
+    refresh_b = _hooks_may_mutate(strat_b)
     validator: Optional[Callable[[str], str]] = None
     if text_mode and (strat_a.validator_id or strat_b.validator_id):
         chosen = strat_a if strat_a.validator_id else strat_b
@@ -565,7 +631,7 @@ def run_controller(
             actor="a",
             agent_name=getattr(agent_a, "name", "agent_a"),
         )
-        env_a_raw, raw_a = _call_step(agent_a, task, transcript, prep_a)
+        env_a_raw, raw_a = yield (agent_a, task, transcript, prep_a)
 
         if text_mode:
             env_a = _prepare_text_turn(env_a_raw, validator)
@@ -586,7 +652,7 @@ def run_controller(
             solved_text["a"] = (final_a or "").strip() or None
         else:
             try:
-                env_a, env_a_data, parse_a = _checked(env_a_raw, dsl_validator)
+                env_a, parse_a = _checked(env_a_raw, dsl_validator)
             except DSLValidationError as err:
                 envelope = err.envelope if isinstance(err.envelope, dict) else {}
                 transcript.append({"r": round_idx, "actor": "a", "envelope": envelope, "errors": list(err.errors)})
@@ -625,9 +691,8 @@ def run_controller(
             )
             if isinstance(env_a_processed, Envelope):
                 env_a = env_a_processed
-                env_a_data = env_a.model_dump()
             else:
-                env_a, env_a_data, parse_a = _checked(env_a_processed, dsl_validator)
+                env_a, parse_a = _checked(env_a_processed, dsl_validator)
 
             stop_a, reason_a = strat_a.should_stop(
                 env_a,
@@ -636,6 +701,8 @@ def run_controller(
                 actor="a",
                 agent_name=getattr(agent_a, "name", "agent_a"),
             )
+            if refresh_a:
+                env_a.refresh_snapshot()
 
             _enforce_schema(env_a, schema_validator, getattr(agent_a, "name", "agent_a"), round_idx)
 
@@ -643,7 +710,7 @@ def run_controller(
                 {
                     "r": round_idx,
                     "actor": "a",
-                    "envelope": env_a.model_dump(),
+                    "envelope": env_a.snapshot(),
                     "raw": raw_a,
                     "strategy": {
                         "name": strat_a.name,
@@ -676,7 +743,7 @@ def run_controller(
                 ca, ha = _canon_and_hash(canonical, kind)
                 final_message = {
                     "actor": "a",
-                    "envelope": env_a.model_dump(),
+                    "envelope": env_a.snapshot(),
                     "canonical_text": ca,
                 }
                 if last_parse["a"] is not None:
@@ -705,7 +772,7 @@ def run_controller(
             actor="b",
             agent_name=getattr(agent_b, "name", "agent_b"),
         )
-        env_b_raw, raw_b = _call_step(agent_b, task, transcript, prep_b)
+        env_b_raw, raw_b = yield (agent_b, task, transcript, prep_b)
 
         if text_mode:
             env_b = _prepare_text_turn(env_b_raw, validator)
@@ -726,7 +793,7 @@ def run_controller(
             solved_text["b"] = (final_b or "").strip() or None
         else:
             try:
-                env_b, env_b_data, parse_b = _checked(env_b_raw, dsl_validator)
+                env_b, parse_b = _checked(env_b_raw, dsl_validator)
             except DSLValidationError as err:
                 envelope = err.envelope if isinstance(err.envelope, dict) else {}
                 transcript.append({"r": round_idx, "actor": "b", "envelope": envelope, "errors": list(err.errors)})
@@ -765,9 +832,8 @@ def run_controller(
             )
             if isinstance(env_b_processed, Envelope):
                 env_b = env_b_processed
-                env_b_data = env_b.model_dump()
             else:
-                env_b, env_b_data, parse_b = _checked(env_b_processed, dsl_validator)
+                env_b, parse_b = _checked(env_b_processed, dsl_validator)
 
             stop_b, reason_b = strat_b.should_stop(
                 env_b,
@@ -776,6 +842,8 @@ def run_controller(
                 actor="b",
                 agent_name=getattr(agent_b, "name", "agent_b"),
             )
+            if refresh_b:
+                env_b.refresh_snapshot()
 
             _enforce_schema(env_b, schema_validator, getattr(agent_b, "name", "agent_b"), round_idx)
 
@@ -783,7 +851,7 @@ def run_controller(
                 {
                     "r": round_idx,
                     "actor": "b",
-                    "envelope": env_b.model_dump(),
+                    "envelope": env_b.snapshot(),
                     "raw": raw_b,
                     "strategy": {
                         "name": strat_b.name,
@@ -816,7 +884,7 @@ def run_controller(
                 cb, hb = _canon_and_hash(canonical, kind)
                 final_message = {
                     "actor": "b",
-                    "envelope": env_b.model_dump(),
+                    "envelope": env_b.snapshot(),
                     "canonical_text": cb,
                 }
                 if last_parse["b"] is not None:
@@ -874,7 +942,7 @@ def run_controller(
                 if ca == cb and ca:
                     final_message = {
                         "actor": "b",
-                        "envelope": env_b_latest.model_dump() if env_b_latest else {},
+                        "envelope": env_b_latest.snapshot() if env_b_latest else {},
                         "canonical_text": ca,
                     }
                     if last_parse["b"] is not None:
@@ -904,4 +972,40 @@ def run_controller(
     }
 
 
-__all__ = ["run_controller"]
+def run_steps(dialog: DialogSteps) -> Dict[str, Any]:
+    """Drive ``dialog`` to completion, running each agent step inline."""
+
+    try:
+        request = next(dialog)
+        while True:
+            request = dialog.send(_call_step(*request))
+    except StopIteration as done:
+        return done.value
+
+
+def run_controller(
+    task: str,
+    agent_a: Any,
+    agent_b: Any,
+    max_rounds: int = 8,
+    *,
+    kind: Optional[str] = None,
+    dsl_validator: Optional[DSLValidator] = None,
+    schema_validator: Optional[Draft7Validator] = None,
+    strategy: Optional[Strategy] = None,
+) -> Dict[str, Any]:
+    return run_steps(
+        controller_steps(
+            task,
+            agent_a,
+            agent_b,
+            max_rounds,
+            kind=kind,
+            dsl_validator=dsl_validator,
+            schema_validator=schema_validator,
+            strategy=strategy,
+        )
+    )
+
+
+__all__ = ["controller_steps", "run_controller", "run_steps"]
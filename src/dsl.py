@@ -2,7 +2,8 @@ from __future__ import annotations
 
 """Domain-specific language (DSL) support for agent envelopes."""
 
-from dataclasses import dataclass, field
+import json
+from dataclasses import asdict, dataclass, field
 from typing import Any, Dict, List, Optional, Sequence
 
 from .utils import sha256_hex
@@ -64,6 +65,10 @@ _ARTIFACT_TYPES = (
 )
 
 
+# Content hash of (spec, extension) -> validator; validators hold no per-dialog state.
+_VALIDATOR_CACHE: Dict[str, "DSLValidator"] = {}
+
+
 @dataclass
 class DSLExtension:
     """Scenario-provided productions merged into the base grammar."""
@@ -122,7 +127,13 @@ class DSLSpec:
     artifact_content_rules: Dict[str, Sequence[str]] = field(default_factory=dict)
 
     def create_validator(self, extension: Optional[DSLExtension] = None) -> "DSLValidator":
+        """Validator for this spec plus ``extension``, shared by specs with the same content."""
+
         ext = extension.normalized() if extension else None
+        key = sha256_hex(json.dumps([asdict(self), asdict(ext) if ext else None], sort_keys=True, default=list))
+        cached = _VALIDATOR_CACHE.get(key)
+        if cached is not None:
+            return cached
         grammar = self.grammar
         if ext and ext.productions:
             grammar = grammar.rstrip() + "\n" + "\n".join(ext.productions)
@@ -139,7 +150,7 @@ class DSLSpec:
         rules = dict(self.artifact_content_rules)
         if ext and ext.artifact_content_rules:
             rules.update(ext.artifact_content_rules)
-        return DSLValidator(
+        validator = DSLValidator(
             grammar=grammar,
             keywords=keywords,
             allowed_status=self.allowed_status,
@@ -147,6 +158,7 @@ class DSLSpec:
             artifact_types=artifact_types,
             artifact_content_rules=rules,
         )
+        return _VALIDATOR_CACHE.setdefault(key, validator)
 
 
 def default_dsl_spec() -> DSLSpec:
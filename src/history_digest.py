@@ -0,0 +1,250 @@
+"""Token-budgeted rolling digest of earlier negotiation rounds.
+
+``HFChatAgent`` only shows its peer's last envelope and ``Agent`` scans the
+last few turns, so after a handful of rounds neither prompt remembers what was
+already proposed or rejected.  :class:`HistoryDigest` turns every transcript
+entry into one short line (round, actor, ACL intent, status, proposed
+solution, a clipped message) as it arrives and keeps the lines within a token
+budget by folding the oldest into a running summary of intent/status counts
+and the latest proposal.  Updates only look at entries added since the last
+call, and token counts come from the shared :mod:`src.token_budget` cache.
+
+:func:`context_window` and :func:`clip_to_tokens` let callers size the digest
+(and, as a last resort, the peer context) so that prompt plus reply fit the
+model's context.
+"""
+
+from __future__ import annotations
+
+import copy
+from collections import Counter
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .token_budget import count_tokens
+from .utils import ACLParseError, parse_acl_message
+
+DEFAULT_HISTORY_TOKENS = 256
+# Room left for chat-template markup around the system and user messages.
+CHAT_TEMPLATE_SLACK = 32
+MESSAGE_CHARS = 96
+SOLUTION_CHARS = 80
+# Sentinel values tokenizers use for "no limit" (e.g. int(1e30)).
+_UNBOUNDED_CONTEXT = 1 << 40
+
+
+def _clip(text: Any, limit: int) -> str:
+    flat = " ".join(str(text or "").split())
+    return flat if len(flat) <= limit else flat[: limit - 1] + "…"
+
+
+def _intent(content: Mapping[str, Any]) -> Optional[str]:
+    acl = content.get("acl")
+    if isinstance(acl, str):
+        try:
+            return parse_acl_message(acl).intent
+        except ACLParseError:
+            return None
+    intent = content.get("intent")
+    if isinstance(intent, str) and intent.strip():
+        return intent.strip().upper()
+    return None
+
+
+def _message(envelope: Mapping[str, Any], content: Mapping[str, Any]) -> str:
+    for source, key in (
+        (content, "message"),
+        (content, "summary"),
+        (content, "body"),
+        (content, "notes"),
+        (envelope, "public_message"),
+    ):
+        value = source.get(key)
+        if isinstance(value, str) and value.strip():
+            return value
+    request = envelope.get("request")
+    if isinstance(request, Mapping) and isinstance(request.get("to_peer"), str):
+        return request["to_peer"]
+    acl = content.get("acl")
+    return acl if isinstance(acl, str) else ""
+
+
+def describe_entry(entry: Mapping[str, Any]) -> Dict[str, Any]:
+    """Fields of one transcript entry used by the digest.
+
+    Accepts controller entries (``{"r", "actor", "envelope"}``) as well as the
+    bare envelopes ``Agent`` keeps (``role``, ``status``, ``public_message``).
+    """
+
+    envelope = entry.get("envelope") if isinstance(entry.get("envelope"), Mapping) else entry
+    content = envelope.get("content") if isinstance(envelope.get("content"), Mapping) else {}
+    final = envelope.get("final_solution") if isinstance(envelope.get("final_solution"), Mapping) else {}
+    return {
+        "round": entry.get("r"),
+        "actor": entry.get("actor") or envelope.get("role") or "?",
+        "intent": _intent(content),
+        "status": envelope.get("status"),
+        "solution": str(final.get("canonical_text") or "").strip(),
+        "message": _message(envelope, content),
+        "errors": bool(entry.get("errors")),
+    }
+
+
+def digest_line(fields: Mapping[str, Any]) -> str:
+    head = f"r{fields['round']} {fields['actor']}" if fields.get("round") is not None else str(fields["actor"])
+    parts = [head]
+    if fields.get("intent"):
+        parts.append(str(fields["intent"]))
+    if fields.get("status"):
+        parts.append(f"[{fields['status']}]")
+    if fields.get("errors"):
+        parts.append("(rejected)")
+    line = " ".join(parts)
+    if fields.get("solution"):
+        line += f" solution={_clip(fields['solution'], SOLUTION_CHARS)!r}"
+    if fields.get("message"):
+        line += f": {_clip(fields['message'], MESSAGE_CHARS)}"
+    return line
+
+
+class HistoryDigest:
+    """Rolling, token-budgeted summary of a transcript.
+
+    ``update`` consumes new entries; ``render`` returns the digest of every
+    entry except the last ``keep_last`` (which callers show verbatim).  When
+    the rendered lines exceed ``budget_tokens`` the oldest are folded into a
+    one-line summary.  A transcript that is shorter than what was already seen,
+    or starts with a different entry, resets the digest.
+    """
+
+    def __init__(self, tokenizer: Any = None, *, budget_tokens: int = DEFAULT_HISTORY_TOKENS, keep_last: int = 1) -> None:
+        self.tokenizer = tokenizer
+        self.budget_tokens = max(int(budget_tokens), 0)
+        self.keep_last = max(int(keep_last), 0)
+        self.reset()
+
+    def reset(self) -> None:
+        self._first: Any = None
+        self._seen = 0
+        self._lines: List[Tuple[str, int, Dict[str, Any]]] = []
+        self._folded = 0
+        self._folded_rounds: List[Any] = []
+        self._intents: Counter = Counter()
+        self._statuses: Counter = Counter()
+        self._last_proposal: Optional[Tuple[Any, Any, str]] = None
+
+    def update(self, transcript: Sequence[Mapping[str, Any]]) -> None:
+        if not transcript or len(transcript) < self._seen or (self._seen and transcript[0] is not self._first):
+            self.reset()
+        if not transcript:
+            return
+        self._first = transcript[0]
+        for entry in transcript[self._seen :]:
+            fields = describe_entry(entry)
+            line = digest_line(fields)
+            self._lines.append((line, count_tokens(self.tokenizer, line) + 1, fields))
+        self._seen = len(transcript)
+        self._fold(self.budget_tokens)
+
+    def _older(self) -> List[Tuple[str, int, Dict[str, Any]]]:
+        return self._lines[: len(self._lines) - self.keep_last] if self.keep_last else list(self._lines)
+
+    def _fold(self, budget: int) -> None:
+        while self._older() and self._tokens(self._older()) > budget:
+            _, _, fields = self._lines.pop(0)
+            self._folded += 1
+            self._folded_rounds.append(fields.get("round"))
+            if fields.get("intent"):
+                self._intents[fields["intent"]] += 1
+            if fields.get("status"):
+                self._statuses[fields["status"]] += 1
+            if fields.get("solution"):
+                self._last_proposal = (fields.get("round"), fields.get("actor"), fields["solution"])
+
+    def _summary(self) -> str:
+        if not self._folded:
+            return ""
+        rounds = [r for r in self._folded_rounds if r is not None]
+        span = f"rounds {min(rounds)}-{max(rounds)}" if rounds else f"{self._folded} earlier turns"
+        parts = [f"{span} summarised"]
+        if self._intents:
+            parts.append("intents " + ", ".join(f"{k}x{v}" for k, v in self._intents.most_common()))
+        if self._statuses:
+            parts.append("statuses " + ", ".join(f"{k}x{v}" for k, v in self._statuses.most_common()))
+        if self._last_proposal:
+            rnd, actor, text = self._last_proposal
+            parts.append(f"last proposal {_clip(text, SOLUTION_CHARS)!r} by {actor} in r{rnd}")
+        return "(" + "; ".join(parts) + ")"
+
+    def _tokens(self, lines: Sequence[Tuple[str, int, Dict[str, Any]]]) -> int:
+        summary = self._summary()
+        return sum(tokens for _, tokens, _ in lines) + (count_tokens(self.tokenizer, summary) if summary else 0)
+
+    def _scratch(self) -> "HistoryDigest":
+        other = copy.copy(self)
+        other._lines = list(self._lines)
+        other._folded_rounds = list(self._folded_rounds)
+        other._intents = Counter(self._intents)
+        other._statuses = Counter(self._statuses)
+        return other
+
+    def render(self, max_tokens: Optional[int] = None) -> str:
+        """Digest text, folded further if ``max_tokens`` is below the budget.
+
+        The extra folding applies to this call only; later renders start
+        again from the digest kept within ``budget_tokens``.  Returns ``""``
+        when ``max_tokens`` leaves no room even for the summary.
+        """
+
+        digest = self
+        if max_tokens is not None and max_tokens < self.budget_tokens:
+            digest = self._scratch()
+            digest._fold(max(max_tokens, 0))
+        lines = [line for line, _, _ in digest._older()]
+        summary = digest._summary()
+        text = "\n".join(([summary] if summary else []) + lines)
+        if max_tokens is not None and text and count_tokens(self.tokenizer, text) > max_tokens:
+            return ""
+        return text
+
+
+def context_window(model: Any = None, tokenizer: Any = None) -> Optional[int]:
+    """Maximum sequence length of ``model``/``tokenizer``, if either declares one."""
+
+    config = getattr(model, "config", None)
+    for attr in ("max_position_embeddings", "n_positions", "max_sequence_length", "seq_length"):
+        value = getattr(config, attr, None)
+        if isinstance(value, int) and 0 < value < _UNBOUNDED_CONTEXT:
+            return value
+    value = getattr(tokenizer, "model_max_length", None)
+    if isinstance(value, int) and 0 < value < _UNBOUNDED_CONTEXT:
+        return value
+    return None
+
+
+def clip_to_tokens(tokenizer: Any, text: str, max_tokens: int) -> str:
+    """Longest prefix of ``text`` within ``max_tokens`` tokens."""
+
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(tokenizer, text) <= max_tokens:
+        return text
+    encode = getattr(tokenizer, "encode", None)
+    decode = getattr(tokenizer, "decode", None)
+    if encode is not None and decode is not None:
+        try:
+            ids = encode(text, add_special_tokens=False)
+            return decode(list(ids)[:max_tokens], skip_special_tokens=True)
+        except Exception:
+            pass
+    return " ".join(text.split()[:max_tokens])
+
+
+__all__ = [
+    "CHAT_TEMPLATE_SLACK",
+    "DEFAULT_HISTORY_TOKENS",
+    "HistoryDigest",
+    "clip_to_tokens",
+    "context_window",
+    "describe_entry",
+    "digest_line",
+]
@@ -1,29 +1,391 @@
-
 from __future__ import annotations
+import copy
+import hashlib
 import json
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Tuple, Union
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union
 
-from jsonschema import Draft7Validator
+if TYPE_CHECKING:
+    from jsonschema import Draft7Validator
 
-SchemaArg = Union[Draft7Validator, Dict[str, Any], str, Path]
+SchemaArg = Union["Draft7Validator", Dict[str, Any], str, Path]
+Checker = Callable[[Any], bool]
 
+MAX_COMPILED_SCHEMAS = 64
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    """A jsonschema validator plus, when the schema allows it, a plain-Python fast path."""
+
+    digest: str
+    validator: "Draft7Validator"
+    check: Optional[Checker]
+
+
+_lock = threading.Lock()
+# Process-wide caches: schema content hash -> compiled schema, schema file ->
+# (stat signature, compiled schema), id(validator) -> fast checker.  Validator
+# entries are dropped when the validator is garbage collected.
+_by_digest: "OrderedDict[str, CompiledSchema]" = OrderedDict()
+_by_path: Dict[str, Tuple[Tuple[int, int], CompiledSchema]] = {}
+_by_validator: Dict[int, Optional[Checker]] = {}
+
+
+def schema_digest(schema: Any) -> str:
+    text = json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# --- fast path -------------------------------------------------------------------
+# ``compile_checker`` turns a schema into nested closures that agree exactly with
+# ``Draft7Validator(schema).is_valid`` for the keywords below.  Any other keyword
+# (``$ref``, ``format``, ``patternProperties``, numeric bounds, ...) makes the whole
+# schema fall back to jsonschema.
+
+class _Unsupported(Exception):
+    pass
+
+
+_ANNOTATIONS = frozenset({"$schema", "$id", "$comment", "title", "description", "default", "examples"})
+
+_TYPES: Dict[str, Checker] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "null": lambda v: v is None,
+    "boolean": lambda v: isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+}
+
+# Types that are a plain isinstance check (bool is not a str/dict/list).
+_PLAIN_TYPES: Dict[str, type] = {"object": dict, "array": list, "string": str}
+
+
+def _always(_: Any) -> bool:
+    return True
+
+
+def _never(_: Any) -> bool:
+    return False
+
+
+def _type(value: Any, _: Dict[str, Any]) -> Checker:
+    names = [value] if isinstance(value, str) else value
+    if not isinstance(names, list) or not names or any(name not in _TYPES for name in names):
+        raise _Unsupported("type")
+    if all(name in _PLAIN_TYPES or name == "null" for name in names):
+        classes = tuple(_PLAIN_TYPES[name] for name in names if name != "null")
+        if "null" in names:
+            return lambda v: v is None or isinstance(v, classes)
+        return lambda v: isinstance(v, classes)
+    checks = tuple(_TYPES[name] for name in names)
+    if len(checks) == 1:
+        return checks[0]
+    return lambda v: any(check(v) for check in checks)
+
+
+def _literals(values: List[Any]) -> frozenset:
+    # Strings and null compare by plain equality in jsonschema; numbers and
+    # booleans (1 == True) do not, so they are left to jsonschema.
+    if any(value is not None and not isinstance(value, str) for value in values):
+        raise _Unsupported("enum")
+    return frozenset(values)
+
+
+def _enum(value: Any, _: Dict[str, Any]) -> Checker:
+    if not isinstance(value, list):
+        raise _Unsupported("enum")
+    allowed = _literals(value)
+    return lambda v: (v is None or isinstance(v, str)) and v in allowed
+
+
+def _const(value: Any, _: Dict[str, Any]) -> Checker:
+    allowed = _literals([value])
+    return lambda v: (v is None or isinstance(v, str)) and v in allowed
+
+
+def _required(value: Any, _: Dict[str, Any]) -> Checker:
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise _Unsupported("required")
+    names = tuple(value)
+
+    def check(v: Any) -> bool:
+        if isinstance(v, dict):
+            for name in names:
+                if name not in v:
+                    return False
+        return True
+
+    return check
+
+
+def _properties(value: Any, _: Dict[str, Any]) -> Checker:
+    if not isinstance(value, dict):
+        raise _Unsupported("properties")
+    props = tuple((name, _compile(sub)) for name, sub in value.items())
+
+    def check(v: Any) -> bool:
+        if not isinstance(v, dict):
+            return True
+        for name, sub in props:
+            if name in v and not sub(v[name]):
+                return False
+        return True
+
+    return check
+
+
+def _additional_properties(value: Any, schema: Dict[str, Any]) -> Checker:
+    if value is True:
+        return _always
+    known = frozenset(schema.get("properties") or ())
+    sub = _compile(value)
+    return lambda v: not isinstance(v, dict) or all(sub(v[k]) for k in v if k not in known)
+
+
+def _pattern(value: Any, _: Dict[str, Any]) -> Checker:
+    try:
+        search = re.compile(value).search
+    except (re.error, TypeError):
+        raise _Unsupported("pattern") from None
+    return lambda v: not isinstance(v, str) or search(v) is not None
+
+
+def _length(bound: Callable[[int, int], bool]) -> Callable[[Any, Dict[str, Any]], Checker]:
+    def build(value: Any, _: Dict[str, Any]) -> Checker:
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise _Unsupported("length")
+        return lambda v: not isinstance(v, str) or bound(len(v), value)
+
+    return build
+
+
+def _item_count(bound: Callable[[int, int], bool]) -> Callable[[Any, Dict[str, Any]], Checker]:
+    def build(value: Any, _: Dict[str, Any]) -> Checker:
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise _Unsupported("items")
+        return lambda v: not isinstance(v, list) or bound(len(v), value)
+
+    return build
+
+
+def _items(value: Any, _: Dict[str, Any]) -> Checker:
+    if isinstance(value, list):  # tuple validation
+        raise _Unsupported("items")
+    sub = _compile(value)
+    return lambda v: not isinstance(v, list) or all(sub(item) for item in v)
+
+
+def _subschemas(value: Any, keyword: str) -> Tuple[Checker, ...]:
+    if not isinstance(value, list) or not value:
+        raise _Unsupported(keyword)
+    return tuple(_compile(sub) for sub in value)
+
+
+def _all_of(value: Any, _: Dict[str, Any]) -> Checker:
+    subs = _subschemas(value, "allOf")
+
+    def check(v: Any) -> bool:
+        for sub in subs:
+            if not sub(v):
+                return False
+        return True
+
+    return check
+
+
+def _any_of(value: Any, _: Dict[str, Any]) -> Checker:
+    subs = _subschemas(value, "anyOf")
+
+    def check(v: Any) -> bool:
+        for sub in subs:
+            if sub(v):
+                return True
+        return False
+
+    return check
+
+
+def _one_of(value: Any, _: Dict[str, Any]) -> Checker:
+    subs = _subschemas(value, "oneOf")
+    return lambda v: sum(1 for sub in subs if sub(v)) == 1
+
+
+def _not(value: Any, _: Dict[str, Any]) -> Checker:
+    sub = _compile(value)
+    return lambda v: not sub(v)
+
+
+def _if(value: Any, schema: Dict[str, Any]) -> Checker:
+    cond = _compile(value)
+    then = _compile(schema["then"]) if "then" in schema else _always
+    other = _compile(schema["else"]) if "else" in schema else _always
+    return lambda v: then(v) if cond(v) else other(v)
+
+
+_KEYWORDS: Dict[str, Callable[[Any, Dict[str, Any]], Checker]] = {
+    "type": _type,
+    "enum": _enum,
+    "const": _const,
+    "required": _required,
+    "properties": _properties,
+    "additionalProperties": _additional_properties,
+    "pattern": _pattern,
+    "minLength": _length(lambda n, limit: n >= limit),
+    "maxLength": _length(lambda n, limit: n <= limit),
+    "items": _items,
+    "minItems": _item_count(lambda n, limit: n >= limit),
+    "maxItems": _item_count(lambda n, limit: n <= limit),
+    "allOf": _all_of,
+    "anyOf": _any_of,
+    "oneOf": _one_of,
+    "not": _not,
+    "if": _if,
+}
+
+
+def _compile(schema: Any) -> Checker:
+    if schema is True:
+        return _always
+    if schema is False:
+        return _never
+    if not isinstance(schema, dict):
+        raise _Unsupported("schema")
+    checks: List[Checker] = []
+    for key, value in schema.items():
+        if key in _ANNOTATIONS:
+            continue
+        if key in ("then", "else"):
+            continue  # applied by "if"; ignored without it
+        builder = _KEYWORDS.get(key)
+        if builder is None:
+            raise _Unsupported(key)
+        checks.append(builder(value, schema))
+    if not checks:
+        return _always
+    if len(checks) == 1:
+        return checks[0]
+    every = tuple(checks)
+
+    def check(v: Any) -> bool:
+        for sub in every:
+            if not sub(v):
+                return False
+        return True
+
+    return check
+
+
+def compile_checker(schema: Any) -> Optional[Checker]:
+    """Plain-Python predicate equal to ``Draft7Validator(schema).is_valid``, or ``None``."""
+
+    try:
+        return _compile(schema)
+    except _Unsupported:
+        return None
+
+
+# --- caches -------------------------------------------------------------------
+
+def compile_schema(schema: Dict[str, Any]) -> CompiledSchema:
+    """Validator and fast checker for ``schema``, shared by every caller with the same content."""
+
+    from jsonschema import Draft7Validator  # imported on first validation, not at import time
+
+    digest = schema_digest(schema)
+    with _lock:
+        cached = _by_digest.get(digest)
+        if cached is not None:
+            _by_digest.move_to_end(digest)
+            return cached
+    # The caller may keep mutating its dict; the cached validator must not see that.
+    owned = copy.deepcopy(schema)
+    validator = Draft7Validator(owned)
+    compiled = CompiledSchema(digest, validator, compile_checker(owned))
+    with _lock:
+        compiled = _by_digest.setdefault(digest, compiled)
+        _by_digest.move_to_end(digest)
+        while len(_by_digest) > MAX_COMPILED_SCHEMAS:
+            _by_digest.popitem(last=False)
+    _remember_checker(compiled.validator, compiled.check)
+    return compiled
+
+
+def _compile_path(path: Path) -> CompiledSchema:
+    key = str(path.resolve())
+    stat = path.stat()
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _by_path.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    compiled = compile_schema(json.loads(path.read_text(encoding="utf-8")))
+    with _lock:
+        _by_path[key] = (signature, compiled)
+    return compiled
+
+
+def _forget_validator(key: int) -> None:
+    with _lock:
+        _by_validator.pop(key, None)
+
+
+def _remember_checker(validator: Any, check: Optional[Checker]) -> None:
+    key = id(validator)
+    with _lock:
+        if key in _by_validator:
+            return
+        _by_validator[key] = check
+    weakref.finalize(validator, _forget_validator, key)
+
+
+def _checker_for(validator: "Draft7Validator") -> Optional[Checker]:
+    from jsonschema import Draft7Validator
+
+    key = id(validator)
+    with _lock:
+        if key in _by_validator:
+            return _by_validator[key]
+    # Subclasses and extended validators may change keyword semantics.
+    check = compile_checker(validator.schema) if type(validator) is Draft7Validator else None
+    _remember_checker(validator, check)
+    return check
+
+
+def _resolve(schema: SchemaArg) -> Tuple["Draft7Validator", Optional[Checker]]:
+    from jsonschema import Draft7Validator
 
-def load_schema(schema: SchemaArg) -> Draft7Validator:
     if isinstance(schema, Draft7Validator):
-        return schema
+        return schema, _checker_for(schema)
     if isinstance(schema, (str, Path)):
-        path = Path(schema)
-        data = json.loads(path.read_text(encoding="utf-8"))
-        return Draft7Validator(data)
-    return Draft7Validator(schema)
+        compiled = _compile_path(Path(schema))
+    else:
+        compiled = compile_schema(schema)
+    return compiled.validator, compiled.check
+
+
+def load_schema(schema: SchemaArg) -> Draft7Validator:
+    return _resolve(schema)[0]
+
+
+def clear_schema_cache() -> None:
+    with _lock:
+        _by_digest.clear()
+        _by_path.clear()
 
 
-def validate_envelope(obj: Dict[str, Any], schema: SchemaArg) -> Tuple[bool, list[str]]:
-    validator = load_schema(schema)
+def validate_envelope(obj: Dict[str, Any], schema: SchemaArg, *, fast: bool = True) -> Tuple[bool, list[str]]:
+    validator, check = _resolve(schema)
     payload = dict(obj)
 
-    if not isinstance(schema, Draft7Validator):
+    if validator is not schema:  # compiled from a raw schema, not a caller's validator
         status = payload.get("status")
         if status == "SOLVED":
             final_solution = payload.get("final_solution")
@@ -34,6 +396,10 @@ def validate_envelope(obj: Dict[str, Any], schema: SchemaArg) -> Tuple[bool, lis
                 final_solution.setdefault("canonical_text", "PENDING")
                 payload["final_solution"] = final_solution
 
+    # The fast path only short-circuits valid envelopes; error messages always
+    # come from jsonschema.
+    if fast and check is not None and check(payload):
+        return True, []
     errors = sorted(validator.iter_errors(payload), key=lambda e: e.path)
     if errors:
         return False, [f"{'/'.join(map(str,e.path))}: {e.message}" for e in errors]
@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""Batch judging of finished runs on a pool of worker processes.
+
+The judges in :mod:`src.judges` score one envelope per call in the calling
+process, so scoring a matrix directory after the run is serial and a single
+pathological candidate (a catastrophically backtracking regex, a runaway SQL
+join) stalls the whole pass.  :class:`JudgePool` streams :class:`JudgeItem`s
+to long-lived spawn workers in small chunks and yields a
+:class:`JudgeOutcome` for each item as soon as its worker reports it.
+
+Workers stay up for the whole batch, so the judges' per-task caches (compiled
+regexes and parsed examples in ``regex_judge``, SQLite fixtures keyed by the
+hash of their ``sqlite_rows`` spec in ``sql_judge``) are built once per task
+and worker rather than once per envelope.  A call that runs past
+``timeout`` seconds is recorded as ``"timeout"``; its worker is terminated
+and replaced and the rest of its chunk is handed out again.  Each worker
+reports on its own pipe, so terminating one can never leave a channel that
+other workers write to half-written or locked.
+
+:meth:`JudgePool.run` appends one JSON line per item to a results file and
+skips item ids that are already recorded there, so an interrupted pass
+resumes where it stopped.
+
+Example::
+
+    python -m src.judges.pool logs/matrix_pool --tasks tasks/tasks.yaml --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import importlib
+import json
+import multiprocessing as mp
+import os
+import time
+import traceback
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from multiprocessing.connection import wait as wait_ready
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+from src.control_trailer import CTRL_PREFIX, envelope_from_payload, extract_control_trailer
+from src.logger import DURABLE, RunLogSink, repair_tail
+from src.run_matrix import load_tasks
+from src.transcript_stream import read_transcript
+
+DEFAULT_JUDGE = "src.judges:judge_auto"
+RESULTS_NAME = "judge_results.jsonl"
+
+
+def task_hash(task_prompt: str) -> str:
+    return hashlib.sha256(task_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class JudgeItem:
+    item_id: str
+    task_prompt: str
+    envelope: Dict[str, Any]
+    roleset_id: Optional[str] = None
+
+
+@dataclass
+class JudgeOutcome:
+    item_id: str
+    status: str  # "ok" | "timeout" | "error"
+    result: Dict[str, Any] = field(default_factory=dict)
+    judge_sec: float = 0.0
+    task_hash: str = ""
+
+    @property
+    def passes(self) -> bool:
+        return self.status == "ok" and bool(self.result.get("passes_judge"))
+
+    def record(self) -> Dict[str, Any]:
+        return {
+            "item_id": self.item_id,
+            "task_hash": self.task_hash,
+            "status": self.status,
+            "passes_judge": self.passes,
+            "judge_sec": round(self.judge_sec, 6),
+            "result": self.result,
+        }
+
+
+def _failed(item: JudgeItem, status: str, reason: str, judge_sec: float = 0.0) -> JudgeOutcome:
+    return JudgeOutcome(
+        item.item_id, status, {"passes_judge": False, "reason": reason}, judge_sec, task_hash(item.task_prompt)
+    )
+
+
+def _resolve_judge(spec: str) -> Callable[..., Dict[str, Any]]:
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _judge_one(judge: Callable[..., Dict[str, Any]], item: JudgeItem) -> JudgeOutcome:
+    start = time.perf_counter()
+    try:
+        result = dict(judge(item.task_prompt, item.envelope, item.roleset_id))
+        status = "ok"
+    except Exception:
+        result = {"passes_judge": False, "reason": "judge raised", "error": traceback.format_exc(limit=3)}
+        status = "error"
+    return JudgeOutcome(item.item_id, status, result, time.perf_counter() - start, task_hash(item.task_prompt))
+
+
+# -- workers ----------------------------------------------------------------
+
+
+def _worker_main(worker_id: int, judge_spec: str, inbox: Any, results: Any) -> None:
+    judge = _resolve_judge(judge_spec)
+    results.send(("ready", worker_id, None))
+    while True:
+        chunk = inbox.get()
+        if chunk is None:
+            break
+        for raw in chunk:
+            results.send(("done", worker_id, asdict(_judge_one(judge, JudgeItem(**raw)))))
+
+
+@dataclass
+class JudgeReport:
+    judged: int = 0
+    passed: int = 0
+    skipped: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    crashed_workers: int = 0
+    elapsed_sec: float = 0.0
+
+    def add(self, outcome: JudgeOutcome) -> None:
+        self.judged += 1
+        self.passed += int(outcome.passes)
+        self.timeouts += int(outcome.status == "timeout")
+        self.errors += int(outcome.status == "error")
+
+
+class JudgePool:
+    """Score :class:`JudgeItem` streams on long-lived judge worker processes.
+
+    ``workers=0`` judges in the calling process (no timeouts), which is
+    cheaper than starting processes for a handful of items.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: Optional[int] = None,
+        timeout: float = 10.0,
+        chunk_size: int = 8,
+        judge: str = DEFAULT_JUDGE,
+        poll_interval: float = 0.5,
+    ) -> None:
+        self.workers = max(int((os.cpu_count() or 1) if workers is None else workers), 0)
+        self.timeout = float(timeout)
+        self.chunk_size = max(int(chunk_size), 1)
+        self.judge = judge
+        self.poll_interval = poll_interval
+        self.crashed_workers = 0
+        self._ctx = mp.get_context("spawn")
+        self._serial = 0
+
+    def _spawn(self, inbox: Any, results: Any) -> tuple:
+        # Every process gets a fresh id, so a replacement is never confused
+        # with the worker it took over from.
+        self._serial += 1
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(self._serial, self.judge, inbox, results),
+            name=f"judge-worker-{self._serial}",
+            daemon=True,
+        )
+        proc.start()
+        return self._serial, proc
+
+    def imap(self, items: Iterable[JudgeItem]) -> Iterator[JudgeOutcome]:
+        """Yield one outcome per item, in completion order."""
+
+        if self.workers == 0:
+            judge = _resolve_judge(self.judge)
+            for item in items:
+                yield _judge_one(judge, item)
+            return
+
+        source = iter(items)
+        requeued: Deque[JudgeItem] = deque()
+        exhausted = False
+
+        def _take(count: int) -> List[JudgeItem]:
+            nonlocal exhausted
+            chunk: List[JudgeItem] = []
+            while len(chunk) < count and requeued:
+                chunk.append(requeued.popleft())
+            while len(chunk) < count and not exhausted:
+                try:
+                    chunk.append(next(source))
+                except StopIteration:
+                    exhausted = True
+            return chunk
+
+        # The parent tracks, per worker, the items it has been sent and not yet
+        # reported.  Workers judge their inbox in order, so the oldest one is
+        # the call in progress and its deadline restarts with every report.
+        # A worker can still be mid-send when its deadline passes, so every
+        # worker gets a private inbox and results pipe that are discarded with
+        # it; the parent closes its copy of the sending end, so a dead worker
+        # reads as EOF.
+        inboxes: Dict[int, Any] = {}
+        conns: Dict[int, Any] = {}
+        procs: Dict[int, Any] = {}
+        inflight: Dict[int, Deque[JudgeItem]] = {}
+        deadline: Dict[int, float] = {}
+        ready: Set[int] = set()
+
+        def _start() -> None:
+            inbox = self._ctx.Queue()
+            receiver, sender = self._ctx.Pipe(duplex=False)
+            wid, proc = self._spawn(inbox, sender)
+            sender.close()
+            inboxes[wid], conns[wid], procs[wid], inflight[wid] = inbox, receiver, proc, deque()
+
+        def _retire(wid: int) -> Deque[JudgeItem]:
+            proc = procs.pop(wid)
+            if proc.is_alive():
+                proc.terminate()
+            proc.join(timeout=5)
+            conns.pop(wid).close()
+            inboxes.pop(wid).cancel_join_thread()
+            ready.discard(wid)
+            deadline.pop(wid, None)
+            return inflight.pop(wid)
+
+        def _dispatch() -> None:
+            for wid in list(ready):
+                backlog = inflight[wid]
+                if len(backlog) > self.chunk_size // 2:
+                    continue
+                chunk = _take(self.chunk_size)
+                if not chunk:
+                    return
+                if not backlog:
+                    deadline[wid] = time.monotonic() + self.timeout
+                backlog.extend(chunk)
+                inboxes[wid].put([asdict(item) for item in chunk])
+
+        try:
+            first = _take(1)
+            if not first:
+                return
+            requeued.extend(first)
+            for _ in range(self.workers):
+                _start()
+
+            while True:
+                _dispatch()
+                if not requeued and exhausted and not any(inflight.values()):
+                    break
+                now = time.monotonic()
+                wait = min([self.poll_interval] + [max(d - now, 0.0) for wid, d in deadline.items() if inflight[wid]])
+                owners = {id(conn): wid for wid, conn in conns.items()}
+                for conn in wait_ready(list(conns.values()), timeout=max(wait, 0.01)):
+                    wid = owners[id(conn)]
+                    try:
+                        kind, _, payload = conn.recv()
+                    except (EOFError, OSError):
+                        procs[wid].join(timeout=1)  # exited; handled by the liveness check below
+                        continue
+                    if kind == "ready":
+                        ready.add(wid)
+                    elif kind == "done":
+                        backlog = inflight[wid]
+                        if backlog and backlog[0].item_id == payload["item_id"]:
+                            backlog.popleft()
+                            deadline[wid] = time.monotonic() + self.timeout
+                            yield JudgeOutcome(**payload)
+
+                now = time.monotonic()
+                for wid in list(procs):
+                    backlog = inflight[wid]
+                    if wid in ready and backlog and now >= deadline[wid]:
+                        stuck = backlog.popleft()
+                        rest = _retire(wid)
+                        requeued.extendleft(reversed(rest))
+                        _start()
+                        yield _failed(stuck, "timeout", f"judge timed out after {self.timeout:g}s", self.timeout)
+                    elif not procs[wid].is_alive():
+                        if wid not in ready:
+                            raise RuntimeError(f"judge worker failed to start (exit code {procs[wid].exitcode})")
+                        self.crashed_workers += 1
+                        code = procs[wid].exitcode
+                        rest = _retire(wid)
+                        _start()
+                        if rest:
+                            crashed = rest.popleft()
+                            requeued.extendleft(reversed(rest))
+                            yield _failed(crashed, "error", f"judge worker exited with code {code}")
+        finally:
+            for wid, proc in procs.items():
+                if proc.is_alive():
+                    inboxes[wid].put(None)
+            for proc in procs.values():
+                proc.join(timeout=5)
+                if proc.is_alive():
+                    proc.terminate()
+            for conn in conns.values():
+                conn.close()
+
+    def run(self, items: Iterable[JudgeItem], out_jsonl: str) -> JudgeReport:
+        """Judge ``items`` into ``out_jsonl``, skipping ids already recorded there."""
+
+        started = time.time()
+        report = JudgeReport()
+        done = judged_items(out_jsonl)
+
+        def _todo() -> Iterator[JudgeItem]:
+            for item in items:
+                if item.item_id in done:
+                    report.skipped += 1
+                    continue
+                done.add(item.item_id)
+                yield item
+
+        crashed = self.crashed_workers
+        with RunLogSink(DURABLE) as log:
+            for outcome in self.imap(_todo()):
+                log.append_jsonl(out_jsonl, outcome.record())
+                report.add(outcome)
+                if outcome.status != "ok":
+                    print(f"[{outcome.status.upper()}] {outcome.item_id}: {outcome.result.get('reason')}")
+        report.crashed_workers = self.crashed_workers - crashed
+        report.elapsed_sec = round(time.time() - started, 3)
+        return report
+
+
+def judged_items(path: str) -> Set[str]:
+    """Item ids that already have a line in the results file at ``path``."""
+
+    if not os.path.exists(path):
+        return set()
+    repair_tail(path)
+    done: Set[str] = set()
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                done.add(str(json.loads(line)["item_id"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return done
+
+
+# -- item sources -----------------------------------------------------------
+
+
+def final_envelope(transcript: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Best-effort envelope for the last non-empty turn of a run transcript.
+
+    Turns that carry an ``envelope`` are used as is; otherwise the output text
+    is read as a control trailer, then as a JSON envelope, then as the bare
+    canonical answer.
+    """
+
+    for turn in reversed(transcript):
+        envelope = turn.get("envelope")
+        if isinstance(envelope, dict):
+            return envelope
+        text = (turn.get("text_out") or "").strip()
+        if not text:
+            continue
+        if CTRL_PREFIX in text:
+            trailer = extract_control_trailer(text)
+            if isinstance(trailer.get("payload"), dict):
+                return envelope_from_payload(trailer["payload"])
+        if text.startswith("{"):
+            try:
+                parsed = json.loads(text)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, dict) and isinstance(parsed.get("final_solution"), dict):
+                return parsed
+        return {"final_solution": {"canonical_text": text}}
+    return {}
+
+
+def matrix_items(logdir: str, tasks_path: str = "tasks/tasks.yaml") -> Iterator[JudgeItem]:
+    """One item per row of ``<logdir>/matrix_results.csv``, read lazily."""
+
+    tasks = {str(task["id"]): task for task in load_tasks(tasks_path)}
+    with open(os.path.join(logdir, "matrix_results.csv"), newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            task = tasks.get(row.get("task_id", ""))
+            if task is None:
+                continue
+            roleset = row.get("roleset") or task.get("roleset") or ""
+            item_id = f"{row['task_id']}_{roleset}_{row['strategy']}_rep{row['repeat_idx']}"
+            path = row.get("out_jsonl") or ""
+            if path and not os.path.isabs(path) and not os.path.exists(path):
+                path = os.path.join(logdir, path)
+            envelope = final_envelope(read_transcript(path)["transcript"]) if os.path.exists(path) else {}
+            yield JudgeItem(item_id, str(task["scenario"]), envelope, roleset or None)
+
+
+def jsonl_items(path: str) -> Iterator[JudgeItem]:
+    """Items from a JSONL file of ``{item_id, task_prompt, envelope, roleset_id}``."""
+
+    with open(path, "r", encoding="utf-8") as handle:
+        for index, line in enumerate(handle):
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            yield JudgeItem(
+                str(obj.get("item_id", index)),
+                obj["task_prompt"],
+                obj.get("envelope") or {},
+                obj.get("roleset_id"),
+            )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Judge finished runs on a worker pool")
+    ap.add_argument("source", help="Matrix logdir (with matrix_results.csv) or an items JSONL")
+    ap.add_argument("--tasks", default="tasks/tasks.yaml", help="Task YAML for matrix logdirs")
+    ap.add_argument("--out", default=None, help=f"Results JSONL (default: <logdir>/{RESULTS_NAME}); re-running resumes it")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count; 0 = in-process)")
+    ap.add_argument("--timeout", type=float, default=10.0, help="Seconds allowed per judge call")
+    ap.add_argument("--chunk-size", type=int, default=8, help="Items sent to a worker at a time")
+    ap.add_argument("--judge", default=DEFAULT_JUDGE, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        items = matrix_items(args.source, args.tasks)
+        out = args.out or os.path.join(args.source, RESULTS_NAME)
+    else:
+        items = jsonl_items(args.source)
+        out = args.out or os.path.splitext(args.source)[0] + ".judged.jsonl"
+    pool = JudgePool(workers=args.workers, timeout=args.timeout, chunk_size=args.chunk_size, judge=args.judge)
+    report = pool.run(items, out)
+    print("JUDGE", json.dumps(asdict(report)))
+    print("WROTE", out)
+
+
+__all__ = [
+    "DEFAULT_JUDGE",
+    "JudgeItem",
+    "JudgeOutcome",
+    "JudgePool",
+    "JudgeReport",
+    "final_envelope",
+    "judged_items",
+    "jsonl_items",
+    "main",
+    "matrix_items",
+    "task_hash",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Regex candidate scoring with a time budget.
+
+A model-written pattern with nested quantifiers (``(a+)+$``) can backtrack
+for minutes on a single example, and ``re`` has no timeout.  The example set
+of one candidate is scored in one guarded call, under a wall-clock budget
+shared by all its examples:
+
+``"signal"``
+    in process, interrupted by a ``SIGALRM`` interval timer.  The ``re``
+    engine checks for pending signals while it backtracks, so the call
+    returns promptly.  Only possible on POSIX, in the main thread and when no
+    other interval timer is armed.
+``"subprocess"``
+    in a persistent helper interpreter that reports each example as it
+    finishes.  A helper that overruns the budget is killed and restarted on
+    the next call.
+
+``"auto"`` (the default) uses the signal guard when it can.  Either way the
+report carries a per-example timing, so a pathological pattern shows which
+input it choked on.  Compiled patterns are cached on both sides.
+
+This module only imports the standard library: the helper runs it as a
+script.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+TIME_BUDGET_SEC = 1.0
+EXAMPLE_PREVIEW = 80
+
+compile_pattern = lru_cache(maxsize=1024)(re.compile)
+
+
+@dataclass
+class ExampleTiming:
+    text: str
+    expected: bool
+    matched: Optional[bool]  # None: not reached, or interrupted
+    sec: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.matched is self.expected
+
+
+@dataclass
+class RegexReport:
+    pattern: str
+    examples: List[ExampleTiming] = field(default_factory=list)
+    error: Optional[str] = None
+    timed_out: bool = False
+    elapsed_sec: float = 0.0
+    guard: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.timed_out and all(ex.ok for ex in self.examples)
+
+    def failures(self, expected: bool) -> List[str]:
+        return [ex.text for ex in self.examples if ex.expected is expected and ex.matched is not None and not ex.ok]
+
+    def slowest(self, count: int = 3) -> List[ExampleTiming]:
+        return sorted(self.examples, key=lambda ex: ex.sec, reverse=True)[:count]
+
+    def timings(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "example": ex.text[:EXAMPLE_PREVIEW],
+                "expected": ex.expected,
+                "matched": ex.matched,
+                "ms": round(ex.sec * 1000, 3),
+            }
+            for ex in self.examples
+        ]
+
+
+def _labelled(positives: Iterable[str], negatives: Iterable[str]) -> List[Tuple[str, bool]]:
+    return [(str(s), True) for s in positives] + [(str(s), False) for s in negatives]
+
+
+def _scan(rx: "re.Pattern[str]", examples: Sequence[Tuple[str, bool]], report: RegexReport) -> None:
+    clock = time.perf_counter
+    search = rx.search
+    for text, expected in examples:
+        start = clock()
+        entry = ExampleTiming(text, expected, None)
+        report.examples.append(entry)
+        entry.matched = search(text) is not None
+        entry.sec = clock() - start
+
+
+# -- signal guard -----------------------------------------------------------
+
+
+class _Expired(Exception):
+    pass
+
+
+def _on_alarm(signum: int, frame: Any) -> None:
+    raise _Expired()
+
+
+def signal_guard_available() -> bool:
+    return (
+        hasattr(signal, "setitimer")
+        and threading.current_thread() is threading.main_thread()
+        and signal.getitimer(signal.ITIMER_REAL)[0] == 0
+    )
+
+
+def _score_in_process(pattern: str, examples: Sequence[Tuple[str, bool]], budget: float) -> RegexReport:
+    report = RegexReport(pattern, guard="signal")
+    try:
+        rx = compile_pattern(pattern)
+    except re.error as exc:
+        report.error = str(exc)
+        return report
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    start = time.perf_counter()
+    try:
+        signal.setitimer(signal.ITIMER_REAL, budget)
+        try:
+            _scan(rx, examples, report)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _Expired:
+        report.timed_out = True
+        stuck = report.examples[-1] if report.examples else None
+        if stuck is not None and stuck.matched is None:
+            stuck.sec = time.perf_counter() - start - sum(ex.sec for ex in report.examples[:-1])
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+    report.elapsed_sec = time.perf_counter() - start
+    return report
+
+
+# -- subprocess guard -------------------------------------------------------
+
+
+class _Helper:
+    """A child interpreter running :func:`_serve`, restarted after a timeout."""
+
+    def __init__(self) -> None:
+        self.proc: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+
+    def _ensure(self) -> subprocess.Popen:
+        if self.proc is None or self.proc.poll() is not None:
+            self.proc = subprocess.Popen(
+                [sys.executable, "-u", os.path.abspath(__file__), "--serve"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        return self.proc
+
+    def kill(self) -> None:
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def score(self, pattern: str, examples: Sequence[Tuple[str, bool]], budget: float) -> RegexReport:
+        report = RegexReport(pattern, guard="subprocess")
+        with self.lock:
+            proc = self._ensure()
+            assert proc.stdin is not None and proc.stdout is not None
+            proc.stdin.write((json.dumps({"pattern": pattern, "examples": examples}) + "\n").encode("utf-8"))
+            proc.stdin.flush()
+            start = time.perf_counter()
+            deadline = start + budget
+            fd = proc.stdout.fileno()
+            pending = b""
+            with selectors.DefaultSelector() as sel:
+                sel.register(fd, selectors.EVENT_READ)
+                while True:
+                    if b"\n" not in pending:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0 or not sel.select(remaining):
+                            self.kill()
+                            report.timed_out = True
+                            index = len(report.examples)
+                            if index < len(examples):
+                                text, expected = examples[index]
+                                spent = time.perf_counter() - start - sum(ex.sec for ex in report.examples)
+                                report.examples.append(ExampleTiming(text, expected, None, spent))
+                            break
+                        chunk = os.read(fd, 65536)
+                        if not chunk:
+                            self.kill()
+                            report.error = "regex helper exited"
+                            break
+                        pending += chunk
+                        continue
+                    line, pending = pending.split(b"\n", 1)
+                    msg = json.loads(line)
+                    if "done" in msg:
+                        report.error = msg.get("error")
+                        break
+                    text, expected = examples[msg["i"]]
+                    report.examples.append(ExampleTiming(text, expected, msg["matched"], msg["sec"]))
+            report.elapsed_sec = time.perf_counter() - start
+        return report
+
+
+_HELPER = _Helper()
+
+
+def _serve() -> None:
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            rx = compile_pattern(request["pattern"])
+        except re.error as exc:
+            print(json.dumps({"done": True, "error": str(exc)}), flush=True)
+            continue
+        for index, (text, _) in enumerate(request["examples"]):
+            start = time.perf_counter()
+            matched = rx.search(text) is not None
+            print(json.dumps({"i": index, "matched": matched, "sec": time.perf_counter() - start}), flush=True)
+        print(json.dumps({"done": True}), flush=True)
+
+
+# -- entry point ------------------------------------------------------------
+
+
+def score_examples(
+    pattern: str,
+    positives: Iterable[str],
+    negatives: Iterable[str],
+    *,
+    time_budget: Optional[float] = None,
+    guard: str = "auto",
+) -> RegexReport:
+    """Search every example with ``pattern`` within ``time_budget`` seconds.
+
+    Positives must match and negatives must not; examples after the one that
+    exhausted the budget are left out of the report.
+    """
+
+    budget = TIME_BUDGET_SEC if time_budget is None else float(time_budget)
+    examples = _labelled(positives, negatives)
+    if guard == "auto":
+        guard = "signal" if signal_guard_available() else "subprocess"
+    if guard == "signal":
+        return _score_in_process(pattern, examples, budget)
+    if guard == "subprocess":
+        return _HELPER.score(pattern, examples, budget)
+    raise ValueError(f"unknown regex guard {guard!r}")
+
+
+__all__ = [
+    "ExampleTiming",
+    "RegexReport",
+    "TIME_BUDGET_SEC",
+    "compile_pattern",
+    "score_examples",
+    "signal_guard_available",
+]
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["--serve"]:
+    _serve()
@@ -1,6 +1,17 @@
 from __future__ import annotations
-from typing import Dict, Any, List
-import re, json
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+import json
+from .regex_engine import score_examples
+
+# Batch judging (src/judges/pool.py) scores many candidates per task in one
+# worker; keep the parsed examples per task (compiled candidates are cached
+# by the engine).
+
+@lru_cache(maxsize=256)
+def _task_examples(task_prompt: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    pos, neg = _extract_examples(task_prompt)
+    return tuple(pos), tuple(neg)
 
 def _extract_examples(task_prompt: str) -> (List[str], List[str]):
     # very loose: look for JSON-like positives/negatives arrays
@@ -24,19 +35,21 @@ def _extract_examples(task_prompt: str) -> (List[str], List[str]):
                 neg.append(l.strip(" ,"))
         return pos, neg
 
-def judge_regex(task_prompt: str, env: Dict[str, Any]) -> Dict[str, Any]:
+def judge_regex(task_prompt: str, env: Dict[str, Any], *, time_budget: Optional[float] = None) -> Dict[str, Any]:
     pattern = (env.get("final_solution") or {}).get("canonical_text","")
-    try:
-        rx = re.compile(pattern)
-    except Exception as e:
-        return {"passes_judge": False, "kind":"regex", "error": str(e)}
-    pos, neg = _extract_examples(task_prompt)
-    ok = True
-    fails = {"pos_fail":[], "neg_fail":[]}
-    for s in pos:
-        if rx.search(s) is None:
-            ok=False; fails["pos_fail"].append(s)
-    for s in neg:
-        if rx.search(s) is not None:
-            ok=False; fails["neg_fail"].append(s)
-    return {"passes_judge": ok, "kind":"regex", "details": fails}
+    pos, neg = _task_examples(task_prompt)
+    # All examples in one guarded call; see regex_engine for the time budget.
+    report = score_examples(pattern, pos, neg, time_budget=time_budget)
+    if report.error is not None:
+        return {"passes_judge": False, "kind":"regex", "error": report.error}
+    fails = {"pos_fail": report.failures(True), "neg_fail": report.failures(False)}
+    out = {
+        "passes_judge": report.ok,
+        "kind": "regex",
+        "details": fails,
+        "elapsed_ms": round(report.elapsed_sec * 1000, 3),
+        "timings": report.timings(),
+    }
+    if report.timed_out:
+        out["error"] = "pattern exceeded regex time budget"
+    return out
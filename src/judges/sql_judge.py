@@ -1,44 +1,135 @@
 from __future__ import annotations
-from typing import Dict, Any
-import sqlite3, json
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Sequence, Union
+import hashlib, sqlite3, json, threading, time
 
-def judge_sql(task_prompt: str, env: Dict[str, Any]) -> Dict[str, Any]:
-    # Expect inline SQLite spec in prompt:
-    # {"sqlite_rows":[{"table":"t","rows":[{"col":"val"}, ...]}], "expected_checksum": <int>}
-    ct = (env.get("final_solution") or {}).get("canonical_text","")
+# Fixture databases are built once per distinct sqlite_rows spec (keyed by its
+# sha256) and each candidate runs against a private copy, so a sweep over the
+# same task does not re-create and re-fill the tables for every envelope.
+# Copies come from the serialised image (Connection.deserialize, Python 3.11+)
+# or, where that is unavailable, from a template connection via backup().
+MAX_FIXTURES = 32
+_FIXTURES: "OrderedDict[str, Union[bytes, sqlite3.Connection]]" = OrderedDict()
+_FIXTURE_LOCK = threading.Lock()
+
+# Candidate statements are interrupted after this many seconds of work.
+TIME_LIMIT_SEC = 2.0
+_PROGRESS_OPS = 1000  # VM instructions between deadline checks
+
+_DENIED_ACTIONS = {sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH}
+
+
+@lru_cache(maxsize=256)
+def _task_spec(task_prompt: str) -> Optional[Dict[str, Any]]:
     try:
         spec = json.loads(task_prompt)
     except Exception:
+        return None
+    return spec if isinstance(spec, dict) else None
+
+
+def fixture_hash(rows_spec: List[Dict[str, Any]]) -> str:
+    blob = json.dumps(rows_spec, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def result_checksum(rows: Sequence[Sequence[Any]]) -> int:
+    """Checksum of a result set that is the same in every process.
+
+    ``hash(tuple(rows))`` changes with ``PYTHONHASHSEED`` for text values;
+    this is the first 64 bits of the sha256 of the rows as JSON.
+    """
+    blob = json.dumps([list(r) for r in rows], separators=(",", ":"), default=str)
+    return int(hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def _build_fixture(rows_spec: List[Dict[str, Any]]) -> sqlite3.Connection:
+    con = sqlite3.connect(":memory:", check_same_thread=False)
+    for tbl in rows_spec:
+        name = tbl["table"]
+        rows = tbl.get("rows", [])
+        if not rows:
+            continue
+        cols = list(rows[0].keys())
+        con.execute(f"CREATE TABLE {name} ({', '.join([c+' TEXT' for c in cols])})")
+        placeholders = ", ".join(["?"] * len(cols))
+        col_list = ", ".join(cols)
+        con.executemany(
+            f"INSERT INTO {name} ({col_list}) VALUES ({placeholders})",
+            ([str(r[c]) for c in cols] for r in rows),
+        )
+    con.commit()
+    return con
+
+
+def _fixture_copy(rows_spec: List[Dict[str, Any]]) -> sqlite3.Connection:
+    key = fixture_hash(rows_spec)
+    con = sqlite3.connect(":memory:")
+    with _FIXTURE_LOCK:
+        image = _FIXTURES.get(key)
+        if image is None:
+            template = _build_fixture(rows_spec)
+            if hasattr(template, "serialize"):
+                image = template.serialize()
+                template.close()
+            else:
+                image = template
+            _FIXTURES[key] = image
+            while len(_FIXTURES) > MAX_FIXTURES:
+                old = _FIXTURES.popitem(last=False)[1]
+                if isinstance(old, sqlite3.Connection):
+                    old.close()
+        else:
+            _FIXTURES.move_to_end(key)
+        if isinstance(image, sqlite3.Connection):
+            image.backup(con)
+    if isinstance(image, bytes):
+        con.deserialize(image)
+    return con
+
+
+def _sandbox(con: sqlite3.Connection, time_limit: float) -> None:
+    # No ATTACH (it creates files on disk); long statements are interrupted.
+    con.set_authorizer(lambda action, *_: sqlite3.SQLITE_DENY if action in _DENIED_ACTIONS else sqlite3.SQLITE_OK)
+    deadline = time.perf_counter() + time_limit
+    con.set_progress_handler(lambda: int(time.perf_counter() > deadline), _PROGRESS_OPS)
+
+
+def judge_sql(task_prompt: str, env: Dict[str, Any], *, time_limit: Optional[float] = None) -> Dict[str, Any]:
+    # Expect inline SQLite spec in prompt:
+    # {"sqlite_rows":[{"table":"t","rows":[{"col":"val"}, ...]}], "expected_checksum": <int>}
+    # where the checksum is result_checksum() of the expected rows.
+    ct = (env.get("final_solution") or {}).get("canonical_text","")
+    spec = _task_spec(task_prompt)
+    if spec is None:
         return {"passes_judge": False, "kind":"sql", "reason":"prompt lacks sqlite spec"}
 
     rows_spec = spec.get("sqlite_rows",[])
     if not rows_spec:
         return {"passes_judge": False, "kind":"sql", "reason":"no sqlite_rows in prompt"}
 
-    con = sqlite3.connect(":memory:")
+    limit = TIME_LIMIT_SEC if time_limit is None else time_limit
+    con = None
     try:
-        # Create and fill tables
-        for tbl in rows_spec:
-            name = tbl["table"]
-            rows = tbl.get("rows", [])
-            if not rows:
-                continue
-            cols = list(rows[0].keys())
-            con.execute(f"CREATE TABLE {name} ({', '.join([c+' TEXT' for c in cols])})")
-            for r in rows:
-                placeholders = ", ".join(["?"] * len(cols))
-                col_list = ", ".join(cols)
-                con.execute(f"INSERT INTO {name} ({col_list}) VALUES ({placeholders})", [str(r[c]) for c in cols])
+        # Fresh copy of the task's tables; the candidate may modify them.
+        con = _fixture_copy(rows_spec)
+        _sandbox(con, limit)
 
         # Run the candidate SQL
         cur = con.execute(ct)
         out = cur.fetchall()
-        checksum = hash(tuple(out))
+        checksum = result_checksum(out)
         exp = spec.get("expected_checksum", None)
         if exp is None:
             return {"passes_judge": True, "kind":"sql", "rows": len(out)}
         return {"passes_judge": checksum == exp, "kind":"sql", "rows": len(out), "checksum": checksum}
+    except sqlite3.OperationalError as e:
+        if str(e) == "interrupted":
+            return {"passes_judge": False, "kind":"sql", "error": f"statement exceeded {limit:g}s time limit"}
+        return {"passes_judge": False, "kind":"sql", "error": str(e)}
     except Exception as e:
         return {"passes_judge": False, "kind":"sql", "error": str(e)}
     finally:
-        con.close()
+        if con is not None:
+            con.close()
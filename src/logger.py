@@ -3,6 +3,14 @@
 The new analytics surface keeps both JSONL and CSV snapshots for every
 controller execution so downstream analysis can pivot across strategies,
 rolesets, and model selections without re-running experiments.
+
+Writes go through a :class:`RunLogSink`, which keeps one append-mode handle
+per file, buffers formatted lines until a :class:`FlushPolicy` threshold
+(records, bytes or seconds) is reached and fsyncs every ``fsync_every``
+flushes.  Each flush is a single ``write`` on an ``O_APPEND`` descriptor taken
+under an exclusive ``flock``, so threads sharing a sink and processes sharing a
+file never interleave partial lines, and a CSV header is written only by
+whichever writer finds the file empty.
 """
 
 from __future__ import annotations
@@ -10,9 +18,22 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Iterable, Mapping
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Mapping, Optional, Tuple
+import atexit
 import csv
+import io
 import json
+import os
+import threading
+import time
+
+try:  # POSIX only; elsewhere the per-sink lock still serialises threads.
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    from .columnar_store import ColumnarSink
 
 
 @dataclass
@@ -31,11 +52,190 @@ def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+@dataclass(frozen=True)
+class FlushPolicy:
+    """When a :class:`RunLogSink` writes its buffers out.
+
+    A file is flushed once it holds ``max_records`` lines or ``max_bytes``
+    bytes, or when a write arrives ``max_interval`` seconds after its last
+    flush.  ``fsync_every=N`` fsyncs on every N-th flush of a file (0: only
+    on close).
+    """
+
+    max_records: int = 64
+    max_bytes: int = 1 << 20
+    max_interval: float = 2.0
+    fsync_every: int = 0
+
+
+#: Flush every record; handles stay open but nothing is left in memory.
+IMMEDIATE = FlushPolicy(max_records=1)
+#: Flush and fsync every record, for logs that must survive a killed job.
+DURABLE = FlushPolicy(max_records=1, fsync_every=1)
+
+
+class _PooledFile:
+    __slots__ = ("fd", "pending", "pending_bytes", "header", "last_flush", "flushes")
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.pending: List[bytes] = []
+        self.pending_bytes = 0
+        self.header: Optional[bytes] = None
+        self.last_flush = time.monotonic()
+        self.flushes = 0
+
+
+class RunLogSink:
+    """Buffered JSONL/CSV appender with a pool of open file handles."""
+
+    def __init__(self, policy: FlushPolicy = FlushPolicy()) -> None:
+        self.policy = policy
+        self._files: Dict[str, _PooledFile] = {}
+        self._csv_writers: Dict[Tuple[Tuple[str, ...], str], Tuple[io.StringIO, csv.DictWriter]] = {}
+        self._lock = threading.RLock()
+
+    def _file(self, path: str | Path) -> _PooledFile:
+        key = os.path.abspath(path)
+        handle = self._files.get(key)
+        if handle is None:
+            handle = self._files[key] = _PooledFile(Path(key))
+        return handle
+
+    def _csv_line(self, fieldnames: Tuple[str, ...], row: Optional[Mapping[str, Any]], extrasaction: str) -> bytes:
+        cached = self._csv_writers.get((fieldnames, extrasaction))
+        if cached is None:
+            buffer = io.StringIO(newline="")
+            cached = (buffer, csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction=extrasaction))
+            self._csv_writers[(fieldnames, extrasaction)] = cached
+        buffer, writer = cached
+        buffer.seek(0)
+        buffer.truncate()
+        if row is None:
+            writer.writeheader()
+        else:
+            writer.writerow(row)
+        return buffer.getvalue().encode("utf-8")
+
+    def _append(self, handle: _PooledFile, line: bytes) -> None:
+        handle.pending.append(line)
+        handle.pending_bytes += len(line)
+        policy = self.policy
+        if (
+            len(handle.pending) >= policy.max_records
+            or handle.pending_bytes >= policy.max_bytes
+            or time.monotonic() - handle.last_flush >= policy.max_interval
+        ):
+            self._flush_file(handle)
+
+    def append_jsonl(self, path: str | Path, obj: Mapping[str, Any]) -> None:
+        line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._append(self._file(path), line)
+
+    def append_csv(
+        self,
+        path: str | Path,
+        fieldnames: Iterable[str],
+        row: Mapping[str, Any],
+        *,
+        extrasaction: str = "raise",
+    ) -> None:
+        """Buffer one CSV row; the header is added if the file is still empty."""
+
+        names = tuple(fieldnames)
+        with self._lock:
+            handle = self._file(path)
+            if handle.header is None:
+                handle.header = self._csv_line(names, None, extrasaction)
+            self._append(handle, self._csv_line(names, row, extrasaction))
+
+    def _flush_file(self, handle: _PooledFile, *, sync: bool = False) -> None:
+        handle.last_flush = time.monotonic()
+        if not handle.pending:
+            if sync:
+                os.fsync(handle.fd)
+            return
+        data = b"".join(handle.pending)
+        handle.pending.clear()
+        handle.pending_bytes = 0
+        if fcntl is not None:
+            fcntl.flock(handle.fd, fcntl.LOCK_EX)
+        try:
+            if handle.header is not None and os.fstat(handle.fd).st_size == 0:
+                data = handle.header + data
+            view = memoryview(data)
+            while view:
+                view = view[os.write(handle.fd, view):]
+            handle.flushes += 1
+            every = self.policy.fsync_every
+            if sync or (every and handle.flushes % every == 0):
+                os.fsync(handle.fd)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fd, fcntl.LOCK_UN)
+
+    def flush(self, *, sync: bool = False) -> None:
+        """Write out every buffer (and fsync them with ``sync=True``)."""
+
+        with self._lock:
+            for handle in self._files.values():
+                self._flush_file(handle, sync=sync)
+
+    def close(self) -> None:
+        """Flush, fsync and close all pooled handles; the sink stays usable."""
+
+        with self._lock:
+            files, self._files = self._files, {}
+            for handle in files.values():
+                try:
+                    self._flush_file(handle, sync=True)
+                finally:
+                    os.close(handle.fd)
+
+    def __enter__(self) -> "RunLogSink":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+
+_DEFAULT_SINK: Optional[RunLogSink] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_sink() -> RunLogSink:
+    """Process-wide sink used when callers do not pass their own.
+
+    It flushes every record (:data:`IMMEDIATE`) so files are readable as soon
+    as ``record_run`` returns; batch drivers should pass a buffered sink.
+    """
+
+    global _DEFAULT_SINK
+    with _DEFAULT_LOCK:
+        if _DEFAULT_SINK is None:
+            _DEFAULT_SINK = RunLogSink(IMMEDIATE)
+            atexit.register(_DEFAULT_SINK.close)
+        return _DEFAULT_SINK
+
+
 def append_jsonl(path: str | Path, obj: Mapping[str, Any]) -> None:
-    p = Path(path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    with p.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    default_sink().append_jsonl(path, obj)
+
+
+def repair_tail(path: str | Path) -> None:
+    """Drop a partially written last line left behind by a killed run.
+
+    Appends made after the repair then start on a line of their own instead
+    of being glued onto the fragment.
+    """
+
+    with open(path, "rb+") as handle:
+        data = handle.read()
+        if not data or data.endswith(b"\n"):
+            return
+        handle.truncate(data.rfind(b"\n") + 1)
 
 
 def _flatten_intent_counts(intents: Mapping[str, Mapping[str, int]]) -> Dict[str, int]:
@@ -132,6 +332,10 @@ def build_run_record(result: Mapping[str, Any], meta: RunMetadata) -> Dict[str,
         final_canonical = control_stats.get("final_canonical")
         if final_canonical:
             record["final_canonical"] = final_canonical
+        draft_acceptance = control_stats.get("draft_acceptance")
+        if isinstance(draft_acceptance, (int, float)):
+            record["draft_acceptance"] = float(draft_acceptance)
+            record["draft_tokens_total"] = int(control_stats.get("draft_tokens_total", 0) or 0)
         for key, value in control_stats.items():
             if isinstance(key, str) and key.startswith("stop_reason_") and isinstance(value, (int, float)):
                 record[key] = int(value)
@@ -169,14 +373,7 @@ def build_run_record(result: Mapping[str, Any], meta: RunMetadata) -> Dict[str,
 
 
 def append_csv(path: str | Path, fieldnames: Iterable[str], row: Mapping[str, Any]) -> None:
-    p = Path(path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    file_exists = p.exists()
-    with p.open("a", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(row)
+    default_sink().append_csv(path, fieldnames, row)
 
 
 def record_run(
@@ -185,27 +382,40 @@ def record_run(
     *,
     csv_path: str | Path,
     jsonl_path: str | Path,
+    sink: Optional[RunLogSink] = None,
+    columnar: Optional["ColumnarSink"] = None,
 ) -> Dict[str, Any]:
     """Persist run analytics to both CSV and JSONL formats.
 
     Returns the flattened record for callers that wish to perform additional
-    in-memory analysis without re-flattening the payload.
+    in-memory analysis without re-flattening the payload.  ``sink`` defaults
+    to :func:`default_sink`; with ``columnar`` the flattened record is also
+    appended to a Parquet store (see :mod:`src.columnar_store`).
     """
 
+    sink = sink or default_sink()
     record = build_run_record(result, meta)
-    append_jsonl(jsonl_path, {"record": record, "raw_result": result})
+    sink.append_jsonl(jsonl_path, {"record": record, "raw_result": result})
 
     # Deterministic ordering keeps CSV columns stable across runs.
     fieldnames = sorted(record.keys())
-    append_csv(csv_path, fieldnames, record)
+    sink.append_csv(csv_path, fieldnames, record)
+    if columnar is not None:
+        columnar.append(record)
     return record
 
 
 __all__ = [
+    "DURABLE",
+    "IMMEDIATE",
+    "FlushPolicy",
+    "RunLogSink",
     "RunMetadata",
     "append_jsonl",
     "append_csv",
     "build_run_record",
+    "default_sink",
     "now_iso",
     "record_run",
+    "repair_tail",
 ]
@@ -1,34 +1,46 @@
 from __future__ import annotations
 
 import argparse
+import importlib
 import json
 import sys
 import time
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
 
 if __package__:
     # Package-relative imports when executed as ``python -m src.main``.
-    from .agents_hf import HFChatAgent
     from .agents_mock import MockAgent
-    from .controller import run_controller
+    from .columnar_store import ColumnarSink
     from .dsl import extension_from_config
     from .logger import RunMetadata, record_run
-    from .model_loader import load_model_and_tokenizer
-    from .schemas import get_envelope_validator
+    from .response_cache import configure_response_cache
     from .strategies import Strategy, build_strategy, list_strategy_ids
     from .template_loader import get_scenario, load_roleset
 else:  # pragma: no cover - fallback for direct execution
-    from agents_hf import HFChatAgent  # type: ignore
     from agents_mock import MockAgent  # type: ignore
-    from controller import run_controller  # type: ignore
+    from columnar_store import ColumnarSink  # type: ignore
     from dsl import extension_from_config  # type: ignore
     from logger import RunMetadata, record_run  # type: ignore
-    from model_loader import load_model_and_tokenizer  # type: ignore
-    from schemas import get_envelope_validator  # type: ignore
+    from response_cache import configure_response_cache  # type: ignore
     from strategies import Strategy, build_strategy, list_strategy_ids  # type: ignore
     from template_loader import get_scenario, load_roleset  # type: ignore
 
+if TYPE_CHECKING:
+    from .agents_hf import HFChatAgent
+    from .model_loader import DraftModel
+
+
+def _sibling(name: str) -> Any:
+    """Import a sibling module on first use.
+
+    The HF agent and model loader (torch, transformers), the controller and the
+    schema helpers (pydantic, jsonschema) are only needed once a run starts, and
+    real models only outside ``--mock``; ``--help`` imports none of them.
+    """
+
+    return importlib.import_module(f".{name}", __package__) if __package__ else importlib.import_module(name)
+
 
 ROOT = Path(__file__).resolve().parents[1]
 RUNS_DIR = ROOT / "runs"
@@ -94,10 +106,9 @@ def _load_models(
     *,
     dtype: Optional[str],
 ) -> Tuple[Tuple[Any, Any], Tuple[Any, Any]]:
-    if model_a == model_b:
-        model, tokenizer = load_model_and_tokenizer(model_a, dtype=dtype)
-        return (tokenizer, model), (tokenizer, model)
-
+    # Both loads resolve through the shared model cache, so identical ids (and
+    # repeated invocations within one process) reuse the resident weights.
+    load_model_and_tokenizer = _sibling("model_loader").load_model_and_tokenizer
     mdl_a, tok_a = load_model_and_tokenizer(model_a, dtype=dtype)
     mdl_b, tok_b = load_model_and_tokenizer(model_b, dtype=dtype)
     return (tok_a, mdl_a), (tok_b, mdl_b)
@@ -108,6 +119,9 @@ def _build_agents(
     tokenizer_pair: Tuple[Any, Any],
     model_pair: Tuple[Any, Any],
     strategy: Strategy,
+    *,
+    constrained_json: Optional[bool] = None,
+    draft: Optional[DraftModel] = None,
 ) -> Tuple[HFChatAgent, HFChatAgent]:
     agent_a_cfg = roleset.get("agent_a") or {}
     agent_b_cfg = roleset.get("agent_b") or {}
@@ -121,8 +135,13 @@ def _build_agents(
 
     tok_a, tok_b = tokenizer_pair
     mdl_a, mdl_b = model_pair
-    agent_a = HFChatAgent(str(name_a), str(system_a), tok_a, mdl_a, strategy)
-    agent_b = HFChatAgent(str(name_b), str(system_b), tok_b, mdl_b, strategy)
+    HFChatAgent = _sibling("agents_hf").HFChatAgent
+    agent_a = HFChatAgent(
+        str(name_a), str(system_a), tok_a, mdl_a, strategy, constrained_json=constrained_json, draft=draft
+    )
+    agent_b = HFChatAgent(
+        str(name_b), str(system_b), tok_b, mdl_b, strategy, constrained_json=constrained_json, draft=draft
+    )
     return agent_a, agent_b
 
 
@@ -141,7 +160,7 @@ def _prepare_validators(scenario: Mapping[str, Any]):
         or scenario.get("schema")
         or scenario.get("envelope_schema")
     )
-    schema_validator = get_envelope_validator(schema_ref) if schema_ref else None
+    schema_validator = _sibling("schemas").get_envelope_validator(schema_ref) if schema_ref else None
 
     dsl_config = scenario.get("dsl")
     dsl_validator = None
@@ -300,6 +319,7 @@ def _run_once(
     model_a: str,
     model_b: str,
     extra_meta: Mapping[str, Any],
+    columnar: Optional[ColumnarSink] = None,
 ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     task_text = str(scenario.get("task", "")).strip()
     if not task_text:
@@ -307,7 +327,7 @@ def _run_once(
 
     agent_a, agent_b = agent_pair
     start_time = time.time()
-    result = run_controller(
+    result = _sibling("controller").run_controller(
         task_text,
         agent_a,
         agent_b,
@@ -331,7 +351,7 @@ def _run_once(
         extra=dict(extra_meta),
     )
 
-    record = record_run(result, metadata, csv_path=csv_path, jsonl_path=jsonl_path)
+    record = record_run(result, metadata, csv_path=csv_path, jsonl_path=jsonl_path, columnar=columnar)
     return result, record
 
 
@@ -348,8 +368,29 @@ def _build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--model-a", dest="model_a", help="Override model id for agent A")
     parser.add_argument("--model-b", dest="model_b", help="Override model id for agent B")
     parser.add_argument("--dtype", help="Model dtype override (bf16, fp16, fp32)")
+    parser.add_argument(
+        "--draft-model",
+        dest="draft_model",
+        help="Small model id for assisted (speculative) decoding of both agents",
+    )
+    parser.add_argument(
+        "--constrained-json",
+        action="store_true",
+        default=None,
+        help="Constrain JSON/DSL replies to the envelope grammar while decoding",
+    )
+    parser.add_argument(
+        "--response-cache",
+        metavar="PATH",
+        help="Replay greedy generations from (and record them to) this SQLite cache",
+    )
     parser.add_argument("--csv-log", default=str(DEFAULT_CSV), help="Path to the summary CSV log")
     parser.add_argument("--jsonl-log", default=str(DEFAULT_JSONL), help="Path to the raw JSONL log")
+    parser.add_argument(
+        "--parquet-dir",
+        metavar="DIR",
+        help="Also append run records to a partitioned Parquet store (needs pyarrow)",
+    )
     parser.add_argument(
         "--show-transcript",
         action="store_true",
@@ -441,6 +482,7 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
     kind = scenario.get("kind")
     dsl_validator, schema_validator = _prepare_validators(scenario)
 
+    draft: Optional[DraftModel] = None
     if args.mock:
         model_a_id = model_b_id = "mock"
         tokenizer_pair = (None, None)
@@ -456,8 +498,13 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
         (tok_a, mdl_a), (tok_b, mdl_b) = _load_models(model_a_id, model_b_id, dtype=dtype)
         tokenizer_pair = (tok_a, tok_b)
         model_pair = (mdl_a, mdl_b)
+        draft_id = args.draft_model or _pick(scenario, "draft_model", "models", "draft")
+        if draft_id:
+            draft = _sibling("model_loader").load_draft_model(draft_id, dtype=dtype)
 
     csv_path, jsonl_path = _resolve_log_paths(args)
+    response_cache = configure_response_cache(args.response_cache) if args.response_cache else None
+    columnar = ColumnarSink(args.parquet_dir) if args.parquet_dir else None
 
     results: List[Tuple[str, Dict[str, Any]]] = []
     for strategy_id in strategy_ids:
@@ -467,7 +514,14 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
             mock_solution = str(scenario.get("mock_solution", "TRUE"))
             agent_pair = _mock_agents(strategy, mock_solution)
         else:
-            agent_pair = _build_agents(roleset, tokenizer_pair, model_pair, strategy)
+            agent_pair = _build_agents(
+                roleset,
+                tokenizer_pair,
+                model_pair,
+                strategy,
+                constrained_json=args.constrained_json,
+                draft=draft,
+            )
 
         result, record = _run_once(
             scenario_id,
@@ -484,6 +538,7 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
             model_a=model_a_id,
             model_b=model_b_id,
             extra_meta={"task_kind": task_kind},
+            columnar=columnar,
         )
 
         out_name = f"{_timestamp()}_{scenario_id}_{strategy_id}.json"
@@ -501,9 +556,15 @@ def main(argv: Optional[Sequence[str]] = None) -> None:
         print(f"WROTE {jsonl_path}")
         results.append((strategy_id, result))
 
+    if columnar is not None:
+        columnar.close()
+        print(f"WROTE {columnar.files_written} Parquet file(s) under {columnar.root}")
     if len(results) > 1:
         wins = sum(1 for _, res in results if res.get("status") == "CONSENSUS")
         print(f"\nCompleted {len(results)} runs: {wins} reached consensus.")
+    if response_cache is not None:
+        stats = response_cache.stats
+        print(f"Response cache: hits={stats.hits} misses={stats.misses} evictions={stats.evictions}")
 
 
 if __name__ == "__main__":  # pragma: no cover - CLI entrypoint
@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""Persistent worker-pool executor for matrix runs.
+
+``scripts/run_tasks.py`` launches one ``python -m ...`` subprocess per task,
+so every cell pays interpreter start-up, imports and a model load.  Here a
+fixed set of long-lived worker processes is started once, each pinned to a
+device (``CUDA_VISIBLE_DEVICES`` is set before CUDA initialises) and keeping
+its models resident through the process-wide model cache.  The parent hands
+each idle worker the next cell, so faster devices simply take more of them.
+
+Only the parent writes the master CSV: one row per finished cell, flushed and
+``fsync``-ed before the next, so a killed job leaves at most a torn final line
+that is dropped on the next start.  Re-running with the same ``--logdir``
+skips every (task, strategy, repeat) already recorded.  A cell whose worker
+dies is re-queued on a fresh worker up to ``--max-attempts`` times; cells that
+raise are logged to ``matrix_errors.jsonl`` and left for the next resume.
+Every worker reports on its own pipe, so one that dies mid-message cannot
+block the others.
+
+Example::
+
+    python -m src.matrix_pool --tasks tasks/tasks.yaml --logdir logs/matrix_pool \\
+        --model-a MODEL --model-b MODEL --devices cuda:0,cuda:1 --repeats 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import importlib
+import json
+import multiprocessing as mp
+import os
+import time
+import traceback
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from multiprocessing.connection import wait as wait_ready
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from src.logger import DURABLE, RunLogSink, repair_tail
+from src.prompt_table import get_prompt_table
+from src.run_matrix import MASTER_FIELDS, MatrixCell, build_row, ensure_dir, load_tasks
+
+DEFAULT_RUNNER = "src.simple_dialog:run_dialog"
+CellKey = Tuple[str, str, str, int]
+
+
+def cell_key(cell: MatrixCell) -> CellKey:
+    # Shards may list the same task, strategy and repeat under several rolesets.
+    return (str(cell.task["id"]), str(cell.task.get("roleset") or ""), cell.strategy, int(cell.repeat_idx))
+
+
+# -- master CSV -------------------------------------------------------------
+
+
+def recorded_cells(path: str) -> Set[CellKey]:
+    """Cells that already have a row in the master CSV at ``path``."""
+
+    if not os.path.exists(path):
+        return set()
+    repair_tail(path)
+    done: Set[CellKey] = set()
+    with open(path, newline="", encoding="utf-8") as handle:
+        for row in csv.DictReader(handle):
+            try:
+                done.add((row["task_id"], row.get("roleset") or "", row["strategy"], int(row["repeat_idx"])))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return done
+
+
+def append_row(
+    path: str,
+    row: Dict[str, Any],
+    fieldnames: Sequence[str] = MASTER_FIELDS,
+    *,
+    sink: Optional[RunLogSink] = None,
+) -> None:
+    """Append ``row`` durably, writing the header first if the file is new.
+
+    Without ``sink`` a one-off :data:`~src.logger.DURABLE` sink is used.
+    """
+
+    if sink is not None:
+        sink.append_csv(path, fieldnames, row, extrasaction="ignore")
+        return
+    with RunLogSink(DURABLE) as own:
+        own.append_csv(path, fieldnames, row, extrasaction="ignore")
+
+
+# -- cells --------------------------------------------------------------------
+
+
+def load_shard_cells(path: str, task_defs: str, *, seed: int = 42) -> List[MatrixCell]:
+    """Cells from a shard JSONL written by ``tools/build_tasks_from_logs.py``.
+
+    Records look like ``{"dataset", "language", "pair", "rep"}``: task id,
+    strategy, roleset and repeat index of one matrix cell.  Scenario text and
+    answer regexes are looked up by task id in ``task_defs``.
+    """
+
+    tasks = {str(task["id"]): task for task in load_tasks(task_defs)}
+    cells: List[MatrixCell] = []
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            task_id = str(record["dataset"])
+            if task_id not in tasks:
+                raise KeyError(f"Task '{task_id}' not found in {task_defs}")
+            task = dict(tasks[task_id])
+            if record.get("pair"):
+                task["roleset"] = record["pair"]
+            rep = int(record.get("rep", 0))
+            cells.append(MatrixCell(task=task, strategy=str(record["language"]), repeat_idx=rep, seed=seed + rep))
+    return cells
+
+
+def matrix_cells(tasks: Iterable[Dict[str, Any]], strategies: Sequence[str], repeats: int, seed: int) -> List[MatrixCell]:
+    return [
+        MatrixCell(task=task, strategy=strat, repeat_idx=rep, seed=seed + rep)
+        for task in tasks
+        for strat in strategies
+        for rep in range(repeats)
+    ]
+
+
+# -- workers ----------------------------------------------------------------
+
+
+@dataclass
+class PoolOptions:
+    """Settings every worker needs to turn a cell into a master CSV row."""
+
+    model_a: str
+    model_b: str
+    turns: int = 6
+    max_new_tokens: int = 192
+    temperature: float = 0.7
+    top_p: float = 0.9
+    runner: str = DEFAULT_RUNNER
+
+
+def _resolve_runner(spec: str) -> Callable[..., Dict[str, Any]]:
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _pin_device(device: str) -> None:
+    if device.startswith("cuda"):
+        _, _, index = device.partition(":")
+        os.environ["CUDA_VISIBLE_DEVICES"] = index or "0"
+    elif device == "cpu":
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+
+def _worker_main(worker_id: int, device: str, options: Dict[str, Any], inbox: Any, results: Any) -> None:
+    # Must run before anything initialises CUDA in this process.
+    _pin_device(device)
+    opts = PoolOptions(**options)
+    runner = _resolve_runner(opts.runner)
+    row_args = argparse.Namespace(model_a=opts.model_a, model_b=opts.model_b, turns=opts.turns)
+    get_prompt_table().compile()
+    results.send(("ready", worker_id, None, None))
+
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        cell = MatrixCell(**item)
+        key = cell_key(cell)
+        try:
+            ensure_dir(cell.outdir)
+            start = time.time()
+            out = runner(
+                scenario=cell.task["scenario"],
+                strategy=cell.strategy,
+                roleset=cell.task["roleset"],
+                turns=opts.turns,
+                model_a=opts.model_a,
+                model_b=opts.model_b,
+                max_new_tokens=opts.max_new_tokens,
+                temperature=opts.temperature,
+                top_p=opts.top_p,
+                seed=cell.seed,
+                outdir=cell.outdir,
+            )
+            elapsed = out.get("elapsed_sec") or (time.time() - start)
+            row = build_row(cell, out, row_args, elapsed)
+        except Exception:
+            results.send(("error", worker_id, key, traceback.format_exc()))
+            continue
+        results.send(("done", worker_id, key, row))
+
+
+@dataclass
+class PoolReport:
+    completed: int = 0
+    skipped: int = 0
+    failed: int = 0
+    crashed_workers: int = 0
+    elapsed_sec: float = 0.0
+
+
+class MatrixPool:
+    """Run matrix cells on long-lived, device-pinned worker processes."""
+
+    def __init__(
+        self,
+        logdir: str,
+        options: PoolOptions,
+        *,
+        devices: Sequence[str] = ("cpu",),
+        workers: Optional[int] = None,
+        max_attempts: int = 2,
+        poll_interval: float = 1.0,
+        parquet_dir: Optional[str] = None,
+    ) -> None:
+        self.logdir = logdir
+        self.options = options
+        self.devices = list(devices) or ["cpu"]
+        self.workers = max(int(workers or len(self.devices)), 1)
+        self.max_attempts = max(int(max_attempts), 1)
+        self.poll_interval = poll_interval
+        self.master_csv = os.path.join(logdir, "matrix_results.csv")
+        self.errors_jsonl = os.path.join(logdir, "matrix_errors.jsonl")
+        self.parquet_dir = parquet_dir
+        self._ctx = mp.get_context("spawn")
+
+    def _spawn(self, worker_id: int, inbox: Any, results: Any) -> Any:
+        device = self.devices[worker_id % len(self.devices)]
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, device, asdict(self.options), inbox, results),
+            name=f"matrix-worker-{worker_id}",
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def run(self, cells: Sequence[MatrixCell]) -> PoolReport:
+        ensure_dir(self.logdir)
+        # Fails fast (before any worker starts) when pyarrow is missing.
+        columnar = None
+        if self.parquet_dir:
+            from src.columnar_store import ColumnarSink
+
+            columnar = ColumnarSink(self.parquet_dir)
+        started = time.time()
+        report = PoolReport()
+        done = recorded_cells(self.master_csv)
+        todo: Dict[CellKey, MatrixCell] = {}
+        for cell in cells:
+            key = cell_key(cell)
+            if key in done or key in todo:
+                report.skipped += 1
+                continue
+            cell.outdir = cell.outdir or os.path.join(self.logdir, cell.run_id)
+            todo[key] = cell
+        if report.skipped:
+            print(f"RESUME skipping {report.skipped} recorded cells")
+        if not todo:
+            report.elapsed_sec = round(time.time() - started, 3)
+            return report
+
+        # Each worker holds at most one cell, handed out by the parent, so the
+        # parent always knows which cell a dead worker was running.
+        pending = deque(todo)
+        attempts: Dict[CellKey, int] = {key: 0 for key in todo}
+        assigned: Dict[int, Optional[CellKey]] = {}
+        ready: Set[int] = set()
+        inboxes: Dict[int, Any] = {}
+        conns: Dict[int, Any] = {}
+        procs: Dict[int, Any] = {}
+
+        def _start(wid: int) -> None:
+            # A private results pipe: a worker that dies mid-send only breaks
+            # its own channel.  The parent drops its copy of the sending end so
+            # a dead worker reads as EOF.
+            receiver, sender = self._ctx.Pipe(duplex=False)
+            inboxes[wid] = self._ctx.Queue()
+            procs[wid] = self._spawn(wid, inboxes[wid], sender)
+            sender.close()
+            conns[wid] = receiver
+
+        for wid in range(min(self.workers, len(todo))):
+            _start(wid)
+        total = len(todo)
+        log = RunLogSink(DURABLE)
+
+        def _dispatch() -> None:
+            for wid in procs:
+                if assigned.get(wid) is None and pending:
+                    key = pending.popleft()
+                    attempts[key] += 1
+                    assigned[wid] = key
+                    inboxes[wid].put(asdict(todo[key]))
+
+        def _give_up(key: CellKey, error: str) -> None:
+            report.failed += 1
+            task_id, roleset, strategy, rep = key
+            log.append_jsonl(
+                self.errors_jsonl,
+                {
+                    "timestamp": datetime.now().isoformat(timespec="seconds"),
+                    "task_id": task_id,
+                    "roleset": roleset,
+                    "strategy": strategy,
+                    "repeat_idx": rep,
+                    "attempts": attempts[key],
+                    "error": error,
+                },
+            )
+            print(f"[ERR] {task_id} × {roleset} × {strategy} rep{rep}: {error.strip().splitlines()[-1]}")
+
+        try:
+            _dispatch()
+            while pending or any(key is not None for key in assigned.values()):
+                messages = []
+                owners = {id(conn): wid for wid, conn in conns.items()}
+                for conn in wait_ready(list(conns.values()), timeout=self.poll_interval):
+                    try:
+                        messages.append(conn.recv())
+                    except (EOFError, OSError):
+                        procs[owners[id(conn)]].join(timeout=1)  # exited; restarted below
+
+                for kind, wid, key, payload in messages:
+                    if kind == "ready":
+                        ready.add(wid)
+                        continue
+                    key = tuple(key)
+                    if assigned.get(wid) == key:
+                        assigned[wid] = None
+                    if kind == "done":
+                        append_row(self.master_csv, payload, sink=log)
+                        if columnar is not None:
+                            columnar.append(payload)
+                        report.completed += 1
+                        print(
+                            f"[{report.completed}/{total}] {payload['task_id']} × {payload['strategy']} "
+                            f"rep{payload['repeat_idx']} -> {payload['out_jsonl']} ({payload['elapsed_sec']:.1f}s)"
+                        )
+                    else:
+                        _give_up(key, payload)
+                    _dispatch()
+
+                for wid, proc in list(procs.items()):
+                    if proc.is_alive():
+                        continue
+                    if wid not in ready:
+                        raise RuntimeError(f"matrix worker {wid} failed to start (exit code {proc.exitcode})")
+                    ready.discard(wid)
+                    report.crashed_workers += 1
+                    print(f"WORKER {wid} exited with code {proc.exitcode}")
+                    key = assigned.pop(wid, None)
+                    if key is not None:
+                        if attempts[key] >= self.max_attempts:
+                            _give_up(key, f"worker exited with code {proc.exitcode}\n")
+                        else:
+                            pending.appendleft(key)
+                    conns.pop(wid).close()
+                    inboxes[wid].cancel_join_thread()
+                    _start(wid)
+                _dispatch()
+        finally:
+            for wid, proc in procs.items():
+                if proc.is_alive():
+                    inboxes[wid].put(None)
+            for proc in procs.values():
+                proc.join(timeout=30)
+                if proc.is_alive():
+                    proc.terminate()
+            for conn in conns.values():
+                conn.close()
+            log.close()
+            if columnar is not None:
+                columnar.close()
+
+        report.elapsed_sec = round(time.time() - started, 3)
+        return report
+
+
+def default_devices() -> List[str]:
+    try:
+        import torch
+
+        count = torch.cuda.device_count()
+    except Exception:
+        count = 0
+    return [f"cuda:{idx}" for idx in range(count)] or ["cpu"]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Run matrix cells on a persistent worker pool")
+    ap.add_argument(
+        "--tasks",
+        default="tasks/tasks.yaml",
+        help="Task YAML (full strategy × repeat product) or shard JSONL from tools/build_tasks_from_logs.py",
+    )
+    ap.add_argument("--task-defs", default="tasks/tasks.yaml", help="Task YAML used to resolve shard JSONL ids")
+    ap.add_argument("--strategies", default="ALL", help="Comma list or ALL (YAML tasks only)")
+    ap.add_argument("--repeats", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=42, help="Base seed; each repeat adds +k")
+    ap.add_argument("--logdir", required=True, help="Output directory; re-running resumes it")
+    ap.add_argument("--model-a", required=True)
+    ap.add_argument("--model-b", required=True)
+    ap.add_argument("--turns", type=int, default=6)
+    ap.add_argument("--max-new-tokens", type=int, default=192)
+    ap.add_argument("--temperature", type=float, default=0.7)
+    ap.add_argument("--top-p", type=float, default=0.9)
+    ap.add_argument("--devices", default=None, help="Comma list, e.g. cuda:0,cuda:1 (default: all GPUs, else cpu)")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes, spread round-robin over devices")
+    ap.add_argument("--max-attempts", type=int, default=2, help="Retries for a cell whose worker died")
+    ap.add_argument("--parquet-dir", default=None, help="Also append rows to a partitioned Parquet store (needs pyarrow)")
+    ap.add_argument("--runner", default=DEFAULT_RUNNER, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.tasks.endswith(".jsonl"):
+        cells = load_shard_cells(args.tasks, args.task_defs, seed=args.seed)
+    else:
+        if args.strategies == "ALL":
+            from src.presets import STRATEGIES
+
+            strategies = sorted(STRATEGIES)
+        else:
+            strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+        cells = matrix_cells(load_tasks(args.tasks), strategies, args.repeats, args.seed)
+
+    devices = [d.strip() for d in args.devices.split(",") if d.strip()] if args.devices else default_devices()
+    options = PoolOptions(
+        model_a=args.model_a,
+        model_b=args.model_b,
+        turns=args.turns,
+        max_new_tokens=args.max_new_tokens,
+        temperature=args.temperature,
+        top_p=args.top_p,
+        runner=args.runner,
+    )
+    pool = MatrixPool(
+        args.logdir,
+        options,
+        devices=devices,
+        workers=args.workers,
+        max_attempts=args.max_attempts,
+        parquet_dir=args.parquet_dir,
+    )
+    print(f"Loaded {len(cells)} cells; devices={','.join(devices)} workers={pool.workers}")
+    report = pool.run(cells)
+    print("POOL", json.dumps(asdict(report)))
+    print("WROTE", pool.master_csv)
+    if report.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
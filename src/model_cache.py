@@ -0,0 +1,208 @@
+"""Process-wide cache of loaded models and tokenizers.
+
+Matrix sweeps call the dialog runners once per (task, strategy, repeat) cell.
+Without a shared cache every call reads the checkpoint from disk and moves it
+to the device again, which dominates wall-clock time for 7B models.  Loaders
+register through :func:`get_model_cache` so that identical requests resolve to
+the same resident ``(model, tokenizer)`` pair.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+MAX_MODELS_ENV = "LLM_MODEL_CACHE_MAX"
+
+Loader = Callable[[], Tuple[Any, Any]]
+
+
+class ModelKey(NamedTuple):
+    model_id: str
+    dtype: str
+    device: str
+    tokenizer_id: str
+
+
+@dataclass
+class LoadMetrics:
+    """Per-key bookkeeping surfaced through :meth:`ModelCache.stats`."""
+
+    model_id: str
+    dtype: str
+    device: str
+    load_seconds: float = 0.0
+    loads: int = 0
+    hits: int = 0
+
+
+def _key_part(value: Any, default: str) -> str:
+    if value is None:
+        return default
+    text = str(value).strip()
+    return text or default
+
+
+def make_key(
+    model_id: str,
+    *,
+    dtype: Any = None,
+    device: Any = None,
+    tokenizer_id: Optional[str] = None,
+) -> ModelKey:
+    return ModelKey(
+        model_id=str(model_id),
+        dtype=_key_part(dtype, "default").lower(),
+        device=_key_part(device, "auto").lower(),
+        tokenizer_id=str(tokenizer_id or model_id),
+    )
+
+
+def _release_device_memory() -> None:
+    try:
+        import torch
+    except Exception:  # pragma: no cover - torch is optional for mock runs
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ModelCache:
+    """LRU cache of ``(model, tokenizer)`` pairs keyed by :class:`ModelKey`."""
+
+    def __init__(self, max_models: Optional[int] = None) -> None:
+        self._entries: "OrderedDict[ModelKey, Tuple[Any, Any]]" = OrderedDict()
+        self._metrics: Dict[ModelKey, LoadMetrics] = {}
+        self._lock = threading.RLock()
+        self.max_models = max_models
+        self.evictions = 0
+
+    @property
+    def max_models(self) -> Optional[int]:
+        return self._max_models
+
+    @max_models.setter
+    def max_models(self, value: Optional[int]) -> None:
+        if value is not None and int(value) <= 0:
+            value = None
+        self._max_models = int(value) if value is not None else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def get_or_load(self, key: ModelKey, loader: Loader) -> Tuple[Any, Any]:
+        """Return the cached pair for ``key`` or call ``loader`` to populate it."""
+
+        with self._lock:
+            metrics = self._metrics.get(key)
+            if metrics is None:
+                metrics = LoadMetrics(key.model_id, key.dtype, key.device)
+                self._metrics[key] = metrics
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                metrics.hits += 1
+                return entry
+
+            start = time.perf_counter()
+            entry = loader()
+            metrics.load_seconds += time.perf_counter() - start
+            metrics.loads += 1
+
+            self._entries[key] = entry
+            self._evict_over_capacity()
+            return entry
+
+    def _evict_over_capacity(self) -> None:
+        if self._max_models is None:
+            return
+        evicted = False
+        while len(self._entries) > self._max_models:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            _release_device_memory()
+
+    def evict(self, key: ModelKey) -> bool:
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return False
+            self.evictions += 1
+        _release_device_memory()
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._metrics.clear()
+            self.evictions = 0
+        _release_device_memory()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_model = [asdict(m) for m in self._metrics.values()]
+            return {
+                "resident": len(self._entries),
+                "max_models": self._max_models,
+                "loads": sum(m["loads"] for m in per_model),
+                "hits": sum(m["hits"] for m in per_model),
+                "evictions": self.evictions,
+                "load_seconds": round(sum(m["load_seconds"] for m in per_model), 3),
+                "models": per_model,
+            }
+
+
+def _env_max_models() -> Optional[int]:
+    raw = os.environ.get(MAX_MODELS_ENV, "").strip()
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        return None
+
+
+_CACHE = ModelCache(max_models=_env_max_models())
+
+
+def get_model_cache() -> ModelCache:
+    return _CACHE
+
+
+def configure_model_cache(*, max_models: Optional[int] = None) -> ModelCache:
+    """Adjust the LRU cap of the shared cache, evicting immediately if needed."""
+
+    with _CACHE._lock:
+        _CACHE.max_models = max_models
+        _CACHE._evict_over_capacity()
+    return _CACHE
+
+
+def format_cache_stats(stats: Optional[Dict[str, Any]] = None) -> str:
+    data = stats or _CACHE.stats()
+    return (
+        f"models resident={data['resident']} loads={data['loads']} "
+        f"hits={data['hits']} evictions={data['evictions']} "
+        f"load_s={data['load_seconds']:.1f}"
+    )
+
+
+__all__ = [
+    "LoadMetrics",
+    "MAX_MODELS_ENV",
+    "ModelCache",
+    "ModelKey",
+    "configure_model_cache",
+    "format_cache_stats",
+    "get_model_cache",
+    "make_key",
+]
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+import copy
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
 
 from jinja2 import TemplateError
 
@@ -9,13 +11,19 @@ import torch
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
+    LogitsProcessorList,
     PreTrainedModel,
     PreTrainedTokenizer,
-    StoppingCriteria,
     StoppingCriteriaList,
 )
 
+from .constrained_json import EnvelopeLogitsProcessor, TokenGrammar
 from .control_trailer import CTRL_PREFIX, CTRL_SUFFIX
+from .model_cache import get_model_cache, make_key
+from .prefix_cache import PrefixCache, PrefixLookup
+from .response_cache import ResponseCache, get_response_cache, response_key
+from .stop_criteria import StopSequences
+from .token_budget import count_tokens
 
 
 TINY_REPO = "roneneldan/TinyStories-1M"
@@ -36,8 +44,13 @@ _DTYPE_ALIASES: Mapping[str, torch.dtype] = {
 }
 
 
-class SuffixStop(StoppingCriteria):
-    """Stop generation once the decoded text contains the CTRL suffix."""
+class SuffixStop(StopSequences):
+    """Stop generation once the generated text contains the CTRL suffix.
+
+    ``suffix`` may be the suffix text or one specific tokenisation of it; in
+    both cases every row of a batch is matched incrementally (see
+    :class:`~src.stop_criteria.StopSequences`).
+    """
 
     def __init__(
         self,
@@ -45,110 +58,25 @@ class SuffixStop(StoppingCriteria):
         suffix: str | Sequence[int],
         *,
         input_length: int | None = None,
-        lookback_chars: int = 160,
     ) -> None:
-        super().__init__()
-        self._tokenizer = tokenizer
-        self._suffix = suffix
         if isinstance(suffix, str):
-            suffix_text = suffix
-            encoded = tokenizer.encode(suffix_text, add_special_tokens=False)
-            if hasattr(encoded, "input_ids"):
-                self._suffix_ids = [int(t) for t in encoded.input_ids]  # type: ignore[arg-type]
-            else:
-                self._suffix_ids = [int(t) for t in encoded]
+            stops, patterns = [suffix], ()
         else:
-            suffix_list = list(suffix)
-            suffix_text = tokenizer.decode(suffix_list, skip_special_tokens=False)
-            self._suffix_ids = [int(token) for token in suffix_list]
-        self._lookback = max(int(lookback_chars), len(suffix_text))
-        self.triggered = False
-        self._input_length = int(input_length) if input_length is not None else None
-        self._suffix_tensor: Optional[torch.Tensor] = None
-
-    def _suffix_tensor_for(self, device: torch.device, dtype: torch.dtype) -> torch.Tensor:
-        if (
-            self._suffix_tensor is None
-            or self._suffix_tensor.device != device
-            or self._suffix_tensor.dtype != dtype
-        ):
-            self._suffix_tensor = torch.tensor(self._suffix_ids, device=device, dtype=dtype)
-        return self._suffix_tensor
-
-    def set_input_length(self, n: int) -> None:
-        self._input_length = int(n)
-
-    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **_: Any) -> bool:
-        if input_ids.numel() == 0 or not self._suffix_ids:
-            return False
-
-        prompt_tokens = max(int(self._input_length or 0), 0)
-        prompt_tokens = min(prompt_tokens, int(input_ids.shape[-1]))
-        tail_view = input_ids[0, prompt_tokens:]
-
-        if tail_view.shape[-1] < len(self._suffix_ids):
-            return False
-
-        suffix_tensor = self._suffix_tensor_for(tail_view.device, tail_view.dtype)
-        if torch.equal(tail_view[-len(self._suffix_ids) :], suffix_tensor):
-            self.triggered = True
-            return True
-
-        return False
-
-
-def _safe_token_length(tokenizer: PreTrainedTokenizer, text: str) -> int:
-    if not text:
-        return 0
-    try:
-        tokens = tokenizer.encode(text, add_special_tokens=False)
-    except TypeError:
-        tokens = tokenizer.encode(text)
-    except Exception:
-        tokens = None
-    if tokens is None:
-        stripped = text.strip()
-        return len(stripped.split()) if stripped else 0
-    if hasattr(tokens, "input_ids") and hasattr(tokens.input_ids, "__len__"):
-        return len(tokens.input_ids)  # type: ignore[arg-type]
-    if hasattr(tokens, "__len__"):
-        return len(tokens)  # type: ignore[arg-type]
-    return 0
+            ids = [int(token) for token in suffix]
+            stops, patterns = [tokenizer.decode(ids, skip_special_tokens=False)], (ids,)
+        super().__init__(tokenizer, stops, input_length=input_length, token_patterns=patterns)
+        self._suffix = suffix
 
 
 def _safe_token_length(tokenizer: PreTrainedTokenizer, text: str) -> int:
-    if not text:
-        return 0
-    try:
-        tokens = tokenizer.encode(text, add_special_tokens=False)
-    except TypeError:
-        tokens = tokenizer.encode(text)
-    except Exception:
-        tokens = None
-    if tokens is None:
-        stripped = text.strip()
-        return len(stripped.split()) if stripped else 0
-    if hasattr(tokens, "input_ids") and hasattr(tokens.input_ids, "__len__"):
-        return len(tokens.input_ids)  # type: ignore[arg-type]
-    if hasattr(tokens, "__len__"):
-        return len(tokens)  # type: ignore[arg-type]
-    return 0
+    return count_tokens(tokenizer, text)
 
 
 def _estimate_trailer_budget(tokenizer: PreTrainedTokenizer, max_new_tokens: int) -> int:
     if max_new_tokens <= 0:
         return 0
-    try:
-        template_tokens = tokenizer.encode(TRAILER_TEMPLATE, add_special_tokens=False)
-    except TypeError:
-        template_tokens = tokenizer.encode(TRAILER_TEMPLATE)
-    except Exception:
-        template_tokens = None
-    if hasattr(template_tokens, "__len__"):
-        template_len = len(template_tokens)  # type: ignore[arg-type]
-    else:
-        template_len = 0
-    if template_len <= 0:
+    template_len = count_tokens(tokenizer, TRAILER_TEMPLATE)
+    if template_len <= 1:  # no usable tokenizer; the template is never one token
         template_len = max(len(TRAILER_TEMPLATE) // 4, 1)
 
     fractional_reserve = max(int(max_new_tokens * TRAILER_RESERVE_FRACTION), 0)
@@ -174,6 +102,88 @@ class GenerationResult:
     suffix_triggered: bool = False
     body_budget: int = 0
     trailer_budget: int = 0
+    prefix_cache_hits: int = 0
+    prefix_cache_misses: int = 0
+    prefix_tokens_reused: int = 0
+    prefill_tokens: int = 0
+    decode_tokens: int = 0
+    salvage_tokens: int = 0
+    response_cache_hit: bool = False
+    draft_tokens: int = 0
+    draft_accepted: int = 0
+    verify_steps: int = 0
+
+
+@dataclass
+class DraftModel:
+    """Small model that proposes tokens for assisted (speculative) decoding.
+
+    ``tokenizer`` is only consulted when the draft's vocabulary differs from
+    the target's; ``generate`` then re-tokenises candidates between the two.
+    ``num_assistant_tokens`` overrides the number of tokens drafted per step.
+    """
+
+    model: PreTrainedModel
+    tokenizer: Optional[PreTrainedTokenizer] = None
+    name: str = ""
+    num_assistant_tokens: Optional[int] = None
+    _shared_vocab: Dict[int, bool] = field(default_factory=dict, repr=False)
+
+    def shares_vocab(self, tokenizer: PreTrainedTokenizer) -> bool:
+        if self.tokenizer is None or self.tokenizer is tokenizer:
+            return True
+        known = self._shared_vocab.get(id(tokenizer))
+        if known is None:
+            try:
+                known = self.tokenizer.get_vocab() == tokenizer.get_vocab()
+            except Exception:
+                known = True
+            self._shared_vocab[id(tokenizer)] = known
+        return known
+
+    def generate_kwargs(self, tokenizer: PreTrainedTokenizer) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {"assistant_model": self.model}
+        if self.num_assistant_tokens is not None:
+            kwargs["num_assistant_tokens"] = int(self.num_assistant_tokens)
+        if not self.shares_vocab(tokenizer):
+            kwargs.update(tokenizer=tokenizer, assistant_tokenizer=self.tokenizer)
+        return kwargs
+
+
+@contextmanager
+def _count_forwards(*modules: Any) -> Iterator[List[int]]:
+    """Count forward passes of each module while the block runs."""
+
+    counts = [0] * len(modules)
+    handles = []
+    for index, module in enumerate(modules):
+        register = getattr(module, "register_forward_hook", None)
+        if register is None:
+            continue
+
+        def _hook(*_: Any, _index: int = index) -> None:
+            counts[_index] += 1
+
+        handles.append(register(_hook))
+    try:
+        yield counts
+    finally:
+        for handle in handles:
+            handle.remove()
+
+
+def _draft_metrics(counts: Sequence[int], new_tokens: int) -> Dict[str, int]:
+    """Drafted/accepted token counts from target and draft forward passes.
+
+    Every target pass verifies one block of candidates and emits the accepted
+    prefix plus one token of its own, so accepted = new tokens - target passes.
+    A call that ends on EOS or the length cap inside an accepted block loses that
+    final bonus token, which undercounts acceptance by at most one per call.
+    """
+
+    verify_steps, drafted = int(counts[0]), int(counts[1])
+    accepted = min(max(int(new_tokens) - verify_steps, 0), drafted)
+    return {"draft_tokens": drafted, "draft_accepted": accepted, "verify_steps": verify_steps}
 
 
 def _resolve_dtype(dtype: Optional[str]) -> Optional[torch.dtype]:
@@ -182,15 +192,12 @@ def _resolve_dtype(dtype: Optional[str]) -> Optional[torch.dtype]:
     return _DTYPE_ALIASES.get(dtype.lower())
 
 
-def load_model_and_tokenizer(
+def _load_uncached(
     model_name: str,
-    *,
-    tokenizer_name: Optional[str] = None,
-    dtype: Optional[str] = "bf16",
-    **extra: Any,
+    tokenizer_name: Optional[str],
+    dtype: Optional[str],
+    extra: Mapping[str, Any],
 ) -> Tuple[PreTrainedModel, PreTrainedTokenizer]:
-    """Load a causal LM and matching tokenizer."""
-
     tok_ref = tokenizer_name or model_name
     tokenizer = AutoTokenizer.from_pretrained(tok_ref, trust_remote_code=True)
     if tokenizer.pad_token_id is None and tokenizer.eos_token_id is not None:
@@ -212,6 +219,31 @@ def load_model_and_tokenizer(
     return model, tokenizer
 
 
+def load_model_and_tokenizer(
+    model_name: str,
+    *,
+    tokenizer_name: Optional[str] = None,
+    dtype: Optional[str] = "bf16",
+    cached: bool = True,
+    **extra: Any,
+) -> Tuple[PreTrainedModel, PreTrainedTokenizer]:
+    """Load a causal LM and matching tokenizer.
+
+    Loads go through the process-wide :mod:`model_cache` so repeated requests for
+    the same (model, dtype, device) return the resident instance; ``cached=False``
+    skips it.  Calls that pass extra ``from_pretrained`` kwargs (``use_cache``
+    included) cannot be keyed safely and always load fresh.
+    """
+
+    if not cached or extra:
+        return _load_uncached(model_name, tokenizer_name, dtype, extra)
+
+    key = make_key(model_name, dtype=dtype, device="auto", tokenizer_id=tokenizer_name)
+    return get_model_cache().get_or_load(
+        key, lambda: _load_uncached(model_name, tokenizer_name, dtype, {})
+    )
+
+
 def load_causal_lm(
     model_name: str,
     *,
@@ -227,6 +259,19 @@ def load_causal_lm(
     return tokenizer, model
 
 
+def load_draft_model(
+    model_name: str,
+    *,
+    tokenizer_name: Optional[str] = None,
+    dtype: Optional[str] = "bf16",
+    num_assistant_tokens: Optional[int] = None,
+) -> DraftModel:
+    """Load a draft model for assisted decoding through the shared model cache."""
+
+    model, tokenizer = load_model_and_tokenizer(model_name, tokenizer_name=tokenizer_name, dtype=dtype)
+    return DraftModel(model, tokenizer, name=model_name, num_assistant_tokens=num_assistant_tokens)
+
+
 def _has_chat_template(tokenizer: PreTrainedTokenizer) -> bool:
     return bool(getattr(tokenizer, "chat_template", None))
 
@@ -334,6 +379,35 @@ def build_inputs(
     return encoded.input_ids
 
 
+def _system_content(prompt: Sequence[Dict[str, str]] | str) -> Optional[str]:
+    if isinstance(prompt, str):
+        return None
+    for message in prompt:
+        if isinstance(message, Mapping) and str(message.get("role", "")).lower() == "system":
+            content = str(message.get("content", ""))
+            return content or None
+    return None
+
+
+def _lookup_prefix(
+    prefix_cache: Optional[PrefixCache],
+    model: PreTrainedModel,
+    tokenizer: PreTrainedTokenizer,
+    prompt: Sequence[Dict[str, str]] | str,
+    input_ids: torch.Tensor,
+) -> PrefixLookup:
+    system_prompt = _system_content(prompt)
+    if prefix_cache is None or not system_prompt:
+        return PrefixLookup()
+    return prefix_cache.lookup(
+        model,
+        tokenizer,
+        system_prompt,
+        input_ids,
+        lambda messages: build_inputs(tokenizer, messages, add_generation_prompt=True),
+    )
+
+
 def _decode_generated(
     tokenizer: PreTrainedTokenizer,
     input_ids: torch.Tensor,
@@ -358,6 +432,147 @@ def _decode_generated(
     )
 
 
+def _generate_with_cache(
+    model: PreTrainedModel,
+    kwargs: Dict[str, Any],
+    *,
+    keep_cache: bool = True,
+) -> Tuple[torch.Tensor, Any]:
+    """Run ``generate`` and return ``(sequences, past_key_values)``."""
+
+    if keep_cache:
+        kwargs = dict(kwargs, return_dict_in_generate=True, use_cache=True)
+    output = model.generate(**kwargs)
+    sequences = getattr(output, "sequences", output)
+    return sequences, getattr(output, "past_key_values", None)
+
+
+_RESULT_FIELDS = frozenset(f.name for f in fields(GenerationResult))
+
+
+def _cached_lookup(
+    cache: Optional[ResponseCache],
+    kind: str,
+    model: PreTrainedModel,
+    input_ids: torch.Tensor,
+    params: Mapping[str, Any],
+) -> Tuple[Optional[str], Optional[GenerationResult]]:
+    """Response-cache key for a greedy call and the stored result, if any."""
+
+    if cache is None:
+        return None, None
+    key = response_key(kind, model, input_ids[0].tolist(), params)
+    if key is None:
+        return None, None
+    stored = cache.get(key)
+    if stored is None:
+        return key, None
+    result = GenerationResult(**{k: v for k, v in stored.items() if k in _RESULT_FIELDS})
+    # Nothing ran on the model for this call.
+    result.prefix_cache_hits = result.prefix_cache_misses = result.prefix_tokens_reused = 0
+    result.prefill_tokens = result.decode_tokens = result.salvage_tokens = 0
+    result.draft_tokens = result.draft_accepted = result.verify_steps = 0
+    result.response_cache_hit = True
+    return key, result
+
+
+def _cache_length(past: Any) -> int:
+    if past is None:
+        return 0
+    get_len = getattr(past, "get_seq_length", None)
+    if callable(get_len):
+        try:
+            return int(get_len())
+        except Exception:
+            return 0
+    if isinstance(past, (tuple, list)) and past and isinstance(past[0], (tuple, list)) and past[0]:
+        return int(past[0][0].shape[-2])
+    return 0
+
+
+def _expand_prompt_cache(
+    model: PreTrainedModel,
+    input_ids: torch.Tensor,
+    past: Any,
+    reused: int,
+    num_samples: int,
+) -> Tuple[Any, int]:
+    """Prefill the prompt once and repeat its KV cache for ``num_samples`` rows.
+
+    ``generate(num_return_sequences=k)`` repeats ``input_ids`` before the
+    prefill, so every sample recomputes the prompt.  Here the prompt minus its
+    last token (which ``generate`` feeds itself) runs once on top of ``past``
+    (``reused`` tokens, e.g. from the prefix cache) and the resulting cache is
+    repeated along the batch dimension.  Returns ``(past, prefilled tokens)``;
+    ``past`` is ``None`` when the cache cannot be repeated.
+    """
+
+    pending = input_ids[:, reused:-1]
+    if pending.shape[-1]:
+        outputs = model(
+            input_ids=pending,
+            attention_mask=torch.ones_like(input_ids[:, :-1]),
+            past_key_values=past,
+            use_cache=True,
+        )
+        past = getattr(outputs, "past_key_values", None)
+    repeat = getattr(past, "batch_repeat_interleave", None)
+    if not callable(repeat):
+        return None, 0
+    repeat(int(num_samples))
+    return past, int(input_ids.shape[-1]) - int(reused)
+
+
+def _batch_prefill(
+    model: PreTrainedModel,
+    kwargs: Dict[str, Any],
+    input_ids: torch.Tensor,
+    reused: int,
+    num_samples: int,
+) -> int:
+    """Set up ``kwargs`` to sample ``num_samples`` rows; return prefilled tokens."""
+
+    kwargs["num_return_sequences"] = int(num_samples)
+    past, prefilled = _expand_prompt_cache(
+        model, input_ids, kwargs.pop("past_key_values", None), reused, num_samples
+    )
+    if past is None:
+        # Let ``generate`` repeat the prompt instead; every row prefills it.
+        return int(num_samples) * int(input_ids.shape[-1])
+    kwargs["past_key_values"] = past
+    return prefilled
+
+
+def _row_tokens(
+    sequences: torch.Tensor,
+    row: int,
+    input_length: int,
+    eos_token_id: Optional[int],
+    end: Optional[int] = None,
+) -> torch.Tensor:
+    """Generated tokens of one row, without the padding after it finished."""
+
+    tokens = sequences[row][input_length:end]
+    if eos_token_id is not None and tokens.numel():
+        hits = (tokens == int(eos_token_id)).nonzero()
+        if hits.numel():
+            tokens = tokens[: int(hits[0][0]) + 1]
+    return tokens
+
+
+def _row_cache(past: Any, row: int, rows: int) -> Any:
+    """KV cache of one batch row (a copy when the batch has several rows)."""
+
+    if past is None or rows == 1:
+        return past
+    select = getattr(past, "batch_select_indices", None)
+    if not callable(select):
+        return None
+    past = copy.deepcopy(past)
+    past.batch_select_indices(torch.tensor([row]))
+    return past
+
+
 @torch.inference_mode()
 def generate_with_trailer(
     model: PreTrainedModel,
@@ -365,11 +580,83 @@ def generate_with_trailer(
     prompt: Sequence[Dict[str, str]] | str,
     *,
     max_new_tokens: int = 512,
+    prefix_cache: Optional[PrefixCache] = None,
+    response_cache: Optional[ResponseCache] = None,
+    draft: Optional[DraftModel] = None,
     **generate_kwargs: Any,
 ) -> GenerationResult:
+    """Generate a reply that ends in a control trailer.
+
+    With ``draft`` the first pass runs as assisted generation; the output is
+    trimmed right after the CTRL suffix so the stop semantics match plain
+    decoding, and the salvage continuation (a short greedy pass) runs on the
+    target alone.  Greedy results are cached under the same key either way.
+    """
+
+    return _trailer_rows(
+        model,
+        tokenizer,
+        prompt,
+        1,
+        max_new_tokens=max_new_tokens,
+        prefix_cache=prefix_cache,
+        response_cache=response_cache,
+        draft=draft,
+        generate_kwargs=generate_kwargs,
+    )[0]
+
+
+@torch.inference_mode()
+def sample_with_trailer(
+    model: PreTrainedModel,
+    tokenizer: PreTrainedTokenizer,
+    prompt: Sequence[Dict[str, str]] | str,
+    num_samples: int,
+    *,
+    max_new_tokens: int = 512,
+    prefix_cache: Optional[PrefixCache] = None,
+    **generate_kwargs: Any,
+) -> List[GenerationResult]:
+    """Sample ``num_samples`` trailer replies from one batched ``generate`` call.
+
+    The prompt is prefilled once (see :func:`_expand_prompt_cache`); rows
+    without a closed trailer are salvaged one by one.  Prefill and prefix-cache
+    counters are reported on the first result only, so totals over the list
+    stay correct.  Greedy decoding yields a single result.
+    """
+
+    return _trailer_rows(
+        model,
+        tokenizer,
+        prompt,
+        max(int(num_samples), 1),
+        max_new_tokens=max_new_tokens,
+        prefix_cache=prefix_cache,
+        response_cache=None,
+        draft=None,
+        generate_kwargs=generate_kwargs,
+    )
+
+
+def _trailer_rows(
+    model: PreTrainedModel,
+    tokenizer: PreTrainedTokenizer,
+    prompt: Sequence[Dict[str, str]] | str,
+    num_samples: int,
+    *,
+    max_new_tokens: int,
+    prefix_cache: Optional[PrefixCache],
+    response_cache: Optional[ResponseCache],
+    draft: Optional[DraftModel],
+    generate_kwargs: Mapping[str, Any],
+) -> List[GenerationResult]:
     gen_kwargs: Dict[str, Any] = dict(generate_kwargs)
+    gen_kwargs.pop("num_return_sequences", None)
 
     requested_max = int(gen_kwargs.pop("max_new_tokens", max_new_tokens))
+    # A caller-planned split (see TrailerBudgetPlanner) is kept in the result's
+    # budget telemetry instead of being re-estimated from the fixed fraction.
+    planned_split = "trailer_budget" in gen_kwargs
     trailer_budget = int(
         gen_kwargs.pop(
             "trailer_budget",
@@ -383,11 +670,13 @@ def generate_with_trailer(
     min_new_tokens = int(gen_kwargs.pop("min_new_tokens", max(min(64, max_new_tokens // 2), 0)))
     raw_salvage = gen_kwargs.pop("salvage_max_new_tokens", None)
     salvage_max_tokens = max(
-        int(raw_salvage) if raw_salvage is not None else max(trailer_budget, 64),
+        int(raw_salvage) if raw_salvage is not None else trailer_budget,
         1,
     )
 
     do_sample = bool(gen_kwargs.pop("do_sample", True))
+    if not do_sample:
+        num_samples = 1
 
     input_ids = build_inputs(tokenizer, prompt, add_generation_prompt=True).to(model.device)
     attention_mask = torch.ones_like(input_ids)
@@ -431,7 +720,40 @@ def generate_with_trailer(
     if "torch_dtype" in final_kwargs and "dtype" not in final_kwargs:
         final_kwargs["dtype"] = final_kwargs.pop("torch_dtype")
 
-    generated = model.generate(**final_kwargs)
+    cache_key: Optional[str] = None
+    if not do_sample:
+        params = {k: v for k, v in final_kwargs.items() if k not in ("input_ids", "attention_mask", "stopping_criteria")}
+        params.update(
+            trailer_budget=trailer_budget,
+            body_budget=body_budget,
+            min_new_tokens=min_new_tokens,
+            salvage_max_new_tokens=salvage_max_tokens,
+        )
+        response_cache = response_cache if response_cache is not None else get_response_cache()
+        cache_key, cached = _cached_lookup(response_cache, "with_trailer", model, input_ids, params)
+        if cached is not None:
+            return [cached]
+
+    prefix = _lookup_prefix(prefix_cache, model, tokenizer, prompt, input_ids)
+    prefix_hits, prefix_misses = prefix.counters
+    prefix_reused = prefix.reused_tokens
+    if prefix.past_key_values is not None:
+        final_kwargs["past_key_values"] = prefix.past_key_values
+    prefill_tokens = int(input_ids.shape[-1]) - prefix_reused
+    if num_samples > 1:
+        prefill_tokens = _batch_prefill(model, final_kwargs, input_ids, prefix_reused, num_samples)
+
+    draft_stats = {"draft_tokens": 0, "draft_accepted": 0, "verify_steps": 0}
+    if draft is not None:
+        final_kwargs.update(draft.generate_kwargs(tokenizer))
+        with _count_forwards(model, draft.model) as forwards:
+            generated, first_pass_cache = _generate_with_cache(model, final_kwargs)
+        draft_stats = _draft_metrics(forwards, int(generated.shape[-1] - input_ids.shape[-1]))
+        end = stopper.match_ends[0] if stopper.triggered else None
+        if end is not None and end < generated.shape[-1]:
+            generated = generated[:, :end]
+    else:
+        generated, first_pass_cache = _generate_with_cache(model, final_kwargs)
 
     def _analyze_text(text: str) -> Dict[str, Any]:
         stripped = text.rstrip()
@@ -453,78 +775,123 @@ def generate_with_trailer(
             "body_text": body_text,
         }
 
-    gen_tokens = generated[0][input_ids.shape[-1] :]
-    total_tokens_used = int(gen_tokens.shape[-1])
-    eos_hit = bool(len(gen_tokens) and eos_token_id is not None and int(gen_tokens[-1]) == int(eos_token_id))
-    decoded = tokenizer.decode(gen_tokens, skip_special_tokens=True)
-
-    suffix_triggered = stopper.triggered
-    total_text = decoded
-    analysis = _analyze_text(total_text)
-    salvage_used = False
-
-    if (not suffix_triggered or not analysis["suffix_at_end"]) and salvage_max_tokens > 0:
-        salvage_stopper = SuffixStop(tokenizer, CTRL_SUFFIX, input_length=int(input_ids.shape[-1]))
-        salvage_stopping = StoppingCriteriaList([salvage_stopper])
-        salvage_kwargs: Dict[str, Any] = {
-            "input_ids": input_ids,
-            "attention_mask": attention_mask,
-            "max_new_tokens": int(salvage_max_tokens),
-            "do_sample": False,
-            "stopping_criteria": salvage_stopping,
-            "pad_token_id": pad_token_id,
-            "eos_token_id": eos_token_id,
-        }
-        if bad_words_ids is not None:
-            salvage_kwargs["bad_words_ids"] = bad_words_ids
-        salvage_output = model.generate(**salvage_kwargs)
-        salvage_tokens = salvage_output[0][input_ids.shape[-1] :]
-        total_tokens_used += int(salvage_tokens.shape[-1])
-        salvage_decoded = tokenizer.decode(salvage_tokens, skip_special_tokens=True)
-        if salvage_decoded:
-            total_text = f"{total_text}{salvage_decoded}"
-        suffix_triggered = suffix_triggered or salvage_stopper.triggered
-        eos_hit = eos_hit or (
-            bool(len(salvage_tokens))
-            and eos_token_id is not None
-            and int(salvage_tokens[-1]) == int(eos_token_id)
-        )
-        analysis = _analyze_text(total_text)
-        salvage_used = True
-
-    suffix_triggered = suffix_triggered or analysis["suffix_at_end"]
+    rows = int(generated.shape[0])
+    match_ends = stopper.match_ends if stopper.triggered else []
 
-    trailer_text = analysis["trailer_text"]
-    body_text = analysis["body_text"]
-    body_tokens = _safe_token_length(tokenizer, body_text)
-    trailer_tokens = _safe_token_length(tokenizer, trailer_text)
+    def _finish(row: int) -> GenerationResult:
+        end = match_ends[row] if row < len(match_ends) else None
+        gen_tokens = _row_tokens(generated, row, int(input_ids.shape[-1]), eos_token_id, end)
+        total_tokens_used = int(gen_tokens.shape[-1])
+        eos_hit = bool(len(gen_tokens) and eos_token_id is not None and int(gen_tokens[-1]) == int(eos_token_id))
+        decoded = tokenizer.decode(gen_tokens, skip_special_tokens=True)
 
-    reserved_tokens = int(max_new_tokens) + (int(salvage_max_tokens) if salvage_used else 0)
-    trailer_budget = _estimate_trailer_budget(tokenizer, reserved_tokens)
-    body_budget = max(reserved_tokens - trailer_budget, 0)
+        suffix_triggered = end is not None if rows > 1 else stopper.triggered
+        total_text = decoded
+        analysis = _analyze_text(total_text)
+        salvage_used = False
+        hits, misses = (prefix_hits, prefix_misses) if row == 0 else (0, 0)
+        reused = prefix_reused if row == 0 else 0
+        prefilled = prefill_tokens if row == 0 else 0
+
+        salvage_token_count = 0
+        if (not suffix_triggered or not analysis["suffix_at_end"]) and salvage_max_tokens > 0:
+            # Continue greedily from the body already produced instead of restarting
+            # from the prompt: the first pass's KV cache covers everything except the
+            # last sampled token, so salvage only prefills that token.
+            continued = generated[row : row + 1, : input_ids.shape[-1] + total_tokens_used]
+            row_cache = first_pass_cache
+            if eos_hit:
+                continued = continued[:, :-1]
+                row_cache = None
+            salvage_stopper = SuffixStop(tokenizer, CTRL_SUFFIX, input_length=int(continued.shape[-1]))
+            salvage_stopping = StoppingCriteriaList([salvage_stopper])
+            salvage_kwargs: Dict[str, Any] = {
+                "input_ids": continued,
+                "attention_mask": torch.ones_like(continued),
+                "max_new_tokens": int(salvage_max_tokens),
+                "do_sample": False,
+                "stopping_criteria": salvage_stopping,
+                "pad_token_id": pad_token_id,
+                "eos_token_id": eos_token_id,
+            }
+            if bad_words_ids is not None:
+                salvage_kwargs["bad_words_ids"] = bad_words_ids
+            cached_len = _cache_length(row_cache)
+            if row_cache is not None and 0 < cached_len < continued.shape[-1]:
+                row_cache = _row_cache(row_cache, row, rows)
+            if row_cache is not None and 0 < cached_len < continued.shape[-1]:
+                salvage_kwargs["past_key_values"] = row_cache
+                prefilled += int(continued.shape[-1]) - cached_len
+            else:
+                salvage_prefix = _lookup_prefix(prefix_cache, model, tokenizer, prompt, continued)
+                if salvage_prefix.past_key_values is not None:
+                    salvage_kwargs["past_key_values"] = salvage_prefix.past_key_values
+                salvage_hits, salvage_misses = salvage_prefix.counters
+                hits += salvage_hits
+                misses += salvage_misses
+                reused += salvage_prefix.reused_tokens
+                prefilled += int(continued.shape[-1]) - salvage_prefix.reused_tokens
+            salvage_output, _ = _generate_with_cache(model, salvage_kwargs, keep_cache=False)
+            salvage_tokens = salvage_output[0][continued.shape[-1] :]
+            salvage_token_count = int(salvage_tokens.shape[-1])
+            total_tokens_used += salvage_token_count
+            total_text = tokenizer.decode(salvage_output[0][input_ids.shape[-1] :], skip_special_tokens=True)
+            suffix_triggered = suffix_triggered or salvage_stopper.triggered
+            eos_hit = eos_hit or (
+                bool(len(salvage_tokens))
+                and eos_token_id is not None
+                and int(salvage_tokens[-1]) == int(eos_token_id)
+            )
+            analysis = _analyze_text(total_text)
+            salvage_used = True
+
+        suffix_triggered = suffix_triggered or analysis["suffix_at_end"]
+
+        trailer_text = analysis["trailer_text"]
+        body_text = analysis["body_text"]
+        body_tokens = _safe_token_length(tokenizer, body_text)
+        trailer_tokens = _safe_token_length(tokenizer, trailer_text)
+
+        reserved_tokens = int(max_new_tokens) + (int(salvage_max_tokens) if salvage_used else 0)
+        row_trailer_budget = trailer_budget
+        if not planned_split:
+            row_trailer_budget = _estimate_trailer_budget(tokenizer, reserved_tokens)
+        row_body_budget = max(reserved_tokens - row_trailer_budget, 0)
+
+        stop_reason = "suffix" if suffix_triggered else ("eos" if eos_hit else "max_new_tokens")
+
+        overflow_tokens = max(0, total_tokens_used - reserved_tokens)
+
+        return GenerationResult(
+            text=total_text,
+            stop_reason=stop_reason,
+            tokens_used=total_tokens_used,
+            overflow_tokens=overflow_tokens,
+            has_tail=analysis["has_tail"],
+            trailer_offset=analysis["trailer_offset"],
+            input_tokens=int(input_ids.shape[-1]),
+            max_new_tokens=int(max_new_tokens),
+            tokens_reserved=reserved_tokens,
+            body_tokens=body_tokens,
+            trailer_tokens=trailer_tokens,
+            tokens_body_overflow=max(body_tokens - row_body_budget, 0),
+            tokens_trailer_overflow=max(trailer_tokens - row_trailer_budget, 0),
+            suffix_triggered=suffix_triggered,
+            body_budget=row_body_budget,
+            trailer_budget=row_trailer_budget,
+            prefix_cache_hits=hits,
+            prefix_cache_misses=misses,
+            prefix_tokens_reused=reused,
+            prefill_tokens=prefilled,
+            decode_tokens=total_tokens_used,
+            salvage_tokens=salvage_token_count,
+            **draft_stats,
+        )
 
-    stop_reason = "suffix" if suffix_triggered else ("eos" if eos_hit else "max_new_tokens")
-
-    overflow_tokens = max(0, total_tokens_used - reserved_tokens)
-
-    return GenerationResult(
-        text=total_text,
-        stop_reason=stop_reason,
-        tokens_used=total_tokens_used,
-        overflow_tokens=overflow_tokens,
-        has_tail=analysis["has_tail"],
-        trailer_offset=analysis["trailer_offset"],
-        input_tokens=int(input_ids.shape[-1]),
-        max_new_tokens=int(max_new_tokens),
-        tokens_reserved=reserved_tokens,
-        body_tokens=body_tokens,
-        trailer_tokens=trailer_tokens,
-        tokens_body_overflow=max(body_tokens - body_budget, 0),
-        tokens_trailer_overflow=max(trailer_tokens - trailer_budget, 0),
-        suffix_triggered=suffix_triggered,
-        body_budget=body_budget,
-        trailer_budget=trailer_budget,
-    )
+    results = [_finish(row) for row in range(rows)]
+    if cache_key is not None and response_cache is not None:
+        response_cache.put(cache_key, asdict(results[0]))
+    return results
 
 
 @torch.inference_mode()
@@ -535,8 +902,74 @@ def generate_json_only(
     *,
     user_prompt: Optional[str] = None,
     decoding: Optional[Dict[str, Any]] = None,
+    prefix_cache: Optional[PrefixCache] = None,
+    constraint: Optional[TokenGrammar] = None,
+    response_cache: Optional[ResponseCache] = None,
+    draft: Optional[DraftModel] = None,
     **legacy_kwargs: Any,
 ) -> GenerationResult:
+    return _json_rows(
+        tokenizer,
+        model,
+        prompt_or_messages,
+        1,
+        user_prompt=user_prompt,
+        decoding=decoding,
+        prefix_cache=prefix_cache,
+        constraint=constraint,
+        response_cache=response_cache,
+        draft=draft,
+        legacy_kwargs=legacy_kwargs,
+    )[0]
+
+
+@torch.inference_mode()
+def sample_json_only(
+    tokenizer: PreTrainedTokenizer,
+    model: PreTrainedModel,
+    prompt_or_messages: Sequence[Dict[str, str]] | str,
+    num_samples: int,
+    *,
+    user_prompt: Optional[str] = None,
+    decoding: Optional[Dict[str, Any]] = None,
+    prefix_cache: Optional[PrefixCache] = None,
+    constraint: Optional[TokenGrammar] = None,
+) -> List[GenerationResult]:
+    """Sample ``num_samples`` JSON replies from one batched ``generate`` call.
+
+    Same prefill sharing and counter attribution as :func:`sample_with_trailer`;
+    greedy decoding yields a single result.
+    """
+
+    return _json_rows(
+        tokenizer,
+        model,
+        prompt_or_messages,
+        max(int(num_samples), 1),
+        user_prompt=user_prompt,
+        decoding=decoding,
+        prefix_cache=prefix_cache,
+        constraint=constraint,
+        response_cache=None,
+        draft=None,
+        legacy_kwargs={},
+    )
+
+
+def _json_rows(
+    tokenizer: PreTrainedTokenizer,
+    model: PreTrainedModel,
+    prompt_or_messages: Sequence[Dict[str, str]] | str,
+    num_samples: int,
+    *,
+    user_prompt: Optional[str],
+    decoding: Optional[Dict[str, Any]],
+    prefix_cache: Optional[PrefixCache],
+    constraint: Optional[TokenGrammar],
+    response_cache: Optional[ResponseCache],
+    draft: Optional[DraftModel],
+    legacy_kwargs: Mapping[str, Any],
+) -> List[GenerationResult]:
     if isinstance(prompt_or_messages, Sequence) and prompt_or_messages and isinstance(prompt_or_messages[0], dict):
         messages = list(prompt_or_messages)  # type: ignore[arg-type]
     else:
@@ -549,12 +982,15 @@ def generate_json_only(
 
     decode_cfg: Dict[str, Any] = dict(decoding or {})
     decode_cfg.update(legacy_kwargs)
+    decode_cfg.pop("num_return_sequences", None)
 
     max_new_tokens = int(decode_cfg.pop("max_new_tokens", 256))
     do_sample = bool(decode_cfg.pop("do_sample", False))
     temperature = float(decode_cfg.pop("temperature", 0.0)) if do_sample else 0.0
     top_p = decode_cfg.pop("top_p", None)
     top_k = decode_cfg.pop("top_k", None)
+    if not do_sample:
+        num_samples = 1
 
     input_ids = build_inputs(tokenizer, messages, add_generation_prompt=True).to(model.device)
     attention_mask = torch.ones_like(input_ids)
@@ -580,32 +1016,78 @@ def generate_json_only(
     if eos_token_id is not None:
         generate_args.setdefault("eos_token_id", eos_token_id)
 
-    generated = model.generate(**generate_args)
-    gen_tokens = generated[0][input_ids.shape[-1] :]
-    eos_hit = bool(len(gen_tokens) and eos_token_id is not None and int(gen_tokens[-1]) == int(eos_token_id))
-    stop_reason = "eos" if eos_hit else "length"
-
-    return GenerationResult(
-        text=tokenizer.decode(gen_tokens, skip_special_tokens=True),
-        stop_reason=stop_reason,
-        tokens_used=int(gen_tokens.shape[-1]),
-        overflow_tokens=max(0, int(gen_tokens.shape[-1]) - max_new_tokens),
-        has_tail=False,
-        trailer_offset=-1,
-        input_tokens=int(input_ids.shape[-1]),
-        max_new_tokens=max_new_tokens,
-    )
+    cache_key: Optional[str] = None
+    if not do_sample:
+        params = {k: v for k, v in generate_args.items() if k not in ("input_ids", "attention_mask")}
+        params["constraint"] = constraint.key if constraint is not None else None
+        response_cache = response_cache if response_cache is not None else get_response_cache()
+        cache_key, cached = _cached_lookup(response_cache, "json_only", model, input_ids, params)
+        if cached is not None:
+            return [cached]
+
+    if constraint is not None:
+        processors = LogitsProcessorList(generate_args.pop("logits_processor", None) or [])
+        processors.append(EnvelopeLogitsProcessor(constraint, input_length=int(input_ids.shape[-1])))
+        generate_args["logits_processor"] = processors
+
+    prefix = _lookup_prefix(prefix_cache, model, tokenizer, messages, input_ids)
+    if prefix.past_key_values is not None:
+        generate_args["past_key_values"] = prefix.past_key_values
+    prefix_hits, prefix_misses = prefix.counters
+    prefill_tokens = int(input_ids.shape[-1]) - prefix.reused_tokens
+    if num_samples > 1:
+        prefill_tokens = _batch_prefill(model, generate_args, input_ids, prefix.reused_tokens, num_samples)
+
+    draft_stats = {"draft_tokens": 0, "draft_accepted": 0, "verify_steps": 0}
+    if draft is not None:
+        generate_args.update(draft.generate_kwargs(tokenizer))
+        with _count_forwards(model, draft.model) as forwards:
+            generated = model.generate(**generate_args)
+        draft_stats = _draft_metrics(forwards, int(generated.shape[-1] - input_ids.shape[-1]))
+    else:
+        generated = model.generate(**generate_args)
+
+    results: List[GenerationResult] = []
+    for row in range(int(generated.shape[0])):
+        gen_tokens = _row_tokens(generated, row, int(input_ids.shape[-1]), eos_token_id)
+        eos_hit = bool(len(gen_tokens) and eos_token_id is not None and int(gen_tokens[-1]) == int(eos_token_id))
+        first = row == 0
+        results.append(
+            GenerationResult(
+                text=tokenizer.decode(gen_tokens, skip_special_tokens=True),
+                stop_reason="eos" if eos_hit else "length",
+                tokens_used=int(gen_tokens.shape[-1]),
+                overflow_tokens=max(0, int(gen_tokens.shape[-1]) - max_new_tokens),
+                has_tail=False,
+                trailer_offset=-1,
+                input_tokens=int(input_ids.shape[-1]),
+                max_new_tokens=max_new_tokens,
+                prefix_cache_hits=prefix_hits if first else 0,
+                prefix_cache_misses=prefix_misses if first else 0,
+                prefix_tokens_reused=prefix.reused_tokens if first else 0,
+                prefill_tokens=prefill_tokens if first else 0,
+                decode_tokens=int(gen_tokens.shape[-1]),
+                **draft_stats,
+            )
+        )
+    if cache_key is not None and response_cache is not None:
+        response_cache.put(cache_key, asdict(results[0]))
+    return results
 
 
 __all__ = [
     "TINY_REPO",
     "TINY_TOKENIZER",
+    "DraftModel",
     "GenerationResult",
     "SuffixStop",
     "build_inputs",
     "generate_json_only",
     "generate_with_trailer",
     "load_causal_lm",
+    "load_draft_model",
     "load_model_and_tokenizer",
+    "sample_json_only",
+    "sample_with_trailer",
     "_render_chat",
 ]
@@ -0,0 +1,227 @@
+"""Reusable KV caches for the static system prefix of agent prompts.
+
+``HFChatAgent`` sends the same system prompt (base prompt, pseudocode insert,
+strategy snippet and ``CONTROL_TRAILER_GUIDE``) on every turn, so most of each
+prefill recomputes identical keys/values.  :class:`PrefixCache` keeps the
+``past_key_values`` of that prefix per (model, tokenizer, prefix hash) and hands
+out private copies so ``generate`` only prefills the per-turn suffix.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import torch
+
+from .prompt_table import PromptTable, get_prompt_table
+from .weak_owners import WeakOwnerIndex
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+# Plain ASCII probes that differ in their first character, so the rendered
+# templates diverge exactly where the user content starts.
+_PROBES = ("A", "Z")
+
+Renderer = Callable[[Sequence[Mapping[str, str]]], torch.Tensor]
+
+
+@dataclass
+class PrefixLookup:
+    past_key_values: Any = None
+    reused_tokens: int = 0
+    hit: bool = False
+    enabled: bool = False
+
+    @property
+    def counters(self) -> Tuple[int, int]:
+        """``(hits, misses)`` contribution of this lookup."""
+        if not self.enabled:
+            return (0, 0)
+        return (1, 0) if self.hit else (0, 1)
+
+
+def _common_prefix_len(a: Sequence[int], b: Sequence[int]) -> int:
+    n = min(len(a), len(b))
+    for idx in range(n):
+        if a[idx] != b[idx]:
+            return idx
+    return n
+
+
+def _tensor_nbytes(tensor: Any) -> int:
+    if isinstance(tensor, torch.Tensor):
+        return tensor.numel() * tensor.element_size()
+    return 0
+
+
+def cache_nbytes(past: Any) -> int:
+    """Best-effort size of a ``past_key_values`` object across transformers versions."""
+
+    layers = getattr(past, "layers", None)
+    if layers is not None:
+        return sum(
+            _tensor_nbytes(getattr(layer, "keys", None)) + _tensor_nbytes(getattr(layer, "values", None))
+            for layer in layers
+        )
+    key_cache = getattr(past, "key_cache", None)
+    value_cache = getattr(past, "value_cache", None)
+    if key_cache is not None and value_cache is not None:
+        return sum(_tensor_nbytes(t) for t in key_cache) + sum(_tensor_nbytes(t) for t in value_cache)
+    if isinstance(past, (tuple, list)):
+        return sum(cache_nbytes(item) if isinstance(item, (tuple, list)) else _tensor_nbytes(item) for item in past)
+    return 0
+
+
+def _ids_hash(ids: Sequence[int]) -> str:
+    return hashlib.sha256(",".join(str(i) for i in ids).encode("ascii")).hexdigest()
+
+
+class PrefixCache:
+    """LRU store of prefix ``past_key_values`` bounded by total tensor bytes."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, *, prompts: Optional[PromptTable] = None) -> None:
+        self.max_bytes = int(max_bytes)
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[Any, int]]" = OrderedDict()
+        self._owners = WeakOwnerIndex(self._forget)
+        # Prefix token ids live in a prompt table; the shared cache uses the
+        # process-wide one, so runners and agents see the same entries.
+        self.prompts = prompts if prompts is not None else PromptTable()
+        self._lock = threading.RLock()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _forget(self, owner: int) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == owner]:
+                self.bytes_used -= self._entries.pop(key)[1]
+
+    # -- prefix discovery --------------------------------------------------
+    def prefix_ids(self, tokenizer: Any, system_prompt: str, render: Renderer) -> Tuple[int, ...]:
+        """Token ids shared by every prompt that starts with ``system_prompt``.
+
+        The template is rendered with two different probe user messages; their
+        longest common token prefix is the static part.  The final shared token is
+        dropped because BPE merges can fold it into the first user token.
+        """
+
+        def _shared_prefix(text: str) -> List[int]:
+            renders: List[List[int]] = []
+            for probe in _PROBES:
+                ids = render([{"role": "system", "content": text}, {"role": "user", "content": probe}])
+                renders.append([int(t) for t in ids[0].tolist()])
+            shared = max(_common_prefix_len(renders[0], renders[1]) - 1, 0)
+            return renders[0][:shared]
+
+        return self.prompts.token_ids(tokenizer, system_prompt, _shared_prefix, kind="chat_prefix")
+
+    # -- KV reuse ----------------------------------------------------------
+    def lookup(
+        self,
+        model: Any,
+        tokenizer: Any,
+        system_prompt: str,
+        input_ids: torch.Tensor,
+        render: Renderer,
+    ) -> PrefixLookup:
+        """Return a private copy of the prefix cache for ``input_ids`` if possible."""
+
+        try:
+            prefix = self.prefix_ids(tokenizer, system_prompt, render)
+        except Exception:
+            return self._miss()
+        if not prefix or input_ids.shape[0] != 1 or input_ids.shape[-1] <= len(prefix):
+            return self._miss()
+        if tuple(int(t) for t in input_ids[0, : len(prefix)].tolist()) != prefix:
+            return self._miss()
+
+        owner = self._owners.key(model)
+        if owner is None:
+            return self._miss()
+        key = (owner, _ids_hash(prefix))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return PrefixLookup(copy.deepcopy(entry[0]), len(prefix), True, True)
+
+        try:
+            past = self._prefill(model, input_ids[:, : len(prefix)])
+        except Exception:
+            return self._miss()
+        if past is None:
+            return self._miss()
+
+        self._store(key, past)
+        with self._lock:
+            self.misses += 1
+        return PrefixLookup(copy.deepcopy(past), len(prefix), False, True)
+
+    @staticmethod
+    def _prefill(model: Any, prefix_ids: torch.Tensor) -> Any:
+        with torch.inference_mode():
+            outputs = model(
+                input_ids=prefix_ids,
+                attention_mask=torch.ones_like(prefix_ids),
+                use_cache=True,
+            )
+        return getattr(outputs, "past_key_values", None)
+
+    def _store(self, key: Tuple[int, str], past: Any) -> None:
+        size = cache_nbytes(past)
+        if size <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes_used -= previous[1]
+            self._entries[key] = (past, size)
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes_used -= evicted_size
+                self.evictions += 1
+
+    def _miss(self) -> PrefixLookup:
+        with self._lock:
+            self.misses += 1
+        return PrefixLookup(enabled=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_SHARED = PrefixCache(prompts=get_prompt_table())
+
+
+def get_prefix_cache() -> PrefixCache:
+    return _SHARED
+
+
+__all__ = [
+    "DEFAULT_MAX_BYTES",
+    "PrefixCache",
+    "PrefixLookup",
+    "cache_nbytes",
+    "get_prefix_cache",
+]
@@ -0,0 +1,156 @@
+"""Precompiled system prompts and their token ids, shared process-wide.
+
+A matrix of tasks × strategies × repeats sends only a few dozen distinct
+system prompts: one per (roleset, strategy, actor) for ``run_dialog`` and one
+per agent configuration for ``HFChatAgent``.  :class:`PromptTable` renders
+each of them once, interns the result, and hands the same string object back
+on every later request.  Dict lookups keyed by those strings then reuse the
+cached ``str`` hash instead of rescanning the text every turn.
+
+The table also keeps token ids per (tokenizer, kind, text): the
+``<<SYSTEM>>`` header of ``SimpleHF`` prompts and the chat-template prefix
+that :class:`~src.prefix_cache.PrefixCache` reuses KV caches for.  Like
+:class:`~src.token_budget.TokenCache`, tokenizers are tracked through weak
+references and their ids are dropped when they are collected (e.g. after a
+model-cache eviction), so a recycled ``id()`` never serves another
+tokenizer's ids.
+
+``get_prompt_table().compile()`` pre-renders every preset combination at
+start-up; otherwise entries are filled on first use.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence, Tuple
+
+from .weak_owners import WeakOwnerIndex
+
+MAX_TOKEN_ENTRIES = 256
+MAX_JOINED_ENTRIES = 1024
+
+TokenIds = Tuple[int, ...]
+
+
+def build_system(role_text: str, strategy_text: str) -> str:
+    return f"{role_text}\n\n{strategy_text}".strip()
+
+
+class PromptTable:
+    """Lookup table of rendered system prompts and their token ids."""
+
+    def __init__(
+        self,
+        rolesets: Optional[Mapping[str, Mapping[str, str]]] = None,
+        strategies: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        self._rolesets = rolesets
+        self._strategies = strategies
+        self._systems: Dict[Tuple[str, str, str], str] = {}
+        self._joined: Dict[Tuple[str, ...], str] = {}
+        self._token_ids: "OrderedDict[Tuple[int, str, str], TokenIds]" = OrderedDict()
+        self._owners = WeakOwnerIndex(self._forget)
+        self._lock = threading.RLock()
+        self.token_hits = 0
+        self.token_misses = 0
+
+    def _presets(self) -> Tuple[Mapping[str, Mapping[str, str]], Mapping[str, str]]:
+        if self._rolesets is None or self._strategies is None:
+            from .presets import ROLESETS, STRATEGIES
+
+            self._rolesets = ROLESETS if self._rolesets is None else self._rolesets
+            self._strategies = STRATEGIES if self._strategies is None else self._strategies
+        return self._rolesets, self._strategies
+
+    # -- text --------------------------------------------------------------
+    def system(self, roleset: str, strategy: str, actor: str) -> str:
+        """System prompt of ``actor`` ("A"/"B") for ``roleset`` under ``strategy``."""
+
+        key = (roleset, strategy, actor)
+        text = self._systems.get(key)
+        if text is None:
+            rolesets, strategies = self._presets()
+            text = sys.intern(build_system(rolesets[roleset][actor], strategies[strategy]))
+            self._systems[key] = text
+        return text
+
+    def compile(self) -> int:
+        """Render every (roleset, strategy, actor) combination; returns the count."""
+
+        rolesets, strategies = self._presets()
+        for roleset, roles in rolesets.items():
+            for actor in roles:
+                for strategy in strategies:
+                    self.system(roleset, strategy, actor)
+        return len(self._systems)
+
+    def join(self, parts: Sequence[Optional[str]]) -> str:
+        """``"\\n\\n".join`` of the non-empty ``parts``, built once per combination."""
+
+        key = tuple(part for part in parts if part)
+        text = self._joined.get(key)
+        if text is None:
+            text = self._joined[key] = sys.intern("\n\n".join(key))
+            # Per-turn prefixes/suffixes from strategies can vary; keep the newest.
+            while len(self._joined) > MAX_JOINED_ENTRIES:
+                self._joined.pop(next(iter(self._joined)), None)
+        return text
+
+    # -- token ids ---------------------------------------------------------
+    def _forget(self, owner: int) -> None:
+        with self._lock:
+            for key in [k for k in self._token_ids if k[0] == owner]:
+                del self._token_ids[key]
+
+    def token_ids(self, tokenizer: Any, text: str, encode: Callable[[str], Sequence[int]], *, kind: str = "text") -> TokenIds:
+        """Token ids of ``text`` under ``tokenizer``, computed once with ``encode``.
+
+        ``kind`` separates different encodings of the same text (plain
+        tokenisation vs. a chat-template prefix).  Tokenizers that cannot be
+        weakly referenced are encoded every time.
+        """
+
+        with self._lock:
+            owner = self._owners.key(tokenizer)
+            key = (owner, kind, text)
+            cached = self._token_ids.get(key) if owner is not None else None
+            if cached is not None:
+                self._token_ids.move_to_end(key)
+                self.token_hits += 1
+                return cached
+        ids = tuple(int(t) for t in encode(text))
+        with self._lock:
+            self.token_misses += 1
+            if owner is not None:
+                self._token_ids[key] = ids
+                while len(self._token_ids) > MAX_TOKEN_ENTRIES:
+                    self._token_ids.popitem(last=False)
+        return ids
+
+    def clear(self) -> None:
+        with self._lock:
+            self._systems.clear()
+            self._joined.clear()
+            self._token_ids.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "systems": len(self._systems),
+                "joined": len(self._joined),
+                "token_entries": len(self._token_ids),
+                "token_hits": self.token_hits,
+                "token_misses": self.token_misses,
+            }
+
+
+_SHARED = PromptTable()
+
+
+def get_prompt_table() -> PromptTable:
+    return _SHARED
+
+
+__all__ = ["MAX_JOINED_ENTRIES", "MAX_TOKEN_ENTRIES", "PromptTable", "build_system", "get_prompt_table"]
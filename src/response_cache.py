@@ -0,0 +1,217 @@
+"""Persistent cache of deterministic generations.
+
+Greedy decoding returns the same text for the same model, prompt token ids
+and decoding parameters, so regression sweeps and CI replays can skip the
+forward passes entirely.  ``generate_json_only`` and ``generate_with_trailer``
+consult a :class:`ResponseCache` when one is passed in or configured through
+``LLM_RESPONSE_CACHE``; sampled generations are never cached.
+
+Entries are zlib-compressed JSON rows in a single SQLite file (WAL mode, so
+several processes can share it).  When the stored payload exceeds
+``max_bytes`` the least recently used rows are deleted until the total drops
+below ``EVICT_TO_FRACTION`` of the cap.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+RESPONSE_CACHE_ENV = "LLM_RESPONSE_CACHE"
+RESPONSE_CACHE_MAX_MB_ENV = "LLM_RESPONSE_CACHE_MAX_MB"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+EVICT_TO_FRACTION = 0.9
+KEY_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed);
+"""
+
+
+def _plain(value: Any) -> Any:
+    """JSON-compatible copy of ``value`` or ``TypeError`` for live objects."""
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Mapping):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    raise TypeError(f"uncacheable decoding parameter of type {type(value).__name__}")
+
+
+def model_fingerprint(model: Any) -> str:
+    config = getattr(model, "config", None)
+    name = getattr(config, "_name_or_path", None) or getattr(model, "name_or_path", "") or type(model).__name__
+    return f"{name}|{getattr(model, 'dtype', '')}"
+
+
+def response_key(
+    kind: str,
+    model: Any,
+    input_ids: Sequence[int],
+    params: Mapping[str, Any],
+) -> Optional[str]:
+    """Hash of everything that determines a greedy generation.
+
+    Returns ``None`` when ``params`` contain objects without a stable value
+    (logits processors, stopping criteria, tensors); such calls bypass the cache.
+    """
+
+    try:
+        plain = _plain(dict(params))
+    except TypeError:
+        return None
+    header = json.dumps(
+        {"v": KEY_VERSION, "kind": kind, "model": model_fingerprint(model), "params": plain},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    digest = hashlib.sha256(header.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(",".join(str(int(t)) for t in input_ids).encode("ascii"))
+    return digest.hexdigest()
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+
+class ResponseCache:
+    """Size-bounded SQLite key-value store for generation results."""
+
+    def __init__(self, path: str, *, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max(int(max_bytes), 1)
+        self.stats = ResponseCacheStats()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.stats.hits += 1
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, key: str, value: Mapping[str, Any]) -> None:
+        blob = zlib.compress(json.dumps(dict(value), separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            self.stats.writes += 1
+            self._evict()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TO_FRACTION
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.stats.evictions += len(victims)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0])
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def summary(self) -> Dict[str, Any]:
+        data = asdict(self.stats)
+        data.update(path=self.path, entries=len(self), bytes=self.size_bytes(), max_bytes=self.max_bytes)
+        return data
+
+
+_CACHE: Optional[ResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+_ENV_CHECKED = False
+
+
+def _env_max_bytes() -> int:
+    raw = os.environ.get(RESPONSE_CACHE_MAX_MB_ENV, "").strip()
+    try:
+        return int(float(raw) * 1024 * 1024) if raw else DEFAULT_MAX_BYTES
+    except ValueError:
+        return DEFAULT_MAX_BYTES
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The process-wide cache, opened from ``LLM_RESPONSE_CACHE`` on first use."""
+
+    global _CACHE, _ENV_CHECKED
+    if _ENV_CHECKED:
+        return _CACHE
+    with _CACHE_LOCK:
+        if not _ENV_CHECKED:
+            path = os.environ.get(RESPONSE_CACHE_ENV, "").strip()
+            if path and _CACHE is None:
+                _CACHE = ResponseCache(path, max_bytes=_env_max_bytes())
+            _ENV_CHECKED = True
+    return _CACHE
+
+
+def configure_response_cache(path: Optional[str], *, max_bytes: Optional[int] = None) -> Optional[ResponseCache]:
+    """Open (or with ``path=None`` disable) the process-wide response cache."""
+
+    global _CACHE, _ENV_CHECKED
+    with _CACHE_LOCK:
+        if _CACHE is not None:
+            _CACHE.close()
+        _CACHE = ResponseCache(path, max_bytes=max_bytes or _env_max_bytes()) if path else None
+        _ENV_CHECKED = True
+    return _CACHE
+
+
+__all__ = [
+    "RESPONSE_CACHE_ENV",
+    "RESPONSE_CACHE_MAX_MB_ENV",
+    "ResponseCache",
+    "ResponseCacheStats",
+    "configure_response_cache",
+    "get_response_cache",
+    "model_fingerprint",
+    "response_key",
+]
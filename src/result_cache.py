@@ -0,0 +1,179 @@
+"""Content-addressed cache of finished matrix cells.
+
+A cell is identified by everything that determines its output: scenario text,
+strategy text, both roleset prompts, model ids, the resolved generation
+config, turn count, seed and git revision.  :func:`cell_key` hashes a canonical
+JSON dump of those inputs, so editing a strategy prompt or bumping
+``max_new_tokens`` only invalidates the cells it actually touches.  Cells run
+in a lockstep batch share one RNG stream, so their key also lists the keys of
+every cell in that batch, in order.
+
+Entries live under ``<root>/objects/<kk>/<key>.json``.  ``<root>/index.jsonl``
+is an append-only list of known keys; it is read once when the cache opens, so
+lookups never list directories.  Objects are written to a temporary file and
+renamed into place before their index line is appended and fsync-ed, so a
+crash can lose at most the cell being written, and a torn final index line is
+cut off when the cache next opens.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+from .logger import repair_tail
+
+INDEX_NAME = "index.jsonl"
+
+
+def cell_key(
+    *,
+    scenario: str,
+    strategy_text: str,
+    roleset: Mapping[str, Any],
+    model_a: str,
+    model_b: str,
+    gen_config: Mapping[str, Any],
+    turns: int,
+    seed: Optional[int],
+    git_rev: str,
+    batch: Optional[Sequence[str]] = None,
+) -> str:
+    """SHA-256 of the canonical JSON of a cell's inputs.
+
+    ``batch`` lists the unbatched keys of the cells sampled together with this
+    one (including itself); leave it ``None`` for a cell run on its own.
+    """
+
+    payload = {
+        "scenario": scenario,
+        "strategy_text": strategy_text,
+        "roleset": dict(roleset),
+        "model_a": model_a,
+        "model_b": model_b,
+        "gen_config": dict(gen_config),
+        "turns": int(turns),
+        "seed": seed,
+        "git_rev": git_rev,
+    }
+    if batch is not None:
+        payload["batch"] = list(batch)
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ResultCache:
+    """On-disk ``key -> cell result`` store with a JSONL index."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self.index_path):
+            return
+        # Cut a torn tail from an interrupted append, so the next put starts
+        # a fresh line instead of extending the fragment.
+        repair_tail(self.index_path)
+        with open(self.index_path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = record.get("key")
+                if isinstance(key, str):
+                    self._index[key] = record
+
+    def _object_path(self, key: str) -> str:
+        return os.path.join(self.root, "objects", key[:2], f"{key}.json")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Stored entry for ``key`` (counted as a hit) or ``None`` (a miss)."""
+
+        entry: Optional[Dict[str, Any]] = None
+        if key in self._index:
+            try:
+                with open(self._object_path(key), "r", encoding="utf-8") as handle:
+                    entry = json.load(handle)
+            except (OSError, json.JSONDecodeError):
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        return entry
+
+    def put(self, key: str, result: Mapping[str, Any], **meta: Any) -> None:
+        """Store ``result`` under ``key``; ``meta`` is copied into the index line."""
+
+        path = self._object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"key": key, "meta": meta, "result": dict(result)}
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump(entry, handle, ensure_ascii=False)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        record = {"key": key, "created": datetime.now().isoformat(timespec="seconds"), **meta}
+        with self._lock:
+            with open(self.index_path, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+                handle.flush()
+                os.fsync(handle.fileno())
+            self._index[key] = record
+            self.stats.writes += 1
+
+    def summary(self) -> Dict[str, Any]:
+        data = asdict(self.stats)
+        data["hit_rate"] = round(self.stats.hit_rate, 3)
+        data["entries"] = len(self._index)
+        data["root"] = self.root
+        return data
+
+
+def format_result_cache_stats(summary: Mapping[str, Any]) -> str:
+    return (
+        f"cells hits={summary['hits']} misses={summary['misses']} "
+        f"hit_rate={summary['hit_rate']:.0%} entries={summary['entries']}"
+    )
+
+
+__all__ = ["CacheStats", "ResultCache", "cell_key", "format_result_cache_stats"]
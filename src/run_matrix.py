@@ -3,19 +3,51 @@ from __future__ import annotations
 
 import argparse
 import csv
+import json
 import os
 import re
 import subprocess
 import time
+from dataclasses import asdict, dataclass
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 
 import yaml
 
-from src.presets import STRATEGIES
-from src.simple_dialog import run_dialog
+from src.logger import RunLogSink
+from src.model_cache import configure_model_cache, format_cache_stats, get_model_cache
+from src.presets import ROLESETS, STRATEGIES
+from src.prompt_table import get_prompt_table
+from src.result_cache import ResultCache, cell_key, format_result_cache_stats
 
 
+MASTER_FIELDS = [
+    "timestamp",
+    "git_rev",
+    "task_id",
+    "strategy",
+    "roleset",
+    "model_a",
+    "model_b",
+    "turns",
+    "repeat_idx",
+    "seed",
+    "elapsed_sec",
+    "total_prompt_tokens",
+    "total_output_tokens",
+    "tokens_per_sec",
+    "first_hit_turn",
+    "last_stop_reason",
+    "out_jsonl",
+    "out_csv",
+    "batch_size",
+    "cache_key",
+    "cache_hit",
+]
+
+
+@lru_cache(maxsize=None)
 def _git_rev() -> str:
     try:
         return (
@@ -47,6 +79,105 @@ def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
+@dataclass
+class MatrixCell:
+    task: Dict[str, Any]
+    strategy: str
+    repeat_idx: int
+    seed: int
+    outdir: str = ""
+    cache_key: str = ""
+
+    @property
+    def run_id(self) -> str:
+        return f"{self.task['id']}_{self.strategy}_rep{self.repeat_idx}"
+
+
+def build_row(
+    cell: MatrixCell,
+    out: Dict[str, Any],
+    args: argparse.Namespace,
+    elapsed: float,
+    *,
+    batch_size: int = 1,
+    cache_hit: bool = False,
+) -> Dict[str, Any]:
+    cfg = out["config"]
+    transcript = out["transcript"]
+
+    total_prompt = int(cfg.get("total_prompt_tokens", 0))
+    total_output = int(cfg.get("total_output_tokens", 0))
+    tps = (total_prompt + total_output) / max(elapsed, 1e-6)
+    last_stop = transcript[-1].get("stop_reason") if transcript else None
+    first_hit = detect_first_hit(transcript, cell.task.get("answer_regex"))
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": _git_rev(),
+        "task_id": cell.task["id"],
+        "strategy": cell.strategy,
+        "roleset": cell.task["roleset"],
+        "model_a": args.model_a,
+        "model_b": args.model_b,
+        "turns": args.turns,
+        "repeat_idx": cell.repeat_idx,
+        "seed": cell.seed,
+        "elapsed_sec": round(elapsed, 3),
+        "total_prompt_tokens": total_prompt,
+        "total_output_tokens": total_output,
+        "tokens_per_sec": round(tps, 2),
+        "first_hit_turn": first_hit,
+        "last_stop_reason": last_stop,
+        "out_jsonl": out["out_jsonl"],
+        "out_csv": out["out_csv"],
+        "batch_size": batch_size,
+        "cache_key": cell.cache_key,
+        "cache_hit": cache_hit,
+    }
+
+
+def cell_cache_key(
+    cell: MatrixCell,
+    args: argparse.Namespace,
+    gen_config: Dict[str, Any],
+    batch: Optional[List[str]] = None,
+) -> str:
+    return cell_key(
+        scenario=cell.task["scenario"],
+        strategy_text=STRATEGIES[cell.strategy],
+        roleset=ROLESETS[cell.task["roleset"]],
+        model_a=args.model_a,
+        model_b=args.model_b,
+        gen_config=gen_config,
+        turns=args.turns,
+        seed=cell.seed,
+        git_rev=_git_rev(),
+        batch=batch,
+    )
+
+
+def assign_cache_keys(chunk: List[MatrixCell], args: argparse.Namespace, gen_config: Dict[str, Any]) -> None:
+    """Set ``cache_key`` on the cells of one chunk.
+
+    A chunk of several cells goes through ``run_dialog_batch``, which samples
+    each same-seed group from one RNG stream; those cells are keyed by their
+    group's composition as well, so a cached result is only reused for the
+    exact batch that produced it.
+    """
+
+    base = [cell_cache_key(cell, args, gen_config) for cell in chunk]
+    if len(chunk) == 1:
+        chunk[0].cache_key = base[0]
+        return
+    groups: Dict[int, List[int]] = {}
+    for idx, cell in enumerate(chunk):
+        groups.setdefault(cell.seed, []).append(idx)
+    for members in groups.values():
+        batch = [base[idx] for idx in members]
+        for idx in members:
+            chunk[idx].cache_key = cell_cache_key(chunk[idx], args, gen_config, batch=batch)
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--tasks", default="tasks/tasks.yaml")
@@ -70,8 +201,44 @@ def main() -> None:
         help="Base seed; each repeat adds +k",
     )
     ap.add_argument("--outdir", default="logs/matrix")
+    ap.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Run N matrix cells in lockstep with batched generate calls",
+    )
+    ap.add_argument(
+        "--max-resident-models",
+        type=int,
+        default=None,
+        help="LRU cap on models kept loaded between cells (default: unbounded)",
+    )
+    ap.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Content-addressed result cache shared across runs (default: <outdir>/cache)",
+    )
+    ap.add_argument(
+        "--parquet-dir",
+        default=None,
+        help="Also append rows to a partitioned Parquet store (needs pyarrow)",
+    )
+    ap.add_argument(
+        "--resume",
+        action="store_true",
+        help="Serve cells already in the result cache instead of re-running them",
+    )
     args = ap.parse_args()
 
+    # Imported here so the helpers above stay importable without torch, e.g.
+    # by the parent process of src.matrix_pool.
+    from src.simple_dialog import DialogSpec, _resolve_gen_cfg, restore_run, run_dialog, run_dialog_batch
+
+    if args.max_resident_models is not None:
+        configure_model_cache(max_models=args.max_resident_models)
+    # Every cell's system prompts come from this table; render them up front.
+    get_prompt_table().compile()
+
     tasks = load_tasks(args.tasks)
     if args.strategies == "ALL":
         strategies = sorted(STRATEGIES)
@@ -83,98 +250,125 @@ def main() -> None:
     ensure_dir(root_out)
 
     master_csv = os.path.join(root_out, "matrix_results.csv")
-    fieldnames = [
-        "timestamp",
-        "git_rev",
-        "task_id",
-        "strategy",
-        "roleset",
-        "model_a",
-        "model_b",
-        "turns",
-        "repeat_idx",
-        "seed",
-        "elapsed_sec",
-        "total_prompt_tokens",
-        "total_output_tokens",
-        "tokens_per_sec",
-        "first_hit_turn",
-        "last_stop_reason",
-        "out_jsonl",
-        "out_csv",
-    ]
+    fieldnames = MASTER_FIELDS
     with open(master_csv, "w", newline="", encoding="utf-8") as handle:
         writer = csv.DictWriter(handle, fieldnames=fieldnames)
         writer.writeheader()
 
+    cells = [
+        MatrixCell(task=task, strategy=strat, repeat_idx=rep, seed=args.seed + rep)
+        for task in tasks
+        for strat in strategies
+        for rep in range(args.repeats)
+    ]
+    batch_size = max(int(args.batch_size), 1)
+
+    gen_config = asdict(_resolve_gen_cfg(None, args.max_new_tokens, args.temperature, args.top_p))
+    result_cache = ResultCache(args.cache_dir or os.path.join(args.outdir, "cache"))
     total_runs = 0
-    for task in tasks:
-        task_id = task["id"]
-        scenario = task["scenario"]
-        roleset = task["roleset"]
-        ans_regex = task.get("answer_regex")
-
-        for strat in strategies:
-            for rep in range(args.repeats):
-                seed = args.seed + rep
-                run_id = f"{task_id}_{strat}_rep{rep}"
-                sub_out = os.path.join(root_out, run_id)
-                ensure_dir(sub_out)
-
-                loop_start = time.time()
-                out = run_dialog(
-                    scenario=scenario,
-                    strategy=strat,
-                    roleset=roleset,
+    log = RunLogSink()
+    columnar = None
+    if args.parquet_dir:
+        from src.columnar_store import ColumnarSink
+
+        columnar = ColumnarSink(args.parquet_dir)
+
+    def _record(cell: MatrixCell, out: Dict[str, Any], elapsed: float, batch: int, hit: bool) -> None:
+        nonlocal total_runs
+        row = build_row(cell, out, args, elapsed, batch_size=batch, cache_hit=hit)
+        log.append_csv(master_csv, fieldnames, row)
+        if columnar is not None:
+            columnar.append(row)
+        total_runs += 1
+        print(
+            f"[{total_runs}] {cell.task['id']} × {cell.strategy} rep{cell.repeat_idx} -> "
+            f"{row['out_jsonl']} ({'cached' if hit else f'{elapsed:.1f}s'})"
+        )
+
+    try:
+        # run_dialog_batch splits a chunk by seed; keep same-seed cells together.
+        # Chunks are cut from the full cell list so a resumed run rebuilds the
+        # same batches, and with them the same cache keys.
+        if batch_size > 1:
+            cells.sort(key=lambda cell: cell.seed)
+        for offset in range(0, len(cells), batch_size):
+            chunk = cells[offset : offset + batch_size]
+            for cell in chunk:
+                cell.outdir = os.path.join(root_out, cell.run_id)
+            assign_cache_keys(chunk, args, gen_config)
+            entries = [result_cache.get(cell.cache_key) for cell in chunk] if args.resume else []
+            if entries and all(entry is not None for entry in entries):
+                for cell, entry in zip(chunk, entries):
+                    out = restore_run(entry["result"], cell.outdir)
+                    _record(cell, out, out["elapsed_sec"], int(entry["meta"].get("batch_size", 1)), True)
+                continue
+            for cell in chunk:
+                ensure_dir(cell.outdir)
+
+            loop_start = time.time()
+            if len(chunk) == 1:
+                cell = chunk[0]
+                outs = [
+                    run_dialog(
+                        scenario=cell.task["scenario"],
+                        strategy=cell.strategy,
+                        roleset=cell.task["roleset"],
+                        turns=args.turns,
+                        model_a=args.model_a,
+                        model_b=args.model_b,
+                        max_new_tokens=args.max_new_tokens,
+                        temperature=args.temperature,
+                        top_p=args.top_p,
+                        seed=cell.seed,
+                        outdir=cell.outdir,
+                    )
+                ]
+            else:
+                outs = run_dialog_batch(
+                    [
+                        DialogSpec(
+                            scenario=cell.task["scenario"],
+                            strategy=cell.strategy,
+                            roleset=cell.task["roleset"],
+                            seed=cell.seed,
+                            outdir=cell.outdir,
+                        )
+                        for cell in chunk
+                    ],
                     turns=args.turns,
                     model_a=args.model_a,
                     model_b=args.model_b,
                     max_new_tokens=args.max_new_tokens,
                     temperature=args.temperature,
                     top_p=args.top_p,
-                    seed=seed,
-                    outdir=sub_out,
                 )
+
+            for cell, out in zip(chunk, outs):
                 elapsed = out.get("elapsed_sec") or (time.time() - loop_start)
-                cfg = out["config"]
-                transcript = out["transcript"]
-
-                total_prompt = int(cfg.get("total_prompt_tokens", 0))
-                total_output = int(cfg.get("total_output_tokens", 0))
-                tps = (total_prompt + total_output) / max(elapsed, 1e-6)
-                last_stop = transcript[-1].get("stop_reason") if transcript else None
-                first_hit = detect_first_hit(transcript, ans_regex)
-
-                row = {
-                    "timestamp": datetime.now().isoformat(timespec="seconds"),
-                    "git_rev": _git_rev(),
-                    "task_id": task_id,
-                    "strategy": strat,
-                    "roleset": roleset,
-                    "model_a": args.model_a,
-                    "model_b": args.model_b,
-                    "turns": args.turns,
-                    "repeat_idx": rep,
-                    "seed": seed,
-                    "elapsed_sec": round(elapsed, 3),
-                    "total_prompt_tokens": total_prompt,
-                    "total_output_tokens": total_output,
-                    "tokens_per_sec": round(tps, 2),
-                    "first_hit_turn": first_hit,
-                    "last_stop_reason": last_stop,
-                    "out_jsonl": out["out_jsonl"],
-                    "out_csv": out["out_csv"],
-                }
-
-                with open(master_csv, "a", newline="", encoding="utf-8") as handle:
-                    csv.DictWriter(handle, fieldnames=fieldnames).writerow(row)
-
-                total_runs += 1
-                print(
-                    f"[{total_runs}] {task_id} × {strat} rep{rep} -> "
-                    f"{row['out_jsonl']} ({elapsed:.1f}s)"
+                batch = int(out.get("batch_size", len(chunk)))
+                result_cache.put(
+                    cell.cache_key,
+                    {"config": out["config"], "transcript": out["transcript"], "elapsed_sec": elapsed},
+                    task_id=cell.task["id"],
+                    strategy=cell.strategy,
+                    repeat_idx=cell.repeat_idx,
+                    batch_size=batch,
                 )
+                _record(cell, out, elapsed, batch, False)
+    finally:
+        log.close()
+        if columnar is not None:
+            columnar.close()
 
+    cache_stats = get_model_cache().stats()
+    with open(os.path.join(root_out, "model_cache.json"), "w", encoding="utf-8") as handle:
+        json.dump(cache_stats, handle, indent=2)
+    print("MODEL CACHE", format_cache_stats(cache_stats))
+    result_stats = result_cache.summary()
+    with open(os.path.join(root_out, "result_cache.json"), "w", encoding="utf-8") as handle:
+        json.dump(result_stats, handle, indent=2)
+    if args.resume:
+        print("RESULT CACHE", format_result_cache_stats(result_stats))
     print("WROTE", master_csv)
 
 
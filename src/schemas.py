@@ -2,11 +2,15 @@ from __future__ import annotations
 import json
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any, Union
+from typing import TYPE_CHECKING, Optional, Dict, Any, Union
 
-from jsonschema import Draft7Validator
 from pydantic import BaseModel, Field
 
+from .json_enforcer import compile_schema
+
+if TYPE_CHECKING:
+    from jsonschema import Draft7Validator
+
 ROOT = Path(__file__).resolve().parents[1]
 from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional, Dict, Any
@@ -23,10 +27,50 @@ class Envelope(BaseModel):
     status: str
     content: Optional[Dict[str, Any]] = None
     final_solution: Optional[FinalSolution] = None
+    # A plain slot rather than a PrivateAttr: private attributes add a few
+    # microseconds to every validation and attribute read.
+    __slots__ = ("_snapshot_cache",)
 
     def is_solved(self) -> bool:
         return self.tag == "[SOLVED]" and self.status == "SOLVED" and self.final_solution is not None
 
+    def snapshot(self) -> Dict[str, Any]:
+        """``model_dump()`` taken on first call and shared until :meth:`refresh_snapshot`.
+
+        The controller dumps each turn once and hands the same dict to strategy
+        validators, the transcript and the final message; treat it as read-only
+        and call :meth:`refresh_snapshot` after mutating the envelope.
+        """
+        try:
+            return _SNAPSHOT_SLOT.__get__(self, Envelope)
+        except AttributeError:
+            data = self.model_dump()
+            _SNAPSHOT_SLOT.__set__(self, data)
+            return data
+
+    def compact_snapshot(self) -> Dict[str, Any]:
+        """``model_dump(exclude_none=True)`` derived from :meth:`snapshot`.
+
+        ``exclude_none`` drops ``None`` fields of the envelope and of
+        ``final_solution`` but leaves ``content`` (a plain dict) untouched.
+        """
+        data = {key: value for key, value in self.snapshot().items() if value is not None}
+        final = data.get("final_solution")
+        if isinstance(final, dict):
+            data["final_solution"] = {key: value for key, value in final.items() if value is not None}
+        return data
+
+    def refresh_snapshot(self) -> None:
+        try:
+            _SNAPSHOT_SLOT.__delete__(self)
+        except AttributeError:
+            pass
+
+
+# Accessed through the descriptor so an empty slot raises AttributeError directly
+# instead of going through BaseModel.__getattr__.
+_SNAPSHOT_SLOT = Envelope.__dict__["_snapshot_cache"]
+
 # Allowed enums (lightweight guard)
 ALLOWED_STATUS = {"WORKING","NEED_PEER","PROPOSED","READY_TO_SOLVE","SOLVED"}
 
@@ -47,7 +91,8 @@ def _load_json_schema(schema_path: str) -> Draft7Validator:
     if not path.exists():
         raise FileNotFoundError(f"Schema not found: {path}")
     data = json.loads(path.read_text(encoding="utf-8"))
-    return Draft7Validator(data)
+    # Shared with json_enforcer's content-hash cache, which also holds the fast checker.
+    return compile_schema(data).validator
 
 
 def get_envelope_validator(schema_ref: Optional[SchemaLike]) -> Optional[Draft7Validator]:
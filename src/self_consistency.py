@@ -0,0 +1,66 @@
+"""Majority voting over self-consistency samples.
+
+An agent that draws ``k`` replies for one turn (``AgentProfile.k_samples``)
+keeps the reply whose answer most samples agree on.  Answers are compared after
+:func:`~src.canonicalize.canonicalize_for_hash`, so whitespace, JSON key order
+or SQL formatting do not split the vote.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+from .canonicalize import canonicalize_for_hash
+
+
+def answer_key(envelope: Mapping[str, Any], kind: Optional[str] = None) -> Optional[str]:
+    """Canonical ``final_solution.canonical_text`` of ``envelope``, if it has one."""
+
+    final = envelope.get("final_solution")
+    if not isinstance(final, Mapping):
+        return None
+    text = final.get("canonical_text")
+    if not isinstance(text, str) or not text.strip():
+        return None
+    return canonicalize_for_hash(text, kind)
+
+
+@dataclass
+class Vote:
+    winner: int
+    answer: Optional[str]
+    votes: int
+    samples: int
+    tally: Dict[str, int] = field(default_factory=dict)
+
+    def telemetry(self, drawn: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "drawn": self.samples if drawn is None else int(drawn),
+            "valid": self.samples,
+            "votes": self.votes,
+            "answers": len(self.tally),
+            "agreement": round(self.votes / self.samples, 4) if self.samples else None,
+        }
+
+
+def majority_vote(envelopes: Sequence[Mapping[str, Any]], kind: Optional[str] = None) -> Vote:
+    """Pick the envelope whose canonical answer most samples share.
+
+    Ties go to the answer seen first.  Envelopes without an answer do not vote;
+    when none has one the first envelope wins.
+    """
+
+    if not envelopes:
+        raise ValueError("majority_vote needs at least one envelope")
+    keys = [answer_key(envelope, kind) for envelope in envelopes]
+    tally = Counter(key for key in keys if key is not None)
+    if not tally:
+        return Vote(winner=0, answer=None, votes=0, samples=len(envelopes))
+    best = max(tally.values())
+    winner = next(index for index, key in enumerate(keys) if key is not None and tally[key] == best)
+    return Vote(winner=winner, answer=keys[winner], votes=best, samples=len(envelopes), tally=dict(tally))
+
+
+__all__ = ["Vote", "answer_key", "majority_vote"]
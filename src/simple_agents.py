@@ -2,18 +2,28 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Tuple
+from typing import TYPE_CHECKING, Any, List, Sequence, Tuple
 
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, set_seed
+from .model_cache import get_model_cache, make_key
+from .prompt_table import get_prompt_table
+
+if TYPE_CHECKING:
+    import torch
+
+# torch/transformers are imported inside the functions below so that importing
+# this module (e.g. for ``GenConfig``) does not load them.
+
+
+def _system_header(system_prompt: str) -> str:
+    return f"<<SYSTEM>>\n{system_prompt}\n<</SYSTEM>>\n\n"
+
+
+def _peer_block(incoming: str) -> str:
+    return f"<<PEER>>\n{incoming}\n<</PEER>>\n\n<<YOU>>\n"
 
 
 def _format_prompt(system_prompt: str, incoming: str) -> str:
-    return (
-        f"<<SYSTEM>>\n{system_prompt}\n<</SYSTEM>>\n\n"
-        f"<<PEER>>\n{incoming}\n<</PEER>>\n\n"
-        f"<<YOU>>\n"
-    )
+    return _system_header(system_prompt) + _peer_block(incoming)
 
 
 @dataclass
@@ -25,24 +35,67 @@ class GenConfig:
     repetition_penalty: float = 1.05
 
 
+def _load_simple(model_id: str, device: str, dtype: torch.dtype | None) -> Tuple[Any, Any]:
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    tok = AutoTokenizer.from_pretrained(model_id, use_fast=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        torch_dtype=dtype,
+        low_cpu_mem_usage=True,
+    )
+    model.to(device)
+    return model, tok
+
+
 class SimpleHF:
     def __init__(self, model_id: str, device: str | None = None):
-        self.tok = AutoTokenizer.from_pretrained(model_id, use_fast=True)
-        self.model = AutoModelForCausalLM.from_pretrained(
+        import torch
+
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        dtype = torch.bfloat16 if torch.cuda.is_available() else None
+        key = make_key(
             model_id,
-            torch_dtype=torch.bfloat16 if torch.cuda.is_available() else None,
-            low_cpu_mem_usage=True,
+            dtype=str(dtype).replace("torch.", "") if dtype is not None else None,
+            device=self.device,
         )
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
+        # Agents sharing a model id (A == B, or consecutive matrix cells) get the
+        # same resident weights instead of reloading the checkpoint.
+        self.model, self.tok = get_model_cache().get_or_load(
+            key, lambda: _load_simple(model_id, self.device, dtype)
+        )
+        self._split_ok: bool | None = None
+
+    def _splits_at_header(self) -> bool:
+        """Whether the header and peer block tokenise independently.
+
+        The boundary text is fixed (``<</SYSTEM>>`` then ``<<PEER>>``), so one
+        probe per tokenizer decides whether cached header ids can be reused.
+        """
+        if self._split_ok is None:
+            head, tail = _system_header("probe"), _peer_block("probe")
+            joint = list(self.tok(head + tail)["input_ids"])
+            split = list(self.tok(head)["input_ids"]) + list(self.tok(tail, add_special_tokens=False)["input_ids"])
+            self._split_ok = joint == split
+        return self._split_ok
+
+    def _prompt_ids(self, system_prompt: str, incoming: str) -> List[int]:
+        # The system header is identical on every turn of a dialog and across
+        # matrix cells; its ids come from the shared prompt table.
+        if not self._splits_at_header():
+            return list(self.tok(_format_prompt(system_prompt, incoming))["input_ids"])
+        head = get_prompt_table().token_ids(
+            self.tok, _system_header(system_prompt), lambda text: self.tok(text)["input_ids"], kind="simple_header"
+        )
+        return [*head, *self.tok(_peer_block(incoming), add_special_tokens=False)["input_ids"]]
 
     def respond(
         self, system_prompt: str, incoming: str, cfg: GenConfig
     ) -> Tuple[str, int, int, str]:
-        prompt = _format_prompt(system_prompt, incoming)
-        enc = self.tok(prompt, return_tensors="pt")
-        input_ids = enc["input_ids"].to(self.device)
-        attn = enc["attention_mask"].to(self.device)
+        import torch
+
+        input_ids = torch.tensor([self._prompt_ids(system_prompt, incoming)], device=self.device)
+        attn = torch.ones_like(input_ids)
         gen_ids = self.model.generate(
             input_ids=input_ids,
             attention_mask=attn,
@@ -62,9 +115,73 @@ class SimpleHF:
         stop = "length" if new_ids.shape[0] >= cfg.max_new_tokens else "eos_or_sample"
         return text, int(input_ids.numel()), int(new_ids.numel()), stop
 
+    def respond_batch(
+        self,
+        system_prompts: Sequence[str],
+        incomings: Sequence[str],
+        cfg: GenConfig,
+    ) -> List[Tuple[str, int, int, str]]:
+        """Answer several independent prompts with one left-padded ``generate`` call.
+
+        Returns one ``respond``-shaped tuple per row.  Rows that finish early are
+        padded by ``generate``; their token counts and stop reasons are recovered
+        from the first EOS in each row.
+        """
+        if len(system_prompts) != len(incomings):
+            raise ValueError("system_prompts and incomings must have the same length")
+        if not incomings:
+            return []
+        if len(incomings) == 1:
+            return [self.respond(system_prompts[0], incomings[0], cfg)]
+
+        import torch
+
+        rows = [self._prompt_ids(s, m) for s, m in zip(system_prompts, incomings)]
+        pad_id = self.tok.eos_token_id if self.tok.pad_token_id is None else self.tok.pad_token_id
+        fill = 0 if pad_id is None else pad_id
+        width = max(len(row) for row in rows)
+        # Left padding, as the tokenizer would with padding_side="left".
+        input_ids = torch.tensor([[fill] * (width - len(row)) + row for row in rows], device=self.device)
+        attn = torch.tensor([[0] * (width - len(row)) + [1] * len(row) for row in rows], device=self.device)
+        gen_ids = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attn,
+            max_new_tokens=cfg.max_new_tokens,
+            temperature=cfg.temperature,
+            top_p=cfg.top_p,
+            do_sample=cfg.do_sample,
+            repetition_penalty=cfg.repetition_penalty,
+            pad_token_id=pad_id,
+            eos_token_id=self.tok.eos_token_id,
+        )
+
+        prompt_tokens = attn.sum(dim=1).tolist()
+        results: List[Tuple[str, int, int, str]] = []
+        for row, n_prompt in enumerate(prompt_tokens):
+            new_ids = gen_ids[row, input_ids.shape[1]:].tolist()
+            kept = _trim_at_eos(new_ids, self.tok.eos_token_id)
+            text = self.tok.decode(kept, skip_special_tokens=True).strip()
+            stop = "length" if len(kept) >= cfg.max_new_tokens else "eos_or_sample"
+            results.append((text, int(n_prompt), len(kept), stop))
+        return results
+
+
+def _trim_at_eos(new_ids: List[int], eos_token_id: int | None) -> List[int]:
+    """Drop the padding ``generate`` appends after a row has emitted EOS."""
+    if eos_token_id is None:
+        return new_ids
+    try:
+        cut = new_ids.index(int(eos_token_id))
+    except ValueError:
+        return new_ids
+    return new_ids[: cut + 1]
+
 
 def seed_everything(seed: int | None):
     if seed is not None:
+        import torch
+        from transformers import set_seed
+
         set_seed(seed)
         torch.manual_seed(seed)
         if torch.cuda.is_available():
@@ -2,14 +2,16 @@
 from __future__ import annotations
 
 import argparse
-import json
 import os
 import time
+from contextlib import ExitStack
 from dataclasses import asdict, dataclass, replace
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Mapping, Sequence
 
 from .presets import ROLESETS, STRATEGIES
+from .prompt_table import build_system, get_prompt_table  # noqa: F401  (build_system re-exported)
 from .simple_agents import GenConfig, SimpleHF, seed_everything
+from .transcript_stream import TranscriptWriter
 
 
 @dataclass
@@ -40,10 +42,6 @@ class RunSummary:
     do_sample: bool
 
 
-def build_system(role_text: str, strategy_text: str) -> str:
-    return f"{role_text}\n\n{strategy_text}".strip()
-
-
 def run_dialog(
     scenario_text: str | None = None,
     strategy_id: str | None = None,
@@ -83,11 +81,46 @@ def run_dialog(
         raise ValueError("model ids must be provided")
 
     os.makedirs(outdir, exist_ok=True)
-    strategy_text = STRATEGIES[strategy]
-    roles = ROLESETS[roleset]
-    sys_a = build_system(roles["A"], strategy_text)
-    sys_b = build_system(roles["B"], strategy_text)
+    prompts = get_prompt_table()
+    sys_a = prompts.system(roleset, strategy, "A")
+    sys_b = prompts.system(roleset, strategy, "B")
+
+    gen_cfg = _resolve_gen_cfg(gen_cfg, max_new_tokens, temperature, top_p)
+
+    seed_everything(seed)
+    agent_a = SimpleHF(model_a)
+    agent_b = SimpleHF(model_b)
+
+    summary = _summary(scenario, strategy, roleset, turns, model_a, model_b, seed, gen_cfg)
+    transcript: List[TurnRecord] = []
+    msg = scenario.strip()
+    tot_in = tot_out = 0
+    start = time.time()
+
+    with _open_writer(outdir, summary) as writer:
+        for r in range(1, turns + 1):
+            actor = "A" if r % 2 == 1 else "B"
+            agent = agent_a if actor == "A" else agent_b
+            sys_prompt = sys_a if actor == "A" else sys_b
+
+            out, tok_in, tok_out, stop = agent.respond(sys_prompt, msg, gen_cfg)
+            record = TurnRecord(r, actor, msg, out, tok_in, tok_out, stop)
+            transcript.append(record)
+            writer.write_turn(asdict(record))
+            tot_in += tok_in
+            tot_out += tok_out
+            msg = out
 
+        summary = replace(summary, total_prompt_tokens=tot_in, total_output_tokens=tot_out)
+        return _finish_run(writer, summary, transcript, time.time() - start)
+
+
+def _resolve_gen_cfg(
+    gen_cfg: GenConfig | None,
+    max_new_tokens: int | None,
+    temperature: float | None,
+    top_p: float | None,
+) -> GenConfig:
     default_cfg = GenConfig()
     if gen_cfg is None:
         cfg_kwargs = {
@@ -100,39 +133,44 @@ def run_dialog(
             "top_p": top_p if top_p is not None else default_cfg.top_p,
             "do_sample": default_cfg.do_sample,
         }
-        gen_cfg = GenConfig(**cfg_kwargs)
-    else:
-        if any(v is not None for v in (max_new_tokens, temperature, top_p)):
-            repl_kwargs = {}
-            if max_new_tokens is not None:
-                repl_kwargs["max_new_tokens"] = max_new_tokens
-            if temperature is not None:
-                repl_kwargs["temperature"] = temperature
-            if top_p is not None:
-                repl_kwargs["top_p"] = top_p
-            gen_cfg = replace(gen_cfg, **repl_kwargs)
-
-    seed_everything(seed)
-    agent_a = SimpleHF(model_a)
-    agent_b = SimpleHF(model_b)
+        return GenConfig(**cfg_kwargs)
+    if any(v is not None for v in (max_new_tokens, temperature, top_p)):
+        repl_kwargs = {}
+        if max_new_tokens is not None:
+            repl_kwargs["max_new_tokens"] = max_new_tokens
+        if temperature is not None:
+            repl_kwargs["temperature"] = temperature
+        if top_p is not None:
+            repl_kwargs["top_p"] = top_p
+        gen_cfg = replace(gen_cfg, **repl_kwargs)
+    return gen_cfg
 
-    transcript: List[TurnRecord] = []
-    msg = scenario.strip()
-    tot_in = tot_out = 0
-    start = time.time()
 
-    for r in range(1, turns + 1):
-        actor = "A" if r % 2 == 1 else "B"
-        agent = agent_a if actor == "A" else agent_b
-        sys_prompt = sys_a if actor == "A" else sys_b
+def _run_base(outdir: str, strategy: str, roleset: str) -> str:
+    ts = time.strftime("%Y%m%d-%H%M%S")
+    base = f"runs_fixed_{strategy}_{roleset}_{ts}"
+    candidate = base
+    n = 1
+    # Batched runs can finish several dialogs with the same stamp in one outdir;
+    # tools/build_tasks_from_logs.py accepts the optional "_<n>" suffix.
+    while os.path.exists(os.path.join(outdir, f"{candidate}.jsonl")):
+        candidate = f"{base}_{n}"
+        n += 1
+    return candidate
 
-        out, tok_in, tok_out, stop = agent.respond(sys_prompt, msg, gen_cfg)
-        transcript.append(TurnRecord(r, actor, msg, out, tok_in, tok_out, stop))
-        tot_in += tok_in
-        tot_out += tok_out
-        msg = out
 
-    summary = RunSummary(
+def _summary(
+    scenario: str,
+    strategy: str,
+    roleset: str,
+    turns: int,
+    model_a: str,
+    model_b: str,
+    seed: int | None,
+    gen_cfg: GenConfig,
+) -> RunSummary:
+    """Run summary with zero token totals; filled in once the dialog ends."""
+    return RunSummary(
         scenario=scenario[:160],
         strategy=strategy,
         roleset=roleset,
@@ -140,54 +178,176 @@ def run_dialog(
         model_a=model_a,
         model_b=model_b,
         seed=seed,
-        total_prompt_tokens=tot_in,
-        total_output_tokens=tot_out,
+        total_prompt_tokens=0,
+        total_output_tokens=0,
         max_new_tokens=gen_cfg.max_new_tokens,
         temperature=gen_cfg.temperature,
         top_p=gen_cfg.top_p,
         do_sample=gen_cfg.do_sample,
     )
 
-    ts = time.strftime("%Y%m%d-%H%M%S")
-    base = f"runs_fixed_{strategy}_{roleset}_{ts}"
-    jsonl_path = os.path.join(outdir, f"{base}.jsonl")
-    csv_path = os.path.join(outdir, f"{base}.csv")
 
-    elapsed = time.time() - start
-    cfg_dict = asdict(summary)
-    transcript_dicts = [asdict(t) for t in transcript]
-
-    with open(jsonl_path, "w", encoding="utf-8") as f:
-        f.write(
-            json.dumps(
-                {
-                    "config": cfg_dict,
-                    "transcript": transcript_dicts,
-                    "elapsed_sec": elapsed,
-                },
-                ensure_ascii=False,
-            )
-            + "\n"
-        )
+def _open_writer(outdir: str, summary: RunSummary) -> TranscriptWriter:
+    base = _run_base(outdir, summary.strategy, summary.roleset)
+    header = asdict(summary)
+    del header["total_prompt_tokens"], header["total_output_tokens"]
+    return TranscriptWriter(
+        os.path.join(outdir, f"{base}.jsonl"),
+        os.path.join(outdir, f"{base}.csv"),
+        header=header,
+    )
 
-    with open(csv_path, "w", encoding="utf-8") as f:
-        f.write("r,actor,prompt_tokens,output_tokens,stop_reason\n")
-        for t in transcript:
-            f.write(
-                f"{t.r},{t.actor},{t.prompt_tokens},{t.output_tokens},{t.stop_reason}\n"
-            )
 
-    print(f"WROTE {jsonl_path}")
-    print(f"WROTE {csv_path}")
+def _finish_run(
+    writer: TranscriptWriter,
+    summary: RunSummary,
+    transcript: List[TurnRecord],
+    elapsed: float,
+) -> Dict[str, Any]:
+    cfg_dict = asdict(summary)
+    writer.close(cfg_dict, elapsed)
+    print(f"WROTE {writer.jsonl_path}")
+    print(f"WROTE {writer.csv_path}")
     return {
         "config": cfg_dict,
-        "transcript": transcript_dicts,
-        "out_jsonl": jsonl_path,
-        "out_csv": csv_path,
+        "transcript": [asdict(t) for t in transcript],
+        "out_jsonl": writer.jsonl_path,
+        "out_csv": writer.csv_path,
         "elapsed_sec": elapsed,
     }
 
 
+def _write_run(
+    summary: RunSummary,
+    transcript: List[TurnRecord],
+    outdir: str,
+    elapsed: float,
+) -> Dict[str, Any]:
+    with _open_writer(outdir, summary) as writer:
+        for t in transcript:
+            writer.write_turn(asdict(t))
+        return _finish_run(writer, summary, transcript, elapsed)
+
+
+@dataclass
+class DialogSpec:
+    """One dialog of a lockstep batch (see :func:`run_dialog_batch`)."""
+
+    scenario: str
+    strategy: str
+    roleset: str
+    seed: int | None = None
+    outdir: str = "logs"
+
+
+def run_dialog_batch(
+    specs: Sequence[DialogSpec],
+    *,
+    turns: int = 6,
+    model_a: str,
+    model_b: str,
+    gen_cfg: GenConfig | None = None,
+    max_new_tokens: int | None = None,
+    temperature: float | None = None,
+    top_p: float | None = None,
+) -> List[Dict[str, Any]]:
+    """Run several independent fixed-turn dialogs in lockstep.
+
+    At every turn all dialogs share the same speaker, so their prompts are
+    left-padded into a single ``generate`` call on that actor's model.  Each
+    dialog keeps its own transcript, token counts, stop reasons and output files,
+    and the returned list matches ``run_dialog``'s result shape in ``specs`` order.
+
+    Specs are grouped by seed and each group runs as its own lockstep batch
+    after ``seed_everything(seed)``, so the seed in every summary is the one
+    sampling actually used.  Rows of a group draw from that one RNG stream: a
+    group is reproducible for the same composition (reported as ``batch_size``
+    and ``batch_index``) but does not replay an unbatched ``run_dialog``.
+    """
+    if not specs:
+        return []
+    for spec in specs:
+        if spec.strategy not in STRATEGIES:
+            raise KeyError(f"Unknown strategy '{spec.strategy}'")
+        if spec.roleset not in ROLESETS:
+            raise KeyError(f"Unknown roleset '{spec.roleset}'")
+        os.makedirs(spec.outdir, exist_ok=True)
+
+    gen_cfg = _resolve_gen_cfg(gen_cfg, max_new_tokens, temperature, top_p)
+    agents = {"A": SimpleHF(model_a), "B": SimpleHF(model_b)}
+
+    groups: Dict[int | None, List[int]] = {}
+    for idx, spec in enumerate(specs):
+        groups.setdefault(spec.seed, []).append(idx)
+
+    results: List[Dict[str, Any]] = [{} for _ in specs]
+    for seed, members in groups.items():
+        seed_everything(seed)
+        group = [specs[idx] for idx in members]
+        outs = _run_lockstep(group, agents, turns, model_a, model_b, gen_cfg)
+        for pos, (idx, out) in enumerate(zip(members, outs)):
+            out["batch_size"] = len(group)
+            out["batch_index"] = pos
+            results[idx] = out
+    return results
+
+
+def _run_lockstep(
+    specs: Sequence[DialogSpec],
+    agents: Mapping[str, SimpleHF],
+    turns: int,
+    model_a: str,
+    model_b: str,
+    gen_cfg: GenConfig,
+) -> List[Dict[str, Any]]:
+    prompts = get_prompt_table()
+    systems = {actor: [prompts.system(spec.roleset, spec.strategy, actor) for spec in specs] for actor in ("A", "B")}
+    summaries = [
+        _summary(spec.scenario, spec.strategy, spec.roleset, turns, model_a, model_b, spec.seed, gen_cfg)
+        for spec in specs
+    ]
+    transcripts: List[List[TurnRecord]] = [[] for _ in specs]
+    messages = [spec.scenario.strip() for spec in specs]
+    start = time.time()
+
+    with ExitStack() as stack:
+        writers = [
+            stack.enter_context(_open_writer(spec.outdir, summary))
+            for spec, summary in zip(specs, summaries)
+        ]
+        for r in range(1, turns + 1):
+            actor = "A" if r % 2 == 1 else "B"
+            outputs = agents[actor].respond_batch(systems[actor], messages, gen_cfg)
+            for idx, (out, tok_in, tok_out, stop) in enumerate(outputs):
+                record = TurnRecord(r, actor, messages[idx], out, tok_in, tok_out, stop)
+                transcripts[idx].append(record)
+                writers[idx].write_turn(asdict(record))
+                messages[idx] = out
+
+        elapsed = time.time() - start
+        results: List[Dict[str, Any]] = []
+        for writer, summary, transcript in zip(writers, summaries, transcripts):
+            summary = replace(
+                summary,
+                total_prompt_tokens=sum(t.prompt_tokens for t in transcript),
+                total_output_tokens=sum(t.output_tokens for t in transcript),
+            )
+            results.append(_finish_run(writer, summary, transcript, elapsed))
+        return results
+
+
+def restore_run(result: Dict[str, Any], outdir: str) -> Dict[str, Any]:
+    """Rewrite the files of an earlier ``run_dialog`` result into ``outdir``.
+
+    Used to materialise cached matrix cells; the returned dict has the same
+    shape as ``run_dialog``'s with paths pointing into ``outdir``.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    summary = RunSummary(**result["config"])
+    transcript = [TurnRecord(**t) for t in result["transcript"]]
+    return _write_run(summary, transcript, outdir, float(result.get("elapsed_sec") or 0.0))
+
+
 def main():
     parser = argparse.ArgumentParser("fixed-turn A↔B dialog")
     parser.add_argument("--scenario", required=True, help="Task text or @path/to/file.txt")
@@ -0,0 +1,261 @@
+"""Incremental stop-sequence matching for ``generate``.
+
+``StopSequences`` follows every row of a (possibly batched) generation one
+token at a time.  Two matchers run side by side:
+
+* an Aho–Corasick automaton over token ids, built from several tokenisations
+  of each stop string, so the common case costs one dict lookup per token;
+* a short decoded-text window per row, fed from a memoised ``id -> text``
+  table, which catches stop strings that were tokenised some other way
+  (e.g. ``}CTRL`` merged into one piece).
+
+No tensors are created on the decode path; the per-row ``done`` mask is
+allocated once and updated in place.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import torch
+from transformers import StoppingCriteria
+
+# Characters that commonly precede a stop string and merge with its first
+# piece under BPE/SentencePiece; each yields an extra token-id pattern.
+_CONTEXT_PREFIXES = ("", " ", "\n", "}", '"', ".")
+
+
+def _encode(tokenizer: Any, text: str) -> List[int]:
+    try:
+        encoded = tokenizer.encode(text, add_special_tokens=False)
+    except TypeError:
+        encoded = tokenizer.encode(text)
+    if hasattr(encoded, "input_ids"):
+        encoded = encoded.input_ids
+    return [int(t) for t in encoded]
+
+
+def _decode(tokenizer: Any, ids: Sequence[int]) -> str:
+    try:
+        return tokenizer.decode(list(ids), skip_special_tokens=False)
+    except TypeError:
+        return tokenizer.decode(list(ids))
+
+
+def token_variants(tokenizer: Any, stop: str) -> List[Tuple[int, ...]]:
+    """Token-id sequences that decode to text ending in ``stop``.
+
+    Besides the plain encoding, ``stop`` is encoded after a few context
+    characters; the shortest token tail whose decoding still contains ``stop``
+    is kept, so merged pieces like ``"}<<<"`` become patterns too.
+    """
+
+    variants: List[Tuple[int, ...]] = []
+    for context in _CONTEXT_PREFIXES:
+        try:
+            ids = _encode(tokenizer, context + stop)
+        except Exception:
+            continue
+        for start in range(len(ids) - 1, -1, -1):
+            tail = ids[start:]
+            if stop in _decode(tokenizer, tail):
+                if tuple(tail) not in variants:
+                    variants.append(tuple(tail))
+                break
+    return variants
+
+
+class TokenAutomaton:
+    """Aho–Corasick automaton over token ids.
+
+    ``goto`` is stored sparsely per state; ``step`` follows failure links,
+    which keeps the amortised cost per token constant.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[Sequence[int], int]]) -> None:
+        self._goto: List[Dict[int, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[int]] = [None]
+        for ids, label in patterns:
+            if ids:
+                self._add(ids, label)
+        self._build()
+
+    def _add(self, ids: Sequence[int], label: int) -> None:
+        state = 0
+        for token in ids:
+            nxt = self._goto[state].get(int(token))
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._goto[state][int(token)] = nxt
+            state = nxt
+        if self._out[state] is None:
+            self._out[state] = label
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                if self._out[nxt] is None:
+                    self._out[nxt] = self._out[self._fail[nxt]]
+
+    @property
+    def empty(self) -> bool:
+        return not self._goto[0]
+
+    def step(self, state: int, token: int) -> Tuple[int, Optional[int]]:
+        """Advance ``state`` by ``token``; return ``(state, matched_label)``."""
+
+        goto = self._goto
+        while state and token not in goto[state]:
+            state = self._fail[state]
+        state = goto[state].get(token, 0)
+        return state, self._out[state]
+
+
+class StopSequences(StoppingCriteria):
+    """Stop each row once its generated text contains any stop string."""
+
+    def __init__(
+        self,
+        tokenizer: Any,
+        stops: Sequence[str] | str,
+        *,
+        input_length: int | None = None,
+        token_patterns: Sequence[Sequence[int]] = (),
+        use_text_window: bool = True,
+    ) -> None:
+        super().__init__()
+        self._tokenizer = tokenizer
+        self.stops: List[str] = [stops] if isinstance(stops, str) else [s for s in stops if s]
+        patterns: List[Tuple[Sequence[int], int]] = []
+        for label, stop in enumerate(self.stops):
+            patterns.extend((ids, label) for ids in token_variants(tokenizer, stop))
+        patterns.extend((tuple(int(t) for t in ids), -1) for ids in token_patterns)
+        self.automaton = TokenAutomaton(patterns)
+        self._use_text = bool(use_text_window) and bool(self.stops)
+        self._window = max((len(s) for s in self.stops), default=0)
+        self._piece_cache: Dict[int, Tuple[str, bool]] = {}
+        self._last_chars = frozenset(stop[-1] for stop in self.stops)
+        self._input_length = int(input_length) if input_length is not None else None
+        self.reset()
+
+    # -- state ---------------------------------------------------------------
+    def reset(self) -> None:
+        self._seen: Optional[int] = None
+        self._states: List[int] = []
+        self._texts: List[str] = []
+        self._matched: List[Optional[int]] = []
+        self._ends: List[Optional[int]] = []
+        self._done: Optional[torch.Tensor] = None
+        self.triggered = False
+
+    def set_input_length(self, n: int) -> None:
+        self._input_length = int(n)
+        self.reset()
+
+    @property
+    def matched(self) -> List[Optional[str]]:
+        """Stop string (or ``None``) that ended each row."""
+
+        return [
+            None if label is None else (self.stops[label] if label >= 0 else "")
+            for label in self._matched
+        ]
+
+    @property
+    def match_ends(self) -> List[Optional[int]]:
+        """Sequence length right after the token that completed each row's match.
+
+        Assisted decoding appends several tokens per step, so a row may run past
+        its stop string before the criterion is consulted; callers trim there.
+        """
+
+        return list(self._ends)
+
+    def _ensure_rows(self, batch: int, length: int) -> None:
+        if self._seen is not None and len(self._states) == batch and length >= self._seen:
+            return
+        self.reset()
+        start = self._input_length if self._input_length is not None else length - 1
+        self._seen = min(max(int(start), 0), length)
+        self._states = [0] * batch
+        self._texts = [""] * batch
+        self._matched = [None] * batch
+        self._ends = [None] * batch
+
+    def _piece(self, token: int) -> Tuple[str, bool]:
+        """Decoded text of ``token`` and whether it can complete a stop string."""
+
+        piece = self._piece_cache.get(token)
+        if piece is None:
+            text = _decode(self._tokenizer, [token])
+            piece = (text, any(ch in self._last_chars for ch in text))
+            self._piece_cache[token] = piece
+        return piece
+
+    def _advance(self, row: int, token: int) -> Optional[int]:
+        state, label = self.automaton.step(self._states[row], token)
+        self._states[row] = state
+        if label is not None or not self._use_text:
+            return label
+        piece, can_complete = self._piece(token)
+        # Test before trimming: the piece may carry text past the stop string
+        # (e.g. ">>>\n"), which would push the stop's start out of the window.
+        text = self._texts[row] + piece
+        keep = self._window - 1
+        self._texts[row] = text[-keep:] if keep > 0 else ""
+        if can_complete:
+            for label, stop in enumerate(self.stops):
+                if stop in text:
+                    return label
+        return None
+
+    # -- StoppingCriteria ----------------------------------------------------
+    def __call__(self, input_ids: torch.LongTensor, scores: Any = None, **_: Any) -> Any:
+        if input_ids.numel() == 0 or (self.automaton.empty and not self._use_text):
+            return False
+        batch, length = int(input_ids.shape[0]), int(input_ids.shape[-1])
+        self._ensure_rows(batch, length)
+        start = self._seen or 0
+        self._seen = length
+        if start >= length:
+            return self._done if self._done is not None else False
+
+        fresh = input_ids[:, start:].tolist()
+        newly_done = False
+        for row, tokens in enumerate(fresh):
+            if self._matched[row] is not None:
+                continue
+            for offset, token in enumerate(tokens):
+                label = self._advance(row, token)
+                if label is not None:
+                    self._matched[row] = label
+                    self._ends[row] = start + offset + 1
+                    newly_done = True
+                    break
+
+        if newly_done:
+            self.triggered = True
+            if self._done is None:
+                self._done = torch.zeros(batch, dtype=torch.bool, device=input_ids.device)
+            for row, label in enumerate(self._matched):
+                if label is not None:
+                    self._done[row] = True
+        if self._done is None:
+            return False
+        return self._done
+
+
+__all__ = ["StopSequences", "TokenAutomaton", "token_variants"]
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 import copy
+import threading
 from dataclasses import dataclass, field, fields, replace
-from typing import Any, Callable, Dict, List, Mapping, MutableMapping, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Mapping, MutableMapping, Optional, Tuple
 
 PreRoundHook = Callable[[MutableMapping[str, Any]], None]
 EnvelopeValidator = Callable[[Mapping[str, Any]], Tuple[bool, Optional[str]]]
@@ -68,7 +69,11 @@ class Strategy:
         ok = True
         errors: List[str] = []
         mapping: Optional[Mapping[str, Any]]
-        if hasattr(envelope, "model_dump"):
+        if not self.envelope_validators:
+            mapping = None
+        elif hasattr(envelope, "snapshot"):
+            mapping = envelope.snapshot()
+        elif hasattr(envelope, "model_dump"):
             mapping = envelope.model_dump()
         elif isinstance(envelope, Mapping):
             mapping = envelope
@@ -260,327 +265,369 @@ def _set_body_style_meta(style: str) -> ControllerBehavior:
 
 # --- Registry ----------------------------------------------------------------
 
-STRATEGY_REGISTRY: Dict[str, StrategyDefinition] = {}
+class _StrategyRegistry(MutableMapping[str, StrategyDefinition]):
+    """``id -> StrategyDefinition`` that registers the built-in strategies on first use."""
+
+    def __init__(self, populate: Callable[[], None]) -> None:
+        self._entries: Dict[str, StrategyDefinition] = {}
+        self._populate: Optional[Callable[[], None]] = populate
+        self._ready = False
+        # Re-entrant: populating calls register_strategy, which lands back here.
+        self._lock = threading.RLock()
+
+    def _loaded(self) -> Dict[str, StrategyDefinition]:
+        if not self._ready:
+            with self._lock:
+                populate, self._populate = self._populate, None
+                if populate is not None:
+                    try:
+                        populate()
+                    finally:
+                        self._ready = True
+        return self._entries
+
+    def __getitem__(self, key: str) -> StrategyDefinition:
+        return self._loaded()[key]
+
+    def __setitem__(self, key: str, value: StrategyDefinition) -> None:
+        self._loaded()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._loaded()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._loaded())
+
+    def __len__(self) -> int:
+        return len(self._loaded())
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._loaded()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._loaded()!r})"
 
 
 def register_strategy(definition: StrategyDefinition) -> None:
     STRATEGY_REGISTRY[definition.id] = definition
 
 
-register_strategy(
-    StrategyDefinition(
-        id="S1",
-        name="control_trailer",
-        description="Free-form dialogue with mandatory control trailer handoff.",
-        json_only=False,
-        allow_cot=False,
-        max_rounds=8,
-        decoding={
-            "do_sample": True,
-            "temperature": 0.2,
-            "top_p": 0.9,
-            "max_new_tokens": 256,
-        },
-        consensus_mode="review_handshake",
-        pre_round_hooks=(_set_controller_strategy_id("S1"),),
-        envelope_validators=(
-            _ensure_status,
-            _ensure_tag,
-        ),
-        prompt_decorators=(
-            _decorate_with_control_hint,
-        ),
-        controller_behaviors=(
-            _set_body_style_meta("control"),
-        ),
-        agent_profile=AgentProfile(greedy=False, k_samples=1, max_new_tokens=288),
-        metadata={
-            "title": "Control trailer negotiation",
-            "body_style": "control",
-        },
-    )
-)
-
-register_strategy(
-    StrategyDefinition(
-        id="S1_QUICK",
-        name="strict_json_quick",
-        description="Fewer rounds and shorter outputs for quick validation runs.",
-        json_only=True,
-        allow_cot=False,
-        max_rounds=4,
-        decoding={
-            "do_sample": False,
-            "temperature": 0.0,
-            "top_p": 1.0,
-            "max_new_tokens": 192,
-        },
-        consensus_mode="review_handshake",
-        pre_round_hooks=(_set_controller_strategy_id("S1_QUICK"),),
-        envelope_validators=(
-            _ensure_status,
-            _ensure_tag,
-        ),
-        prompt_decorators=(
-            _decorate_with_json_hint,
-        ),
-        controller_behaviors=(
-            _toggle_json_mode,
-        ),
-        agent_profile=AgentProfile(greedy=True, k_samples=1, max_new_tokens=192),
-        metadata={
-            "title": "Quick strict JSON runs",
-            "body_style": "json",
-        },
-    )
-)
-
-register_strategy(
-    StrategyDefinition(
-        id="S2_PLAN_EXECUTE",
-        name="plan_execute",
-        description="Planner-to-executor handshake with explicit stage reminders.",
-        json_only=True,
-        allow_cot=True,
-        max_rounds=6,
-        decoding={
-            "do_sample": False,
-            "temperature": 0.0,
-            "top_p": 1.0,
-            "max_new_tokens": 384,
-        },
-        consensus_mode="review_handshake",
-        pre_round_hooks=(
-            _set_controller_strategy_id("S2_PLAN_EXECUTE"),
-        ),
-        envelope_validators=(
-            _ensure_status,
-            _ensure_tag,
-        ),
-        prompt_decorators=(
-            _decorate_with_guidance(
-                "Stage reminder: plan first, then implementation, then testing feedback. Reference the current stage in your JSON tag."
+def _register_builtin_strategies() -> None:
+    register_strategy(
+        StrategyDefinition(
+            id="S1",
+            name="control_trailer",
+            description="Free-form dialogue with mandatory control trailer handoff.",
+            json_only=False,
+            allow_cot=False,
+            max_rounds=8,
+            decoding={
+                "do_sample": True,
+                "temperature": 0.2,
+                "top_p": 0.9,
+                "max_new_tokens": 256,
+            },
+            consensus_mode="review_handshake",
+            pre_round_hooks=(_set_controller_strategy_id("S1"),),
+            envelope_validators=(
+                _ensure_status,
+                _ensure_tag,
             ),
-        ),
-        controller_behaviors=(
-            _toggle_json_mode,
-        ),
-        agent_profile=AgentProfile(greedy=True, k_samples=1, max_new_tokens=384),
-        metadata={
-            "title": "Planner/executor/tester structured turn-taking",
-            "body_style": "pseudocode",
-        },
+            prompt_decorators=(
+                _decorate_with_control_hint,
+            ),
+            controller_behaviors=(
+                _set_body_style_meta("control"),
+            ),
+            agent_profile=AgentProfile(greedy=False, k_samples=1, max_new_tokens=288),
+            metadata={
+                "title": "Control trailer negotiation",
+                "body_style": "control",
+            },
+        )
     )
-)
-
-register_strategy(
-    StrategyDefinition(
-        id="S3_SELF_REFINE",
-        name="self_refine",
-        description="Generator/critic refinement loop with actionable feedback cues.",
-        json_only=True,
-        allow_cot=True,
-        max_rounds=5,
-        decoding={
-            "do_sample": False,
-            "temperature": 0.0,
-            "top_p": 1.0,
-            "max_new_tokens": 320,
-        },
-        consensus_mode="review_handshake",
-        pre_round_hooks=(
-            _set_controller_strategy_id("S3_SELF_REFINE"),
-        ),
-        envelope_validators=(
-            _ensure_status,
-            _ensure_tag,
-        ),
-        prompt_decorators=(
-            _decorate_with_guidance(
-                "Self-refine pattern: proposer shares work, critic responds with issues, proposer revises and highlights changes."
+
+    register_strategy(
+        StrategyDefinition(
+            id="S1_QUICK",
+            name="strict_json_quick",
+            description="Fewer rounds and shorter outputs for quick validation runs.",
+            json_only=True,
+            allow_cot=False,
+            max_rounds=4,
+            decoding={
+                "do_sample": False,
+                "temperature": 0.0,
+                "top_p": 1.0,
+                "max_new_tokens": 192,
+            },
+            consensus_mode="review_handshake",
+            pre_round_hooks=(_set_controller_strategy_id("S1_QUICK"),),
+            envelope_validators=(
+                _ensure_status,
+                _ensure_tag,
             ),
-        ),
-        controller_behaviors=(
-            _toggle_json_mode,
-        ),
-        agent_profile=AgentProfile(greedy=True, k_samples=1, max_new_tokens=320),
-        metadata={
-            "title": "Self-reflection refinement loop",
-            "body_style": "nl",
-        },
+            prompt_decorators=(
+                _decorate_with_json_hint,
+            ),
+            controller_behaviors=(
+                _toggle_json_mode,
+            ),
+            agent_profile=AgentProfile(greedy=True, k_samples=1, max_new_tokens=192),
+            metadata={
+                "title": "Quick strict JSON runs",
+                "body_style": "json",
+            },
+        )
     )
-)
-
-register_strategy(
-    StrategyDefinition(
-        id="S4_CONSTITUTIONAL",
-        name="constitutional_review",
-        description="Constitutional critique followed by safe editing and checklist reporting.",
-        json_only=True,
-        allow_cot=True,
-        max_rounds=5,
-        decoding={
-            "do_sample": False,
-            "temperature": 0.0,
-            "top_p": 1.0,
-            "max_new_tokens": 320,
-        },
-        consensus_mode="review_handshake",
-        pre_round_hooks=(
-            _set_controller_strategy_id("S4_CONSTITUTIONAL"),
-        ),
-        envelope_validators=(
-            _ensure_status,
-            _ensure_tag,
-        ),
-        prompt_decorators=(
-            _decorate_with_guidance(
-                "Apply the safety constitution: cite policies, then perform or reject edits with explicit checklist status."
+
+    register_strategy(
+        StrategyDefinition(
+            id="S2_PLAN_EXECUTE",
+            name="plan_execute",
+            description="Planner-to-executor handshake with explicit stage reminders.",
+            json_only=True,
+            allow_cot=True,
+            max_rounds=6,
+            decoding={
+                "do_sample": False,
+                "temperature": 0.0,
+                "top_p": 1.0,
+                "max_new_tokens": 384,
+            },
+            consensus_mode="review_handshake",
+            pre_round_hooks=(
+                _set_controller_strategy_id("S2_PLAN_EXECUTE"),
             ),
-        ),
-        controller_behaviors=(
-            _toggle_json_mode,
-        ),
-        agent_profile=AgentProfile(greedy=True, k_samples=1, max_new_tokens=320),
-        metadata={
-            "title": "Policy citation and safe-edit workflow",
-            "body_style": "kqml",
-        },
+            envelope_validators=(
+                _ensure_status,
+                _ensure_tag,
+            ),
+            prompt_decorators=(
+                _decorate_with_guidance(
+                    "Stage reminder: plan first, then implementation, then testing feedback. Reference the current stage in your JSON tag."
+                ),
+            ),
+            controller_behaviors=(
+                _toggle_json_mode,
+            ),
+            agent_profile=AgentProfile(greedy=True, k_samples=1, max_new_tokens=384),
+            metadata={
+                "title": "Planner/executor/tester structured turn-taking",
+                "body_style": "pseudocode",
+            },
+        )
     )
-)
-
-register_strategy(
-    StrategyDefinition(
-        id="S5_DEBATE",
-        name="debate_review",
-        description="Peer review dialogue encouraging explicit critiques before convergence.",
-        json_only=True,
-        allow_cot=True,
-        max_rounds=6,
-        decoding={
-            "do_sample": False,
-            "temperature": 0.2,
-            "top_p": 0.9,
-            "max_new_tokens": 384,
-        },
-        consensus_mode="review_handshake",
-        pre_round_hooks=(
-            _set_controller_strategy_id("S5_DEBATE"),
-        ),
-        envelope_validators=(
-            _ensure_status,
-            _ensure_tag,
-        ),
-        prompt_decorators=(
-            _decorate_with_guidance(
-                "Debate protocol: state your position, critique your partner's reasoning, and document convergence explicitly."
+
+    register_strategy(
+        StrategyDefinition(
+            id="S3_SELF_REFINE",
+            name="self_refine",
+            description="Generator/critic refinement loop with actionable feedback cues.",
+            json_only=True,
+            allow_cot=True,
+            max_rounds=5,
+            decoding={
+                "do_sample": False,
+                "temperature": 0.0,
+                "top_p": 1.0,
+                "max_new_tokens": 320,
+            },
+            consensus_mode="review_handshake",
+            pre_round_hooks=(
+                _set_controller_strategy_id("S3_SELF_REFINE"),
             ),
-        ),
-        controller_behaviors=(
-            _toggle_json_mode,
-        ),
-        agent_profile=AgentProfile(greedy=False, k_samples=1, max_new_tokens=384),
-        metadata={
-            "title": "Peer debate with critique tracking",
-            "body_style": "nl",
-        },
+            envelope_validators=(
+                _ensure_status,
+                _ensure_tag,
+            ),
+            prompt_decorators=(
+                _decorate_with_guidance(
+                    "Self-refine pattern: proposer shares work, critic responds with issues, proposer revises and highlights changes."
+                ),
+            ),
+            controller_behaviors=(
+                _toggle_json_mode,
+            ),
+            agent_profile=AgentProfile(greedy=True, k_samples=1, max_new_tokens=320),
+            metadata={
+                "title": "Self-reflection refinement loop",
+                "body_style": "nl",
+            },
+        )
     )
-)
-
-
-_STYLE_STRATEGIES = {
-    "NL": {
-        "description": "Matrix runner natural language style",
-        "prompt": (
-            "STYLE: Use concise natural language. Be direct. Avoid fluff. Use short bullet points when helpful."
-        ),
-        "body_style": "nl",
-        "json_only": False,
-        "controller": _set_body_style_meta("nl"),
-    },
-    "JSON_SCHEMA": {
-        "description": "Matrix runner strict JSON style",
-        "prompt": (
-            "STYLE: Reply ONLY as JSON that conforms to:\n"
-            "{\n"
-            "  \"answer\": string,\n"
-            "  \"steps\": string[]\n"
-            "}\n"
-            "No prose outside JSON. If unknown, set fields to empty strings."
-        ),
-        "body_style": "json",
-        "json_only": True,
-        "controller": _toggle_json_mode,
-    },
-    "PSEUDOCODE": {
-        "description": "Matrix runner pseudocode style",
-        "prompt": (
-            "STYLE: Reply in compact pseudocode using BEGIN/END, IF, FOR, RETURN. Keep lines short."
-        ),
-        "body_style": "pseudocode",
-        "json_only": False,
-        "controller": _set_body_style_meta("pseudocode"),
-    },
-    "KQMLISH": {
-        "description": "Matrix runner symbolic dialogue style",
-        "prompt": (
-            "STYLE: Use symbolic acts, each on separate lines:\n"
-            "(propose :content \"...\")\n"
-            "(inform :content \"...\")\n"
-            "(ask :content \"...\")"
-        ),
-        "body_style": "kqml",
-        "json_only": False,
-        "controller": _set_body_style_meta("kqml"),
-    },
-    "EMERGENT_TOY": {
-        "description": "Matrix runner compressed emergent language style",
-        "prompt": (
-            "STYLE: Compressed tag-speak <T1:...>; <T2:...>. Minimize tokens. No full sentences."
-        ),
-        "body_style": "toy",
-        "json_only": False,
-        "controller": _set_body_style_meta("toy"),
-    },
-    "DSL": {
-        "description": "Matrix runner domain-specific language style",
-        "prompt": (
-            "STYLE: Reply strictly in the provided domain-specific language. If impossible, emit DSL_LIMITATION(\"<reason>\")."
-        ),
-        "body_style": "dsl",
-        "json_only": False,
-        "controller": _set_body_style_meta("dsl"),
-    },
-}
-
-
-for style_id, info in _STYLE_STRATEGIES.items():
+
     register_strategy(
         StrategyDefinition(
-            id=style_id,
-            name=f"matrix_style_{style_id.lower()}",
-            description=info["description"],
-            json_only=info["json_only"],
+            id="S4_CONSTITUTIONAL",
+            name="constitutional_review",
+            description="Constitutional critique followed by safe editing and checklist reporting.",
+            json_only=True,
             allow_cot=True,
-            max_rounds=4,
+            max_rounds=5,
             decoding={
                 "do_sample": False,
                 "temperature": 0.0,
                 "top_p": 1.0,
-                "max_new_tokens": 256,
+                "max_new_tokens": 320,
+            },
+            consensus_mode="review_handshake",
+            pre_round_hooks=(
+                _set_controller_strategy_id("S4_CONSTITUTIONAL"),
+            ),
+            envelope_validators=(
+                _ensure_status,
+                _ensure_tag,
+            ),
+            prompt_decorators=(
+                _decorate_with_guidance(
+                    "Apply the safety constitution: cite policies, then perform or reject edits with explicit checklist status."
+                ),
+            ),
+            controller_behaviors=(
+                _toggle_json_mode,
+            ),
+            agent_profile=AgentProfile(greedy=True, k_samples=1, max_new_tokens=320),
+            metadata={
+                "title": "Policy citation and safe-edit workflow",
+                "body_style": "kqml",
+            },
+        )
+    )
+
+    register_strategy(
+        StrategyDefinition(
+            id="S5_DEBATE",
+            name="debate_review",
+            description="Peer review dialogue encouraging explicit critiques before convergence.",
+            json_only=True,
+            allow_cot=True,
+            max_rounds=6,
+            decoding={
+                "do_sample": False,
+                "temperature": 0.2,
+                "top_p": 0.9,
+                "max_new_tokens": 384,
             },
             consensus_mode="review_handshake",
+            pre_round_hooks=(
+                _set_controller_strategy_id("S5_DEBATE"),
+            ),
+            envelope_validators=(
+                _ensure_status,
+                _ensure_tag,
+            ),
             prompt_decorators=(
-                _decorate_with_guidance(info["prompt"]),
+                _decorate_with_guidance(
+                    "Debate protocol: state your position, critique your partner's reasoning, and document convergence explicitly."
+                ),
+            ),
+            controller_behaviors=(
+                _toggle_json_mode,
             ),
-            controller_behaviors=(info["controller"],),
+            agent_profile=AgentProfile(greedy=False, k_samples=1, max_new_tokens=384),
             metadata={
-                "title": f"Matrix style {style_id}",
-                "body_style": info["body_style"],
+                "title": "Peer debate with critique tracking",
+                "body_style": "nl",
             },
         )
     )
 
+    style_strategies = {
+        "NL": {
+            "description": "Matrix runner natural language style",
+            "prompt": (
+                "STYLE: Use concise natural language. Be direct. Avoid fluff. Use short bullet points when helpful."
+            ),
+            "body_style": "nl",
+            "json_only": False,
+            "controller": _set_body_style_meta("nl"),
+        },
+        "JSON_SCHEMA": {
+            "description": "Matrix runner strict JSON style",
+            "prompt": (
+                "STYLE: Reply ONLY as JSON that conforms to:\n"
+                "{\n"
+                "  \"answer\": string,\n"
+                "  \"steps\": string[]\n"
+                "}\n"
+                "No prose outside JSON. If unknown, set fields to empty strings."
+            ),
+            "body_style": "json",
+            "json_only": True,
+            "controller": _toggle_json_mode,
+        },
+        "PSEUDOCODE": {
+            "description": "Matrix runner pseudocode style",
+            "prompt": (
+                "STYLE: Reply in compact pseudocode using BEGIN/END, IF, FOR, RETURN. Keep lines short."
+            ),
+            "body_style": "pseudocode",
+            "json_only": False,
+            "controller": _set_body_style_meta("pseudocode"),
+        },
+        "KQMLISH": {
+            "description": "Matrix runner symbolic dialogue style",
+            "prompt": (
+                "STYLE: Use symbolic acts, each on separate lines:\n"
+                "(propose :content \"...\")\n"
+                "(inform :content \"...\")\n"
+                "(ask :content \"...\")"
+            ),
+            "body_style": "kqml",
+            "json_only": False,
+            "controller": _set_body_style_meta("kqml"),
+        },
+        "EMERGENT_TOY": {
+            "description": "Matrix runner compressed emergent language style",
+            "prompt": (
+                "STYLE: Compressed tag-speak <T1:...>; <T2:...>. Minimize tokens. No full sentences."
+            ),
+            "body_style": "toy",
+            "json_only": False,
+            "controller": _set_body_style_meta("toy"),
+        },
+        "DSL": {
+            "description": "Matrix runner domain-specific language style",
+            "prompt": (
+                "STYLE: Reply strictly in the provided domain-specific language. If impossible, emit DSL_LIMITATION(\"<reason>\")."
+            ),
+            "body_style": "dsl",
+            "json_only": False,
+            "controller": _set_body_style_meta("dsl"),
+        },
+    }
+
+    for style_id, info in style_strategies.items():
+        register_strategy(
+            StrategyDefinition(
+                id=style_id,
+                name=f"matrix_style_{style_id.lower()}",
+                description=info["description"],
+                json_only=info["json_only"],
+                allow_cot=True,
+                max_rounds=4,
+                decoding={
+                    "do_sample": False,
+                    "temperature": 0.0,
+                    "top_p": 1.0,
+                    "max_new_tokens": 256,
+                },
+                consensus_mode="review_handshake",
+                prompt_decorators=(
+                    _decorate_with_guidance(info["prompt"]),
+                ),
+                controller_behaviors=(info["controller"],),
+                metadata={
+                    "title": f"Matrix style {style_id}",
+                    "body_style": info["body_style"],
+                },
+            )
+        )
+
+
+STRATEGY_REGISTRY: MutableMapping[str, StrategyDefinition] = _StrategyRegistry(_register_builtin_strategies)
+
 
 REGISTRY = STRATEGY_REGISTRY
 
@@ -1,5 +1,5 @@
 from __future__ import annotations
-import yaml, json
+import json
 from pathlib import Path
 from typing import Any, Dict
 
@@ -16,6 +16,8 @@ def _scenario_lookup_id(scenario_id: str) -> str:
     return ":".join(parts)
 
 def _load_yaml(path: Path) -> Dict[str, Any]:
+    import yaml  # deferred so that importing the CLI modules stays cheap
+
     with path.open("r", encoding="utf-8") as f:
         data = yaml.safe_load(f) or {}
     return data
@@ -41,6 +43,8 @@ def load_roleset(path_str: str) -> Dict[str, Any]:
     with path.open("r", encoding="utf-8") as f:
         if path.suffix.lower() == ".json":
             return json.load(f)
+        import yaml
+
         return yaml.safe_load(f)
 
 def get_scenario(scenario_id: str) -> Dict[str, Any]:
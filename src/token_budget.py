@@ -0,0 +1,191 @@
+"""Cached token counts and observed-length trailer budgets.
+
+Trailer-mode generation measures the same strings over and over: the trailer
+template on every call, and body/trailer splits of every attempt.
+:class:`TokenCache` is a process-wide LRU of token counts keyed by tokenizer
+identity and text, shared by :mod:`src.model_loader` and
+:mod:`src.agents_hf`.
+
+:class:`TrailerBudgetPlanner` replaces the fixed ``TRAILER_RESERVE_FRACTION``
+split once a strategy has produced enough trailers.  It keeps a sliding window
+of observed trailer token lengths per strategy and reserves a high quantile of
+that distribution (plus a margin) for the trailer; the same figure caps the
+salvage pass, so continuations that only need to close a trailer stop paying
+for a quarter of ``max_new_tokens``.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from .weak_owners import WeakOwnerIndex
+
+DEFAULT_MAX_ENTRIES = 8192
+
+
+def _encoded_length(tokenizer: Any, text: str) -> Optional[int]:
+    encode = getattr(tokenizer, "encode", None) if tokenizer is not None else None
+    if encode is None:
+        return None
+    try:
+        tokens = encode(text, add_special_tokens=False)
+    except TypeError:
+        try:
+            tokens = encode(text)
+        except Exception:
+            return None
+    except Exception:
+        return None
+    if tokens is None:
+        return None
+    candidate = getattr(tokens, "input_ids", tokens)
+    if hasattr(candidate, "__len__"):
+        return len(candidate)
+    return None
+
+
+def _word_count(text: str) -> int:
+    stripped = text.strip()
+    return len(stripped.split()) if stripped else 0
+
+
+class TokenCache:
+    """LRU of ``(tokenizer, text) -> token count``.
+
+    Tokenizers are tracked by identity through weak references; when one is
+    garbage collected its entries are dropped, so a recycled ``id()`` never
+    serves stale counts.  Objects that cannot be weakly referenced bypass the
+    cache.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max(int(max_entries), 1)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, str], int]" = OrderedDict()
+        self._owners = WeakOwnerIndex(self._forget)
+        self._lock = threading.RLock()
+
+    def _forget(self, owner: int) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == owner]:
+                del self._entries[key]
+
+    def count(self, tokenizer: Any, text: str) -> int:
+        """Token count of ``text`` without special tokens (words as a fallback)."""
+
+        if not text:
+            return 0
+        with self._lock:
+            owner = self._owners.key(tokenizer)
+            if owner is not None:
+                cached = self._entries.get((owner, text))
+                if cached is not None:
+                    self._entries.move_to_end((owner, text))
+                    self.hits += 1
+                    return cached
+            self.misses += 1
+        length = _encoded_length(tokenizer, text)
+        if length is None:
+            return _word_count(text)
+        if owner is not None:
+            with self._lock:
+                self._entries[(owner, text)] = length
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return length
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+@dataclass(frozen=True)
+class BudgetPlan:
+    body_budget: int
+    trailer_budget: int
+    salvage_max_new_tokens: int
+    samples: int
+
+
+class TrailerBudgetPlanner:
+    """Per-strategy trailer budgets from the observed trailer length distribution."""
+
+    def __init__(
+        self,
+        *,
+        quantile: float = 0.95,
+        margin: int = 8,
+        min_samples: int = 5,
+        window: int = 256,
+    ) -> None:
+        self.quantile = min(max(float(quantile), 0.0), 1.0)
+        self.margin = max(int(margin), 0)
+        self.min_samples = max(int(min_samples), 1)
+        self.window = max(int(window), 1)
+        self._lengths: Dict[str, Deque[int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, strategy_id: str, trailer_tokens: int) -> None:
+        if trailer_tokens <= 0:
+            return
+        with self._lock:
+            lengths = self._lengths.setdefault(strategy_id, deque(maxlen=self.window))
+            lengths.append(int(trailer_tokens))
+
+    def samples(self, strategy_id: str) -> int:
+        with self._lock:
+            return len(self._lengths.get(strategy_id, ()))
+
+    def plan(self, strategy_id: str, max_new_tokens: int, *, template_tokens: int = 0) -> Optional[BudgetPlan]:
+        """Budgets for one call, or ``None`` until ``min_samples`` trailers were seen."""
+
+        with self._lock:
+            observed = sorted(self._lengths.get(strategy_id, ()))
+        if len(observed) < self.min_samples or max_new_tokens <= 0:
+            return None
+        rank = min(math.ceil(self.quantile * len(observed)), len(observed)) - 1
+        trailer = max(observed[max(rank, 0)] + self.margin, int(template_tokens), 1)
+        trailer = min(trailer, int(max_new_tokens))
+        return BudgetPlan(
+            body_budget=max(int(max_new_tokens) - trailer, 0),
+            trailer_budget=trailer,
+            salvage_max_new_tokens=trailer,
+            samples=len(observed),
+        )
+
+
+_TOKEN_CACHE = TokenCache()
+_PLANNER = TrailerBudgetPlanner()
+
+
+def get_token_cache() -> TokenCache:
+    return _TOKEN_CACHE
+
+
+def get_budget_planner() -> TrailerBudgetPlanner:
+    return _PLANNER
+
+
+def count_tokens(tokenizer: Any, text: str) -> int:
+    """Token count through the shared :class:`TokenCache`."""
+
+    return _TOKEN_CACHE.count(tokenizer, text)
+
+
+__all__ = [
+    "BudgetPlan",
+    "TokenCache",
+    "TrailerBudgetPlanner",
+    "count_tokens",
+    "get_budget_planner",
+    "get_token_cache",
+]
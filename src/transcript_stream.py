@@ -0,0 +1,173 @@
+"""Incremental transcript files for fixed-turn dialogs.
+
+A run's ``.jsonl`` file is a stream of records::
+
+    {"type": "header", "version": 1, "started": ..., "config": {...}}
+    {"type": "turn", "r": 1, "actor": "A", "text_in": ..., "text_out": ..., ...}
+    ...
+    {"type": "footer", "config": {...}, "elapsed_sec": ...}
+
+Turns are appended as they are produced and flushed every ``flush_every``
+turns; the footer carries the final ``RunSummary`` and is fsync-ed on close.
+If a dialog dies mid-run the turns written so far stay readable, and
+:func:`read_transcript` rebuilds the ``{"config", "transcript"}`` shape from
+the header plus the recorded turns.  The reader also accepts the older
+single-record files.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional
+
+STREAM_VERSION = 1
+DEFAULT_FLUSH_EVERY = 2
+CSV_HEADER = "r,actor,prompt_tokens,output_tokens,stop_reason\n"
+
+
+class TranscriptWriter:
+    """Append turn records to a run's JSONL (and per-turn CSV) as they happen."""
+
+    def __init__(
+        self,
+        jsonl_path: str,
+        csv_path: Optional[str] = None,
+        *,
+        header: Optional[Mapping[str, Any]] = None,
+        flush_every: int = DEFAULT_FLUSH_EVERY,
+    ) -> None:
+        self.jsonl_path = jsonl_path
+        self.csv_path = csv_path
+        self.flush_every = max(int(flush_every), 1)
+        self.turns_written = 0
+        self._pending = 0
+        self._jsonl = open(jsonl_path, "w", encoding="utf-8")
+        self._csv = open(csv_path, "w", encoding="utf-8") if csv_path else None
+        self._write_record(
+            {
+                "type": "header",
+                "version": STREAM_VERSION,
+                "started": datetime.now().isoformat(timespec="seconds"),
+                "config": dict(header or {}),
+            }
+        )
+        if self._csv is not None:
+            self._csv.write(CSV_HEADER)
+        self.flush()
+
+    @property
+    def closed(self) -> bool:
+        return self._jsonl.closed
+
+    def _write_record(self, record: Mapping[str, Any]) -> None:
+        self._jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write_turn(self, turn: Mapping[str, Any]) -> None:
+        self._write_record({"type": "turn", **turn})
+        if self._csv is not None:
+            self._csv.write(
+                f"{turn['r']},{turn['actor']},{turn['prompt_tokens']},"
+                f"{turn['output_tokens']},{turn['stop_reason']}\n"
+            )
+        self.turns_written += 1
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self, *, sync: bool = False) -> None:
+        for handle in (self._jsonl, self._csv):
+            if handle is None or handle.closed:
+                continue
+            handle.flush()
+            if sync:
+                os.fsync(handle.fileno())
+        self._pending = 0
+
+    def close(self, config: Mapping[str, Any], elapsed_sec: float) -> None:
+        """Write the footer and close both files."""
+
+        self._write_record({"type": "footer", "config": dict(config), "elapsed_sec": elapsed_sec})
+        self.flush(sync=True)
+        self._close_handles()
+
+    def abort(self) -> None:
+        """Flush what was written and close without a footer."""
+
+        if self.closed:
+            return
+        self.flush(sync=True)
+        self._close_handles()
+
+    def _close_handles(self) -> None:
+        self._jsonl.close()
+        if self._csv is not None:
+            self._csv.close()
+
+    def __enter__(self) -> "TranscriptWriter":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.abort()
+
+
+def _partial_config(header: Mapping[str, Any], transcript: List[Dict[str, Any]]) -> Dict[str, Any]:
+    config = dict(header)
+    config["total_prompt_tokens"] = sum(int(t.get("prompt_tokens", 0)) for t in transcript)
+    config["total_output_tokens"] = sum(int(t.get("output_tokens", 0)) for t in transcript)
+    return config
+
+
+def read_transcript(path: str) -> Dict[str, Any]:
+    """Rebuild ``{"config", "transcript", "elapsed_sec", "complete"}`` from a run file.
+
+    ``complete`` is ``False`` when the stream has no footer (the run was
+    interrupted); ``config`` then comes from the header with token totals
+    summed over the recorded turns and ``elapsed_sec`` is ``None``.
+    """
+
+    header: Dict[str, Any] = {}
+    footer: Optional[Dict[str, Any]] = None
+    transcript: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # torn final line from a killed process
+            kind = record.get("type")
+            if kind is None and "transcript" in record:
+                return {
+                    "config": record.get("config", {}),
+                    "transcript": list(record.get("transcript") or []),
+                    "elapsed_sec": record.get("elapsed_sec"),
+                    "complete": True,
+                }
+            if kind == "header":
+                header = dict(record.get("config") or {})
+            elif kind == "turn":
+                turn = dict(record)
+                turn.pop("type", None)
+                transcript.append(turn)
+            elif kind == "footer":
+                footer = record
+
+    if footer is not None:
+        return {
+            "config": dict(footer.get("config") or {}),
+            "transcript": transcript,
+            "elapsed_sec": footer.get("elapsed_sec"),
+            "complete": True,
+        }
+    return {
+        "config": _partial_config(header, transcript),
+        "transcript": transcript,
+        "elapsed_sec": None,
+        "complete": False,
+    }
+
+
+__all__ = ["DEFAULT_FLUSH_EVERY", "TranscriptWriter", "read_transcript"]
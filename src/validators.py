@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import re
 from functools import partial
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, Tuple
 
 
 def _split_sentences(text: str) -> list[str]:
@@ -52,12 +52,23 @@ _VALIDATORS: Dict[str, Callable[..., str]] = {
 }
 
 
+# (validator, sorted params) -> bound partial, so every dialog of a run reuses one.
+_BOUND: Dict[Tuple[Callable[..., str], Tuple[Tuple[str, Any], ...]], Callable[[str], str]] = {}
+
+
 def get_validator(name: str, params: Dict[str, Any] | None = None) -> Callable[[str], str]:
     try:
         fn = _VALIDATORS[name]
     except KeyError as exc:
         raise KeyError(f"Validator '{name}' is not registered.") from exc
-    if params:
+    if not params:
+        return fn
+    key = (fn, tuple(sorted(params.items())))
+    try:
+        return _BOUND[key]
+    except KeyError:
+        bound = _BOUND[key] = partial(fn, **params)
+        return bound
+    except TypeError:  # unhashable parameter values
         return partial(fn, **params)
-    return fn
 
@@ -0,0 +1,55 @@
+"""Identity keys for caches that must forget collected objects.
+
+Several process-wide caches key their entries by the ``id()`` of a tokenizer
+or model.  ``id()`` values are recycled once an object is collected, so each
+cache must drop an owner's entries before its id can name a different object.
+:class:`WeakOwnerIndex` does this tracking for all of them: it hands out
+``id()`` keys and calls back when the object behind a key is collected.
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional
+
+
+class WeakOwnerIndex:
+    """Map live objects to ``id()`` keys and report when they are collected.
+
+    ``on_release(key)`` runs from the object's finalizer, which can fire during
+    garbage collection at any allocation, including while the caller holds its
+    own lock.  Callers that guard their entries with a lock should therefore
+    use a :class:`threading.RLock`.
+    """
+
+    def __init__(self, on_release: Callable[[int], None]) -> None:
+        self._on_release = on_release
+        self._finalizers: Dict[int, Any] = {}
+        self._lock = threading.RLock()
+
+    def key(self, obj: Any) -> Optional[int]:
+        """Return the key for ``obj``, or ``None`` if it cannot be weakly referenced."""
+
+        owner = id(obj)
+        with self._lock:
+            if owner not in self._finalizers:
+                try:
+                    self._finalizers[owner] = weakref.finalize(obj, self._release, owner)
+                except TypeError:
+                    return None
+        return owner
+
+    def _release(self, owner: int) -> None:
+        with self._lock:
+            self._finalizers.pop(owner, None)
+        self._on_release(owner)
+
+    def __contains__(self, owner: object) -> bool:
+        return owner in self._finalizers
+
+    def __len__(self) -> int:
+        return len(self._finalizers)
+
+
+__all__ = ["WeakOwnerIndex"]
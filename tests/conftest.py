@@ -1,6 +1,43 @@
+import string
 import sys
 from pathlib import Path
 
+import pytest
+
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(scope="session")
+def tiny_tokenizer():
+    """Character-level fast tokenizer: one id per printable character."""
+
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {"<eos>": 0, "<pad>": 1}
+    for ch in string.printable:
+        vocab.setdefault(ch, len(vocab))
+    tok = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<pad>"))
+    tok.pre_tokenizer = pre_tokenizers.Split(pattern="", behavior="isolated")
+    tok.decoder = decoders.Fuse()
+    return PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<eos>", pad_token="<pad>")
+
+
+@pytest.fixture(scope="session")
+def tiny_gpt2(tiny_tokenizer):
+    """Factory for randomly initialised GPT-2 models over ``tiny_tokenizer``."""
+
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    def make(layers: int = 2, seed: int = 0) -> GPT2LMHeadModel:
+        torch.manual_seed(seed)
+        config = GPT2Config(
+            vocab_size=len(tiny_tokenizer), n_positions=4096, n_embd=32, n_layer=layers, n_head=2,
+            eos_token_id=0, pad_token_id=1, bos_token_id=0,
+        )
+        return GPT2LMHeadModel(config).eval()
+
+    return make
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+from src.agents_mock import ScriptedAgent
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _suite():
+    spec = importlib.util.spec_from_file_location("bench_controller_suite", ROOT / "scripts" / "bench_controller_suite.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules.setdefault(spec.name, module)  # dataclasses resolve their module
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_scripted_agent_replays_copies_and_repeats_last():
+    script = [{"tag": "[CONTACT]", "status": "WORKING", "content": {"n": 1}}, {"tag": "[SOLVED]", "status": "SOLVED"}]
+    agent = ScriptedAgent("A", script)
+    first, raw = agent.step("t", [])
+    first["content"]["n"] = 99
+    assert raw.startswith("{") and script[0]["content"]["n"] == 1
+    assert [agent.step("t", [])[0]["status"] for _ in range(2)] == ["SOLVED", "SOLVED"]
+    with pytest.raises(ValueError):
+        ScriptedAgent("B", [])
+
+
+def test_controller_suite_runs_scripted_cases_and_flags_regressions():
+    suite = _suite()
+    cases = suite._cases(["S1", "DSL", "TEXT"])
+    results = {case.name: suite.run_case(case, 2, repeats=2, memory_dialogs=1, dumps=True) for case in cases}
+    assert results["S1"]["rounds"] == 8
+    for res in results.values():
+        assert set(res["phases_us"]) == set(suite.PHASES)
+        assert res["us_per_round"] >= res["controller_us_per_round"] > 0
+    assert results["DSL"]["phases_us"]["dsl"] > 0 and results["S1"]["phases_us"]["repair"] > 0
+    assert results["S1"]["dumps_per_turn"] > 0
+
+    baseline = {"cases": {"S1": {"normalized": results["S1"]["controller_us_per_round"] / 10.0 / 2}}}
+    assert suite.compare(results, 10.0, baseline, tolerance=0.25) == ["S1"]
+    # Allocation growth is gated on its own.
+    peak = results["DSL"]["peak_kib"]
+    baseline = {"cases": {"DSL": {"normalized": 1e9, "peak_kib": peak / 2}}}
+    assert suite.compare(results, 10.0, baseline, tolerance=0.25) == ["DSL"]
+    assert suite.compare(results, 10.0, baseline, tolerance=0.25, memory_tolerance=1.5) == []
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from src.agents_mock import MockAgent
+from src.async_controller import GenerationWorker, Scenario, run_controller_async, run_scenarios
+from src.controller import run_controller
+
+
+class ThreadRecordingAgent(MockAgent):
+    def __init__(self, name: str, solution_text: str) -> None:
+        super().__init__(name, solution_text)
+        self.threads: set = set()
+
+    def step(self, task, transcript, preparation=None):
+        self.threads.add(threading.current_thread().name)
+        return super().step(task, transcript, preparation=preparation)
+
+
+def _scenario(answer: str) -> Scenario:
+    return Scenario(f"Return {answer}", MockAgent("A", answer), MockAgent("B", answer), max_rounds=4)
+
+
+def test_async_result_matches_sync_controller():
+    expected = run_controller("Return 42", MockAgent("A", "42"), MockAgent("B", "42"), max_rounds=4)
+    got = asyncio.run(run_controller_async("Return 42", MockAgent("A", "42"), MockAgent("B", "42"), max_rounds=4))
+    assert got == expected
+    assert got["status"] == "CONSENSUS"
+
+
+def test_many_scenarios_share_one_worker_and_keep_order():
+    answers = [str(n) for n in range(6)]
+    finished = []
+    agents = [ThreadRecordingAgent("A", "1"), ThreadRecordingAgent("B", "1")]
+    scenarios = [_scenario(a) for a in answers] + [Scenario("Return 1", *agents, max_rounds=4)]
+
+    with GenerationWorker(name="gen") as worker:
+        results = run_scenarios(scenarios, worker=worker, max_active=3, on_result=lambda i, _: finished.append(i))
+        assert worker.calls == sum(len(r["transcript"]) for r in results)
+
+    assert [r["canonical_text"] for r in results] == answers + ["1"]
+    assert sorted(finished) == list(range(len(scenarios)))
+    assert all(name.startswith("gen") for agent in agents for name in agent.threads)
+    assert results[0] == run_controller("Return 0", MockAgent("A", "0"), MockAgent("B", "0"), max_rounds=4)
+
+
+def test_failures_can_be_returned_in_place():
+    class Broken(MockAgent):
+        def step(self, *args, **kwargs):
+            raise RuntimeError("boom")
+
+    scenarios = [_scenario("7"), Scenario("Return 7", Broken("A", "7"), MockAgent("B", "7"))]
+    results = run_scenarios(scenarios, return_exceptions=True)
+    assert results[0]["status"] == "CONSENSUS"
+    assert isinstance(results[1], RuntimeError)
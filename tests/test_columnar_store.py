@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import pytest
+
+from src.columnar_store import (
+    aggregate_rows,
+    batch_schema,
+    partition_files,
+    partition_of,
+    unify_schemas,
+)
+
+
+def _row(strategy, elapsed, prompt, **extra):
+    return {
+        "timestamp": "2025-10-21T18:05:17",
+        "model_a": "org/model-7b",
+        "strategy": strategy,
+        "elapsed_sec": elapsed,
+        "total_prompt_tokens": prompt,
+        "total_output_tokens": 10,
+        **extra,
+    }
+
+
+def test_known_columns_are_typed_and_new_columns_widen():
+    schema = batch_schema([_row("NL", 1, 5, extra_metric=1), _row("NL", 2.5, 6, extra_metric=0.5)])
+    assert schema["elapsed_sec"] == "float64"  # typed even though the first value is an int
+    assert schema["total_prompt_tokens"] == "int64"
+    assert schema["extra_metric"] == "float64"
+    assert unify_schemas([{"a": "int64"}, {"a": "float64", "b": "bool"}]) == {"a": "float64", "b": "bool"}
+    assert unify_schemas([{"a": "int64"}, {"a": "string"}])["a"] == "string"
+
+
+def test_partitions_and_pruning(tmp_path):
+    assert partition_of(_row("JSON_SCHEMA", 1.0, 5)) == ("2025-10-21", "org__model-7b", "JSON_SCHEMA")
+    assert partition_of({"strategy_id": "S1", "model_a": "m"})[1:] == ("m", "S1")
+    for strategy in ("NL", "DSL"):
+        leaf = tmp_path / "dt=2025-10-21" / "model=org__model-7b" / f"strategy={strategy}"
+        leaf.mkdir(parents=True)
+        (leaf / "part-1.parquet").write_bytes(b"")
+    assert len(partition_files(str(tmp_path))) == 2
+    (only,) = partition_files(str(tmp_path), {"strategy": "DSL", "model": "org/model-7b"})
+    assert "strategy=DSL" in only
+    assert partition_files(str(tmp_path), {"dt": "2025-10-22"}) == []
+
+
+def test_aggregate_rows_per_strategy():
+    rows = [_row("NL", 1.0, 100), _row("NL", 3.0, 300), _row("DSL", 2.0, 50, elapsed_sec=None)]
+    by_strategy = {entry["strategy"]: entry for entry in aggregate_rows(rows)}
+    assert by_strategy["NL"]["runs"] == 2
+    assert by_strategy["NL"]["elapsed_sec_mean"] == 2.0
+    assert by_strategy["NL"]["elapsed_sec_p50"] == 2.0
+    assert by_strategy["NL"]["total_prompt_tokens_sum"] == 400
+    assert "elapsed_sec_mean" not in by_strategy["DSL"]
+    assert by_strategy["DSL"]["total_output_tokens_mean"] == 10
+
+
+def test_parquet_round_trip_with_schema_evolution(tmp_path):
+    pytest.importorskip("pyarrow")
+    from src.columnar_store import ColumnarSink, read_rows, strategy_aggregates
+
+    with ColumnarSink(str(tmp_path)) as sink:
+        sink.append(_row("NL", 1.0, 100))
+        sink.append(_row("DSL", 2.0, 50))
+    with ColumnarSink(str(tmp_path)) as sink:
+        sink.append(_row("NL", 3.0, 300, cache_hit=True, new_metric=7))
+
+    rows = read_rows(str(tmp_path), filters={"strategy": "NL"})
+    assert sorted(r["elapsed_sec"] for r in rows) == [1.0, 3.0]
+    assert sorted((r["new_metric"] is None) for r in rows) == [False, True]
+    summary = {entry["strategy"]: entry for entry in strategy_aggregates(str(tmp_path))}
+    assert summary["NL"]["total_prompt_tokens_sum"] == 400
+    assert summary["DSL"]["runs"] == 1
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import gc
+import json
+
+import torch
+from jsonschema import Draft202012Validator
+
+from src.agents_hf import HFChatAgent, _validate_envelope_candidate
+import src.constrained_json as constrained_json
+from src.constrained_json import (
+    CharDFA,
+    EnvelopeLogitsProcessor,
+    TokenGrammar,
+    TokenIndex,
+    dsl_dfa,
+    envelope_constraint,
+    envelope_dfa,
+    json_string,
+    lit,
+    load_envelope_schema,
+    pattern_node,
+)
+from src.controller import _control_summary, _update_control_stats
+from src.dsl import default_dsl_spec
+from src.model_loader import GenerationResult
+from src.schemas import Envelope
+from src.strategies import build_strategy
+
+
+class CharTokenizer:
+    """Character vocabulary plus a few multi-character pieces."""
+
+    eos_token_id = 0
+    all_special_ids = [0]
+    name_or_path = "char-stub"
+
+    def __init__(self) -> None:
+        pieces = [chr(c) for c in range(32, 127)] + ['{"', '":', '", "', "SOLVED", "ING", "\\n"]
+        self.vocab = {piece: idx for idx, piece in enumerate(pieces, start=1)}
+        self.inverse = {idx: piece for piece, idx in self.vocab.items()}
+
+    def __len__(self) -> int:
+        return len(self.vocab) + 1
+
+    def encode(self, text, add_special_tokens=False):  # noqa: ARG002
+        return [self.vocab[ch] for ch in text if ch in self.vocab]
+
+    def decode(self, ids, skip_special_tokens=False):  # noqa: ARG002
+        return "".join(self.inverse.get(int(i), "") for i in ids)
+
+
+def _envelope(**fields):
+    base = {"status": "WORKING", "tag": "[PLAN]", "content": {"acl": "PLAN: outline => wait"}}
+    base.update(fields)
+    return json.dumps(base)
+
+
+def test_schema_grammar_accepts_only_valid_envelopes():
+    _, dfa = envelope_dfa()
+    solved = {"canonical_text": "42"}
+    assert dfa.matches(_envelope())
+    assert dfa.matches(_envelope(status="SOLVED", final_solution=solved))
+    assert dfa.matches(_envelope(tag="[SOLVEDX]"))
+    assert not dfa.matches(_envelope(status="SOLVED"))  # allOf: SOLVED requires final_solution
+    assert not dfa.matches(_envelope(tag="[SOLVED]"))
+    assert not dfa.matches(_envelope(tag="[plan]"))
+    assert not dfa.matches(_envelope(status="DONE"))
+    assert not dfa.matches(_envelope(content={"acl": "MAYBE: x"}))
+
+
+def test_dsl_grammar_follows_validator_rules():
+    validator = default_dsl_spec().create_validator()
+    _, dfa = dsl_dfa(validator)
+    envelope = {
+        "status": "NEED_PEER",
+        "tag": "[CONTACT]",
+        "role": "planner",
+        "domain": "math",
+        "task_understanding": "sum",
+        "public_message": "[CONTACT] need numbers",
+        "artifact": {"type": "plan", "content": {}},
+        "needs_from_peer": ["numbers"],
+        "handoff_to": "B",
+        "content": {"acl": "QUESTION: which numbers?"},
+    }
+    assert dfa.matches(json.dumps(envelope))
+    validator.validate(envelope)
+    assert not dfa.matches(json.dumps(dict(envelope, public_message="need numbers")))
+    assert not dfa.matches(json.dumps(dict(envelope, tag="[SOLVED]")))
+
+
+def test_pattern_subset():
+    dfa = CharDFA(json_string(pattern_node(r"^ab{2,3}[x-z]?$")))
+    assert [dfa.matches(f'"{s}"') for s in ("abb", "abbb", "abbz", "ab", "abbbb")] == [
+        True,
+        True,
+        True,
+        False,
+        False,
+    ]
+
+
+def test_compiled_grammars_are_cached_per_schema_and_tokenizer(monkeypatch):
+    tokenizer = CharTokenizer()
+    first = envelope_constraint(tokenizer)
+    assert envelope_constraint(tokenizer) is first
+    assert envelope_dfa(load_envelope_schema())[1] is first.dfa
+
+    # Collected tokenizers take their tries and grammars with them.
+    owner = id(tokenizer)
+    del tokenizer, first
+    gc.collect()
+    assert not any(k[0] == owner for k in constrained_json._TOKEN_INDEXES)
+    assert not any(k[1][0] == owner for k in constrained_json._TOKEN_GRAMMARS)
+
+    monkeypatch.setattr(constrained_json, "MAX_TOKEN_INDEXES", 2)
+    live = [CharTokenizer() for _ in range(3)]
+    for tok in live:
+        envelope_constraint(tok)
+    assert len(constrained_json._TOKEN_INDEXES) <= 2
+
+
+def test_logits_processor_only_emits_valid_envelopes():
+    tokenizer = CharTokenizer()
+    grammar = envelope_constraint(tokenizer)
+    schema = Draft202012Validator(load_envelope_schema())
+    closers = [tokenizer.vocab[ch] for ch in '"}'] + [tokenizer.eos_token_id]
+
+    for seed in range(5):
+        gen = torch.Generator().manual_seed(seed)
+        processor = EnvelopeLogitsProcessor(grammar, input_length=1)
+        ids = torch.tensor([[tokenizer.vocab["x"]]])
+        for _ in range(400):
+            scores = torch.randn(1, len(tokenizer), generator=gen)
+            scores[0, closers] += 2.0  # keep free-text fields short
+            scores = processor(ids, scores)
+            token = int(torch.argmax(scores, dim=-1))
+            if token == tokenizer.eos_token_id:
+                break
+            ids = torch.cat([ids, torch.tensor([[token]])], dim=1)
+        else:
+            raise AssertionError("constrained generation did not finish")
+        envelope = json.loads(tokenizer.decode(ids[0, 1:]))
+        assert _validate_envelope_candidate(envelope) == []
+        assert not list(schema.iter_errors(envelope))
+
+
+def test_dead_end_without_eos_leaves_the_row_unmasked(monkeypatch):
+    tokenizer = CharTokenizer()
+    tokenizer.eos_token_id = None
+    grammar = TokenGrammar(CharDFA(lit("ab")), TokenIndex(tokenizer))
+    processor = EnvelopeLogitsProcessor(grammar, input_length=0)
+    width = len(tokenizer)
+
+    scores = processor(torch.tensor([[tokenizer.vocab["a"]]]), torch.zeros(1, width))
+    assert torch.isfinite(scores).sum() == 1
+    ids = torch.tensor([[tokenizer.vocab["a"], tokenizer.vocab["b"]]])
+    scores = processor(ids, torch.zeros(1, width))
+    assert not torch.isnan(torch.softmax(scores, dim=-1)).any() and torch.isfinite(scores).all()
+
+    monkeypatch.setattr(constrained_json, "MAX_MASK_ENTRIES", 2)
+    monkeypatch.setattr(constrained_json, "MAX_STATE_ENTRIES", 2)
+    grammar = TokenGrammar(grammar.dfa, grammar.index)
+    for sid in (0, 1, 2):
+        grammar.blocked(grammar.dfa.walk(grammar.dfa.start, "ab"[:sid]), width, torch.device("cpu"))
+    assert len(grammar._masks) == len(grammar._next) == 2
+
+
+def test_json_mode_reports_invalid_outputs_and_tokens(monkeypatch):
+    outputs = iter(["not json", _envelope()])
+
+    def fake_generate(tokenizer, model, convo, **kwargs):
+        assert kwargs["constraint"] is None
+        return GenerationResult(text=next(outputs), stop_reason="eos", tokens_used=7)
+
+    monkeypatch.setattr("src.agents_hf.generate_json_only", fake_generate)
+    agent = HFChatAgent("A", "system", CharTokenizer(), object(), build_strategy("S1_QUICK"), use_prefix_cache=False)
+    envelope, _ = agent.step("task", [])
+
+    telemetry = envelope["content"]["control"]["telemetry"]
+    assert telemetry["json_invalid_outputs"] == 1
+    assert telemetry["json_attempts"] == 2
+    assert telemetry["tokens_used_total"] == 14
+
+    stats: dict = {}
+    _update_control_stats(stats, Envelope(**envelope), 1)
+    summary = _control_summary(stats)
+    assert summary["json_invalid_rate"] == 0.5
+    assert summary["tokens_per_accepted_envelope"] == 14
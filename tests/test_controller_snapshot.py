@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from src.controller import run_controller
+from src.schemas import Envelope, get_envelope_validator
+from src.strategies import Strategy, build_strategy
+
+
+def test_compact_snapshot_matches_exclude_none_dump():
+    for data in (
+        {"tag": "[CONTACT]", "status": "WORKING"},
+        {"tag": "[X]", "status": "W", "content": {"a": None, "b": {"c": None}}},
+        {"tag": "[SOLVED]", "status": "SOLVED", "final_solution": {"canonical_text": "1", "sha256": None, "x": None}},
+    ):
+        env = Envelope.model_validate(data)
+        assert env.snapshot() == env.model_dump()
+        assert env.snapshot() is env.snapshot()
+        assert env.compact_snapshot() == env.model_dump(exclude_none=True)
+        env.status = "REVISED"
+        env.refresh_snapshot()
+        assert env.snapshot()["status"] == "REVISED"
+
+
+class _Agent:
+    def __init__(self, name, strategy, answer):
+        self.name, self.strategy, self.answer, self.turn = name, strategy, answer, 0
+
+    def step(self, task, transcript):
+        self.turn += 1
+        if self.turn == 1:
+            return {"tag": "[CONTACT]", "status": "PROPOSED", "content": {"acl": "PROPOSE: x => WAIT"},
+                    "final_solution": {"canonical_text": self.answer}}, ""
+        return {"tag": "[SOLVED]", "status": "SOLVED", "content": {"acl": "SOLVED: done => END"},
+                "final_solution": {"canonical_text": self.answer}}, ""
+
+
+class _Stamping(Strategy):
+    def postprocess(self, envelope, *, raw, validation, transcript, actor, agent_name):
+        envelope.content = dict(envelope.content or {}, stamped=actor)
+        return envelope, {}
+
+
+def test_controller_dumps_each_turn_once(monkeypatch):
+    calls = []
+    original = Envelope.model_dump
+
+    def counted(self, *args, **kwargs):
+        calls.append(kwargs)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(Envelope, "model_dump", counted)
+    strategy = build_strategy("S1")
+    schema = get_envelope_validator("schemas/envelope.schema.json")
+    out = run_controller("t", _Agent("a", strategy, "7"), _Agent("b", strategy, "7"), max_rounds=3,
+                         schema_validator=schema)
+    turns = len(out["transcript"])
+    assert out["status"] == "CONSENSUS" and turns == 2
+    assert len(calls) == turns
+    assert out["final_message"]["envelope"] is out["transcript"][-1]["envelope"]
+
+
+def test_snapshot_refreshed_after_custom_postprocess():
+    strategy = _Stamping(id="stamp", name="stamp", envelope_validators=(lambda env: (True, None),))
+    out = run_controller("t", _Agent("a", strategy, "7"), _Agent("b", strategy, "7"), max_rounds=3)
+    assert [entry["envelope"]["content"]["stamped"] for entry in out["transcript"]] == ["a", "b"]
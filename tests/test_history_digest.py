@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from src.agents_hf import HFChatAgent
+from src.history_digest import HistoryDigest, clip_to_tokens, context_window, describe_entry
+from src.strategies import Strategy
+
+
+class CharTokenizer:
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def encode(self, text, add_special_tokens=False):  # noqa: ARG002
+        return [ord(ch) for ch in text]
+
+    def decode(self, tokens, skip_special_tokens=True):  # noqa: ARG002
+        return "".join(chr(int(t)) for t in tokens)
+
+
+def _entry(r, actor, intent, body, solution=""):
+    envelope = {"tag": "[CONTACT]", "status": "PROPOSED", "content": {"acl": f"{intent}: {body}"}}
+    if solution:
+        envelope["final_solution"] = {"canonical_text": solution}
+    return {"r": r, "actor": actor, "envelope": envelope}
+
+
+def test_describe_entry_reads_acl_intent_and_bare_envelopes():
+    fields = describe_entry(_entry(2, "b", "PROPOSE", "use plan X", solution="X"))
+    assert (fields["round"], fields["actor"], fields["intent"], fields["solution"]) == (2, "b", "PROPOSE", "X")
+    bare = describe_entry({"role": "planner", "status": "NEED_PEER", "request": {"to_peer": "why?"}})
+    assert (bare["actor"], bare["status"], bare["message"]) == ("planner", "NEED_PEER", "why?")
+
+
+def test_digest_is_incremental_folds_oldest_and_resets():
+    tok = CharTokenizer()
+    digest = HistoryDigest(tok, budget_tokens=320)
+    transcript = [_entry(1, "a", "QUESTION", "what constraints apply?")]
+    digest.update(transcript)
+    assert digest.render() == ""  # the last entry is shown verbatim by the caller
+
+    transcript.append(_entry(2, "b", "PROPOSE", "plan one", solution="plan one"))
+    digest.update(transcript)
+    assert digest.render().startswith("r1 a QUESTION [PROPOSED]")
+
+    for r in range(3, 12):
+        transcript.append(_entry(r, "ab"[r % 2], "CRITIQUE", f"revise step {r} " * 3))
+        digest.update(transcript)
+    text = digest.render()
+    assert len(tok.encode(text)) <= 320
+    assert text.startswith("(rounds 1-")
+    assert "last proposal 'plan one' by b in r2" in text
+    assert "r10" in text and "r11" not in text
+
+    assert len(tok.encode(digest.render(max_tokens=200))) <= 200
+    assert digest.render(max_tokens=5) == ""
+
+    digest.update(transcript[:2])
+    assert digest.render().startswith("r1 a QUESTION")
+
+
+def test_tight_render_leaves_the_digest_unchanged():
+    digest = HistoryDigest(CharTokenizer(), budget_tokens=320)
+    transcript = [_entry(r, "ab"[r % 2], "PROPOSE", f"step {r}") for r in range(1, 6)]
+    digest.update(transcript)
+    full = digest.render()
+    assert full.startswith("r1 b PROPOSE") and "r4" in full
+
+    assert digest.render(max_tokens=120).startswith("(rounds 1-")
+    assert digest.render() == full
+    digest.update(transcript)
+    assert digest.render() == full
+
+
+def test_context_window_and_clip():
+    model = SimpleNamespace(config=SimpleNamespace(max_position_embeddings=512))
+    assert context_window(model) == 512
+    assert context_window(None, SimpleNamespace(model_max_length=int(1e30))) is None
+    assert clip_to_tokens(CharTokenizer(), "abcdef", 4) == "abcd"
+
+
+def test_hf_agent_prompt_fits_small_context():
+    model = SimpleNamespace(config=SimpleNamespace(max_position_embeddings=4096))
+    agent = HFChatAgent("a", "sys", CharTokenizer(), model, Strategy(id="S"), use_prefix_cache=False)
+    transcript = [_entry(r, "ab"[r % 2], "PROPOSE", "x" * 80) for r in range(1, 8)]
+    system, user = agent._messages("task", transcript, None, reply_tokens=0)
+    assert "Earlier rounds:\n(rounds 1-" in user["content"]
+    full = len(system["content"]) + len(user["content"])
+
+    model.config.max_position_embeddings = full + 64 + 32
+    system, user = agent._messages("task", transcript, None, reply_tokens=64)
+    assert len(system["content"]) + len(user["content"]) + 64 + 32 <= model.config.max_position_embeddings
+    assert "Peer context: {" in user["content"]
+
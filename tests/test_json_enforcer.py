@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import itertools
+import json
+from pathlib import Path
+
+from jsonschema import Draft7Validator
+
+from src.dsl import default_dsl_spec, extension_from_config
+from src.json_enforcer import compile_checker, compile_schema, load_schema, validate_envelope
+from src.validators import get_validator
+
+ROOT = Path(__file__).resolve().parents[1]
+SCHEMAS = [
+    ROOT / "schemas" / "envelope.schema.json",
+    ROOT / "schemas" / "envelope.number.schema.json",
+    ROOT / "prompts" / "schemas" / "envelope.schema.json",
+]
+
+VALUES = {
+    "status": ["SOLVED", "WORKING", "REVISED", "solved", 3, None],
+    "tag": ["[SOLVED]", "[CONTACT]", "[PLAN:1]", "SOLVED", None],
+    "content": [{"acl": "PROPOSE: x"}, None, "text", [], {}],
+    "final_solution": [
+        {"canonical_text": "42"},
+        {"canonical_text": "-1.5", "sha256": None},
+        {"canonical_text": ""},
+        {"canonical_text": 42},
+        {"sha256": "abc"},
+        None,
+        "42",
+    ],
+    "role": ["planner", None, 1],
+}
+MISSING = object()
+
+
+def _envelopes():
+    keys = list(VALUES)
+    for combo in itertools.product(*[VALUES[k] + [MISSING] for k in keys]):
+        yield {k: v for k, v in zip(keys, combo) if v is not MISSING}
+
+
+def test_fast_checker_agrees_with_jsonschema_on_envelope_schemas():
+    for path in SCHEMAS:
+        schema = json.loads(path.read_text(encoding="utf-8"))
+        reference = Draft7Validator(schema)
+        check = compile_checker(schema)
+        assert check is not None, path
+        for envelope in _envelopes():
+            assert check(envelope) == reference.is_valid(envelope), (path.name, envelope)
+
+
+def test_fast_checker_covers_combinators_and_bails_on_unknown_keywords():
+    schema = {
+        "type": ["integer", "string"],
+        "oneOf": [{"type": "integer"}, {"minLength": 2, "maxLength": 3}],
+        "not": {"const": "no"},
+    }
+    check = compile_checker(schema)
+    reference = Draft7Validator(schema)
+    for value in [1, 2.0, 2.5, True, "a", "ab", "no", "abcd", None, [1]]:
+        assert check(value) == reference.is_valid(value), value
+    assert compile_checker({"type": "string", "format": "email"}) is None
+    assert compile_checker({"enum": [1, 2]}) is None
+    assert compile_checker({"$ref": "#/definitions/x"}) is None
+
+
+def test_compiled_schemas_are_shared_by_content_and_isolated_from_mutation():
+    schema = {"type": "object", "required": ["status"]}
+    first = compile_schema(schema)
+    assert compile_schema(json.loads(json.dumps(schema))) is first
+    schema["required"].append("tag")
+    assert first.validator.is_valid({"status": "WORKING"})
+    assert compile_schema(schema) is not first
+    assert load_schema(SCHEMAS[0]) is load_schema(str(SCHEMAS[0]))
+
+
+def test_validate_envelope_fast_path_keeps_error_messages(tmp_path):
+    path = tmp_path / "schema.json"
+    path.write_text(json.dumps({"type": "object", "required": ["status"]}), encoding="utf-8")
+    assert validate_envelope({"status": "WORKING"}, path) == (True, [])
+    ok, errors = validate_envelope({}, path)
+    assert not ok and "'status' is a required property" in errors[0]
+
+    path.write_text(json.dumps({"type": "object", "required": ["tag"]}), encoding="utf-8")
+    ok, _ = validate_envelope({"status": "WORKING"}, path)
+    assert not ok  # a rewritten schema file is recompiled
+
+    custom = Draft7Validator({"required": ["tag"]})
+    assert validate_envelope({"tag": "[X]"}, custom) == (True, [])
+    assert validate_envelope({}, custom, fast=False)[0] is False
+
+
+def test_dsl_and_text_validators_are_reused():
+    spec = default_dsl_spec()
+    ext = extension_from_config({"artifact_types": ["diagram"]})
+    assert spec.create_validator() is default_dsl_spec().create_validator()
+    assert spec.create_validator(ext) is spec.create_validator(ext)
+    assert spec.create_validator(ext) is not spec.create_validator()
+    params = {"max_sentences": 2}
+    assert get_validator("concise_text", params) is get_validator("concise_text", dict(params))
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import time
+
+from src.judges import judge_auto, sql_judge
+from src.judges.pool import JudgeItem, JudgePool, final_envelope, judged_items, matrix_items
+from src.run_matrix import MASTER_FIELDS
+
+SQL_TASK = json.dumps({"sqlite_rows": [{"table": "t", "rows": [{"a": 1}, {"a": 2}, {"a": 3}]}]})
+REGEX_TASK = "TASK: match digits\npositives:\n123\n7\nnegatives:\nabc\n"
+
+
+def _env(text: str) -> dict:
+    return {"final_solution": {"canonical_text": text}}
+
+
+def flaky_judge(task_prompt, envelope, roleset_id=None):
+    text = envelope["final_solution"]["canonical_text"]
+    if text == "hang":
+        time.sleep(60)
+    if text == "crash":
+        os._exit(5)
+    if text == "raise":
+        raise ValueError("bad judge input")
+    return judge_auto(task_prompt, envelope, roleset_id)
+
+
+def _items():
+    items = [JudgeItem(f"sql{i}", SQL_TASK, _env("SELECT a FROM t WHERE a > 1")) for i in range(4)]
+    items += [JudgeItem(f"rx{i}", REGEX_TASK, _env(r"^\d+$")) for i in range(4)]
+    items.append(JudgeItem("bad_sql", SQL_TASK, _env("SELECT nope FROM t")))
+    return items
+
+
+def test_inline_pool_reuses_sql_fixture_and_keeps_verdicts():
+    sql_judge._FIXTURES.clear()
+    outcomes = {o.item_id: o for o in JudgePool(workers=0).imap(_items())}
+    assert len(sql_judge._FIXTURES) == 1
+    assert all(outcomes[f"sql{i}"].passes and outcomes[f"sql{i}"].result["rows"] == 2 for i in range(4))
+    assert all(outcomes[f"rx{i}"].passes for i in range(4))
+    assert outcomes["bad_sql"].status == "ok" and not outcomes["bad_sql"].passes
+    # Candidates get a copy, so writes never leak into the cached fixture.
+    judge_auto(SQL_TASK, _env("SELECT a FROM t; DROP TABLE t"))
+    sql_judge.judge_sql(SQL_TASK, _env("DELETE FROM t"))
+    assert judge_auto(SQL_TASK, _env("SELECT a FROM t"))["rows"] == 3
+
+
+def test_worker_pool_times_out_and_replaces_stuck_workers():
+    items = _items()
+    items[2:2] = [JudgeItem("hang", REGEX_TASK, _env("hang")), JudgeItem("crash", REGEX_TASK, _env("crash"))]
+    items.append(JudgeItem("raise", REGEX_TASK, _env("raise")))
+    pool = JudgePool(workers=2, timeout=1.0, chunk_size=4, judge="test_judge_pool:flaky_judge", poll_interval=0.1)
+    outcomes = list(pool.imap(items))
+
+    by_id = {o.item_id: o for o in outcomes}
+    assert len(outcomes) == len(by_id) == len(items)
+    assert by_id["hang"].status == "timeout" and not by_id["hang"].passes
+    assert by_id["crash"].status == "error" and "exited with code 5" in by_id["crash"].result["reason"]
+    assert by_id["raise"].status == "error" and "bad judge input" in by_id["raise"].result["error"]
+    assert sum(o.passes for o in outcomes) == 8 and pool.crashed_workers == 1
+
+
+def test_run_scores_matrix_dir_incrementally_and_resumes(tmp_path):
+    tasks = tmp_path / "tasks.yaml"
+    tasks.write_text(
+        "tasks:\n"
+        "  - {id: m, scenario: 'TASK: 1+1', roleset: Math-SolverChecker}\n"
+        "  - {id: b, scenario: 'TASK: true?', roleset: Boolean-ProposeCheck}\n"
+    )
+    rows = []
+    for task_id, roleset, text in (("m", "Math-SolverChecker", "2"), ("b", "Boolean-ProposeCheck", "maybe")):
+        run = tmp_path / f"{task_id}.jsonl"
+        turns = [{"r": 1, "text_out": "thinking"}, {"r": 2, "text_out": text}, {"r": 3, "text_out": ""}]
+        run.write_text(json.dumps({"config": {}, "transcript": turns}) + "\n")
+        rows.append({"task_id": task_id, "strategy": "S1", "roleset": roleset, "repeat_idx": 0, "out_jsonl": run.name})
+    with open(tmp_path / "matrix_results.csv", "w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, fieldnames=MASTER_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+    out = tmp_path / "judge_results.jsonl"
+    items = list(matrix_items(str(tmp_path), str(tasks)))
+    assert [item.envelope for item in items] == [_env("2"), _env("maybe")]
+    report = JudgePool(workers=0).run(items[:1], str(out))
+    assert (report.judged, report.passed) == (1, 1)
+
+    report = JudgePool(workers=0).run(matrix_items(str(tmp_path), str(tasks)), str(out))
+    assert (report.judged, report.skipped, report.passed) == (1, 1, 0)
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    ids = ["m_Math-SolverChecker_S1_rep0", "b_Boolean-ProposeCheck_S1_rep0"]
+    assert [r["item_id"] for r in records] == ids
+    assert records[1]["result"]["kind"] == "boolean" and judged_items(str(out)) == set(ids)
+
+
+def test_matrix_rows_differing_only_by_roleset_are_separate_items(tmp_path):
+    tasks = tmp_path / "tasks.yaml"
+    tasks.write_text("tasks:\n  - {id: m, scenario: 'TASK: 1+1', roleset: Math-SolverChecker}\n")
+    rows = [
+        {"task_id": "m", "strategy": "S1", "roleset": roleset, "repeat_idx": 0, "out_jsonl": "missing.jsonl"}
+        for roleset in ("Math-SolverChecker", "Planner-Solver")
+    ]
+    with open(tmp_path / "matrix_results.csv", "w", newline="", encoding="utf-8") as handle:
+        writer = csv.DictWriter(handle, fieldnames=MASTER_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+    items = list(matrix_items(str(tmp_path), str(tasks)))
+    assert len({item.item_id for item in items}) == 2
+    assert [item.roleset_id for item in items] == ["Math-SolverChecker", "Planner-Solver"]
+
+
+def test_final_envelope_reads_control_trailers_and_json():
+    trailer = 'body <<<CTRL{"tag": "[SOLVED]", "status": "SOLVED", "final_solution": {"canonical_text": "42"}}CTRL>>>'
+    assert final_envelope([{"text_out": trailer}])["final_solution"]["canonical_text"] == "42"
+    envelope = {"tag": "[SOLVED]", "final_solution": {"canonical_text": "7"}}
+    assert final_envelope([{"text_out": json.dumps(envelope)}]) == envelope
+    assert final_envelope([{"text_out": "  "}]) == {}
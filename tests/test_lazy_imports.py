@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from src.strategies.registry import StrategyDefinition, _StrategyRegistry
+
+ROOT = Path(__file__).resolve().parents[1]
+HEAVY = ("torch", "transformers", "jsonschema", "pydantic", "sqlparse")
+
+
+def test_cli_modules_import_without_heavy_dependencies():
+    code = (
+        "import json, sys\n"
+        "import src.main, src.simple_dialog\n"
+        "from src.strategies import registry\n"
+        f"print(json.dumps({{'heavy': [m for m in {HEAVY!r} if m in sys.modules],"
+        " 'registry_ready': registry.STRATEGY_REGISTRY._ready}))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert report == {"heavy": [], "registry_ready": False}
+
+
+def test_strategy_registry_populates_once_on_first_access():
+    calls = []
+    registry = _StrategyRegistry(lambda: calls.append(1))
+    assert calls == []
+    registry["X"] = StrategyDefinition(id="X", name="x", description="")
+    assert "X" in registry and len(registry) == 1
+    assert list(registry) == ["X"]
+    assert calls == [1]
@@ -60,3 +60,62 @@ def test_record_run_persists_csv_and_jsonl(tmp_path: Path, sample_result):
     assert payload["record"]["batch_id"] == "exp-1"
     assert payload["raw_result"]["status"] == "CONSENSUS"
     assert record["batch_id"] == "exp-1"
+
+
+def _sink_worker(path, worker_id):
+    from src.logger import FlushPolicy, RunLogSink
+
+    with RunLogSink(FlushPolicy(max_records=7)) as sink:
+        for i in range(50):
+            sink.append_csv(path, ["worker", "i"], {"worker": worker_id, "i": i})
+
+
+def test_sink_buffers_until_policy_threshold(tmp_path: Path):
+    from src.logger import FlushPolicy, RunLogSink
+
+    path = tmp_path / "log.jsonl"
+    sink = RunLogSink(FlushPolicy(max_records=3, max_interval=60.0))
+    sink.append_jsonl(path, {"n": 1})
+    sink.append_jsonl(path, {"n": 2})
+    assert path.read_text() == ""
+    sink.append_jsonl(path, {"n": 3})
+    assert [json.loads(line)["n"] for line in path.read_text().splitlines()] == [1, 2, 3]
+    sink.append_jsonl(path, {"n": 4})
+    sink.close()
+    assert len(path.read_text().splitlines()) == 4
+
+
+def test_sink_is_safe_across_threads_and_processes(tmp_path: Path):
+    import csv
+    import multiprocessing as mp
+    import threading
+
+    from src.logger import FlushPolicy, RunLogSink
+
+    path = str(tmp_path / "rows.csv")
+    shared = RunLogSink(FlushPolicy(max_records=5))
+    threads = [
+        threading.Thread(
+            target=lambda wid=wid: [shared.append_csv(path, ["worker", "i"], {"worker": wid, "i": i}) for i in range(50)]
+        )
+        for wid in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=_sink_worker, args=(path, 10 + wid)) for wid in range(2)]
+    for proc in procs:
+        proc.start()
+    for thread in threads:
+        thread.join()
+    for proc in procs:
+        proc.join(timeout=60)
+    shared.close()
+
+    with open(path, newline="", encoding="utf-8") as handle:
+        lines = handle.read().splitlines()
+    assert lines.count("worker,i") == 1 and lines[0] == "worker,i"
+    with open(path, newline="", encoding="utf-8") as handle:
+        rows = list(csv.DictReader(handle))
+    assert len(rows) == 6 * 50
+    assert {(r["worker"], r["i"]) for r in rows} == {(str(w), str(i)) for w in [0, 1, 2, 3, 10, 11] for i in range(50)}
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import csv
+import os
+from pathlib import Path
+
+from src.matrix_pool import MatrixPool, PoolOptions, append_row, load_shard_cells, matrix_cells, recorded_cells
+from src.run_matrix import MASTER_FIELDS
+
+TASKS = [
+    {"id": "t1", "scenario": "Say 1", "roleset": "R", "answer_regex": "1"},
+    {"id": "t2", "scenario": "Say 2", "roleset": "R"},
+]
+
+
+def fake_run_dialog(*, scenario, strategy, roleset, seed, outdir, **_):
+    crash_marker = Path(outdir).parent / "crash_once"
+    if strategy == "S_CRASH" and not crash_marker.exists():
+        crash_marker.write_text(str(os.getpid()))
+        os._exit(3)
+    if strategy == "S_FAIL":
+        raise RuntimeError("bad cell")
+    jsonl = os.path.join(outdir, "run.jsonl")
+    Path(jsonl).write_text("{}\n")
+    return {
+        "config": {"total_prompt_tokens": 3, "total_output_tokens": 4, "pid": os.getpid()},
+        "transcript": [{"r": 1, "text_out": scenario[-1], "stop_reason": "eos"}],
+        "out_jsonl": jsonl,
+        "out_csv": jsonl.replace(".jsonl", ".csv"),
+        "elapsed_sec": 0.01,
+    }
+
+
+def _pool(logdir, **kwargs):
+    options = PoolOptions(model_a="m", model_b="m", turns=1, runner="test_matrix_pool:fake_run_dialog")
+    return MatrixPool(str(logdir), options, devices=["cpu"], poll_interval=0.1, **kwargs)
+
+
+def _rows(path):
+    with open(path, newline="", encoding="utf-8") as handle:
+        return list(csv.DictReader(handle))
+
+
+def test_pool_records_cells_retries_crashes_and_resumes(tmp_path):
+    cells = matrix_cells(TASKS, ["S_OK", "S_CRASH", "S_FAIL"], repeats=2, seed=7)
+    report = _pool(tmp_path, workers=2).run(cells)
+
+    assert (report.completed, report.failed, report.crashed_workers) == (8, 4, 1)
+    rows = _rows(tmp_path / "matrix_results.csv")
+    assert sorted((r["task_id"], r["strategy"], r["repeat_idx"]) for r in rows) == sorted(
+        (t["id"], s, str(rep)) for t in TASKS for s in ("S_OK", "S_CRASH") for rep in range(2)
+    )
+    assert {r["first_hit_turn"] for r in rows if r["task_id"] == "t1"} == {"1"}
+    assert (tmp_path / "matrix_errors.jsonl").read_text().count("RuntimeError: bad cell") == 4
+
+    again = _pool(tmp_path, workers=1).run(matrix_cells(TASKS, ["S_OK", "S_CRASH"], repeats=2, seed=7))
+    assert (again.completed, again.skipped) == (0, 8)
+
+
+def test_torn_tail_is_dropped_on_resume(tmp_path):
+    path = tmp_path / "matrix_results.csv"
+    append_row(str(path), {"task_id": "t1", "strategy": "S", "repeat_idx": 0})
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write("2025-01-01,abc,t2,S")
+    assert recorded_cells(str(path)) == {("t1", "", "S", 0)}
+    assert path.read_text().count("\n") == 2
+    assert _rows(path)[0].keys() == set(MASTER_FIELDS)
+
+
+def test_shard_jsonl_resolves_task_definitions(tmp_path):
+    defs = tmp_path / "tasks.yaml"
+    defs.write_text("tasks:\n  - id: t1\n    scenario: Say 1\n    roleset: R\n")
+    shard = tmp_path / "shard0.jsonl"
+    shard.write_text('{"dataset": "t1", "language": "S1", "pair": "R2", "rep": 1}\n')
+    (cell,) = load_shard_cells(str(shard), str(defs), seed=10)
+    assert (cell.run_id, cell.task["roleset"], cell.seed) == ("t1_S1_rep1", "R2", 11)
+
+
+def test_shard_cells_differing_only_by_roleset_all_run(tmp_path):
+    defs = tmp_path / "tasks.yaml"
+    defs.write_text("tasks:\n  - id: t1\n    scenario: Say 1\n    roleset: R\n")
+    shard = tmp_path / "shard0.jsonl"
+    shard.write_text(
+        '{"dataset": "t1", "language": "S_OK", "pair": "R1", "rep": 0}\n'
+        '{"dataset": "t1", "language": "S_OK", "pair": "R2", "rep": 0}\n'
+    )
+    cells = load_shard_cells(str(shard), str(defs))
+    logdir = tmp_path / "logs"
+    report = _pool(logdir, workers=1).run(cells)
+    assert (report.completed, report.skipped) == (2, 0)
+    assert {r["roleset"] for r in _rows(logdir / "matrix_results.csv")} == {"R1", "R2"}
+    assert recorded_cells(str(logdir / "matrix_results.csv")) == {("t1", "R1", "S_OK", 0), ("t1", "R2", "S_OK", 0)}
+
+    again = _pool(logdir, workers=1).run(load_shard_cells(str(shard), str(defs)))
+    assert (again.completed, again.skipped) == (0, 2)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from src.model_cache import ModelCache, configure_model_cache, get_model_cache, make_key
+
+
+def _loader(calls, name):
+    def _load():
+        calls.append(name)
+        return (f"model:{name}", f"tok:{name}")
+
+    return _load
+
+
+def test_same_key_shares_instance():
+    cache = ModelCache()
+    calls = []
+    key = make_key("org/model", dtype="bf16", device="cuda")
+
+    first = cache.get_or_load(key, _loader(calls, "a"))
+    second = cache.get_or_load(make_key("org/model", dtype="BF16", device="cuda"), _loader(calls, "b"))
+
+    assert first is second
+    assert calls == ["a"]
+    stats = cache.stats()
+    assert stats["loads"] == 1
+    assert stats["hits"] == 1
+    assert stats["models"][0]["model_id"] == "org/model"
+
+
+def test_distinct_dtype_or_device_loads_separately():
+    cache = ModelCache()
+    calls = []
+    cache.get_or_load(make_key("m", dtype="bf16", device="cuda"), _loader(calls, "bf16"))
+    cache.get_or_load(make_key("m", dtype="fp32", device="cuda"), _loader(calls, "fp32"))
+    cache.get_or_load(make_key("m", dtype="bf16", device="cpu"), _loader(calls, "cpu"))
+    assert calls == ["bf16", "fp32", "cpu"]
+    assert len(cache) == 3
+
+
+def test_lru_cap_evicts_least_recently_used():
+    cache = ModelCache(max_models=2)
+    calls = []
+    key_a, key_b, key_c = (make_key(name) for name in ("a", "b", "c"))
+
+    cache.get_or_load(key_a, _loader(calls, "a"))
+    cache.get_or_load(key_b, _loader(calls, "b"))
+    cache.get_or_load(key_a, _loader(calls, "a"))  # refresh a
+    cache.get_or_load(key_c, _loader(calls, "c"))  # evicts b
+
+    assert key_a in cache
+    assert key_b not in cache
+    assert key_c in cache
+    assert cache.stats()["evictions"] == 1
+
+    cache.get_or_load(key_b, _loader(calls, "b"))
+    assert calls == ["a", "b", "c", "b"]
+
+
+def test_configure_model_cache_shrinks_shared_cache():
+    cache = get_model_cache()
+    cache.clear()
+    try:
+        for name in ("x", "y", "z"):
+            cache.get_or_load(make_key(name), _loader([], name))
+        configure_model_cache(max_models=1)
+        assert len(cache) == 1
+        assert make_key("z") in cache
+    finally:
+        configure_model_cache(max_models=None)
+        cache.clear()
+
+
+def test_simple_dialog_agents_share_model(monkeypatch):
+    import src.simple_agents as sa
+
+    get_model_cache().clear()
+    loads = []
+
+    def fake_load(model_id, device, dtype):
+        loads.append(model_id)
+        return object(), object()
+
+    monkeypatch.setattr(sa, "_load_simple", fake_load)
+    try:
+        agent_a = sa.SimpleHF("org/shared", device="cpu")
+        agent_b = sa.SimpleHF("org/shared", device="cpu")
+        assert agent_a.model is agent_b.model
+        assert agent_a.tok is agent_b.tok
+        assert loads == ["org/shared"]
+    finally:
+        get_model_cache().clear()
+
+
+def test_loader_passes_from_pretrained_kwargs_and_bypasses_cache(monkeypatch):
+    import src.model_loader as ml
+
+    get_model_cache().clear()
+    loads = []
+
+    def fake_load(model_name, tokenizer_name, dtype, extra):
+        loads.append(extra)
+        return object(), object()
+
+    monkeypatch.setattr(ml, "_load_uncached", fake_load)
+    try:
+        first = ml.load_model_and_tokenizer("org/m")
+        assert ml.load_model_and_tokenizer("org/m") is first
+        ml.load_model_and_tokenizer("org/m", cached=False)
+        ml.load_model_and_tokenizer("org/m", use_cache=False)
+        assert loads == [{}, {}, {"use_cache": False}]
+    finally:
+        get_model_cache().clear()
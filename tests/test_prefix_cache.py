@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import gc
+from types import SimpleNamespace
+
+import torch
+
+from src.prefix_cache import PrefixCache, PrefixLookup, cache_nbytes
+
+
+def _render(messages):
+    text = "".join(f"<{m['role']}>{m['content']}" for m in messages) + "<assistant>"
+    return torch.tensor([[ord(ch) for ch in text]])
+
+
+class StubModel:
+    def __init__(self, width: int = 4) -> None:
+        self.width = width
+        self.calls = 0
+
+    def __call__(self, *, input_ids, attention_mask, use_cache):
+        self.calls += 1
+        length = input_ids.shape[-1]
+        layer = (torch.zeros(1, 1, length, self.width), torch.zeros(1, 1, length, self.width))
+        return SimpleNamespace(past_key_values=(layer,))
+
+
+def test_prefix_ids_stop_before_user_content():
+    cache = PrefixCache()
+    prefix = cache.prefix_ids(object(), "be terse", _render)
+    rendered = "".join(chr(i) for i in prefix)
+    assert "<system>be terse<user>".startswith(rendered)
+    assert len(rendered) == len("<system>be terse<user>") - 1
+
+
+def test_second_lookup_hits_and_returns_private_copy():
+    cache = PrefixCache()
+    model, tokenizer = StubModel(), object()
+    ids = _render([{"role": "system", "content": "sys"}, {"role": "user", "content": "hello"}])
+
+    first = cache.lookup(model, tokenizer, "sys", ids, _render)
+    second = cache.lookup(model, tokenizer, "sys", ids, _render)
+
+    assert first.counters == (0, 1)
+    assert second.counters == (1, 0)
+    assert second.reused_tokens == len("<system>sys<user>") - 1
+    assert model.calls == 1
+    assert second.past_key_values is not first.past_key_values
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_mismatched_prefix_is_a_miss_without_prefill():
+    cache = PrefixCache()
+    model = StubModel()
+    ids = _render([{"role": "system", "content": "other"}, {"role": "user", "content": "hi"}])
+    result = cache.lookup(model, object(), "sys", ids, _render)
+    assert result.past_key_values is None
+    assert result.counters == (0, 1)
+    assert model.calls == 0
+
+
+def test_byte_cap_evicts_oldest_prefix():
+    model, tokenizer = StubModel(width=8), object()
+    one_entry = cache_nbytes(model(input_ids=torch.zeros(1, 16), attention_mask=None, use_cache=True).past_key_values)
+    cache = PrefixCache(max_bytes=one_entry * 2)
+    for system in ("aaaaa", "bbbbb", "ccccc"):
+        ids = _render([{"role": "system", "content": system}, {"role": "user", "content": "q"}])
+        cache.lookup(model, tokenizer, system, ids, _render)
+    stats = cache.stats()
+    assert stats["evictions"] >= 1
+    assert stats["bytes_used"] <= cache.max_bytes
+
+
+def test_entries_are_released_with_their_model():
+    cache = PrefixCache()
+    model, tokenizer = StubModel(), object()
+    ids = _render([{"role": "system", "content": "sys"}, {"role": "user", "content": "hello"}])
+    cache.lookup(model, tokenizer, "sys", ids, _render)
+    assert cache.stats()["entries"] == 1 and cache.stats()["bytes_used"] > 0
+
+    del model
+    gc.collect()
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes_used"] == 0
+    assert cache.lookup(StubModel(), tokenizer, "sys", ids, _render).counters == (0, 1)
+
+
+def test_disabled_lookup_contributes_no_counters():
+    assert PrefixLookup().counters == (0, 0)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import gc
+
+import pytest
+import torch
+
+from src.agents_hf import HFChatAgent
+from src.prefix_cache import get_prefix_cache
+from src.presets import ROLESETS, STRATEGIES
+from src.prompt_table import PromptTable, build_system, get_prompt_table
+from src.simple_agents import GenConfig, SimpleHF, _format_prompt
+from src.strategies import Strategy
+
+
+class _EosAppending:
+    """Appends EOS, so the header cannot be tokenised on its own."""
+
+    eos_token_id = pad_token_id = 0
+
+    def __call__(self, text, add_special_tokens=True):
+        return {"input_ids": [ord(ch) for ch in text] + ([0] if add_special_tokens else [])}
+
+
+def _simple(tok) -> SimpleHF:
+    agent = SimpleHF.__new__(SimpleHF)
+    agent.tok, agent.device, agent._split_ok = tok, "cpu", None
+    return agent
+
+
+def test_system_prompts_are_rendered_once_per_combination():
+    table = PromptTable()
+    first = table.system("Planner-Solver", "NL", "A")
+    assert first == build_system(ROLESETS["Planner-Solver"]["A"], STRATEGIES["NL"])
+    assert table.system("Planner-Solver", "NL", "A") is first
+    assert table.compile() == sum(len(roles) for roles in ROLESETS.values()) * len(STRATEGIES)
+    with pytest.raises(KeyError):
+        table.system("Planner-Solver", "NOPE", "A")
+
+    joined = table.join(["base", None, "", "guide"])
+    assert joined == "base\n\nguide" and table.join(["base", "guide"]) is joined
+
+
+def test_simple_hf_reuses_header_ids_from_the_shared_table(tiny_tokenizer):
+    agent = _simple(tiny_tokenizer)
+    system = get_prompt_table().system("Planner-Solver", "JSON_SCHEMA", "B")
+    before = get_prompt_table().stats()
+    for incoming in ("hello", "a longer peer message", ""):
+        expected = tiny_tokenizer(_format_prompt(system, incoming))["input_ids"]
+        assert agent._prompt_ids(system, incoming) == expected
+    after = get_prompt_table().stats()
+    assert after["token_misses"] - before["token_misses"] == 1
+    assert after["token_hits"] - before["token_hits"] == 2
+
+    fallback = _simple(_EosAppending())
+    assert fallback._prompt_ids("sys", "hi") == _EosAppending()(_format_prompt("sys", "hi"))["input_ids"]
+    assert fallback._split_ok is False
+
+
+def test_token_ids_are_dropped_with_their_tokenizer():
+    class _Tok:
+        pass
+
+    table = PromptTable()
+    tok = _Tok()
+    assert table.token_ids(tok, "ab", lambda text: [1, 2]) == (1, 2)
+    assert table.token_ids(tok, "ab", lambda text: [9]) == (1, 2)
+    assert table.stats()["token_entries"] == 1
+    del tok
+    gc.collect()
+    assert table.stats()["token_entries"] == 0
+
+    # Not weakly referenceable: encoded every time, never cached.
+    assert table.token_ids(3, "ab", lambda text: [7]) == (7,)
+    assert table.token_ids(3, "ab", lambda text: [8]) == (8,)
+    assert table.stats()["token_entries"] == 0
+
+
+def test_hf_agent_system_prompt_is_one_interned_string(tiny_tokenizer):
+    strategy = Strategy(id="T", metadata={"prompt_snippet": "Be exact."})
+    agent = HFChatAgent("a", "Solve it.", tiny_tokenizer, object(), strategy, use_prefix_cache=False, history_tokens=0)
+    first = agent._system_prompt(None)
+    assert "Be exact." in first and agent._system_prompt({}) is first
+    assert agent._system_prompt({"system_prefix": "X"}).startswith("X\n\n")
+    assert get_prefix_cache().prompts is get_prompt_table()
+
+
+def test_batched_prompts_are_left_padded(tiny_tokenizer):
+    agent = _simple(tiny_tokenizer)
+    calls = {}
+
+    class _Model:
+        def generate(self, *, input_ids, attention_mask, **_):
+            calls["ids"], calls["mask"] = input_ids, attention_mask
+            return torch.cat([input_ids, torch.zeros(input_ids.shape[0], 1, dtype=input_ids.dtype)], dim=1)
+
+    agent.model = _Model()
+    out = agent.respond_batch(["s", "s"], ["hi", "a much longer message"], GenConfig(max_new_tokens=1))
+    tiny_tokenizer.padding_side = "left"
+    try:
+        enc = tiny_tokenizer([_format_prompt("s", "hi"), _format_prompt("s", "a much longer message")], padding=True)
+    finally:
+        tiny_tokenizer.padding_side = "right"
+    assert calls["ids"].tolist() == enc["input_ids"] and calls["mask"].tolist() == enc["attention_mask"]
+    assert [row[1] for row in out] == [sum(mask) for mask in enc["attention_mask"]]
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from src.judges.regex_engine import score_examples
+from src.judges.regex_judge import judge_regex
+
+EVIL = r"^(a+)+$"
+POSITIVES = ["aaa", "a"]
+NEGATIVES = ["b", "a" * 40 + "b", "ab"]
+TASK = "positives:\n" + "\n".join(POSITIVES) + "\nnegatives:\n" + "\n".join(NEGATIVES)
+
+
+@pytest.mark.parametrize("guard", ["signal", "subprocess"])
+def test_backtracking_pattern_is_cut_off_at_the_slow_example(guard):
+    start = time.perf_counter()
+    report = score_examples(EVIL, POSITIVES, NEGATIVES, time_budget=0.3, guard=guard)
+    assert time.perf_counter() - start < 2
+    assert report.timed_out and not report.ok and report.guard == guard
+    assert [ex.matched for ex in report.examples] == [True, True, False, None]
+    assert report.slowest(1)[0].text == "a" * 40 + "b"
+
+    # The guard recovers: a well-behaved pattern is scored in full afterwards.
+    report = score_examples(r"^a+$", POSITIVES, NEGATIVES, time_budget=1.0, guard=guard)
+    assert report.ok and len(report.examples) == 5 and not report.timed_out
+    assert all(ex.sec >= 0 for ex in report.examples)
+
+
+def test_worker_threads_fall_back_to_the_subprocess_guard():
+    reports = []
+    thread = threading.Thread(target=lambda: reports.append(score_examples(r"\d", ["1"], ["x"])))
+    thread.start()
+    thread.join()
+    assert reports[0].guard == "subprocess" and reports[0].ok
+
+
+def test_judge_regex_reports_failures_and_timings():
+    verdict = judge_regex(TASK, {"final_solution": {"canonical_text": "a"}})
+    assert not verdict["passes_judge"]
+    assert verdict["details"] == {"pos_fail": [], "neg_fail": ["a" * 40 + "b", "ab"]}
+    assert [t["example"] for t in verdict["timings"]] == POSITIVES + NEGATIVES
+
+    verdict = judge_regex(TASK, {"final_solution": {"canonical_text": EVIL}}, time_budget=0.2)
+    assert not verdict["passes_judge"] and "time budget" in verdict["error"]
+    assert verdict["timings"][-1]["matched"] is None
+
+    assert "error" in judge_regex(TASK, {"final_solution": {"canonical_text": "(unclosed"}})
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import torch
+
+from src.model_loader import generate_json_only, generate_with_trailer
+from src.response_cache import ResponseCache, response_key
+
+REPLY = '{"status": "WORKING"}<<<CTRL{}CTRL>>>'
+
+
+class CharTokenizer:
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def encode(self, text, add_special_tokens=False):  # noqa: ARG002
+        return [ord(ch) for ch in text]
+
+    def decode(self, tokens, skip_special_tokens=True):  # noqa: ARG002
+        return "".join(chr(int(t)) for t in tokens if not (skip_special_tokens and int(t) in {0, 1}))
+
+
+class CountingModel:
+    device = torch.device("cpu")
+    config = SimpleNamespace(_name_or_path="stub/model")
+    dtype = torch.float32
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def generate(self, **kwargs):
+        self.calls += 1
+        extra = torch.tensor([[ord(ch) for ch in REPLY]], dtype=torch.long)
+        sequences = torch.cat([kwargs["input_ids"], extra], dim=1)
+        if kwargs.get("return_dict_in_generate"):
+            return SimpleNamespace(sequences=sequences, past_key_values=None)
+        return sequences
+
+
+def _prompt(monkeypatch, ids):
+    monkeypatch.setattr("src.model_loader.build_inputs", lambda *_a, **_k: torch.tensor([ids]))
+
+
+def test_greedy_calls_replay_without_the_model(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    model, tok = CountingModel(), CharTokenizer()
+    _prompt(monkeypatch, [5, 6, 7])
+
+    first = generate_json_only(tok, model, "sys", user_prompt="u", decoding={"max_new_tokens": 64}, response_cache=cache)
+    again = generate_json_only(tok, model, "sys", user_prompt="u", decoding={"max_new_tokens": 64}, response_cache=cache)
+    assert model.calls == 1
+    assert again.response_cache_hit and not first.response_cache_hit
+    assert (again.text, again.tokens_used, again.decode_tokens) == (first.text, first.tokens_used, 0)
+
+    generate_json_only(tok, model, "sys", user_prompt="u", decoding={"max_new_tokens": 65}, response_cache=cache)
+    _prompt(monkeypatch, [5, 6, 8])
+    generate_json_only(tok, model, "sys", user_prompt="u", decoding={"max_new_tokens": 64}, response_cache=cache)
+    assert model.calls == 3
+
+    kwargs = dict(max_new_tokens=64, body_budget=32, trailer_budget=32, do_sample=False, response_cache=cache)
+    trailer = generate_with_trailer(model, tok, "plain", **kwargs)
+    calls = model.calls
+    replay = generate_with_trailer(model, tok, "plain", **kwargs)
+    assert model.calls == calls and replay.response_cache_hit
+    assert (replay.text, replay.stop_reason) == (trailer.text, trailer.stop_reason)
+
+
+def test_sampled_calls_bypass_the_cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    model = CountingModel()
+    _prompt(monkeypatch, [5])
+    for _ in range(2):
+        generate_with_trailer(model, CharTokenizer(), "plain", max_new_tokens=64, do_sample=True, response_cache=cache)
+    assert model.calls == 4  # first pass + salvage, twice
+    assert len(cache) == 0
+
+
+def test_size_cap_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_bytes=600)
+    payload = {"text": "x" * 40}
+    for i in range(30):
+        cache.put(f"k{i}", dict(payload, i=i))
+        cache.get("k0")  # keep k0 hot
+    assert cache.size_bytes() <= 600
+    assert cache.get("k0") is not None
+    assert cache.get("k1") is None
+    assert cache.stats.evictions > 0
+
+
+def test_key_rejects_live_objects():
+    model = CountingModel()
+    assert response_key("json_only", model, [1, 2], {"max_new_tokens": 8}) is not None
+    assert response_key("json_only", model, [1, 2], {"logits_processor": object()}) is None
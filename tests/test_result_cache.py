@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+from src.result_cache import ResultCache, cell_key
+from src.simple_dialog import restore_run
+from src.transcript_stream import read_transcript
+
+BASE = dict(
+    scenario="TASK: add",
+    strategy_text="Be brief.",
+    roleset={"A": "solver", "B": "checker"},
+    model_a="m",
+    model_b="m",
+    gen_config={"max_new_tokens": 8, "temperature": 0.7},
+    turns=2,
+    seed=42,
+    git_rev="abc123",
+)
+
+RESULT = {
+    "config": {
+        "scenario": "TASK: add",
+        "strategy": "NL",
+        "roleset": "R",
+        "turns": 1,
+        "model_a": "m",
+        "model_b": "m",
+        "seed": 42,
+        "total_prompt_tokens": 5,
+        "total_output_tokens": 2,
+        "max_new_tokens": 8,
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "do_sample": True,
+    },
+    "transcript": [
+        {"r": 1, "actor": "A", "text_in": "TASK: add", "text_out": "2", "prompt_tokens": 5, "output_tokens": 2, "stop_reason": "eos"}
+    ],
+    "elapsed_sec": 1.5,
+}
+
+
+def test_key_changes_with_any_input():
+    key = cell_key(**BASE)
+    assert key == cell_key(**dict(BASE, gen_config={"temperature": 0.7, "max_new_tokens": 8}))
+    for field, value in [
+        ("scenario", "TASK: sub"),
+        ("strategy_text", "Be verbose."),
+        ("roleset", {"A": "solver", "B": "critic"}),
+        ("gen_config", {"max_new_tokens": 9, "temperature": 0.7}),
+        ("seed", 43),
+        ("git_rev", "def456"),
+        ("batch", [key]),
+    ]:
+        assert cell_key(**dict(BASE, **{field: value})) != key
+    assert cell_key(**dict(BASE, batch=[key, "k2"])) != cell_key(**dict(BASE, batch=["k2", key]))
+
+
+def test_batched_cells_are_keyed_by_their_seed_group():
+    from argparse import Namespace
+
+    from src.run_matrix import MatrixCell, assign_cache_keys
+
+    args = Namespace(model_a="m", model_b="m", turns=2)
+    task = {"id": "t", "scenario": "TASK: add", "roleset": "Planner-Solver"}
+
+    def chunk(*seeds):
+        strategies = ["NL", "JSON_SCHEMA"]
+        return [MatrixCell(task=task, strategy=strategies[i], repeat_idx=0, seed=seed) for i, seed in enumerate(seeds)]
+
+    alone = chunk(1)
+    assign_cache_keys(alone, args, {})
+    pair, mixed = chunk(1, 1), chunk(1, 2)
+    assign_cache_keys(pair, args, {})
+    assign_cache_keys(mixed, args, {})
+    assert pair[0].cache_key != pair[1].cache_key
+    assert len({alone[0].cache_key, pair[0].cache_key, mixed[0].cache_key}) == 3
+
+    again = chunk(1, 1)
+    assign_cache_keys(again, args, {})
+    assert [c.cache_key for c in again] == [c.cache_key for c in pair]
+
+
+def test_entries_survive_reopen_and_torn_index(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cell_key(**BASE)
+    assert cache.get(key) is None
+    cache.put(key, RESULT, task_id="t1", batch_size=1)
+    with open(cache.index_path, "a", encoding="utf-8") as handle:
+        handle.write('{"key": "tor')
+
+    reopened = ResultCache(str(tmp_path))
+    assert key in reopened and len(reopened) == 1
+    entry = reopened.get(key)
+    assert entry["result"] == RESULT and entry["meta"] == {"task_id": "t1", "batch_size": 1}
+    assert reopened.summary()["hits"] == 1 and cache.summary()["misses"] == 1
+
+    # The next put lands on a line of its own, not on the torn fragment.
+    key2 = cell_key(**dict(BASE, seed=43))
+    reopened.put(key2, RESULT, task_id="t2")
+    again = ResultCache(str(tmp_path))
+    assert key in again and key2 in again and len(again) == 2
+
+
+def test_restore_run_rewrites_transcript_files(tmp_path):
+    out = restore_run(RESULT, str(tmp_path / "cell"))
+    record = read_transcript(out["out_jsonl"])
+    assert record["complete"] and record["transcript"] == RESULT["transcript"]
+    assert record["config"] == RESULT["config"]
+    assert out["elapsed_sec"] == 1.5
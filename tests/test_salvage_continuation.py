@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import torch
+
+from src.control_trailer import CTRL_SUFFIX
+from src.model_loader import generate_with_trailer
+
+BODY = "Body only"
+TRAILER = '<<<CTRL{"tag":"[PLAN]","status":"PROPOSED","content":{}}CTRL>>>'
+
+
+class CharTokenizer:
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def encode(self, text, add_special_tokens=False):  # noqa: ARG002
+        return [ord(ch) for ch in text]
+
+    def decode(self, tokens, skip_special_tokens=True):  # noqa: ARG002
+        return "".join(
+            chr(int(tok)) for tok in tokens if not (skip_special_tokens and int(tok) in {0, 1})
+        )
+
+
+class StubCache:
+    def __init__(self, length: int) -> None:
+        self.length = length
+
+    def get_seq_length(self) -> int:
+        return self.length
+
+
+class ContinuingModel:
+    device = torch.device("cpu")
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def generate(self, **kwargs):
+        self.calls.append(kwargs)
+        input_ids = kwargs["input_ids"]
+        text = BODY if len(self.calls) == 1 else TRAILER
+        extra = torch.tensor([[ord(ch) for ch in text]], dtype=torch.long)
+        sequences = torch.cat([input_ids, extra], dim=1)
+        return SimpleNamespace(sequences=sequences, past_key_values=StubCache(sequences.shape[-1] - 1))
+
+
+def test_salvage_resumes_from_first_pass_tokens_and_cache(monkeypatch):
+    prompt_ids = torch.tensor([[100, 101, 102]], dtype=torch.long)
+    monkeypatch.setattr("src.model_loader.build_inputs", lambda *_a, **_k: prompt_ids)
+    model = ContinuingModel()
+
+    result = generate_with_trailer(
+        model,
+        CharTokenizer(),
+        prompt="plain",
+        max_new_tokens=16,
+        body_budget=8,
+        trailer_budget=8,
+        salvage_max_new_tokens=80,
+    )
+
+    first, salvage = model.calls
+    assert first["return_dict_in_generate"] is True
+    resumed = salvage["input_ids"][0].tolist()
+    assert resumed == prompt_ids[0].tolist() + [ord(ch) for ch in BODY]
+    assert isinstance(salvage["past_key_values"], StubCache)
+    assert salvage["do_sample"] is False
+    assert salvage["max_new_tokens"] == 80
+
+    assert result.text == BODY + TRAILER
+    assert result.text.endswith(CTRL_SUFFIX)
+    assert result.stop_reason == "suffix"
+    assert result.salvage_tokens == len(TRAILER)
+    assert result.decode_tokens == len(BODY) + len(TRAILER)
+    # Prompt prefill plus the single body token missing from the first-pass cache.
+    assert result.prefill_tokens == prompt_ids.shape[-1] + 1
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+import torch
+
+from src.agents_hf import HFChatAgent
+from src.model_loader import GenerationResult, generate_json_only, sample_json_only, sample_with_trailer
+from src.self_consistency import majority_vote
+from src.strategies import AgentProfile, Strategy
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Name a colour."}]
+
+
+@pytest.fixture(scope="module")
+def tiny(tiny_tokenizer, tiny_gpt2):
+    return tiny_tokenizer, tiny_gpt2()
+
+
+def _solved(answer: str) -> dict:
+    return {
+        "tag": "[SOLVED]",
+        "status": "SOLVED",
+        "content": {"acl": "SOLVED: done => END"},
+        "final_solution": {"canonical_text": answer},
+    }
+
+
+def test_majority_vote_compares_canonical_answers():
+    envelopes = [_solved('{"b": 2, "a": 1}'), _solved("7"), _solved('{"a":1,"b":2}'), _solved("7")]
+    vote = majority_vote(envelopes)
+    assert (vote.winner, vote.votes, len(vote.tally)) == (0, 2, 2)  # tie goes to the first answer
+    assert majority_vote([_solved("x"), _solved(" y "), _solved("y")]).winner == 1
+    assert majority_vote([{"tag": "[PLAN]", "status": "WORKING"}, _solved("")]).answer is None
+
+
+def test_batched_json_samples_prefill_once(tiny):
+    tokenizer, model = tiny
+    decoding = {"max_new_tokens": 12, "do_sample": True, "temperature": 1.0}
+    forwards = []
+    handle = model.register_forward_hook(lambda _m, args, kwargs, _o: forwards.append(1), with_kwargs=True)
+    try:
+        torch.manual_seed(1)
+        batched = sample_json_only(tokenizer, model, MESSAGES, 4, decoding=decoding)
+        batched_passes = len(forwards)
+        forwards.clear()
+        for _ in range(4):
+            generate_json_only(tokenizer, model, MESSAGES, decoding=decoding)
+        separate_passes = len(forwards)
+    finally:
+        handle.remove()
+
+    assert len(batched) == 4
+    assert len({result.text for result in batched}) > 1
+    prompt = batched[0].input_tokens
+    assert [result.prefill_tokens for result in batched] == [prompt, 0, 0, 0]
+    assert all(0 < result.decode_tokens <= 12 for result in batched)
+    assert batched_passes <= separate_passes / 3
+    # Greedy decoding has nothing to vote on.
+    assert len(sample_json_only(tokenizer, model, MESSAGES, 4, decoding={"max_new_tokens": 4})) == 1
+
+
+def test_batched_trailer_samples_salvage_each_row(tiny):
+    tokenizer, model = tiny
+    torch.manual_seed(2)
+    results = sample_with_trailer(
+        model, tokenizer, MESSAGES, 3, max_new_tokens=12, do_sample=True,
+        trailer_budget=4, body_budget=8, salvage_max_new_tokens=6,
+    )
+    assert len(results) == 3
+    for result in results:
+        # An untrained model never closes the trailer, so every row is salvaged.
+        assert result.salvage_tokens == 6
+        assert result.decode_tokens == result.tokens_used == 12 + 6
+    assert results[0].prefill_tokens > results[1].prefill_tokens > 0
+
+
+def test_agent_keeps_the_majority_answer_from_one_batched_call(monkeypatch, tiny):
+    tokenizer, _ = tiny
+    replies = [json.dumps(_solved(answer)) for answer in ("3", " 4", "4 ")] + ["not json"]
+    calls = []
+
+    def fake_sample(tok, model, convo, num_samples, **kwargs):
+        calls.append((num_samples, kwargs["decoding"]))
+        return [GenerationResult(text=text, stop_reason="eos", tokens_used=5) for text in replies]
+
+    monkeypatch.setattr("src.agents_hf.sample_json_only", fake_sample)
+    strategy = Strategy(
+        id="SC", decoding={"max_new_tokens": 16}, agent_profile=AgentProfile(greedy=False, k_samples=4)
+    )
+    agent = HFChatAgent("a", "sys", tokenizer, object(), strategy, use_prefix_cache=False, history_tokens=0)
+    envelope, raw = agent.step("task", [])
+
+    assert len(calls) == 1 and calls[0][0] == 4 and calls[0][1]["do_sample"] is True
+    assert envelope["final_solution"]["canonical_text"].strip() == "4" and raw == replies[1]
+    telemetry = envelope["content"]["control"]["telemetry"]
+    assert telemetry["self_consistency"] == {"drawn": 4, "valid": 3, "votes": 2, "answers": 2, "agreement": 0.6667}
+    assert telemetry["json_invalid_outputs"] == 1 and telemetry["tokens_used_total"] == 20
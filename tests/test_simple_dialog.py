@@ -43,3 +43,72 @@ def test_fixed_turn_pass_through(monkeypatch, tmp_path):
     assert transcript[1]["actor"] == "B"
     assert transcript[1]["text_in"] == transcript[0]["text_out"]
     assert cfg["turns"] == 4
+
+
+class DummyBatchHF(DummyHF):
+    def __init__(self, outputs):
+        super().__init__(outputs)
+        self.batch_calls = []
+
+    def respond_batch(self, system_prompts, incomings, cfg):
+        self.batch_calls.append(list(incomings))
+        return [
+            (f"{self.outputs[self.i % len(self.outputs)]}<{msg}>", 10 + idx, 5, "eos_or_sample")
+            for idx, msg in enumerate(incomings)
+        ]
+
+
+def test_batched_dialogs_run_in_lockstep(monkeypatch, tmp_path):
+    import src.simple_dialog as sd
+    from src.simple_dialog import DialogSpec, run_dialog_batch
+
+    agent_a = DummyBatchHF(outputs=["plan"])
+    agent_b = DummyBatchHF(outputs=["solve"])
+    monkeypatch.setattr(sd, "SimpleHF", lambda model_id: agent_a if "modelA" in model_id else agent_b)
+
+    specs = [
+        DialogSpec("TASK one", "NL", "Planner-Solver", seed=1, outdir=str(tmp_path / "one")),
+        DialogSpec("TASK two", "JSON_SCHEMA", "Math-SolverChecker", seed=1, outdir=str(tmp_path / "two")),
+    ]
+    results = run_dialog_batch(specs, turns=3, model_a="modelA", model_b="modelB")
+
+    # One batched call per turn, each covering both dialogs.
+    assert [len(call) for call in agent_a.batch_calls] == [2, 2]
+    assert [len(call) for call in agent_b.batch_calls] == [2]
+    assert agent_a.batch_calls[0] == ["TASK one", "TASK two"]
+
+    assert [(r["config"]["seed"], r["batch_size"], r["batch_index"]) for r in results] == [(1, 2, 0), (1, 2, 1)]
+    assert [r["config"]["strategy"] for r in results] == ["NL", "JSON_SCHEMA"]
+    first, second = (r["transcript"] for r in results)
+    assert first[1]["text_in"] == first[0]["text_out"] == "plan<TASK one>"
+    assert second[0]["prompt_tokens"] == 11
+    assert results[1]["config"]["total_prompt_tokens"] == 33
+    assert results[0]["out_jsonl"].startswith(str(tmp_path / "one"))
+
+
+def test_batched_dialogs_are_grouped_by_seed(monkeypatch, tmp_path):
+    import src.simple_dialog as sd
+    from src.simple_dialog import DialogSpec, run_dialog_batch
+
+    agent_a = DummyBatchHF(outputs=["plan"])
+    agent_b = DummyBatchHF(outputs=["solve"])
+    seeded = []
+    monkeypatch.setattr(sd, "SimpleHF", lambda model_id: agent_a if "modelA" in model_id else agent_b)
+    monkeypatch.setattr(sd, "seed_everything", seeded.append)
+
+    specs = [DialogSpec(f"TASK {i}", "NL", "Planner-Solver", seed=seed, outdir=str(tmp_path)) for i, seed in enumerate([1, 2, 1])]
+    results = run_dialog_batch(specs, turns=1, model_a="modelA", model_b="modelB")
+
+    assert seeded == [1, 2]
+    assert agent_a.batch_calls == [["TASK 0", "TASK 2"], ["TASK 1"]]
+    assert [(r["config"]["seed"], r["batch_size"]) for r in results] == [(1, 2), (2, 1), (1, 2)]
+    assert results[0]["transcript"][0]["text_in"] == "TASK 0"
+    assert len({r["out_jsonl"] for r in results}) == 3
+
+
+def test_trim_at_eos_drops_batch_padding():
+    from src.simple_agents import _trim_at_eos
+
+    assert _trim_at_eos([5, 6, 0, 1, 1], 0) == [5, 6, 0]
+    assert _trim_at_eos([5, 6, 7], 0) == [5, 6, 7]
+    assert _trim_at_eos([5, 6], None) == [5, 6]
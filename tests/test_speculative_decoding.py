@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import pytest
+import torch
+
+from src.agents_hf import HFChatAgent
+from src.model_loader import DraftModel, generate_json_only, generate_with_trailer
+from src.strategies import AgentProfile, Strategy
+
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Name a colour."}]
+
+
+@pytest.fixture(scope="module")
+def tiny(tiny_tokenizer, tiny_gpt2):
+    target = tiny_gpt2(layers=2, seed=0)
+    twin = tiny_gpt2(layers=2, seed=0)
+    draft = tiny_gpt2(layers=1, seed=1)
+    return tiny_tokenizer, target, twin, draft
+
+
+def test_assisted_trailer_generation_matches_plain_greedy(tiny):
+    tokenizer, target, twin, draft = tiny
+    kwargs = dict(max_new_tokens=24, do_sample=False, trailer_budget=8, body_budget=16, salvage_max_new_tokens=8)
+    plain = generate_with_trailer(target, tokenizer, MESSAGES, **kwargs)
+    assert (plain.draft_tokens, plain.draft_accepted) == (0, 0)
+
+    same = generate_with_trailer(target, tokenizer, MESSAGES, draft=DraftModel(twin, tokenizer), **kwargs)
+    assert same.text == plain.text
+    assert same.draft_tokens > 0 and same.draft_accepted == same.draft_tokens
+    assert same.verify_steps < plain.decode_tokens
+
+    small = generate_with_trailer(target, tokenizer, MESSAGES, draft=DraftModel(draft, tokenizer), **kwargs)
+    assert small.text == plain.text
+    assert 0 <= small.draft_accepted <= small.draft_tokens
+
+
+def test_assisted_json_generation_reports_acceptance(tiny):
+    tokenizer, target, twin, _ = tiny
+    decoding = {"max_new_tokens": 16, "do_sample": False}
+    plain = generate_json_only(tokenizer, target, MESSAGES, decoding=decoding)
+    assisted = generate_json_only(
+        tokenizer, target, MESSAGES, decoding=decoding, draft=DraftModel(twin, tokenizer, num_assistant_tokens=4)
+    )
+    assert assisted.text == plain.text
+    assert assisted.draft_accepted == assisted.draft_tokens > 0
+
+
+def test_agent_turn_telemetry_carries_draft_acceptance(tiny):
+    tokenizer, target, twin, _ = tiny
+    strategy = Strategy(id="S", json_only=True, decoding={"max_new_tokens": 12, "do_sample": False})
+    agent = HFChatAgent(
+        "a", "sys", tokenizer, target, strategy, use_prefix_cache=False, history_tokens=0,
+        draft=DraftModel(twin, tokenizer),
+    )
+    envelope, _ = agent.step("Return JSON", [])
+    telemetry = envelope["content"]["control"]["telemetry"]
+    assert telemetry["draft_accepted_total"] <= telemetry["draft_tokens_total"]
+    assert 0.5 <= telemetry["draft_acceptance"] <= 1.0
+    assert telemetry["draft"] == "assisted"
+
+
+def test_batched_samples_report_the_unused_draft(tiny):
+    tokenizer, target, twin, _ = tiny
+    strategy = Strategy(
+        id="SC", json_only=True, decoding={"max_new_tokens": 8},
+        agent_profile=AgentProfile(greedy=False, k_samples=2),
+    )
+    agent = HFChatAgent(
+        "a", "sys", tokenizer, target, strategy, use_prefix_cache=False, history_tokens=0,
+        draft=DraftModel(twin, tokenizer),
+    )
+    with pytest.warns(RuntimeWarning, match="draft model ignored for 2 batched samples"):
+        envelope, _ = agent.step("Return JSON", [])
+    telemetry = envelope["content"]["control"]["telemetry"]
+    assert telemetry["draft"] == "disabled_for_batched_samples" and telemetry["draft_tokens_total"] == 0
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from src.judges import sql_judge
+from src.judges.sql_judge import judge_sql, result_checksum
+
+ROWS = [{"table": "orders", "rows": [{"customer": c, "amount": a} for c, a in (("ann", 5), ("bob", 7), ("ann", 1))]}]
+QUERY = "SELECT customer, SUM(amount) FROM orders GROUP BY customer ORDER BY customer"
+
+
+def _task(**extra) -> str:
+    return json.dumps({"sqlite_rows": ROWS, **extra})
+
+
+def _env(sql: str) -> dict:
+    return {"final_solution": {"canonical_text": sql}}
+
+
+def test_checksum_is_stable_across_hash_seeds():
+    expected = result_checksum([("ann", 6), ("bob", 7)])
+    code = "from src.judges.sql_judge import result_checksum; print(result_checksum([('ann', 6), ('bob', 7)]))"
+    for seed in ("1", "2"):
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+            env={**os.environ, "PYTHONHASHSEED": seed},
+        )
+        assert int(out.stdout) == expected
+    verdict = judge_sql(_task(expected_checksum=expected), _env(QUERY))
+    assert verdict["passes_judge"] and verdict["checksum"] == expected
+    assert not judge_sql(_task(expected_checksum=expected), _env(QUERY + " DESC"))["passes_judge"]
+
+
+def test_fixture_built_once_and_copied_per_candidate(monkeypatch):
+    sql_judge._FIXTURES.clear()
+    builds = []
+    original = sql_judge._build_fixture
+    monkeypatch.setattr(sql_judge, "_build_fixture", lambda spec: builds.append(1) or original(spec))
+    assert judge_sql(_task(), _env("DELETE FROM orders"))["passes_judge"]
+    for _ in range(3):
+        assert judge_sql(_task(), _env(QUERY))["rows"] == 2
+    assert len(builds) == 1
+
+
+def test_sandbox_interrupts_long_statements_and_denies_attach(tmp_path):
+    runaway = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    start = time.perf_counter()
+    verdict = judge_sql(_task(), _env(runaway), time_limit=0.2)
+    assert time.perf_counter() - start < 2
+    assert not verdict["passes_judge"] and "time limit" in verdict["error"]
+
+    target = tmp_path / "x.db"
+    verdict = judge_sql(_task(), _env(f"ATTACH DATABASE '{target}' AS x"))
+    assert not verdict["passes_judge"] and "not authorized" in verdict["error"]
+    assert not target.exists()
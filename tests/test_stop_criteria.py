@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import torch
+
+from src.control_trailer import CTRL_SUFFIX
+from src.model_loader import SuffixStop
+from src.stop_criteria import StopSequences, TokenAutomaton
+
+
+class PieceTokenizer:
+    """Greedy longest-match tokenizer over a small multi-character vocabulary."""
+
+    def __init__(self, pieces):
+        self.vocab = {piece: idx for idx, piece in enumerate(pieces, start=2)}
+        for ch in "abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ{}<>\"'.:\n":
+            self.vocab.setdefault(ch, len(self.vocab) + 2)
+        self.inverse = {idx: piece for piece, idx in self.vocab.items()}
+        self.decode_calls = 0
+
+    def encode(self, text, add_special_tokens=False):  # noqa: ARG002
+        ids, pos = [], 0
+        longest = max(len(p) for p in self.vocab)
+        while pos < len(text):
+            for size in range(min(longest, len(text) - pos), 0, -1):
+                piece = text[pos : pos + size]
+                if piece in self.vocab:
+                    ids.append(self.vocab[piece])
+                    pos += size
+                    break
+            else:
+                raise ValueError(text[pos])
+        return ids
+
+    def decode(self, ids, skip_special_tokens=False):  # noqa: ARG002
+        self.decode_calls += 1
+        return "".join(self.inverse.get(int(i), "") for i in ids)
+
+
+def _feed(stopper, rows, prompt_len=1):
+    """Feed ``rows`` (equal-length token lists) one step at a time."""
+
+    prompt = [[0] * prompt_len for _ in rows]
+    stopper.set_input_length(prompt_len)
+    done_at = [None] * len(rows)
+    for step in range(len(rows[0])):
+        ids = torch.tensor([p + r[: step + 1] for p, r in zip(prompt, rows)])
+        result = stopper(ids, None)
+        mask = result.tolist() if isinstance(result, torch.Tensor) else [bool(result)] * len(rows)
+        for row, flag in enumerate(mask):
+            if flag and done_at[row] is None:
+                done_at[row] = step
+    return done_at
+
+
+def test_automaton_reports_overlapping_patterns():
+    automaton = TokenAutomaton([((1, 2), 0), ((3, 1, 2, 4), 1), ((2, 4), 2)])
+    state, hits = 0, []
+    for token in (3, 1, 2, 4):
+        state, label = automaton.step(state, token)
+        hits.append(label)
+    assert hits == [None, None, 0, 1]
+
+
+def test_rows_stop_independently():
+    tok = PieceTokenizer(["CTRL", ">>>"])
+    stopper = SuffixStop(tok, CTRL_SUFFIX)
+    finished = tok.encode("ok CTRL>>>")
+    running = tok.encode("still going")
+    width = max(len(finished), len(running))
+    rows = [finished + [0] * (width - len(finished)), running + [0] * (width - len(running))]
+
+    done_at = _feed(stopper, rows)
+
+    assert done_at == [len(finished) - 1, None]
+    assert stopper.triggered
+    assert stopper.matched == [CTRL_SUFFIX, None]
+
+
+def test_text_window_catches_other_tokenisations():
+    tok = PieceTokenizer(["CTRL", ">>>", "}CTRL", ">>"])
+    stopper = StopSequences(tok, [CTRL_SUFFIX])
+    # "}CTRL" + ">>" + ">" is not one of the precomputed token patterns.
+    ids = [tok.vocab["}CTRL"], tok.vocab[">>"], tok.vocab[">"]]
+    assert _feed(stopper, [ids]) == [2]
+
+
+def test_stop_found_when_the_last_token_runs_past_it():
+    tok = PieceTokenizer(["CTRL", ">>>\n"])
+    stopper = StopSequences(tok, [CTRL_SUFFIX])
+    ids = tok.encode("x CTRL>>>\n")
+    assert ids[-2:] == [tok.vocab["CTRL"], tok.vocab[">>>\n"]]
+    assert _feed(stopper, [ids]) == [len(ids) - 1]
+    assert stopper.triggered and stopper.matched == [CTRL_SUFFIX]
+
+
+def test_multiple_stop_strings_and_piece_cache():
+    tok = PieceTokenizer([])
+    stopper = StopSequences(tok, ["END", "STOP"])
+    ids = tok.encode("abc STOP")
+    assert _feed(stopper, [ids]) == [len(ids) - 1]
+    assert stopper.matched == ["STOP"]
+
+    calls = tok.decode_calls
+    _feed(stopper, [ids])
+    assert tok.decode_calls == calls  # pieces are memoised per token id
+
+
+def test_suffix_stop_accepts_token_ids():
+    tok = PieceTokenizer(["CTRL", ">>>"])
+    suffix_ids = tok.encode(CTRL_SUFFIX)
+    stopper = SuffixStop(tok, suffix_ids)
+    assert _feed(stopper, [tok.encode("x") + suffix_ids]) == [len(suffix_ids)]
+
+
+def test_match_end_marks_stop_inside_a_multi_token_step():
+    tok = PieceTokenizer(["CTRL", ">>>"])
+    stopper = SuffixStop(tok, CTRL_SUFFIX)
+    stopper.set_input_length(1)
+    generated = tok.encode("ok CTRL>>> extra")
+    # One call with the whole block, as assisted decoding appends accepted drafts at once.
+    stopper(torch.tensor([[0] + generated]), None)
+    assert stopper.triggered
+    assert stopper.match_ends == [1 + len(tok.encode("ok CTRL>>>"))]
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import gc
+from types import SimpleNamespace
+
+import torch
+
+from src.agents_hf import HFChatAgent
+from src.model_loader import generate_with_trailer
+from src.strategies import Strategy
+from src.token_budget import TokenCache, TrailerBudgetPlanner
+
+
+class CountingTokenizer:
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def __init__(self) -> None:
+        self.encodes = 0
+
+    def encode(self, text, add_special_tokens=False):  # noqa: ARG002
+        self.encodes += 1
+        return [ord(ch) for ch in text]
+
+    def decode(self, tokens, skip_special_tokens=True):  # noqa: ARG002
+        return "".join(chr(int(t)) for t in tokens if not (skip_special_tokens and int(t) in {0, 1}))
+
+
+def test_token_cache_hits_evicts_and_forgets_collected_tokenizers():
+    cache = TokenCache(max_entries=2)
+    tok = CountingTokenizer()
+    assert cache.count(tok, "abc") == 3
+    assert cache.count(tok, "abc") == 3
+    assert tok.encodes == 1 and cache.hits == 1
+
+    cache.count(tok, "de")
+    cache.count(tok, "fgh")  # evicts "abc"
+    cache.count(tok, "abc")
+    assert tok.encodes == 4 and len(cache) == 2
+
+    other = CountingTokenizer()
+    cache.count(other, "xyz")
+    del other
+    gc.collect()
+    assert all(key[0] == id(tok) for key in cache._entries)
+    assert cache.count(None, "two words") == 2
+
+
+def test_planner_uses_observed_quantile_with_floor_and_cap():
+    planner = TrailerBudgetPlanner(quantile=0.9, margin=4, min_samples=3)
+    assert planner.plan("S", 200) is None
+    for length in (10, 12, 30):
+        planner.observe("S", length)
+    plan = planner.plan("S", 200, template_tokens=8)
+    assert (plan.trailer_budget, plan.body_budget, plan.salvage_max_new_tokens) == (34, 166, 34)
+    assert planner.plan("S", 200, template_tokens=50).trailer_budget == 50
+    assert planner.plan("S", 20).trailer_budget == 20
+    assert planner.plan("other", 200) is None
+
+
+def test_planned_split_caps_salvage_and_is_reported(monkeypatch):
+    class BodyOnlyModel:
+        device = torch.device("cpu")
+        config = SimpleNamespace(_name_or_path="stub/model")
+
+        def __init__(self) -> None:
+            self.max_new_tokens = []
+
+        def generate(self, **kwargs):
+            self.max_new_tokens.append(kwargs["max_new_tokens"])
+            extra = torch.tensor([[ord(ch) for ch in "body text"]], dtype=torch.long)
+            sequences = torch.cat([kwargs["input_ids"], extra], dim=1)
+            if kwargs.get("return_dict_in_generate"):
+                return SimpleNamespace(sequences=sequences, past_key_values=None)
+            return sequences
+
+    monkeypatch.setattr("src.model_loader.build_inputs", lambda *_a, **_k: torch.tensor([[5, 6]]))
+    model = BodyOnlyModel()
+    result = generate_with_trailer(
+        model, CountingTokenizer(), "p", max_new_tokens=128, trailer_budget=20, body_budget=108, salvage_max_new_tokens=20
+    )
+    assert model.max_new_tokens == [128, 20]
+    assert (result.trailer_budget, result.body_budget) == (20, 128)
+
+
+def test_agent_plans_budgets_once_the_strategy_has_samples():
+    planner = TrailerBudgetPlanner(min_samples=2, margin=0)
+    agent = HFChatAgent(
+        "a", "sys", CountingTokenizer(), object(), Strategy(id="S"), use_prefix_cache=False, budget_planner=planner
+    )
+    assert agent._planned_budget(256, {}) == {}
+    planner.observe("S", 90)
+    planner.observe("S", 100)
+    assert agent._planned_budget(256, {}) == {"trailer_budget": 100, "body_budget": 156, "salvage_max_new_tokens": 100}
+    assert agent._planned_budget(256, {"trailer_budget": 64}) == {}
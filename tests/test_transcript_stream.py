@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from src.simple_agents import GenConfig
+from src.simple_dialog import run_dialog
+from src.transcript_stream import TranscriptWriter, read_transcript
+
+
+def _turn(r, actor="A"):
+    return {"r": r, "actor": actor, "text_in": f"in{r}", "text_out": f"out{r}", "prompt_tokens": 10, "output_tokens": 3, "stop_reason": "eos"}
+
+
+class FailingHF:
+    def __init__(self, fail_at):
+        self.calls = 0
+        self.fail_at = fail_at
+
+    def respond(self, system_prompt, incoming, cfg):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise RuntimeError("out of memory")
+        return f"reply{self.calls}", 7, 2, "eos"
+
+
+def test_run_dialog_streams_turns_and_footer(monkeypatch, tmp_path):
+    import src.simple_dialog as sd
+
+    agent = FailingHF(fail_at=0)
+    monkeypatch.setattr(sd, "SimpleHF", lambda model_id: agent)
+    result = run_dialog(
+        scenario="TASK", strategy="NL", roleset="Planner-Solver", turns=3,
+        model_a="m", model_b="m", gen_cfg=GenConfig(do_sample=False), seed=1, outdir=str(tmp_path),
+    )
+
+    with open(result["out_jsonl"], encoding="utf-8") as handle:
+        kinds = [json.loads(line)["type"] for line in handle]
+    assert kinds == ["header", "turn", "turn", "turn", "footer"]
+
+    record = read_transcript(result["out_jsonl"])
+    assert record["complete"] is True
+    assert record["config"] == result["config"]
+    assert record["transcript"] == result["transcript"]
+    assert record["config"]["total_prompt_tokens"] == 21
+    with open(result["out_csv"], encoding="utf-8") as handle:
+        assert len(handle.readlines()) == 4
+
+
+def test_crashed_run_keeps_written_turns(monkeypatch, tmp_path):
+    import src.simple_dialog as sd
+
+    agent = FailingHF(fail_at=3)
+    monkeypatch.setattr(sd, "SimpleHF", lambda model_id: agent)
+    with pytest.raises(RuntimeError):
+        run_dialog(
+            scenario="TASK", strategy="NL", roleset="Planner-Solver", turns=4,
+            model_a="m", model_b="m", seed=1, outdir=str(tmp_path),
+        )
+
+    (path,) = tmp_path.glob("*.jsonl")
+    record = read_transcript(str(path))
+    assert record["complete"] is False and record["elapsed_sec"] is None
+    assert [t["r"] for t in record["transcript"]] == [1, 2]
+    assert record["config"]["strategy"] == "NL"
+    assert record["config"]["total_output_tokens"] == 4
+
+
+def test_reader_tolerates_torn_tail_and_legacy_files(tmp_path):
+    path = tmp_path / "run.jsonl"
+    writer = TranscriptWriter(str(path), header={"turns": 3}, flush_every=1)
+    writer.write_turn(_turn(1))
+    writer.write_turn(_turn(2, "B"))
+    writer.abort()
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write('{"type": "turn", "r": 3, "act')
+    record = read_transcript(str(path))
+    assert [t["r"] for t in record["transcript"]] == [1, 2]
+    assert record["config"] == {"turns": 3, "total_prompt_tokens": 20, "total_output_tokens": 6}
+
+    legacy = tmp_path / "legacy.jsonl"
+    legacy.write_text(json.dumps({"config": {"turns": 1}, "transcript": [_turn(1)], "elapsed_sec": 0.5}) + "\n")
+    record = read_transcript(str(legacy))
+    assert record == {"config": {"turns": 1}, "transcript": [_turn(1)], "elapsed_sec": 0.5, "complete": True}
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import gc
+
+from src.weak_owners import WeakOwnerIndex
+
+
+class Owner:
+    pass
+
+
+def test_keys_are_released_once_and_unreferenceable_objects_opt_out():
+    released = []
+    owners = WeakOwnerIndex(released.append)
+    obj = Owner()
+    key = owners.key(obj)
+    assert key == id(obj) and owners.key(obj) == key
+    assert key in owners and len(owners) == 1
+
+    del obj
+    gc.collect()
+    assert released == [key]
+    assert key not in owners and len(owners) == 0
+
+    assert owners.key(("tuples", "cannot be weakly referenced")) is None
+    assert len(owners) == 0
@@ -4,7 +4,7 @@ import re
 from pathlib import Path
 
 DIR_RE = re.compile(r'^(?P<dataset>.+)_(?P<language>[A-Z_]+)_rep(?P<rep>\d+)$')
-FILE_RE = re.compile(r'^runs_fixed_(?P<language>[A-Z_]+)_(?P<pair>.+?)_\d{8}-\d{6}\.jsonl$')
+FILE_RE = re.compile(r'^runs_fixed_(?P<language>[A-Z_]+)_(?P<pair>.+?)_\d{8}-\d{6}(?:_\d+)?\.jsonl$')
 
 def main():
     ap = argparse.ArgumentParser()